@@ -2,33 +2,30 @@
 """
 alphacon_add_pae.py:
 Parse AlphaFold PAE scores from JSON files into SQL table 'alphacon'.
-Note: No fragment support since PAE scores aren't particularly useful for fragments (they're intended for full-length proteins and would be inaccurate).
+PAE matrices are loaded client-side into NumPy arrays and looked up for all contacts of an accession at once (see pae.py), then written back through a keyed staging table (UPDATE ... JOIN).
+Pending accessions are found with a single set difference (PAE files vs. one grouped query on 'alphacon'), and sharded across worker processes (each with its own MySQL connection, committing in batches of accessions).
+Interrupted runs can simply be restarted: accessions whose batch was committed no longer have contacts with pae=NULL, and uncommitted batches get rolled back.
+Note: By default, no fragment support since PAE scores aren't particularly useful for fragments (they're intended for full-length proteins and would be inaccurate).
+With -frags, fragmented proteins (>2700 aa) are included, using each fragment's kept residue range (ignoring residues within 200 aa of artificial termini) and averaging across fragments.
 """
 
 # TODO Should add PAE parsing to job_lahuta.py instead and get the PAE scores for a given protein there - would be much faster than adding them to a giant table later on, as done here
 
 # Initialize
-# import pandas as pd
-# import numpy as np
-# import networkx as nx
-# import seaborn as sns
-# import matplotlib.pyplot as mp
-import tarfile
-import gzip
-import io
-import json
-import pickle
-# from Bio import SeqIO
+import multiprocessing
+import numpy as np
+import blang_mysql
 from blang_mysql import *
 from blang import *
+from pae import *
+from summary import *
 
 alphafrag = "alphafrag"
 alphaseq = "alphaseq"
 alphacon = "alphacon"
 
-Args(0, " \n -refresh: Reset wanted list (do not use temporary file)\n -debug: Don't actually make any changes, just simulate", "")
+Args(0, " \n -frags: Also include fragmented proteins (>2700 aa, using the kept residue range of each fragment)\n -store: Read PAE matrices from the quantized uint8 .npy store (written by pae_store.py) instead of .json.gz files (AlphaFold DB only: exact for its integer PAE values, whereas AlphaSync's non-integer values always get read from the .json.gz files)\n -debug: Don't actually make any changes, just simulate (roll back every batch)", "")
 paepath = "input/pae/besian"
-tmpfile = "input/pae/besian_diagnostic/tmp-filelist-seqlen-accs.pkl"
 
 # AlphaSync updated structures PAE scores
 alphasync_paepath = "input/alphasync/pae"
@@ -39,14 +36,25 @@ if Switch('alphasync'):
     afdb = 0
     paepath = alphasync_paepath
 
-# Note - This script contains many experiments for speeding up import. Ultimately the fastest way was a join with a temporary JSON table (used here).
+# Quantized uint8 PAE store (see pae_store.py), mirroring the .json.gz directory structure
+# Only for AlphaFold DB (integer PAE values, so quantization in steps of 0.25 is exact): AlphaSync PAE values (afdb=0) aren't integers, and rounding quantized values would differ from rounding the originals for about 12% of contacts (e.g. 12.6 >> 12.5 >> 12 instead of 13)
+paeext = "json.gz"
+if Switch('store'):
+    if afdb == 1:
+        paepath = f"{paepath}_uint8"
+        paeext = "npy"
+    else:
+        State(f"Note: Reading AlphaSync PAE values from .json.gz files despite -store (the quantized store would be lossy for their non-integer values)")
+
+# Number of worker processes (each with its own MySQL connection): cores allocated by LSF, or all cores when run directly
+workers = int(os.environ.get("LSB_DJOB_NUMPROC", os.cpu_count()))
+# Number of accessions per transaction (commit)
+batchsize = 50
+
+# Keyed staging table holding the PAE values for all contacts (site1|site2 pairs) of one accession (one per worker connection)
+tmptable = f"alphacon_tmp_update"
 
-# fifofile = "tmp/json_fifo"
-# fifofile = "../../mysql/backup/tmp-json-fifo.txt"
-# fifofile_server = "/mnt/backup/tmp/json_fifo" # Server refuses due to SHOW VARIABLES LIKE 'secure_file_priv';
-# fifofile_server = "/mnt/backup/tmp-json-fifo.txt"
-# fifofile_server = "json_fifo"
-# fifofile_server = "/var/lib/mysql-files/tmp/"
+# Note - This script contained many experiments for speeding up import. The fastest way used to be a join with a temporary JSON table, until PAE values started getting looked up client-side using NumPy (pae.py).
 
 # # Takes very long to run (affects 3,423,869,501 rows)
 # # (3,419,234,111 will have PAE scores after this script is run)
@@ -55,477 +63,137 @@ if Switch('alphasync'):
 #     query = Query(f"UPDATE {alphacon} SET pae=NULL")
 #     print(f"Rows affected: {Comma(Numrows(query))}")
 
-# If I wanted an "alphapae" table, MySQL has a JSON data type that sounds great:
-# https://dev.mysql.com/doc/refman/8.3/en/json.html
-# "Optimized storage format. JSON documents stored in JSON columns are converted to an internal format that permits quick read access to document elements. When the server later must read a JSON value stored in this binary format, the value need not be parsed from a text representation. The binary format is structured to enable the server to look up subobjects or nested values directly by key or array index without reading all values before or after them in the document."
-# >> Can avoid text parsing
-# >> However: Simply adding PAE scores to alphacon is sufficient.
-# >> Actually using JSON in a temporary table now below to update alphacon faster through JOINs.
+
+
+# Functions
+
+def InitWorker():
+    """Open a separate MySQL connection for this worker process and create its staging table"""
+    # Forked workers inherit the parent's connection: discard its engine's pool without closing the parent's socket, and keep a reference to the inherited connection so it never gets garbage-collected (which would roll back on the parent's socket)
+    global inherited_connection
+    inherited_connection = blang_mysql.blang_mysql_connection
+    inherited_connection.engine.dispose(close=False)
+    Connect()
+    Query(f"""CREATE TEMPORARY TABLE {tmptable} (
+    `site1` mediumint NOT NULL,
+    `site2` mediumint NOT NULL,
+    `pae` float DEFAULT NULL,
+    PRIMARY KEY (`site1`, `site2`)
+    ) engine=InnoDB""")
+
+def AddPae(acc, infiles, length):
+    """Add PAE scores to all contacts of an accession in table 'alphacon' (returns rows affected)"""
+
+    # Get all contacts (site1|site2 pairs) for this accession
+    sites = np.array(FetchAll(Query(f"SELECT DISTINCT site1, site2 FROM {alphacon} WHERE acc='{acc}' AND afdb={afdb}")), dtype=int).reshape(-1, 2)
+    if len(sites) == 0:
+        return 0
+
+    # Look up PAE values for all contacts at once (NumPy fancy indexing, using the higher value of both directions, averaged across fragments if fragmented)
+    # Round as before (AlphaSync structures (afdb=0) have non-integer PAE values)
+    paes = np.round(ProteinPae(infiles, sites[:, 0], sites[:, 1], length))
+    if np.isnan(paes).any():
+        Die(f"Error: PAE values missing for {np.isnan(paes).sum()} contacts for acc '{acc}' (not covered by any fragment's kept range)")
+
+    # Fill keyed staging table (single multi-row insert) and update alphacon through a join on it
+    # (DELETE instead of TRUNCATE, since TRUNCATE would implicitly commit the batch's transaction)
+    Query(f"DELETE FROM {tmptable}")
+    Query(f"INSERT INTO {tmptable} (site1, site2, pae) VALUES " + ", ".join(f"ROW ({site1}, {site2}, {pae:g})" for (site1, site2), pae in zip(sites, paes)))
+    query = Query(f"UPDATE {alphacon} c JOIN {tmptable} t ON c.site1=t.site1 AND c.site2=t.site2 SET c.pae=t.pae WHERE c.acc='{acc}' AND c.afdb={afdb}")
+    # Flag PAE scores as present in table 'alphasummary' (in the same transaction)
+    Query(SummaryQuery(acc, afdb, {"has_pae": 1}))
+    return Numrows(query)
+
+def AddPaeBatch(batch):
+    """Add PAE scores for a batch of accessions in a single transaction (returns rows affected per accession)"""
+    Query("START TRANSACTION")
+    try:
+        res = [(acc, AddPae(acc, infiles, length)) for (acc, infiles, length) in batch]
+    except BaseException:
+        # Roll back the partial batch (otherwise this worker's next START TRANSACTION would implicitly commit it)
+        Query("ROLLBACK")
+        raise
+    if not Switch('debug'):
+        Query("COMMIT")
+    else:
+        Query("ROLLBACK")
+    return res
+
 
 
 # Start
 Starttime()
 
-# Get list of .json.gz files to parse (should take ~5 minutes)
-print(f"\nGetting list of .json.gz archives in '{paepath}'...")
+# Get list of PAE files (should take ~5 minutes)
+print(f"\nGetting list of .{paeext} files in '{paepath}'...")
+Time(1)
+accfiles = {}
+for infile in tq(nsort(Return(f"find {paepath} -name '*.{paeext}'").split("\n"))):
+
+    # Get acc from source file name (e.g. input/pae/besian/store/afdb/data/x8772/AF-P53587-F1-predicted_aligned_error_v4.json.gz)
+    m = rx(r"AF-(\w+(-\d+)?)-F(\d+)-predicted_aligned_error_v\d+\.(json\.gz|npy)$", infile)
+    if not m:
+        Die(f"Error: Couldn't parse accession from '{infile}'")
+    accfiles.setdefault(m[0], []).append(infile)
 Time(1)
-if not Exists(tmpfile) or Switch('refresh') or Switch('alphasync'):
-    
-    # First 10 files only
-    # infiles = nsort(Return(f"find {paepath} -name '*.json.gz' | head").split("\n"))
-    # First 100,000 files only
-    # infiles = nsort(Return(f"find {paepath} -name '*.json.gz' | head -n 100000").split("\n"))
-    # All files
-    infiles = nsort(Return(f"find {paepath} -name '*.json.gz'").split("\n"))
-
-    # Get wanted accs from alphaseq
-    Time(2)
-    print(f"\nGetting list of 'wanted' accessions (that consist of a single fragment and have contacts) and their sequence lengths (for verifying that the PAE matrix dimensions equal protein length) from table '{alphaseq}':")
-    seqlen = {}
-    wanted_accs = set()
-    # Require frags=1 since PAE scores aren't meaningful for fragmented proteins (>2700 aa)
-    for acc, length in tq(Query(f"SELECT acc, LENGTH(seq) FROM {alphaseq} WHERE frags=1 AND afdb={afdb} AND nocon!=1")):
-        # Only add to wanted list if alphacon already has PAE scores for every contact for this protein
-        # if Numrows(Query(f"SELECT 1 FROM {alphacon} WHERE acc='{acc}' AND pae IS NULL LIMIT 1")) > 0:
-        # https://dev.mysql.com/doc/refman/8.4/en/exists-and-not-exists-subqueries.html
-        if Switch('alphasync'):
-            # If updating: also update rows where pae is already set (not NULL)
-            if FetchOne(Query(f"SELECT EXISTS (SELECT * FROM {alphacon} WHERE acc='{acc}' AND afdb={afdb})")) == 1:
-                wanted_accs.add(acc)
-                seqlen[acc] = length
-        else:
-            if FetchOne(Query(f"SELECT EXISTS (SELECT * FROM {alphacon} WHERE acc='{acc}' AND afdb={afdb} AND pae IS NULL)")) == 1:
-                wanted_accs.add(acc)
-                seqlen[acc] = length
-    Time(2)
-
-    # Filter infiles to only include wanted_accs
-    print(f"\nFiltering input file list to only retain wanted accessions:")
-    Time(3)
-    tmpinfiles = infiles
-    infiles = []
-    accs = {}
-    for infile in tq(tmpinfiles):
-
-        # Get acc from source file name (e.g. input/pae/besian/store/afdb/data/x8772/AF-P53587-F1-predicted_aligned_error_v4.json.gz)
-        m = rx(r"AF-(\w+(-\d+)?)-F(\d+)-predicted_aligned_error_v\d+\.json\.gz$", infile)
-        if not m:
-            Die(f"Error: Couldn't parse accession from '{infile}'")
-
-        acc = m[0]
-        frag = int(m[2])
-
-        if acc not in wanted_accs:
-            Log(f"unwanted infile skipped for infile (skipped)", infile)
-            Log(f"unwanted infile skipped for acc (skipped)", acc)
-            continue
-        else:
-            Log(f"wanted infile kept for infile (kept)", infile)
-            Log(f"wanted infile kept for acc (kept)", acc)
-            infiles.append(infile)
-            accs[infile] = acc
-
-        if frag != 1:
-            Die(f"Error: Fragment is '{frag}' for acc '{acc}' (no support for fragment numbers higher than 1 in this script)")
-    Time(3)
-
-    print(f"Number of wanted accessions: {len(wanted_accs):,}\n")
-
-    if not Switch('alphasync'):
-        # Write to file
-        with open(tmpfile, "wb") as f:
-            pickle.dump([infiles, seqlen, accs], f)
-        print(f" >> Wrote to '{tmpfile}'")
 
+# Get wanted accs from alphaseq, and their sequence lengths (for verifying that the PAE matrix dimensions equal protein length)
+# Require frags=1 since PAE scores aren't meaningful for fragmented proteins (>2700 aa) (unless -frags is active)
+print(f"\nGetting 'wanted' accessions (that have contacts) and their sequence lengths from table '{alphaseq}'...")
+Time(2)
+tmpfrags = " AND frags=1"
+if Switch('frags'):
+    tmpfrags = ""
+seqlen = FetchMap(Query(f"SELECT acc, LENGTH(seq) FROM {alphaseq} WHERE afdb={afdb} AND nocon!=1{tmpfrags}"))
+Time(2)
+
+# Get accessions with contacts that still need PAE scores (a single grouped query)
+print(f"\nGetting accessions with contacts that still need PAE scores from table '{alphacon}'...")
+Time(3)
+if Switch('alphasync'):
+    # If updating: also update rows where pae is already set (not NULL)
+    todo_accs = FetchSet(Query(f"SELECT acc FROM {alphacon} WHERE afdb={afdb} GROUP BY acc"))
 else:
+    todo_accs = FetchSet(Query(f"SELECT acc FROM {alphacon} WHERE afdb={afdb} AND pae IS NULL GROUP BY acc"))
+Time(3)
 
-    # Load from file
-    with open(tmpfile, "rb") as f:
-        (infiles, seqlen, accs) = pickle.load(f)
-    print(f" >> Loaded from '{tmpfile}'")
+# Pending accessions: set difference between wanted accessions with PAE files and accessions that are done (i.e. have no contacts with pae=NULL)
+done_accs = set(seqlen) - todo_accs
+pending = nsort((set(accfiles) & set(seqlen)) - done_accs)
+for acc in pending:
+    if len(accfiles[acc]) > 1 and not Switch('frags'):
+        Die(f"Error: Found {len(accfiles[acc])} fragment files for acc '{acc}' (no support for fragment numbers higher than 1 without -frags)")
 
-Time(1)
+print(f" >> PAE files for {Comma(len(accfiles))} accessions")
+print(f" >> Wanted accessions in '{alphaseq}': {Comma(len(seqlen))}")
+print(f" >> Accessions in '{alphacon}' with contacts that still need PAE scores: {Comma(len(todo_accs))}")
+print(f" >> Pending accessions: {Comma(len(pending))}")
+for acc in todo_accs - set(accfiles):
+    Log(f"no PAE file found for acc with contacts that still need PAE scores (skipped)", acc)
 
-if Switch('debug'):
-    infiles = ["input/pae/besian/store/afdb/data/x0006/AF-A0A1S3ETA8-F1-predicted_aligned_error_v4.json.gz"] * 1000
-    wanted_accs = ["A0A1S3ETA8"]
-    # infiles = infiles[:100]
 
-# Create temporary table
-# print("\n >> Create temp table\t", end="") if Switch('debug') else None
-# Starttime() if Switch('debug') else None
-tmptable = f"alphacon_tmp_update"
-# # PRIMARY and indexes
-# q = f"""CREATE TEMPORARY TABLE {tmptable} (
-# `id` int unsigned NOT NULL AUTO_INCREMENT,
-# `acc` char(10) DEFAULT NULL,
-# `site1` mediumint DEFAULT NULL,
-# `site2` mediumint DEFAULT NULL,
-# `pae` float DEFAULT NULL,
-# PRIMARY KEY (`id`),
-# KEY `Acc` (`acc`),
-# KEY `Site1` (`site1`),
-# KEY `Site2` (`site2`)
-# );"""
-# # Indexes
-# q = f"""CREATE TEMPORARY TABLE {tmptable} (
-# `acc` char(10) DEFAULT NULL,
-# `site1` mediumint DEFAULT NULL,
-# `site2` mediumint DEFAULT NULL,
-# `pae` float DEFAULT NULL,
-# KEY `Acc` (`acc`),
-# KEY `Site1` (`site1`),
-# KEY `Site2` (`site2`)
-# );"""
-# # Indexes, without acc
-# q = f"""CREATE TEMPORARY TABLE {tmptable} (
-# `site1` mediumint DEFAULT NULL,
-# `site2` mediumint DEFAULT NULL,
-# `pae` float DEFAULT NULL,
-# KEY `Site1` (`site1`),
-# KEY `Site2` (`site2`)
-# );"""
-# # Composite index
-# q = f"""CREATE TEMPORARY TABLE {tmptable} (
-# `acc` char(10) DEFAULT NULL,
-# `site1` mediumint DEFAULT NULL,
-# `site2` mediumint DEFAULT NULL,
-# `pae` float DEFAULT NULL,
-# KEY `Acc` (`acc`, `site1`, `site2`)
-# );"""
-# # Composite index, without acc
-# q = f"""CREATE TEMPORARY TABLE {tmptable} (
-# `site1` mediumint DEFAULT NULL,
-# `site2` mediumint DEFAULT NULL,
-# `pae` float DEFAULT NULL,
-# KEY `Sites` (`site1`, `site2`)
-# )"""
-# # No indexes
-# q = f"""CREATE TEMPORARY TABLE {tmptable} (
-# `acc` char(10) DEFAULT NULL,
-# `site1` mediumint DEFAULT NULL,
-# `site2` mediumint DEFAULT NULL,
-# `pae` float DEFAULT NULL
-# );"""
-# # No indexes, without acc
-# q = f"""CREATE TEMPORARY TABLE {tmptable} (
-# `site1` mediumint DEFAULT NULL,
-# `site2` mediumint DEFAULT NULL,
-# `pae` float DEFAULT NULL
-# );"""
-# JSON (can't be used with MEMORY engine, but performance hit should be small)
-# InnoDB is slightly faster here than MyISAM, I think because it does more in-memory.
-q = f"""CREATE TEMPORARY TABLE {tmptable} (
-`pae` json DEFAULT NULL
-) engine=InnoDB"""
-# ) engine=MyISAM"""
-Query(q)
-# Stoptime() if Switch('debug') else None
-
-# # Create FIFO pipe so MySQL can read compressed files through it
-# if Exists(fifofile):
-#     Run("Remove existing FIFO pipe", f"rm -fv {fifofile}")
-# if not Exists(fifofile):
-#     Run("Create FIFO pipe", f"mkfifo {fifofile}")
-#     # Run("Chmod FIFO pipe", f"chmod 777 {fifofile}")
-
-
-
-# Main loop: Parse .json.gz files
-print(f"\nParsing PAE scores in .json.gz archives in '{paepath}' and updating table '{alphacon}':")
+
+# Main loop: Parse PAE files (sharded across worker processes, in batches of accessions)
+batches = [[(acc, nsort(accfiles[acc]), seqlen[acc]) for acc in pending[i:i + batchsize]] for i in range(0, len(pending), batchsize)]
+workers = max(1, min(workers, len(batches)))
+print(f"\nParsing PAE scores in .{paeext} files in '{paepath}' and updating table '{alphacon}' ({workers} worker processes, {len(batches)} batches of up to {batchsize} accessions):")
 affected = 0
-for infile in tq(infiles):
-    # print(f" >> {infile}") if Switch('debug') else None
-    
-    # # Get acc from source file name (e.g. input/pae/besian/store/afdb/data/x8772/AF-P53587-F1-predicted_aligned_error_v4.json.gz)
-    # m = rx(r"AF-(\w+(-\d+)?)-F(\d+)-predicted_aligned_error_v\d+\.json\.gz$", infile)
-    # if not m:
-    #     Die(f"Error: Couldn't parse accession from '{infile}'")
-    # acc = m[0]
-
-    acc = accs[infile]
-
-    # Simply overwrite instead
-    # # Check if acc has any contacts where PAE has not been set yet ('pae' IS NULL) in table 'alphacon'
-    # if Numrows(Query(f"SELECT * FROM {alphacon} WHERE acc='{acc}' AND pae IS NULL LIMIT 1")) == 0:
-    #     Log(f"acc already had PAE scores for every contact for acc (skipped)", acc)
-    #     continue
-
-    # # Skip unwanted accessions (i.e. those that are not in table 'alphaseq')
-    # if acc not in wanted_accs:
-    #     Log(f"unwanted acc skipped for acc", acc)
-    #     continue
-    # else:
-    #     Log(f"found file for wanted acc for acc", acc)
-
-    # print(f" >> {infile}") if Switch('debug') else None
-
-    # # Parse JSON from .json.gz file
-    # print("\n >> Load JSON\t", end="") if Switch('debug') else None
-    # Starttime() if Switch('debug') else None
-    # with gzip.open(infile, "rt") as f:
-    #     data = json.load(f)
-    # Stoptime() if Switch('debug') else None
-    # # paes = data[0]["predicted_aligned_error"]
-    # # maxpae = data[0]["max_predicted_aligned_error"]
-    # # if maxpae != 31.75:
-    # #     Die(f"Error: Expected max max_predicted_aligned_error to be '31.75', but got '{maxpae}' instead in '{infile}'")
-    # # Not sure what maxpae is actually good for:
-    # # It appears to always be 31.75.
-    # # https://alphafold.ebi.ac.uk/faq
-    # # "predicted_aligned_error: The PAE value of the residue pair, rounded to the closest integer. For the PAE value at position (i, j), i is the residue on which the structure is aligned, j is the residue on which the error is predicted."
-    # # https://alphafold.ebi.ac.uk/faq
-    # # "max_predicted_aligned_error: A number that denotes the maximum possible value of PAE. The smallest possible value of PAE is 0."
-    # # https://alphafold.ebi.ac.uk/entry/G5EBL2#help
-    # # Section: "How to interpret the Predicted Aligned Error"
-    # # [PAE scores are] "the expected distance error in Ångströms (Å), ranging from 0 Å to an arbitrary cut-off of 31 Å."
-    # # >> I've seen values of 32, so this isn't even correct (I suppose ≥31.5 gets rounded to 32). The actual maximum must be 31.75.
-    # # Looking directly at AF 2.3.2 PAE results files, the diagonal has values like 0.3, so the function used must indeed be a normal round().
-
-    # # Load JSON directly from .json.gz file through FIFO pipe
-    # print("\n >> Load JSON\t", end="") if Switch('debug') else None
-    # Starttime() if Switch('debug') else None
-    # # with gzip.open(infile, "rt") as f:
-    # #     data = json.load(f)
-    # # gunzip in background (will terminate as soon as LOAD DATA LOCAL INFILE is done)
-    # os.system(f"gunzip -c {infile} > {fifofile} &")
-    # Query(f"TRUNCATE TABLE {tmptable}; LOAD DATA LOCAL INFILE '{fifofile}' INTO TABLE {tmptable} (pae)")
-    # # Query(f"TRUNCATE TABLE {tmptable}; LOAD DATA INFILE '{fifofile_server}' INTO TABLE {tmptable} (pae)")
-    # Stoptime() if Switch('debug') else None
-
-    # Load JSON into memory, but don't parse it
-    # print(" >> Load JSON\t", end="") if Switch('debug') else None
-    # Starttime() if Switch('debug') else None
-    with gzip.open(infile, "rt") as f:
-        data = f.read()
-    # Stoptime() if Switch('debug') else None
-
-    # # Verify PAE matrix size
-    # if seqlen[acc] != len(paes):
-    #     Die(f"Error: Expected PAE matrix height '{seqlen[acc]}', but got '{len(paes)}' instead in '{infile}'")
-    # if seqlen[acc] != len(paes[0]):
-    #     Die(f"Error: Expected PAE matrix width '{seqlen[acc]}', but got '{len(paes[0])}' instead in '{infile}'")
-
-# Previous method, with one UPDATE query per site1|site2 combination:
-#     # Insert PAE scores for alphacon contacts
-#     for site1, site2 in Query(f"SELECT DISTINCT site1, site2 FROM {alphacon} WHERE acc='{acc}'"):
-# 
-#         # Verify PAE matrix size
-#         if seqlen[acc] != len(paes[site1-1]):
-#             Die(f"Error: Expected PAE matrix width '{seqlen[acc]}', but got '{len(paes[site1-1])}' instead in '{infile}'")
-# 
-#         # # Verify that PAE matrix is symmetric
-#         # It's not symmetric:
-#         # https://alphafold.ebi.ac.uk/faq
-#         # "predicted_aligned_error: The PAE value of the residue pair, rounded to the closest integer. For the PAE value at position (i, j), i is the residue on which the structure is aligned, j is the residue on which the error is predicted."
-#         # https://alphafold.ebi.ac.uk/entry/G5EBL2#help
-#         # Section: "How to interpret the Predicted Aligned Error"
-#         # "Note that the PAE scores are asymmetrical, meaning there might be variations in PAE values between (x,y) and (y,x) positions. This is particularly relevant for loop regions with highly uncertain orientations, as seen on the DNA topoisomerase 3 (Q8T2T7)."
-#         # >> Use maximum of the two values
-#         # if paes[site1][site2] != paes[site2][site1]:
-#         #     d()
-#         #     Die(f"Error: PAE matrix is not symmetric for acc '{acc}' site1 '{site1}' site2 '{site2}' in '{infile}'")
-#         mypae = max(paes[site1-1][site2-1], paes[site2-1][site1-1])
-# 
-#         # Update alphacon with PAE score
-#         if not Switch('debug'):
-#             query = Query(f"UPDATE {alphacon} SET pae='{mypae}' WHERE acc='{acc}' AND site1='{site1}' AND site2='{site2}'")
-#             affected += Numrows(query)
-#         else:
-#             State(f"UPDATE {alphacon} SET pae='{mypae}' WHERE acc='{acc}' AND site1='{site1}' AND site2='{site2}'")
-#             affected += 1
-    
-
-
-#     # Combined method using CASE, with one UPDATE query for all site1|site2 combinations
-#     
-#     # Insert PAE scores for alphacon contacts
-#     # print("\n >> Build pae_values\t", end="")
-#     # Starttime()
-#     pae_values = {}
-#     # Initialise pae_values dictionary
-#     for i in range(0, 33):
-#         pae_values[i] = []
-#     # Fill it
-#     for site1 in range(0, seqlen[acc]):
-#         for site2 in range(0, seqlen[acc]):
-#             if site1 == site2:
-#                 continue
-#             # mypae = max(paes[site1][site2], paes[site2][site1])
-#             mypae = max(data[0]["predicted_aligned_error"][site1][site2], data[0]["predicted_aligned_error"][site2][site1])
-#             pae_values[mypae].append((site1 + 1, site2 + 1))
-#     # Stoptime()
-#     
-# 
-# 
-#     # Update alphacon with PAE score in a single query per acc
-#     # Example:
-#     # UPDATE alphacon
-#     # SET pae = (
-#     #   CASE 
-#     #     WHEN (site1, site2) IN ((site1_value1, site2_value1), (site1_value2, site2_value2), ...) 
-#     #     THEN 'value1' -- for (site1_value1, site2_value1)
-#     #     WHEN (site1, site2) IN ((site1_value3, site2_value3), (site1_value4, site2_value4), ...) 
-#     #     THEN 'value2' -- for (site1_value3, site2_value3)
-#     #     -- Add more WHEN clauses for additional combinations with their corresponding pae values
-#     #     ELSE NULL -- optional: handle unmatched combinations (if needed)
-#     #   END
-#     # )
-#     # WHERE acc='A0A1S3EUJ9';
-#     # Build query
-#     # print("\n >> Build query\t", end="")
-#     # Starttime()
-#     cases = "\n".join(["WHEN (site1,site2) IN (" + ",".join([f"({site1},{site2})" for site1, site2 in pae_values[pae]]) + f") THEN {pae}" for pae in range(0, 33) if len(pae_values[pae]) > 0])
-#     cases += " ELSE NULL END\n"
-#     q = f"UPDATE {alphacon} SET pae=(CASE {cases}) WHERE acc='{acc}'"
-#     # Stoptime()
-#     
-#     # print("\n >> Run query\t", end="")
-#     # Starttime()
-#     # if not Switch('debug'):
-#     query = Query(q)
-#     affected += Numrows(query)
-#     # else:
-#     #     State(q)
-#     #     affected += 1
-#     # Stoptime()
-    
-
-
-    # # Simpler method using individual queries for each site1|site2 combination
-    # print("\n >> Run queries\t", end="")
-    # Starttime()
-    # for site1 in range(0, seqlen[acc]):
-    #     for site2 in range(0, seqlen[acc]):
-    #         if site1 == site2:
-    #             continue
-    #         # mypae = max(paes[site1][site2], paes[site2][site1])
-    #         mypae = max(data[0]["predicted_aligned_error"][site1][site2], data[0]["predicted_aligned_error"][site2][site1])
-    #         # Build query
-    #         q = f"UPDATE {alphacon} SET pae='{mypae}' WHERE acc='{acc}' AND site1='{site1+1}' AND site2='{site2+1}'"
-    #         # Update alphacon with PAE score
-    #         if not Switch('debug'):
-    #             query = Query(q)
-    #             affected += Numrows(query)
-    #         else:
-    #             State(q)
-    #             affected += 1
-    # Stoptime()
-    
-    
-
-    
-    # # Simpler method using individual queries for each site1|site2 combination, but sent as a single multi-statement
-    # print("\n >> Run queries\t", end="")
-    # Starttime()
-    # q = ""
-    # for site1 in range(0, seqlen[acc]):
-    #     for site2 in range(0, seqlen[acc]):
-    #         if site1 == site2:
-    #             continue
-    #         # mypae = max(paes[site1][site2], paes[site2][site1])
-    #         mypae = max(data[0]["predicted_aligned_error"][site1][site2], data[0]["predicted_aligned_error"][site2][site1])
-    #         # Build query
-    #         q += f"UPDATE {alphacon} SET pae='{mypae}' WHERE acc='{acc}' AND site1='{site1+1}' AND site2='{site2+1}';\n"
-    # # Update alphacon with PAE scores
-    # if not Switch('debug'):
-    #     query = Query(q)
-    #     # affected += Numrows(query)
-    # else:
-    #     State(q)
-    #     # affected += 1
-    # Stoptime()
-
-
-
-
-#     # Combined method using a temporary table and joining it with alphacon
-#     # Default engine for temporary tables is MEMORY (which is fast)
-# #     print("\n >> Clear temp table\t", end="")
-# #     Starttime()
-# #     Query(f"TRUNCATE TABLE {tmptable}")
-# #     Stoptime()
-# 
-#     print(" >> Build query\t", end="") if Switch('debug') else None
-#     Starttime() if Switch('debug') else None
-#     # q = f"INSERT INTO {tmptable} (id, acc, site1, site2, pae) VALUES "
-#     # q = f"INSERT INTO {tmptable} (acc, site1, site2, pae) VALUES "
-#     q = f"TRUNCATE TABLE {tmptable};INSERT INTO {tmptable} (site1,site2,pae) VALUES "
-# 
-#     # Build query
-#     for site1 in range(0, seqlen[acc]):
-#         # site1 is always < site2, hence we can start site2 at site1 + 1:
-#         for site2 in range(site1 + 1, seqlen[acc]):
-#             if site1 == site2:
-#                 Die("Error: site1 == site2")
-#             # Use the "worst possible" (highest) PAE value since site1 and site2 are equally important for a given contact
-#             # (As mentioned elsewhere, the PAE matrix can be slightly asymmetric since it's the predicted aligned error at residue x for residue y, and vice versa)
-#             mypae = max(data[0]["predicted_aligned_error"][site1][site2], data[0]["predicted_aligned_error"][site2][site1])
-#             # with id column
-#             # q += f"(NULL, '{acc}', {site1+1}, {site2+1}, {mypae}),"
-#             # without id column
-#             # q += f"('{acc}', {site1+1}, {site2+1}, {mypae}),"
-#             # without id and acc columns
-#             q += f"({site1+1},{site2+1},{mypae}),"
-#     # Remove last character of q (the trailing comma)
-#     q = q[:-1]
-#     Stoptime() if Switch('debug') else None
-#     
-#     # Fill temporary table
-#     print("\ >> Fill temp table\t", end="") if Switch('debug') else None
-#     Starttime() if Switch('debug') else None
-#     query = Query(q)
-#     Stoptime() if Switch('debug') else None
-#     
-#     # Use temporary table to set PAE values in alphacon
-#     print(" >> Update alphacon\t", end="") if Switch('debug') else None
-#     Starttime() if Switch('debug') else None
-#     # if not Switch('debug'):
-#     # query = Query(f"UPDATE {alphacon} c, {tmptable} t SET c.pae=t.pae WHERE c.acc='{acc}' AND c.acc=t.acc AND c.site1=t.site1 AND c.site2=t.site2")
-#     query = Query(f"UPDATE {alphacon} c, {tmptable} t SET c.pae=t.pae WHERE c.acc='{acc}' AND c.site1=t.site1 AND c.site2=t.site2")
-#     affected += Numrows(query)
-#     # else:
-#     #     State(f"UPDATE {alphacon} c, {tmptable} t SET c.pae=t.pae WHERE c.acc='{acc}' AND c.acc=t.acc AND c.site1=t.site1 AND c.site2=t.site2")
-#     #     affected += 1
-#     Stoptime() if Switch('debug') else None
-
-
-
-    # Use JSON directly
-    # SELECT c.acc, c.site1, c.site2, c.pae, GREATEST(JSON_EXTRACT(t.pae, CONCAT('$[0].predicted_aligned_error[', site1-1, '][', site2-1, ']')), JSON_EXTRACT(t.pae, CONCAT('$[0].predicted_aligned_error[', site2-1, '][', site1-1, ']'))) AS t_pae FROM alphacon c, alphacon_tmp t WHERE c.acc='A0A1S3ETA8' HAVING c.pae!=t_pae
-    # query = Query(f"SELECT c.acc, c.site1, c.site2, c.pae, GREATEST(JSON_EXTRACT(t.pae, CONCAT('$[0].predicted_aligned_error[', site1-1, '][', site2-1, ']')), JSON_EXTRACT(t.pae, CONCAT('$[0].predicted_aligned_error[', site2-1, '][', site1-1, ']'))) AS t_pae FROM alphacon c, alphacon_tmp t WHERE c.acc='{acc}'")
-    # print(" >> Update alphacon\t", end="") if Switch('debug') else None
-    # Starttime() if Switch('debug') else None
-    # query = Query(f"UPDATE {alphacon} c, {tmptable} t SET c.pae=GREATEST(JSON_EXTRACT(t.pae, CONCAT('$[0].predicted_aligned_error[', site1-1, '][', site2-1, ']')), JSON_EXTRACT(t.pae, CONCAT('$[0].predicted_aligned_error[', site2-1, '][', site1-1, ']'))) WHERE c.acc='{acc}'")
-    # Escape : in data
-    # data = Esc(data)
-    # Slightly faster
-    data = data.replace(":", "\\:")
-    Query(f"TRUNCATE {tmptable}")
-    Query(f"INSERT INTO {tmptable} SET pae='{data}'")
-    # query = Query(f"UPDATE {alphacon} c, {tmptable} t SET c.pae=GREATEST(CAST(JSON_UNQUOTE(JSON_EXTRACT(t.pae, CONCAT('$[0].predicted_aligned_error[', site1-1, '][', site2-1, ']'))) AS SIGNED), CAST(JSON_UNQUOTE(JSON_EXTRACT(t.pae, CONCAT('$[0].predicted_aligned_error[', site2-1, '][', site1-1, ']'))) AS SIGNED)) WHERE c.acc='{acc}' AND c.afdb={afdb}")
-    # For AlphaSync structures (afdb=0): need to use ROUND() to round the values. Also removed unnecessary CAST to SIGNED that didn't work with FLOAT values.
-    query = Query(f"UPDATE {alphacon} c, {tmptable} t SET c.pae=ROUND(GREATEST(JSON_UNQUOTE(JSON_EXTRACT(t.pae, CONCAT('$[0].predicted_aligned_error[', site1-1, '][', site2-1, ']'))), JSON_UNQUOTE(JSON_EXTRACT(t.pae, CONCAT('$[0].predicted_aligned_error[', site2-1, '][', site1-1, ']'))))) WHERE c.acc='{acc}' AND c.afdb={afdb}")
-    # # Shorter JSON operator notation in MySQL 8.3 that includes unquoting (->>), see https://dev.mysql.com/doc/refman/8.3/en/json-search-functions.html
-    # Still on MySQL 8.0 though
-    # query = Query(f"UPDATE {alphacon} c, {tmptable} t SET c.pae=GREATEST(t.pae->>CONCAT('$[0].predicted_aligned_error[', site1-1, '][', site2-1, ']'), t.pae->>CONCAT('$[0].predicted_aligned_error[', site2-1, '][', site1-1, ']')) WHERE c.acc='{acc}'")
-    affected += Numrows(query)
-    # Stoptime() if Switch('debug') else None
-    
-
-    
-    # print(" >> Log\t", end="") if Switch('debug') else None
-    # Starttime() if Switch('debug') else None
-    if Numrows(query) > 0:
-        Log(f"successfully added PAE scores for acc", acc)
-    # Stoptime() if Switch('debug') else None
-
-# # Remove FIFO pipe
-# Run("Remove FIFO pipe", f"rm -fv {fifofile}")
+t = time.perf_counter()
+with multiprocessing.get_context("fork").Pool(workers, initializer=InitWorker) as pool:
+    for res in tq(pool.imap_unordered(AddPaeBatch, batches), total=len(batches)):
+        for (acc, rows) in res:
+            affected += rows
+            if rows > 0:
+                Log(f"successfully added PAE scores for acc", acc)
+            else:
+                Log(f"no contacts found for acc (skipped)", acc)
+elapsed = time.perf_counter() - t
 
 Show(lim=20)
 
 print(f"\nRows affected: {Comma(affected)}")
+if elapsed > 0:
+    print(f"Throughput: {len(pending) / elapsed:,.1f} accessions/s, {affected / elapsed:,.0f} rows/s")
 
 # Optimize(alphacon)
 Stoptime()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+alphacoverage.py:
+Fill SQL table 'alphacoverage', per-taxon coverage (UniProt accessions, mapped accessions and sequences, unmapped core sequences, structures, AlphaSync vs. AFDB structures, residues and mean pLDDT), read by alphauniprot_species.py and alphastats.py.
+The structure columns are kept up to date by the job scripts as structures are finished or removed (see summary.py), so this only fills the accession columns for the current UniProt release (one grouped query each), and verifies the structure columns against a rebuild from scratch (-rebuild to replace them, -check to only compare).
+"""
+
+# Initialize
+from blang_mysql import *
+from blang import *
+from summary import *
+
+alphauniprot = "alphauniprot"
+alphamap = "alphamap"
+type = "uniprot"
+
+# Relative tolerance for comparing 'plddt_sum' (accumulated incrementally as doubles from single-precision floats)
+tolerance = 1e-6
+
+Args(0, " \n -rebuild: Rebuild the structure columns from scratch (from table 'alphasummary') as well, replacing the incrementally maintained values\n -check: Don't make any changes, only compare the structure columns to a rebuild from scratch\n -debug: Don't actually make any changes, just simulate", " -check")
+
+if Switch('check'):
+    SetSwitch('debug')
+
+uniprot_version = get_local_uniprot_release()
+
+# Accession columns: ([columns], query returning tax and columns)
+accession_queries = [
+    # UniProt accessions
+    (["accs"], f"SELECT tax, COUNT(*) FROM {alphauniprot} GROUP BY tax"),
+    # Accessions and distinct sequences mapped to a structure
+    (["mapped_accs", "mapped_seqs"], f"SELECT au.tax, COUNT(DISTINCT au.acc), COUNT(DISTINCT au.seq) FROM {alphauniprot} au, {alphamap} m WHERE au.acc=m.value AND m.type='{type}' AND m.version='{uniprot_version}' AND m.map IS NOT NULL AND m.best=1 GROUP BY au.tax"),
+    # Unmapped core sequences: reviewed or canonical reference proteome, without isoforms (as in alphauniprot_species.py's 'complete' column)
+    (["unmapped_seqs"], f"SELECT au.tax, COUNT(DISTINCT au.seq) FROM {alphauniprot} au, {alphamap} m WHERE (au.reviewed=1 OR au.refprotcanon=1) AND au.acc=au.canon AND au.acc=m.value AND m.type='{type}' AND m.version='{uniprot_version}' AND m.map IS NULL GROUP BY au.tax"),
+    # Unmapped core sequences, including isoforms ('complete_iso' column)
+    (["unmapped_iso_seqs"], f"SELECT au.tax, COUNT(DISTINCT au.seq) FROM {alphauniprot} au, {alphamap} m WHERE (au.reviewed=1 OR au.refprotcanon=1) AND au.acc=m.value AND m.type='{type}' AND m.version='{uniprot_version}' AND m.map IS NULL GROUP BY au.tax"),
+]
+accession_columns = [column for (columns, q) in accession_queries for column in columns]
+
+
+
+def Differs(stored, rebuilt):
+    """Structure columns that differ between stored and rebuilt coverage (tuples in the order of coverage_columns)"""
+    differs = []
+    for column, a, b in zip(coverage_columns, stored, rebuilt):
+        if column == "plddt_sum":
+            if abs(a - b) > tolerance * max(abs(a), abs(b), 1):
+                differs.append(column)
+        elif a != b:
+            differs.append(column)
+    return differs
+
+def Upsert(columns, values):
+    """SQL query that inserts or updates coverage columns for taxa (values: {tax: [values in the order of columns]})"""
+    return f"INSERT INTO {alphacoverage} (tax, {', '.join(columns)}) VALUES " + ", ".join(f"('{tax}', " + ", ".join(f"'{value}'" for value in row) + ")" for tax, row in values.items()) + " ON DUPLICATE KEY UPDATE " + ", ".join(f"{column}=VALUES({column})" for column in columns)
+
+
+
+# Start
+Starttime()
+
+# Accession columns (for the current UniProt release)
+print(f"\nGetting per-taxon UniProt accession counts for release '{uniprot_version}' from tables '{alphauniprot}' and '{alphamap}':")
+accessions = {}
+for (columns, q) in accession_queries:
+    Time(1)
+    for (tax, *values) in Query(q):
+        row = accessions.setdefault(tax, dict.fromkeys(accession_columns, 0))
+        row.update(zip(columns, values))
+    print(f" >> {', '.join(columns)}")
+    Time(1)
+print(f" >> {Comma(len(accessions))} taxa")
+if len(accessions) == 0:
+    Die(f"Error: No UniProt accessions found in table '{alphauniprot}'")
+
+if not Switch('debug'):
+    print(f"\nUpdating accession columns in table '{alphacoverage}'...")
+    # In a single transaction, so readers never see a partial release
+    Query("START TRANSACTION")
+    Query(f"UPDATE {alphacoverage} SET version=NULL, " + ", ".join(f"{column}=0" for column in accession_columns))
+    taxa = sorted(accessions)
+    for i in range(0, len(taxa), 1000):
+        Query(Upsert(["version"] + accession_columns, {tax: [uniprot_version] + list(accessions[tax].values()) for tax in taxa[i:i + 1000]}))
+    Query("COMMIT")
+
+# Structure columns: rebuild from scratch and compare to the incrementally maintained values
+print(f"\nRebuilding structure columns from table '{alphasummary}' (taxa stored with the summaries)...")
+rebuilt = {}
+for (tax, *values) in Query(f"SELECT tax, COUNT(*), SUM(afdb=0), SUM(afdb=1), SUM(length), SUM(avg_plddt*length) FROM {alphasummary} WHERE length IS NOT NULL AND tax IS NOT NULL GROUP BY tax"):
+    rebuilt[tax] = (int(values[0]), int(values[1]), int(values[2]), int(values[3]), float(values[4]))
+stored = {}
+for (tax, *values) in Query(f"SELECT tax, {', '.join(coverage_columns)} FROM {alphacoverage}"):
+    stored[tax] = (int(values[0]), int(values[1]), int(values[2]), int(values[3]), float(values[4]))
+print(f" >> {Comma(len(rebuilt))} taxa with structures")
+
+mismatches = 0
+for tax in sorted(set(rebuilt) | set(stored)):
+    for column in Differs(stored.get(tax, (0, 0, 0, 0, 0.0)), rebuilt.get(tax, (0, 0, 0, 0, 0.0))):
+        Log(f"coverage column '{column}' differs from rebuild for tax", tax)
+        mismatches += 1
+print(f" >> {Comma(mismatches)} differences between table '{alphacoverage}' and rebuild")
+
+if Switch('rebuild') and not Switch('debug'):
+    print(f"\nReplacing structure columns in table '{alphacoverage}' with rebuild...")
+    Query("START TRANSACTION")
+    Query(f"UPDATE {alphacoverage} SET " + ", ".join(f"{column}=0" for column in coverage_columns))
+    taxa = sorted(rebuilt)
+    for i in range(0, len(taxa), 1000):
+        Query(Upsert(coverage_columns, {tax: rebuilt[tax] for tax in taxa[i:i + 1000]}))
+    Query("COMMIT")
+
+Show(lim=20)
+
+if not Switch('debug'):
+    Optimize(alphacoverage)
+
+Stoptime()
+print("\nDone!")
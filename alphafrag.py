@@ -13,15 +13,23 @@ Parse AlphaFold fragment sequences into SQL table 'alphafrag'.
 import tarfile
 import gzip
 import io
+import itertools
+import hashlib
+import multiprocessing
 # from Bio import SeqIO
 from blang_mysql import *
 from blang import *
+from mmcif import *
+from manifest import *
+from fragments import Fragments
 
 # SQL table with fragment protein sequences (>2700 aa proteins get split into 1400 aa fragments with a step size of 200 in AlphaFold DB, for human only - other species don't have results for >2700 aa proteins)
 alphafrag = "alphafrag"
 # SQL table with UniProt protein annotation and sequences
 # alphauniprot = "alphauniprot_backup_2024_05"
 alphauniprot = "alphauniprot"
+# Staging table for the accessions in an AlphaSync archive (see FetchCurrent)
+tmptable = "alphafrag_tmp_accs"
 
 # Paths
 alphasyncpath = "input/alphasync"
@@ -33,12 +41,169 @@ cifdir = "input/alphasync/cif"
 paedir = "input/alphasync/pae"
 paramdir = "input/alphasync/params"
 
-Args(0, f"\n -alphasync: Syncing: only parse updated fragments from AlphaSync TAR file in '{alphasyncpath}'\n -humanonly: Parse only human TAR file\n -debug: Don't actually make any changes, just simulate", " -humanonly")
+Args(0, f"\n -alphasync: Syncing: only parse updated fragments from AlphaSync TAR file in '{alphasyncpath}'\n -humanonly: Parse only human TAR file\n -concurrent: Parse multiple TAR archives concurrently (one archive per worker process) instead of parsing the members of one archive at a time in parallel\n -changes: Only show what changed since the last run (per TAR archive: new, changed, appended or unchanged according to table '{manifest}', and bytes that would be read), don't parse anything\n -rescan: Ignore table '{manifest}' and parse all TAR archives completely\n -debug: Don't actually make any changes, just simulate", " -humanonly")
+
+# Number of worker processes for decompressing and parsing .cif.gz members: cores allocated by LSF, or all cores when run directly
+workers = int(os.environ.get("LSB_DJOB_NUMPROC", os.cpu_count()))
+# Number of members read from an archive at a time (bounds memory use while the worker processes parse them)
+readahead = 2000
+# Number of parsed chunks (of readahead members) buffered per archive with -concurrent (bounds memory use while worker processes parse archives ahead of the writer)
+queuesize = 4
+# Number of rows per multi-row INSERT into table 'alphafrag'
+batchsize = 1000
 # if not Switch('debug'):
 #     Clear(alphafrag)
 
 
 
+# Functions
+
+def ReadMembers(tar, afdb):
+    """Stream live members of an open TAR archive (see manifest.LiveMembers) as (member name, compressed contents, afdb, byte offset after member) (reader)"""
+    for member in LiveMembers(tar):
+        data = b""
+        if member.isfile():
+            data = tar.extractfile(member).read()
+        yield (member.name, data, afdb, MemberEnd(member))
+
+def ParseMember(item):
+    """Decompress and parse a .cif.gz member (runs in worker processes). Returns (member name, byte offset after member, parsed fields, or None for skipped non-mmCIF members)."""
+    (membername, data, afdb, end) = item
+
+    # Skip .pdb (PDB) files
+    if rx(r"\.pdb\.gz$", membername):
+        return (membername, end, None)
+
+    if rx(r"\.json\.gz$", membername):
+        return (membername, end, None)
+
+    # Get only .cif.gz files
+    if not rx(r"\.cif\.gz$", membername):
+        # Non-mmCIF file
+        Die(f"Error: Unexpected non-PDB, non-mmCIF file: {membername}")
+
+    # Get accession (for handling fragments)
+    # AF-A0A009IHW8-F1-model_v2.cif.gz
+    m = rx(r"^AF-(\w+(-\d+)?)-F(\d+)-model_v\d+\.cif\.gz$", membername)
+    if m:
+        acc = m[0]
+        frag = int(m[2])
+    else:
+        Die(f"Couldn't parse '{membername}'")
+
+    # Open .cif.gz contents in text mode (decompressing while streaming, no temporary files)
+    cif = gzip.open(io.BytesIO(data), mode="rt")
+
+    ciffile = f"tmp/{membername}"
+    # Remove .gz from file name
+    ciffile = re.sub(r"\.gz$", "", ciffile)
+
+    # Parse mmCIF header (stops reading before the _atom_site coordinate loop, see mmcif.py)
+    (tmpacc, name, species, tax, fragstart, fragstop, seq) = ParseCifHeader(cif, acc, ciffile, afdb)
+
+    return (membername, end, (ciffile, acc, frag, tmpacc, name, species, tax, fragstart, fragstop, seq))
+
+def ParseArchive(infile, afdb, offset):
+    """Parse all members of a TAR archive (from a byte offset on, see manifest.py) in archive order, using the worker pool (producer/consumer: this process reads, worker processes decompress and parse)"""
+    with OpenArchive(infile, offset) as tar:
+        members = ReadMembers(tar, afdb)
+        while True:
+            chunk = list(itertools.islice(members, readahead))
+            if len(chunk) == 0:
+                break
+            # Pool.imap returns results in input (archive) order
+            yield from pool.imap(ParseMember, chunk, chunksize=64)
+
+def ParseArchiveSerial(item):
+    """Parse all members of a TAR archive (from a byte offset on, see manifest.py) in archive order within a single worker process (for -concurrent), putting them on a bounded queue in chunks of readahead members (followed by None)"""
+    (infile, afdb, offset, queue) = item
+    try:
+        with OpenArchive(infile, offset) as tar:
+            members = ReadMembers(tar, afdb)
+            while True:
+                chunk = [ParseMember(member) for member in itertools.islice(members, readahead)]
+                if len(chunk) == 0:
+                    break
+                # Blocks while the queue is full, i.e. until the writer catches up
+                queue.put(chunk)
+    finally:
+        queue.put(None)
+
+def QueuedResults(queue, task):
+    """Parsed members of an archive from a worker's queue (see ParseArchiveSerial), re-raising any error from the worker at the end"""
+    while True:
+        chunk = queue.get()
+        if chunk is None:
+            break
+        yield from chunk
+    task.get()
+
+def InsertRows(rows, replace=False):
+    """Bulk-insert queued fragment rows into table 'alphafrag' (single multi-row INSERT, or REPLACE for members appended to an archive, which might have been inserted by an interrupted run already) and clear the queue"""
+    if len(rows) == 0:
+        return
+    tmpinsert = "REPLACE" if replace else "INSERT"
+    q = f"{tmpinsert} INTO {alphafrag} (acc, name, species, tax, frag, fragstart, fragstop, source, afdb, seq) VALUES " + ", ".join(rows)
+    if not Switch('debug'):
+        Query(q)
+    else:
+        print(f"\n{q}")
+    rows.clear()
+
+def FragmentHashes(seq):
+    """MD5 hashes of a protein's fragment sequences after replacing non-standard amino acids (B/Z/U/X, as for AlphaSync predictions), fragmented as by alphasync.py (see fragments.py)"""
+    seq = ReplaceNonstandardAAs(seq)
+    return [hashlib.md5(seq[start:end].encode()).digest() for (start, end) in Fragments(seq)]
+
+def FetchCurrent(membernames):
+    """Get name, species, tax and fragment sequence hashes (see FragmentHashes) from table 'alphauniprot' for all accessions in an AlphaSync archive, using a single streamed join against a staging table of the accessions (instead of an IN list that grows with the archive)"""
+    accs = set()
+    for membername in membernames:
+        m = rx(r"^AF-(\w+(-\d+)?)-F\d+-model_v\d+\.cif\.gz$", membername)
+        if m:
+            accs.add(m[0])
+    current = {}
+    if len(accs) == 0:
+        return current
+    accs = nsort(accs)
+    Query(f"DROP TEMPORARY TABLE IF EXISTS {tmptable}")
+    Query(f"CREATE TEMPORARY TABLE {tmptable} (`acc` varchar(13) NOT NULL, PRIMARY KEY (`acc`)) ENGINE=InnoDB")
+    for i in range(0, len(accs), 10000):
+        Query(f"INSERT INTO {tmptable} (acc) VALUES " + ", ".join(f"('{acc}')" for acc in accs[i:i + 10000]))
+    query = Query(f"SELECT u.acc, u.name, u.species, u.tax, u.seq FROM {alphauniprot} u JOIN {tmptable} t ON t.acc=u.acc")
+    for (acc, name, species, tax, seq) in Fetch(query):
+        current[acc] = (name, species, tax, FragmentHashes(seq))
+    Query(f"DROP TEMPORARY TABLE {tmptable}")
+    return current
+
+def DeleteAlphaSyncFiles(accs):
+    """Delete all loose AlphaSync output files (/cif, /pae and /params) for a set of accessions (obsolete, or with updated sequences), listing each directory only once (returns number of files deleted)"""
+    deleted = 0
+    if len(accs) == 0:
+        return deleted
+    # e.g. for acc='Q96EY7-2':
+    # {cifdir}/AF-Q96EY7-2-F1-model_v0.cif.gz
+    # {paedir}/AF-Q96EY7-2-F1-predicted_aligned_error_v0.json.gz
+    # {paramdir}/AF-Q96EY7-2-F1-alphafold_params.json
+    for (path, pattern) in ((cifdir, r"^AF-(\w+(-\d+)?)-F\d+-model_v0\.cif\.gz$"), (paedir, r"^AF-(\w+(-\d+)?)-F\d+-predicted_aligned_error_v0\.json\.gz$"), (paramdir, r"^AF-(\w+(-\d+)?)-F\d+-alphafold_params\.json$")):
+        if not os.path.isdir(path):
+            continue
+        for file in os.listdir(path):
+            m = rx(pattern, file)
+            if m and m[0] in accs:
+                if not Switch('debug'):
+                    os.remove(f"{path}/{file}")
+                Log(f"deleted loose alphasync file for obsolete or updated acc", f"{path}/{file}")
+                deleted += 1
+    return deleted
+
+def Afdb(infile):
+    """Return afdb=0 for AlphaSync archives (not in the AlphaFold Protein Structure Database, predicted by AlphaSync instead), else afdb=1"""
+    if infile.startswith(alphasyncpath):
+        return 0
+    return 1
+
+
 
 # Start
 
@@ -74,8 +239,24 @@ else:
     #     print(file)
     # print()
 
+# Compare TAR archives to the manifest (table 'alphamanifest', see manifest.py): skip unchanged archives, and only parse new members of appended archives
+if not Switch('rescan'):
+    statuses = ArchiveStatuses(infiles, "alphafrag")
+else:
+    statuses = {infile: ("new", 0, 0) for infile in infiles}
+ManifestReport(statuses, "alphafrag")
+if Switch('changes'):
+    # Report only
+    Done()
+    sys.exit(0)
+for infile in infiles:
+    if statuses[infile][0] == "unchanged":
+        Log(f"skipped unchanged archive according to table '{manifest}'", infile)
+infiles = [infile for infile in infiles if statuses[infile][0] != "unchanged"]
+
 # If syncing (switch -alphasync active): first, clear AlphaSync fragments from table 'alphafrag'
-if Switch('alphasync'):
+# (unless the AlphaSync archive was parsed before, and has at most been appended to since)
+if Switch('alphasync') and any(statuses[infile][0] in ("new", "changed") for infile in infiles):
     print(f"\nClearing AlphaSync fragments from table '{alphafrag}'...")
     if not Switch('debug'):
         query = Query(f"DELETE FROM {alphafrag} WHERE afdb=0")
@@ -86,12 +267,22 @@ if Switch('alphasync'):
 
 # Main loop: Parse TAR files
 Starttime()
-for infile in infiles:
+pool = multiprocessing.get_context("fork").Pool(workers)
+if Switch('concurrent'):
+    # Parse multiple archives concurrently (one archive per worker process), writing them in archive order
+    # Workers parse ahead into bounded per-archive queues (rather than returning complete archives), so memory use doesn't grow with archive size
+    manager = multiprocessing.Manager()
+    queues = [manager.Queue(queuesize) for infile in infiles]
+    tasks = [pool.apply_async(ParseArchiveSerial, ((infile, Afdb(infile), statuses[infile][1], queue),)) for infile, queue in zip(infiles, queues)]
+    archive_results = (QueuedResults(queue, task) for queue, task in zip(queues, tasks))
+else:
+    # Parse one archive at a time, with its members parsed in parallel
+    archive_results = (ParseArchive(infile, Afdb(infile), statuses[infile][1]) for infile in infiles)
+totalrecords = 0
+totaltime = 0
+for infile, results in zip(infiles, archive_results):
 
-    afdb = 1
-    if infile.startswith(alphasyncpath):
-        # This structure isn't in the AlphaFold Protein Structure Database (it was predicted by AlphaSync instead!)
-        afdb = 0
+    afdb = Afdb(infile)
 
     if afdb == 1:
         print(f" >> {infile}")
@@ -100,239 +291,52 @@ for infile in infiles:
 
     # Format source file name (remove .tar, e.g. UP000000589_10090_MOUSE_v2.tar to UP000000589_10090_MOUSE_v2)
     source = re.sub(r"\.tar$", "", Basename(infile))
-    
-    # Open TAR file
-    tar = tarfile.open(infile, mode="r:")
-    acc = None
-    prevacc = None
-    maxfrag = 0
-    for member in tq(tar, total=int(Return(f"tar -tf {infile} | wc -l"))):
-        # print(f"   >> {member.name}")
-        
-        # Skip .pdb (PDB) files
-        if rx(r"\.pdb\.gz$", member.name):
-            Log("skipped pdb file", member.name)
-            continue
 
-        if rx(r"\.json\.gz$", member.name):
-            Log("skipped json file", member.name)
+    # Members already parsed in a previous run (appended archives: only parse members after this byte offset)
+    (status, offset, members) = statuses[infile]
+    if status in ("new", "changed"):
+        # Clear any rows from a previous (interrupted) run, or from the previous version of this archive
+        if not Switch('debug'):
+            query = Query(f"DELETE FROM {alphafrag} WHERE source='{source}'")
+            print(f"   >> {status} archive: {Numrows(query):,} existing rows deleted")
+    else:
+        print(f"   >> {status} archive: parsing members after byte offset {Comma(offset)} ({Comma(members)} members already parsed)")
+
+    t = time.perf_counter()
+    records = 0
+    rows = []
+    end = offset
+
+    # Get list of archive members (from the byte offset on)
+    membernames = ListMembers(infile, offset)
+
+    if afdb == 0:
+        # AlphaSync: Prefetch name, species, tax and fragment sequence hashes for all accessions in this archive from table 'alphauniprot' (a single query, instead of one query per structure)
+        current = FetchCurrent(membernames)
+        # Accessions that have since been made obsolete or had their sequence updated in UniProt (their loose output files get deleted at the end, in one pass)
+        obsolete = set()
+
+    for (membername, end, parsed) in tq(results, total=len(membernames)):
+
+        if parsed is None:
+            if rx(r"\.pdb\.gz$", membername):
+                Log("skipped pdb file", membername)
+            else:
+                Log("skipped json file", membername)
             continue
 
-        # Get only .cif.gz files
-        if not rx(r"\.cif\.gz$", member.name):
-            # Non-mmCIF file
-            # print(f"     >> non-cif, skipped")
-            # Log("skipped non-cif file", member.name)
-            Die(f"Error: Unexpected non-PDB, non-mmCIF file: {member.name}")
-            # continue
-            
-        # mmCIF file
-        # print(f"     >> OK")
-        
-        # if not rx("Q9Y4Z8", member.name):   # random example, 1 fragment
-        #     continue
-        # if not rx("A0A024RBG1", member.name):   # random example, 1 fragment
-        #     continue
-        # if not rx("A0A087WUL8", member.name):   # random example, 14 fragments
-        #     continue
-        # if not rx("A0A075B6H5", member.name):     # DSSP error
-        #     continue
-        # if not rx("-(A0A024RBG1|A0A087WUL8|A0A075B6H5)-", member.name):     # Skip everything but this test set
-        #     continue
-        
-        # Get accession (for handling fragments)
-        # AF-A0A009IHW8-F1-model_v2.cif.gz
-        m = rx(r"^AF-(\w+(-\d+)?)-F(\d+)-model_v\d+\.cif\.gz$", member.name)
-        if m:
-            acc = m[0]
-
-            frag = int(m[2])
-            if frag > maxfrag:
-                maxfrag = frag
-            # if frag > 1:
-            #     Die(f"Fragment is '{frag}' for acc '{acc}'")
-        else:
-            Die(f"Couldn't parse '{member.name}'")
-        
-        # Extract .cif.gz to .cif using gzip (streaming, no temporary files)
-        gz = tar.extractfile(member)
-        # Open extracted .cif in text mode (streaming, no temporary files)
-        cif = gzip.open(gz, mode="rt")
-
-        # # Write .cif to temporary file for DSSP
-        # os.mkdir(f"tmp/{acc}")
-        # Run("Make temporary directory for DSSP for this acc", f"mkdir -p tmp/{acc}", silent=True)
-        ciffile = f"tmp/{member.name}"
-        # Remove .gz from file name
-        ciffile = re.sub(r"\.gz$", "", ciffile)
-        # Store list of mmCIF files and DSSP files, so they can be deleted once all fragments are present
-        
-        # # Write to output file (diagnostic)
-        # with open(ciffile, "w") as cifout:
-        #     print(cif.read(), file=cifout)
-        # # Close
-        # cif.close()
-        # gz.close()
-        # # Reopen
-        # # Extract .cif.gz to .cif using gzip (streaming, no temporary files)
-        # gz = tar.extractfile(member)
-        # # Open extracted .cif in text mode (streaming, no temporary files)
-        # cif = gzip.open(gz, mode="rt")
-
-        # Parse mmCIF file (custom parsing, since Bio.SeqIO would require temporary files and be much slower)
-        tmpacc = None
-        name = None
-        species = None
-        tax = None
-        fragstart = None
-        fragstop = None
-        tmplen = None
-        seq = None
-        for line in cif:
-            # Parse line
-
-            # Parse annotation
-            if rx(r"^_ma_target_ref_db_details\.", line):
-                # _ma_target_ref_db_details.db_accession                 A0A087WUL8
-                # _ma_target_ref_db_details.db_code                      NBPFJ_HUMAN
-                # _ma_target_ref_db_details.db_name                      UNP
-                # _ma_target_ref_db_details.gene_name                    NBPF19
-                # _ma_target_ref_db_details.ncbi_taxonomy_id             9606
-                # _ma_target_ref_db_details.organism_scientific          "Homo sapiens"
-                # _ma_target_ref_db_details.seq_db_align_begin           201
-                # _ma_target_ref_db_details.seq_db_align_end             1600
-                # _ma_target_ref_db_details.seq_db_isoform               ?
-                # _ma_target_ref_db_details.seq_db_sequence_checksum     24A59AA23097CB90
-                # _ma_target_ref_db_details.seq_db_sequence_version_date 2014-10-29
-                # _ma_target_ref_db_details.target_entity_id             1
-                
-                # Accession
-                m = rx(r"^_ma_target_ref_db_details\.db_accession +(\w+)", line)
-                if m:
-                    tmpacc = m[0]
-                    # Verify that this is the correct UniProt accession (as expected from the file name)
-                    if tmpacc != acc:
-                        Die(f"Error: Expected UniProt accession '{acc}', but found '{tmpacc}' in '{ciffile}'")
-                else:
-                # Name (UniProt ID)
-                    m = rx(r"^_ma_target_ref_db_details.db_code +(\w+)", line)
-                    if m:
-                        name = m[0]
-                        # Parse species from e.g. NUD4B_HUMAN
-                        m = rx(r"[A-Z0-9]+_([A-Z0-9]+)", name)
-                        if m:
-                            species = m[0]
-                        else:
-                            Die(f"Error: Couldn't parse species from UniProt ID '{name}'")
-                    else:
-                # Taxonomy (NCBI ID)
-                        m = rx(r"^_ma_target_ref_db_details.ncbi_taxonomy_id +(\d+)", line)
-                        if m:
-                            tax = m[0]
-                        else:
-                # Start coordinate of this fragment
-                            m = rx(r"^_ma_target_ref_db_details.seq_db_align_begin +(\d+)", line)
-                            if m:
-                                fragstart = m[0]
-                # Stop coordinate of this fragment
-                            m = rx(r"^_ma_target_ref_db_details.seq_db_align_end +(\d+)", line)
-                            if m:
-                                fragstop = m[0]
-            
-            # Parse sequence from _entity_poly.pdbx_seq_one_letter_code_can lines
-            # Documentation:
-            # https://mmcif.wwpdb.org/dictionaries/mmcif_pdbx_v40.dic/Items/_entity_poly.pdbx_seq_one_letter_code_can.html (uses canonical residues as far as possible) (doesn't make any difference for AlphaFold, but should be the best choice for PDB structures as well)
-            # https://mmcif.wwpdb.org/dictionaries/mmcif_pdbx_v50.dic/Items/_entity_poly.pdbx_seq_one_letter_code.html
-            # https://mmcif.wwpdb.org/dictionaries/mmcif_pdbx_v40.dic/Items/_struct_ref.pdbx_seq_one_letter_code.html
-            # _entity_poly.pdbx_seq_one_letter_code_can 
-            # ;EDSLEECAITYSNSHGPYDSNQPHRKTKITFEEDKVDSTLIGSSSHVEWEDAVHIIPENESDDEEEEEKGPVSPRNLQES
-            # EEEEVPQESWDEGYSTLSIPPEMLASYQSYSSTFHSLEEQQVCMAVDIGRHRWDQVKKEDQEATGPRLSRELLDEKGPEV
-            # LQDSLDRCYSTPSGCLELTDSCQPYRSAFYVLEQQRVGLAIDMDEIEKYQEVEEDQDPSCPRLSRELLDEKEPEVLQDSL
-            # DRCYSIPSGYLELPDLGQPYSSAVYSLEEQYLGLALDVDRIKKDQEEEEDQDPPCPRLSRELVEVVEPEVLQDSLDRCYS
-            # TPSSCLEQPDSCQPYGSSFYALEEKHVGFSLDVGEIEKKGKGKKRRGRRSKKERRRGRKEGEEDQNPPCPRLSRELLDEK
-            # GPEVLQDSLDRCYSTPSGCLELTDSCQPYRSAFYILEQQCVGLAVDMDEIEKYQEVEEDQDPSCPRLSRELLDEKEPEVL
-            # QDSLDRCYSIPSGYLELPDLGQPYSSAVYSLEEQYLGLALDVDRIKKDQEEEEDQDPPCPRLSRELVEVVEPEVLQDSLD
-            # RCYSTPSSCLEQPDSCQPYGSSFYALEEKHVGFSLDVGEIEKKGKGKKRRGRRSKKERRRGRKEGEEDQNPPCPRLSREL
-            # LDEKGPEVLQDSLDRCYSTPSGCLELTDSCQPYRSAFYILEQQCVGLAIDMDEIEKYQEVEEDQDPSCPRLSRELLDEKE
-            # PEVLQDSLDRCYSIPSGYLELPDLGQPYSSAVYSLEEQYLGLALDVDRIKKDQEEEEDQDPPCPRLSRELVEVVEPEVLQ
-            # DSLDRCYSTPSSCLEQPDSCQPYGSSFYALEEKHVGFSLDVGEIEKKGKGKKRRGRRSKKERRRGRKEGEEDQNPPCPRL
-            # SRELLDEKGPEVLQDSLDRCYSTPSGCLELTDSCQPYRSAFYILEQQCVGLAVDMDEIEKYQEVEEDQDPSCPRLSRELL
-            # DEKEPEVLQDSLDRCYSIPSGYLELPDLGQPYSSAVYSLEEQYLGLALDVDRIKKDQEEEEDQDPPCPRLSRELVEVVEP
-            # EVLQDSLDRCYSTPSSCLEQPDSCQPYGSSFYALEEKHVGFSLDVGEIEKKGKGKKRRGRRSKKERRRGRKEGEEDQNPP
-            # CPRLSRELLDEKGPEVLQDSLDRCYSTPSGCLELTDSCQPYRSAFYILEQQCVGLAVDMDEIEKYQEVEEDQDPSCPRLS
-            # RELLDEKEPEVLQDSLDRCYSIPSGYLELPDLGQPYSSAVYSLEEQYLGLALDVDRIKKDQEEEEDQDPPCPRLSRELVE
-            # VVEPEVLQDSLDRCYSTPSSCLEQPDSCQPYGSSFYALEEKHVGFSLDVGEIEKKGKGKKRRGRRSKKERRRGRKEGEED
-            # QNPPCPRLSRELLDEKGPEVLQDSLDRCYSTPSGCLELTD
-            # ;
-            elif rx(r"^_entity_poly.pdbx_seq_one_letter_code_can +", line):
-
-                m = rx(r"^_entity_poly.pdbx_seq_one_letter_code_can +(\w+)$", line)
-                if m:
-                    # Single-line sequence:
-                    seq = m[0]
-                else:
-                    # Multi-line sequence:
-                    seq = ""
-
-                    # Parse entire sequence block
-                    for line in cif:
-
-                        # Break on closing semicolon
-                        if rx(r"^;$", line):
-                            break
-
-                        # Ignore initial semicolon
-                        m = rx(r"^;?([A-Z]+)$", line)
-                        if m:
-                            # Build complete sequence
-                            seq += m[0]
-                        else:
-                            Die(f"Error: Couldn't parse '_entity_poly.pdbx_seq_one_letter_code_can' line:\n\n'{line}'\n\n")
-
-            # AlphaSync structure (re-predicted using AlphaFold 2.3.2):
-            # Parse sequence from _entity_poly_seq.mon_id lines instead (three-letter code, can convert using ThreeToOne())
-            # Always one line per residue, terminated by #
-            # _entity_poly_seq.mon_id
-            # 0 1   MET 
-            # 0 2   GLY 
-            # 0 3   ARG 
-            # 0 4   VAL 
-            # 0 5   ARG 
-            # ...
-            # 0 270 GLN 
-            # 0 271 GLU 
-            # 0 272 GLN 
-            # #
-            elif afdb == 0 and rx(r"^_entity_poly_seq.mon_id$", line):
-                seq = ""
-
-                # Parse entire sequence block
-                for line in cif:
-
-                    # Break on #
-                    if rx(r"^#$", line):
-                        break
-
-                    # Ignore initial semicolon
-                    m = rx(r"^0 \d+ +([A-Z]{3}) +$", line)
-                    if m:
-                        # Build complete sequence
-                        seq += ThreeToOne(m[0])
-                    else:
-                        Die(f"Error: Couldn't parse '_entity_poly_seq.mon_id' line:\n\n'{line}'\n\n")
-                
+        (ciffile, acc, frag, tmpacc, name, species, tax, fragstart, fragstop, seq) = parsed
 
         Log("parsed cif file", ciffile)
 
         if afdb == 0:
-            # For AlphaSync, acc, name, species and tax will not be present in the .cif file. Need to retrieve these from alphauniprot.
-            query = Query(f"SELECT acc, name, species, tax, seq FROM {alphauniprot} WHERE acc='{acc}'")
-            if Numrows(query) == 0:
-                # Log(f"alphasync acc from alphasync .cif file no longer found in table 'alphauniprot' for acc (acc must have been made obsolete) (skipped)", acc)
-                Run(f"Delete all output files for obsolete acc '{acc}' (if they exist)", f"rm -fv {cifdir}/AF-{acc}-F*-model_v0.cif.gz {paedir}/AF-{acc}-F*-predicted_aligned_error_v0.json.gz {paramdir}/AF-{acc}-F*-alphafold_params.json")
+            # For AlphaSync, acc, name, species and tax will not be present in the .cif file. Need to retrieve these from alphauniprot (prefetched).
+            if acc not in current:
+                obsolete.add(acc)
                 Log(f"alphasync acc from alphasync .cif file no longer found in table 'alphauniprot' for acc (acc must have been made obsolete) (loose /cif, /pae and /params files deleted) (skipped)", acc)
                 continue
-            tmpacc, name, species, tax, tmpseq = FetchOne(query)
+            tmpacc = acc
+            name, species, tax, hashes = current[acc]
             # Calculate fragment start and stop coordinates from fragment number with step size 200
             fragstart = 1 + 200 * (frag - 1)
             fragstop = 1400 + 200 * (frag - 1)
@@ -340,19 +344,10 @@ for infile in infiles:
                 fragstop = len(seq)
             elif frag > 1 and len(seq) != 1400:
                 fragstop = fragstart + len(seq) - 1
-            tmpseq = tmpseq[fragstart-1:fragstop]
 
-            # Replace non-standard amino acids (B/Z/U/X) in sequence (for compatibility with AlphaFold)
-            tmpseq = ReplaceNonstandardAAs(tmpseq)
-            
-            if seq != tmpseq:
-                # Die(f"Error: Sequence mismatch for acc '{acc}' between table '{alphauniprot}' and AlphaSync .cif file '{ciffile}':\n\n{tmpseq}\n\n{seq}\n\n")
-                # Log(f"sequence mismatch between alphasync .cif file and table 'alphauniprot' for acc (sequence must have been updated) (skipped)", acc)
-                # Delete all files for this acc (if they exist): e.g. for acc='
-                # {cifdir}/AF-Q96EY7-2-F*-model_v0.cif.gz
-                # {paedir}/AF-Q96EY7-2-F*-predicted_aligned_error_v0.json.gz
-                # {paramdir}/AF-Q96EY7-2-F*-alphafold_params.json
-                Run(f"Delete all output files for acc with updated sequence '{acc}' (if they exist)", f"rm -fv {cifdir}/AF-{acc}-F*-model_v0.cif.gz {paedir}/AF-{acc}-F*-predicted_aligned_error_v0.json.gz {paramdir}/AF-{acc}-F*-alphafold_params.json")
+            # Compare to the fragment's sequence in table 'alphauniprot' (with non-standard amino acids (B/Z/U/X) replaced for compatibility with AlphaFold) via MD5 hashes
+            if frag > len(hashes) or hashlib.md5(seq.encode()).digest() != hashes[frag - 1]:
+                obsolete.add(acc)
                 Log(f"sequence mismatch between alphasync .cif file and table 'alphauniprot' for acc (sequence must have been updated) (loose /cif, /pae and /params files deleted) (skipped)", acc)
                 continue
 
@@ -381,12 +376,11 @@ for infile in infiles:
         if len(seq) != tmplen:
             Die(f"Error: Expected sequence of length '{tmplen}', but got '{len(seq)}' aa in mmCIF file '{ciffile}'")
             
-        # Insert fragment sequences into fragment SQL table
-        q = f"INSERT INTO {alphafrag} SET acc='{acc}', name='{name}', species='{species}', tax='{tax}', frag='{frag}', fragstart='{fragstart}', fragstop='{fragstop}', source='{source}', afdb={afdb}, seq='{seq}'"
-        if not Switch('debug'):
-            Query(q)
-        else:
-            print(f"\n{q}")
+        # Queue fragment sequence for bulk insertion into fragment SQL table (in archive order)
+        rows.append(f"('{acc}', '{name}', '{species}', '{tax}', '{frag}', '{fragstart}', '{fragstop}', '{source}', {afdb}, '{seq}')")
+        if len(rows) >= batchsize:
+            InsertRows(rows, replace=(offset > 0))
+        records += 1
 
         Log(f"successfully inserted into table '{alphafrag}' for acc", acc)
         Log(f"successfully inserted into table '{alphafrag}' for acc|frag", f"{acc}|{frag}")
@@ -398,9 +392,29 @@ for infile in infiles:
         Log(f"successfully inserted into table '{alphafrag}' for species|tax", f"{species}|{tax}")
         Log(f"successfully inserted into table '{alphafrag}' for source", source)
         Log(f"successfully inserted into table '{alphafrag}' for seq", seq)
-            
 
-        
+    # Insert remaining rows
+    InsertRows(rows, replace=(offset > 0))
+
+    # Record parsed members in the manifest
+    if not Switch('debug'):
+        UpdateManifest(infile, "alphafrag", end, members + len(membernames))
+
+    if afdb == 0:
+        # Delete all loose output files for obsolete accessions and accessions with updated sequences (one pass over each directory)
+        deleted = DeleteAlphaSyncFiles(obsolete)
+        print(f"   >> 1 query on table '{alphauniprot}' for {Comma(len(current))} accessions (instead of one query per structure), {Comma(len(obsolete))} obsolete or updated accessions skipped, {Comma(deleted)} loose files deleted")
+
+    elapsed = time.perf_counter() - t
+    totalrecords += records
+    totaltime += elapsed
+    print(f"   >> {Comma(records)} records in {elapsed:.1f} sec ({records / max(elapsed, 1e-9):,.0f} records/s)")
+
+pool.close()
+pool.join()
+
+print(f"\nParsed {Comma(totalrecords)} records in {totaltime:.1f} sec ({totalrecords / max(totaltime, 1e-9):,.0f} records/s)")
+
 Show(lim=20)
 
 if not Switch('debug'):
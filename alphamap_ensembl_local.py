@@ -16,6 +16,7 @@ import io
 # from Bio import SeqIO
 from blang_mysql import *
 from blang import *
+from seqmap import *
 
 type = "ensembl"
 
@@ -65,6 +66,12 @@ tax = {}
 for species, thistax in Fetch(Query(f"SELECT fullspecies, tax FROM ensembl_species")):
     tax[species] = thistax
 
+# Load all AlphaSync structures with their average pLDDT once, keyed by sequence hash (hash join, instead of one alphaseq/alphasa query per Ensembl sequence)
+State(f"Getting structures and their average pLDDT from tables '{alphaseq}' and '{alphasummary}' (keyed by sequence hash):")
+structures = StructureMap()
+State(f" >> {Comma(len(structures))} unique sequences")
+
+rows = []
 State(f"Filling table '{alphamap}' with mappings for Ensembl version '{version}' based on perfect sequence matching in table '{ensembl}':")
 for ensp, unispec, species, seq in Fetch(Query(f"SELECT ensp, species, LOWER(fullspecies), seq FROM {ensembl} ORDER BY species='human' DESC, fullspecies, ensp")):
 
@@ -83,12 +90,14 @@ for ensp, unispec, species, seq in Fetch(Query(f"SELECT ensp, species, LOWER(ful
     Log("total taxa", tax[species])
     Log("total sequences", seq)
 
-    # Get all alphaseq accs that have this exact sequence (we don't care about the species here)
-    query = Query(f"SELECT s.acc, s.afdb, AVG(a.plddt) AS avg_plddt FROM alphaseq s, alphasa a WHERE s.seq='{seq}' AND a.acc=s.acc AND a.afdb=s.afdb GROUP BY s.acc ORDER BY avg_plddt DESC, s.afdb ASC, s.acc")
-    if Numrows(query) == 0:
-        # Insert NULL mapping into alphamap
-        Query(f"INSERT INTO {alphamap} SET type='{type}', version='{version}', species='{species}', tax='{tax[species]}', value='{ensp}', map=NULL, afdb=NULL, avg_plddt=NULL, best=NULL")
+    # Get all alphaseq accs that have this exact sequence (we don't care about the species here), best first
+    matches = structures.get(SeqHash(seq), [])
+
+    # Queue mapping rows for table 'alphamap' (a NULL mapping if there are no matches)
+    rows.extend(MapRows(type, version, species, tax[species], ensp, matches))
+    InsertMapRows(rows)
 
+    if len(matches) == 0:
         Log("sequence not found in alphaseq for ensp (skipped)", ensp)
         Log("sequence not found in alphaseq for seq (skipped)", seq)
         # Check if sequence contains non-AA characters
@@ -96,12 +105,7 @@ for ensp, unispec, species, seq in Fetch(Query(f"SELECT ensp, species, LOWER(ful
             Log("sequence not found in alphaseq & contains non-AA characters for ensp (skipped)", ensp)
             Log("sequence not found in alphaseq & contains non-AA characters for seq (skipped)", seq)
         continue
-    best = 1
-    for alphacc, afdb, avg_plddt in query:
-
-        # Insert mapping into alphamap
-        Query(f"INSERT INTO {alphamap} SET type='{type}', version='{version}', species='{species}', tax='{tax[species]}', value='{ensp}', map='{alphacc}', afdb='{afdb}', avg_plddt='{avg_plddt}', best='{best}'")
-        best = 0
+    for alphacc, afdb, avg_plddt in matches:
 
         Log("successfully mapped for ensp|alphacc", f"{ensp}|{alphacc}")
         Log("successfully mapped for ensp", ensp)
@@ -117,6 +121,9 @@ for ensp, unispec, species, seq in Fetch(Query(f"SELECT ensp, species, LOWER(ful
             Log("successfully mapped to non-AFDB AlphaSync acc for species", species)
             Log("successfully mapped to non-AFDB AlphaSync acc for tax", tax[species])
 
+# Insert remaining rows
+InsertMapRows(rows, force=True)
+
 Show(lim=0, sort=True)
 
 State("Average number of AlphaFold DB structures per unique sequence: " + str(round(len(Get("successfully mapped for ensp|alphacc")) / len(Get("successfully mapped for ensp")), 2)))
@@ -16,6 +16,7 @@ import io
 # from Bio import SeqIO
 from blang_mysql import *
 from blang import *
+from seqmap import *
 
 type = "uniprot"
 
@@ -37,18 +38,26 @@ tax = {}
 for species, thistax in Fetch(Query(f"SELECT species, tax FROM unitax")):
     tax[species] = thistax
 
+# Load all AlphaSync structures with their average pLDDT once, keyed by sequence hash (hash join, instead of one alphaseq/alphasa query per UniProt sequence)
+State(f"Getting structures and their average pLDDT from tables '{alphaseq}' and '{alphasummary}' (keyed by sequence hash):")
+structures = StructureMap()
+State(f" >> {Comma(len(structures))} unique sequences")
+
+rows = []
 State(f"Filling table '{alphamap}' with type '{type}' mappings for UniProt version '{version}' based on perfect sequence matching in table '{uniseq}':")
 for acc, species, seq in Fetch(Query(f"SELECT acc, species, seq FROM {uniseq} WHERE type IN ('UniProt', 'UniIso') ORDER BY species='human' DESC, species, acc")):
     Log("total accs", acc)
     Log("total species", species)
     Log("total sequences", seq)
 
-    # Get all alphaseq accs that have this exact sequence (we don't care about the species here)
-    query = Query(f"SELECT s.acc, s.afdb, AVG(a.plddt) AS avg_plddt FROM alphaseq s, alphasa a WHERE s.seq='{seq}' AND a.acc=s.acc AND a.afdb=s.afdb GROUP BY s.acc ORDER BY avg_plddt DESC, s.afdb ASC, s.acc")
-    if Numrows(query) == 0:
-        # Insert NULL mapping into alphamap
-        Query(f"INSERT INTO {alphamap} SET type='{type}', version='{version}', species='{species}', tax='{tax[species]}', value='{acc}', map=NULL, afdb=NULL, avg_plddt=NULL, best=NULL")
+    # Get all alphaseq accs that have this exact sequence (we don't care about the species here), best first
+    matches = structures.get(SeqHash(seq), [])
+
+    # Queue mapping rows for table 'alphamap' (a NULL mapping if there are no matches)
+    rows.extend(MapRows(type, version, species, tax[species], acc, matches))
+    InsertMapRows(rows)
 
+    if len(matches) == 0:
         Log("sequence not found in alphaseq for acc (skipped)", acc)
         Log("sequence not found in alphaseq for seq (skipped)", seq)
         # Check if sequence contains non-AA characters
@@ -56,11 +65,7 @@ for acc, species, seq in Fetch(Query(f"SELECT acc, species, seq FROM {uniseq} WH
             Log("sequence not found in alphaseq & contains non-AA characters for acc (skipped)", acc)
             Log("sequence not found in alphaseq & contains non-AA characters for seq (skipped)", seq)
         continue
-    best = 1
-    for alphacc, afdb, avg_plddt in query:
-        # Insert mapping into alphamap
-        Query(f"INSERT INTO {alphamap} SET type='{type}', version='{version}', species='{species}', tax='{tax[species]}', value='{acc}', map='{alphacc}', afdb='{afdb}', avg_plddt='{avg_plddt}', best='{best}'")
-        best = 0
+    for alphacc, afdb, avg_plddt in matches:
 
         Log("successfully mapped for acc|alphacc", f"{acc}|{alphacc}")
         Log("successfully mapped for acc", acc)
@@ -76,6 +81,9 @@ for acc, species, seq in Fetch(Query(f"SELECT acc, species, seq FROM {uniseq} WH
             Log("successfully mapped to non-AFDB AlphaSync acc for species", species)
             Log("successfully mapped to non-AFDB AlphaSync acc for tax", tax[species])
 
+# Insert remaining rows
+InsertMapRows(rows, force=True)
+
 Show(lim=0, sort=True)
 
 State("Average number of AlphaFold DB structures per unique sequence: " + str(round(len(Get("successfully mapped for acc|alphacc")) / len(Get("successfully mapped for acc")), 2)))
@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 """
 Fills the 'membrane' column in table 'alphasa', flagging residues that, according to UniProt (table unifeat), are within 'transmembrane region' or 'intramembrane region' features.
+Feature intervals are matched to 'alphaseq' accessions by sequence and bulk-loaded into a staging table with a single INSERT ... SELECT, then applied with a single range-join UPDATE (instead of one UPDATE per feature and accession, see membrane.py).
 """
 
 # Initialize
@@ -11,14 +12,14 @@ Fills the 'membrane' column in table 'alphasa', flagging residues that, accordin
 # import matplotlib.pyplot as mp
 from blang_mysql import *
 from blang import *
-
-alphasa = "alphasa"
+from membrane import *
 
 # Args(0, "", "")
 # var = Args(1, "[species]", "human")
 # infile = f"input/input.txt"
 
 # Start
+Starttime()
 print(f"\nClearing 'membrane' column in table '{alphasa}'...")
 
 # # First, initialise column by setting it to NULL
@@ -30,27 +31,31 @@ print(f"\nFilling the 'membrane' column in table '{alphasa}', flagging residues
 
 # Cycle through all unifeat features that are 'transmembrane region' or 'intramembrane region'
 # for (acc, start, stop) in tq(Query(f"SELECT acc, start, stop FROM unifeat WHERE description IN ('transmembrane region', 'intramembrane region')")):
-for (uniacc, seq, start, stop) in tq(Query(f"SELECT f.acc, s.seq, f.start, f.stop FROM unifeat f, uniseq s WHERE f.type IN ('transmembrane region', 'intramembrane region') AND f.acc=s.acc AND s.type IN ('UniProt', 'UniIso')")):
-    Log("total membrane features for uniacc|start|stop", f"{uniacc}|{start}|{stop}")
-    Log("total uniaccs", uniacc)
-    Log("total sequences", seq)
-
-    # Get all alphaseq accs that have this exact sequence (we don't care about the species here)
-    for (acc,) in Query(f"SELECT DISTINCT acc FROM alphaseq WHERE seq='{seq}'"):
-        Log("total accs", acc)
-        
-        # Set membrane column in table 'alphasa' to 1 for each residue of this feature
-        Query(f"UPDATE {alphasa} SET membrane=1 WHERE acc='{acc}' AND site BETWEEN {start} AND {stop}")
-        Log("successfully set membrane column 1 for residues of acc", acc)
-
-        # TODO
-        # Ideally, this script would also set orthologous residues' membrane values to 0.
-        # For now, I can simply check what the status of the human PTM site is and assume it's the same for others.
-
-Show(lim=0)
+# for (uniacc, seq, start, stop) in tq(Query(f"SELECT f.acc, s.seq, f.start, f.stop FROM unifeat f, uniseq s WHERE f.type IN ('transmembrane region', 'intramembrane region') AND f.acc=s.acc AND s.type IN ('UniProt', 'UniIso')")):
+#     # Get all alphaseq accs that have this exact sequence (we don't care about the species here)
+#     for (acc,) in Query(f"SELECT DISTINCT acc FROM alphaseq WHERE seq='{seq}'"):
+#         # Set membrane column in table 'alphasa' to 1 for each residue of this feature
+#         Query(f"UPDATE {alphasa} SET membrane=1 WHERE acc='{acc}' AND site BETWEEN {start} AND {stop}")
+
+# Features
+(features, uniaccs, seqs) = FetchRow(Query(f"SELECT COUNT(DISTINCT f.acc, f.start, f.stop), COUNT(DISTINCT f.acc), COUNT(DISTINCT s.seq) FROM unifeat f, uniseq s WHERE f.type IN ('transmembrane region', 'intramembrane region') AND f.acc=s.acc AND s.type IN ('UniProt', 'UniIso')"))
+print(f" >> {Comma(features)} membrane features for {Comma(uniaccs)} UniProt accessions ({Comma(seqs)} distinct sequences)")
+
+# Bulk-load feature intervals for all alphaseq accs that have the feature's exact sequence into a staging table, and set membrane=1 for residues within them (see membrane.py)
+print(f"\nSetting membrane=1 for residues within feature intervals (staging table '{tmptable}') in table '{alphasa}'...")
+Time(1)
+(intervals, accs, changed) = AddMembrane()
+print(f" >> {Comma(intervals)} intervals for {Comma(accs)} accs")
+print(f" >> {Comma(changed)} rows changed")
+Time(1)
+
+# TODO
+# Ideally, this script would also set orthologous residues' membrane values to 0.
+# For now, I can simply check what the status of the human PTM site is and assume it's the same for others.
 
 print("\nCounting residues that have membrane=1...")
 affected = FetchOne(Query(f"SELECT COUNT(*) FROM {alphasa} WHERE membrane=1"))
 print(f"{Comma(affected)} rows affected")
 
+Stoptime()
 print("\nDone!")
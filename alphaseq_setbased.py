@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+alphaseq_setbased.py:
+Combine AlphaFold fragment sequences from SQL table 'alphafrag' into SQL table 'alphaseq' (set-based alternative to alphaseq.py, with the same switches and results).
+Fragments get stitched together inside the database (first 200 aa of each fragment, followed by the complete final fragment), and the -comparaonly filter is a join on sequence hashes instead of a Python set of all comparafasta_… sequences.
+The complete table is built in a temporary staging table first, verified, and then copied into 'alphaseq' with a single INSERT ... SELECT.
+"""
+
+# Initialize
+from blang_mysql import *
+from blang import *
+
+alphafrag = "alphafrag"     # SQL table with fragment protein sequences (>2700 aa proteins get split into 1400 aa fragments with a step size of 200 in AlphaFold DB, for human only - other species don't have results for >2700 aa proteins)
+alphaseq = "alphaseq"       # SQL table with complete protein sequences
+
+# Temporary staging tables
+tmptable = "alphaseq_tmp_new"
+tmpseqs = "alphaseq_tmp_wanted_seqs"
+tmptaxa = "alphaseq_tmp_wanted_taxa"
+
+# Fragment length and step size used by DeepMind.
+# Proteins longer than 2700 residues are split into windows of width 1400 with a step size of 200.
+fraglen = 1400
+fragstep = 200
+
+# GROUP_CONCAT result length limit for stitched sequences (the longest protein sequences are ~36,000 aa, see 'alphaseq')
+group_concat_max_len = 1048576
+
+Args(0, " \n -alphasync: Syncing: only refresh updated proteins from AlphaSync (those with afdb=0)\n -comparaonly: Only use proteins from the ~200 species contained in Ensembl Compara (specifically, the comparafasta_… tables, as well as all 'model organism' and 'global health proteomes' sequences from the AlphaFold Protein Structure Database)\n -debug: Don't actually make any changes, just simulate (build the staging table only)", " -comparaonly")
+
+tmpafdb = ""
+if Switch('alphasync'):
+    # Syncing (switch -alphasync active): only get AlphaSync re-predicted proteins
+    tmpafdb = " WHERE afdb=0"
+
+
+
+# Start
+Starttime()
+
+# Verify fragments: every acc needs fragments 1 to MAX(frag), and every acc|frag a single sequence across sources (alphaseq.py dies on these as well)
+print(f"\nVerifying fragments in table '{alphafrag}'...")
+query = Query(f"SELECT acc, MAX(frag) AS frags, COUNT(DISTINCT frag) AS distinctfrags FROM {alphafrag}{tmpafdb} GROUP BY acc HAVING frags!=distinctfrags LIMIT 1")
+if Numrows(query) > 0:
+    (acc, frags, distinctfrags) = FetchOne(query)
+    Die(f"Error: Expected {frags} fragments, but got {distinctfrags} for acc '{acc}'")
+query = Query(f"SELECT acc, frag, COUNT(DISTINCT seq) AS seqs FROM {alphafrag}{tmpafdb} GROUP BY acc, frag HAVING seqs>1 LIMIT 1")
+if Numrows(query) > 0:
+    (acc, frag, seqs) = FetchOne(query)
+    Die(f"Error: Expected a single sequence, but got {seqs} different sequences for fragment {frag} of acc '{acc}'")
+
+# Stitch fragment sequences together (set-based): first 200 aa of each fragment, followed by the complete final fragment
+print(f"\nGetting fragment sequences from table '{alphafrag}' and combining them into complete protein sequences in staging table '{tmptable}'...")
+Time(1)
+Query(f"SET SESSION group_concat_max_len={group_concat_max_len}")
+Query(f"CREATE TEMPORARY TABLE {tmptable} LIKE {alphaseq}")
+query = Query(f"""INSERT INTO {tmptable} (acc, name, species, tax, frags, afdb, seq)
+    SELECT f.acc, ANY_VALUE(f.name), ANY_VALUE(f.species), ANY_VALUE(f.tax), m.frags, m.afdb, GROUP_CONCAT(IF(f.frag < m.frags, LEFT(f.seq, {fragstep}), f.seq) ORDER BY f.frag SEPARATOR '')
+    FROM (SELECT acc, frag, ANY_VALUE(name) AS name, ANY_VALUE(species) AS species, ANY_VALUE(tax) AS tax, ANY_VALUE(seq) AS seq FROM {alphafrag}{tmpafdb} GROUP BY acc, frag) f
+    JOIN (SELECT acc, MAX(frag) AS frags, MIN(afdb) AS afdb FROM {alphafrag}{tmpafdb} GROUP BY acc) m ON m.acc=f.acc
+    GROUP BY f.acc""")
+print(f" >> {Comma(Numrows(query))} proteins")
+Time(1)
+
+# Verify that no stitched sequence hit the GROUP_CONCAT length limit (they would have been truncated)
+if FetchOne(Query(f"SELECT COUNT(*) FROM {tmptable} WHERE LENGTH(seq)>={group_concat_max_len}")) > 0:
+    Die(f"Error: Stitched sequences reached group_concat_max_len ({group_concat_max_len}) and would have been truncated")
+
+# Only sequences required for Ensembl Compara (plus all model organism and global health proteome sequences): join on sequence hashes
+if Switch('comparaonly'):
+
+    print(f"\nGetting set of wanted sequence hashes from comparafasta_… tables (excluding comparafasta itself, which contains all paralogs and lower-quality orthologs):")
+    Time(2)
+    Query(f"CREATE TEMPORARY TABLE {tmpseqs} (`hash` binary(16) NOT NULL, PRIMARY KEY (`hash`)) ENGINE=InnoDB")
+    for comparafasta in FetchList(Query("SHOW TABLES LIKE 'comparafasta\\_%'")):
+        query = Query(f"INSERT IGNORE INTO {tmpseqs} (hash) SELECT UNHEX(MD5(REPLACE(seq, '-', ''))) FROM {comparafasta}")
+        print(f" >> {comparafasta} >> {Comma(Numrows(query))} new sequences")
+    print(f" >> total {Comma(FetchOne(Query(f'SELECT COUNT(*) FROM {tmpseqs}')))} sequences (plus all model organism and global health proteome sequences)")
+    Time(2)
+
+    # Wanted taxa: Ensembl Compara species (complete=0), plus "Model organisms" and "Global health proteomes" from AlphaFold Protein Structure Database (complete=1, all of their sequences are wanted)
+    print(f"\nGetting set of wanted taxa from compara_species, and completely wanted taxa (model organisms and global health proteomes):")
+    Query(f"CREATE TEMPORARY TABLE {tmptaxa} (`tax` mediumint NOT NULL, `complete` tinyint NOT NULL, PRIMARY KEY (`tax`)) ENGINE=InnoDB")
+    Query(f"INSERT IGNORE INTO {tmptaxa} (tax, complete) SELECT DISTINCT tax, 0 FROM compara_species")
+    Query(f"INSERT INTO {tmptaxa} (tax, complete) SELECT DISTINCT tax, 1 FROM {alphafrag} WHERE source LIKE 'UP%' ON DUPLICATE KEY UPDATE complete=1")
+    print(f" >> {Comma(FetchOne(Query(f'SELECT COUNT(*) FROM {tmptaxa}')))} taxa ({Comma(FetchOne(Query(f'SELECT COUNT(*) FROM {tmptaxa} WHERE complete=1')))} completely wanted)")
+
+    # Remove unwanted sequences from staging table (anti-join)
+    query = Query(f"DELETE s FROM {tmptable} s LEFT JOIN {tmptaxa} t ON t.tax=s.tax LEFT JOIN {tmpseqs} w ON w.hash=UNHEX(MD5(s.seq)) WHERE t.tax IS NULL OR (t.complete=0 AND w.hash IS NULL)")
+    print(f" >> {Comma(Numrows(query))} unwanted proteins skipped")
+
+print(f" >> {Comma(FetchOne(Query(f'SELECT COUNT(*) FROM {tmptable}')))} proteins to insert into table '{alphaseq}'")
+
+# Replace table contents with staging table
+if not Switch('debug'):
+    if Switch('alphasync'):
+        # If syncing (switch -alphasync active): only clear AlphaSync fragments from table 'alphaseq'
+        print(f"\nClearing AlphaSync fragments from table '{alphaseq}'...")
+        query = Query(f"DELETE FROM {alphaseq} WHERE afdb=0")
+        print(f" >> {Comma(Numrows(query))} rows affected")
+    else:
+        # Clear entire table
+        Clear(alphaseq)
+
+    print(f"\nInserting proteins into table '{alphaseq}'...")
+    query = Query(f"INSERT INTO {alphaseq} SELECT * FROM {tmptable}")
+    print(f" >> {Comma(Numrows(query))} rows inserted")
+
+    Optimize(alphaseq)
+
+Stoptime()
+print("\nDone!")
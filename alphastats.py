@@ -2,6 +2,8 @@
 """
 alphastats.py:
 Fill AlphaSync table 'alphastats', a table containing precalculated statistics that are displayed on the AlphaSync website.
+All statistics for a table are computed in a single scan with grouped (conditional) aggregates, and per-taxon counts come from the incrementally maintained table 'alphacoverage' (see alphacoverage.py), so each source table is only read once.
+With -verify, every statistic is also recomputed from scratch using a separate query per statistic, and differences are reported.
 """
 
 # Initialize
@@ -12,181 +14,156 @@ Fill AlphaSync table 'alphastats', a table containing precalculated statistics t
 # import matplotlib.pyplot as mp
 from blang_mysql import *
 from blang import *
+from summary import *
 
 alphastats = "alphastats"
 
-# Args(0, "", "")
+Args(0, " \n -verify: Also recompute every statistic from scratch (one query per statistic, as before) and report differences\n -debug: Don't actually make any changes, just simulate", " -verify")
 # var = Args(1, "[species]", "human")
 # infile = f"input/input.txt"
 
-# Clear table
-Clear(alphastats)
-
 # Start
 
 uniprot_version = get_local_uniprot_release()
 ensembl_version = "108"
 
-# current_accs
-Starttime()
-print(f"\nGetting number of UniProt accessions successfully mapped to structures in table 'alphasync_compact.alphamap'...")
-current_accs = FetchOne(Query(f"SELECT COUNT(DISTINCT value) FROM alphasync_compact.alphamap WHERE type='uniprot' AND version='{uniprot_version}' AND map IS NOT NULL AND best=1"))
-print(f" >> current_accs {current_accs:,}")
-Query(f"INSERT INTO {alphastats} SET stat='current_accs', value='{current_accs}'")
-Stoptime()
-
-# current_accs_tax_[tax]
-Starttime()
-print(f"\nGetting number of UniProt accessions successfully mapped to structures in table 'alphasync_compact.alphamap' for individual completed taxa...")
-for tax, accs in Query(f"SELECT DISTINCT tax, COUNT(DISTINCT value) FROM alphasync_compact.alphamap WHERE type='uniprot' AND version='{uniprot_version}' AND map IS NOT NULL AND best=1 AND tax IN (SELECT DISTINCT tax FROM alphasync_compact.alphauniprot_species WHERE complete=1) GROUP BY tax"):
-    print(f" >> current_accs_tax_{tax} >> {accs:,}")
-    Query(f"INSERT INTO {alphastats} SET stat='current_accs_tax_{tax}', value='{accs}'")
-# for tax, in Fetch(Query(f"SELECT DISTINCT tax FROM alphamap WHERE type='uniprot' AND version='{uniprot_version}' AND map IS NOT NULL AND best=1")):
-#     acc_count = FetchOne(Query(f"SELECT COUNT(DISTINCT value) FROM alphamap WHERE type='uniprot' AND version='{uniprot_version}' AND map IS NOT NULL AND best=1 AND tax='{tax}'"))
-#     print(f" >> current_accs_{tax} {acc_count}")
-#     Query(f"INSERT INTO {alphastats} SET stat='current_accs_{tax}', value='{acc_count}'")
-Stoptime()
-
-# current_residues
-Starttime()
-print(f"\nGetting number of residues in table 'alphasync_compact.alphasa'...")
-# # Faster but slightly inaccurate due to afdb=1 and afdb=0 being present in some cases, but only afdb=0 being used
-# current_residues = FetchOne(Query(f"SELECT COUNT(*) FROM alphasync_compact.alphasa"))
-current_residues = FetchOne(Query(f"SELECT COUNT(*) FROM alphasync_compact.alphamap m, alphasync_compact.alphasa a WHERE m.type='uniprot' AND m.version='{uniprot_version}' AND m.map=a.acc AND m.afdb=a.afdb"))
-print(f" >> current_residues {current_residues:,}")
-Query(f"INSERT INTO {alphastats} SET stat='current_residues', value='{current_residues}'")
-Stoptime()
-
-# current_contacts
-Starttime()
-print(f"\nGetting number of contacts in table 'alphasync.alphacon'...")
-# # Faster but slightly inaccurate due to afdb=1 and afdb=0 being present in some cases, but only afdb=0 being used
-# current_contacts = FetchOne(Query(f"SELECT COUNT(*) FROM alphasync_compact.alphacon"))
-current_contacts = FetchOne(Query(f"SELECT COUNT(*) FROM alphasync_compact.alphamap m, alphasync.alphacon c WHERE m.type='uniprot' AND m.version='{uniprot_version}' AND m.map=c.acc AND m.afdb=c.afdb"))
-print(f" >> current_contacts {current_contacts:,}")
-Query(f"INSERT INTO {alphastats} SET stat='current_contacts', value='{current_contacts}'")
-Stoptime()
-
-# current_data
-Starttime()
-print(f"\nGetting total size of data in schema 'alphasync_compact' (also including 'alphasync.alphacon', which is only present as a view in 'alphasync_compact')...")
-total_gb = FetchOne(Query(f"SELECT SUM(t.total_gb) AS `total_GB` FROM (SELECT table_schema AS `db`, table_name AS `table`, table_rows/1000000000 AS `billion_rows`, table_rows AS `rows`, round(((data_length) / 1024 / 1024), 2) AS `data_mb`, round(((index_length) / 1024 / 1024), 2) AS `index_mb`, round(((data_length + index_length) / 1024 / 1024), 2) AS `total_mb`, round(((data_length) / 1024 / 1024 / 1024), 2) AS `data_gb`, round(((index_length) / 1024 / 1024 / 1024), 2) AS `index_gb`, round(((data_length + index_length) / 1024 / 1024 / 1024), 2) AS `total_gb` FROM information_schema.TABLES WHERE (table_schema='alphasync_compact' AND table_name LIKE 'alpha%') OR (table_schema='blang' AND table_name='alphacon')) AS t"))
-current_data = str(round(total_gb)) + " GB"
-print(f" >> current_data {current_data}")
-Query(f"INSERT INTO {alphastats} SET stat='current_data', value='{current_data}'")
-Stoptime()
-
-# ensembl_version
-Starttime()
-print(f"\nCurrent Ensembl version (Note: hardcoded here in alphastats.py):")
-print(f" >> ensembl_version {ensembl_version}")
-Query(f"INSERT INTO {alphastats} SET stat='ensembl_version', value='{ensembl_version}'")
-Stoptime()
-
-# current_predictions
-Starttime()
-print(f"\nGetting number of AlphaSync re-predicted structures (accessions) in table 'alphaseq'...")
-# current_predictions = FetchOne(Query(f"SELECT COUNT(DISTINCT acc) FROM alphaseq WHERE afdb=0"))
-current_predictions = FetchOne(Query(f"SELECT COUNT(DISTINCT map) FROM alphasync_compact.alphamap WHERE afdb=0"))
-print(f" >> current_predictions {current_predictions:,}")
-Query(f"INSERT INTO {alphastats} SET stat='current_predictions', value='{current_predictions}'")
-Stoptime()
-
-# current_predictions_frags
-Starttime()
-print(f"\nGetting number of AlphaSync re-predicted structures (accessions & fragments) in table 'alphaseq'...")
-current_predictions_frags = FetchOne(Query(f"SELECT COUNT(DISTINCT acc, frag) FROM alphafrag WHERE afdb=0"))
-print(f" >> current_predictions_frags {current_predictions_frags:,}")
-Query(f"INSERT INTO {alphastats} SET stat='current_predictions_frags', value='{current_predictions_frags}'")
-Stoptime()
+# Statistics: stat => value (written to table 'alphastats' in a single transaction at the end)
+stats = {}
 
-# current_predictions_nofrag
-Starttime()
-print(f"\nGetting number of AlphaSync re-predicted structures (accessions & fragments) in table 'alphaseq'...")
-current_predictions_nofrag = FetchOne(Query(f"SELECT COUNT(DISTINCT acc) FROM alphaseq WHERE afdb=0 AND frags=1"))
-print(f" >> current_predictions_nofrag {current_predictions_nofrag:,}")
-Query(f"INSERT INTO {alphastats} SET stat='current_predictions_nofrag', value='{current_predictions_nofrag}'")
-Stoptime()
+def Stat(stat, value):
+    """Record a statistic"""
+    stats[stat] = value
+    print(f" >> {stat} {value:,}" if isinstance(value, int) else f" >> {stat} {value}")
 
-# current_isoforms
-Starttime()
-print(f"\nGetting number of UniProt non-canonical isoforms successfully mapped to structures in table 'alphasync_compact.alphamap'...")
-current_isoforms = FetchOne(Query(f"SELECT COUNT(DISTINCT value) FROM alphasync_compact.alphamap WHERE type='uniprot' AND version='{uniprot_version}' AND map IS NOT NULL AND value REGEXP '-[0-9]+$'"))
-print(f" >> current_isoforms {current_isoforms:,}")
-Query(f"INSERT INTO {alphastats} SET stat='current_isoforms', value='{current_isoforms}'")
-Stoptime()
 
-# current_isoform_predictions
-Starttime()
-print(f"\nGetting number of AlphaSync re-predicted structures (accessions) for UniProt non-canonical isoforms in table 'alphaseq'...")
-current_isoform_predictions = FetchOne(Query(f"SELECT COUNT(DISTINCT acc) FROM alphaseq WHERE afdb=0 AND acc REGEXP '-[0-9]+$'"))
-print(f" >> current_isoform_predictions {current_isoform_predictions:,}")
-Query(f"INSERT INTO {alphastats} SET stat='current_isoform_predictions', value='{current_isoform_predictions}'")
-Stoptime()
-
-# current_isoform_predictions_frags
-Starttime()
-print(f"\nGetting number of AlphaSync re-predicted structures (accessions) for UniProt non-canonical isoforms in table 'alphaseq'...")
-current_isoform_predictions_frags = FetchOne(Query(f"SELECT COUNT(DISTINCT acc, frag) FROM alphafrag WHERE afdb=0 AND acc REGEXP '-[0-9]+$'"))
-print(f" >> current_isoform_predictions_frags {current_isoform_predictions_frags:,}")
-Query(f"INSERT INTO {alphastats} SET stat='current_isoform_predictions_frags', value='{current_isoform_predictions_frags}'")
-Stoptime()
 
-# current_species
+# alphamap: current_accs, current_isoforms, current_predictions (one scan)
 Starttime()
-print(f"\nGetting number of taxa (species) successfully mapped to structures in table 'alphasync_compact.alphamap'...")
-current_species = FetchOne(Query(f"SELECT COUNT(DISTINCT tax) FROM alphasync_compact.alphamap WHERE type='uniprot' AND version='{uniprot_version}' AND map IS NOT NULL"))
-print(f" >> current_species {current_species:,}")
-Query(f"INSERT INTO {alphastats} SET stat='current_species', value='{current_species}'")
+print(f"\nGetting numbers of UniProt accessions and non-canonical isoforms successfully mapped to structures, and of AlphaSync re-predicted structures, from table 'alphasync_compact.alphamap'...")
+mapped = f"type='uniprot' AND version='{uniprot_version}' AND map IS NOT NULL"
+(current_accs, current_isoforms, current_predictions) = FetchRow(Query(f"SELECT COUNT(DISTINCT IF({mapped} AND best=1, value, NULL)), COUNT(DISTINCT IF({mapped} AND value REGEXP '-[0-9]+$', value, NULL)), COUNT(DISTINCT IF(afdb=0, map, NULL)) FROM alphasync_compact.alphamap"))
+Stat("current_accs", current_accs)
+Stat("current_isoforms", current_isoforms)
+Stat("current_predictions", current_predictions)
 Stoptime()
 
-# current_species_completed
+# alphamap & alphasummary: current_residues, current_contacts (one scan)
 Starttime()
-# # Query to get the list of 39 fully finished, albeit ((au.reviewed=1 OR au.refprotcanon=1) AND acc=canon), taxa:
-# print("\nGetting list of completed taxa using table 'alphamap'...")
-# complete_taxa = FetchSet(Query(f"""SELECT DISTINCT t.mapped_tax FROM (SELECT *, mapped_tax IN (SELECT DISTINCT tax FROM alphafrag WHERE source IN (SELECT DISTINCT source FROM alphafrag HAVING source LIKE 'UP%')) AS is_model, mapped.mapped_seqs + unmapped.unmapped_seqs AS total_seqs, mapped.mapped_seqs / (mapped.mapped_seqs + unmapped.unmapped_seqs) AS mapped_fraction FROM
-# 	(SELECT au.tax AS mapped_tax, au.species AS mapped_species, COUNT(DISTINCT au.seq) AS mapped_seqs FROM alphauniprot au, alphamap m WHERE au.acc=m.value AND m.type='uniprot' AND m.version='{uniprot_version}' AND m.map IS NOT NULL AND best=1 GROUP BY au.tax) mapped
-#     LEFT OUTER JOIN
-#     (SELECT au.tax AS unmapped_tax, au.species AS unmapped_species, COUNT(DISTINCT au.seq) AS unmapped_seqs FROM alphauniprot au, alphamap m WHERE (au.reviewed=1 OR au.refprotcanon=1) AND acc=canon AND au.acc=m.value AND m.type='uniprot' AND m.version='{uniprot_version}' AND m.map IS NULL AND au.seq NOT REGEXP '[BZX]' AND LENGTH(au.seq)>=16 GROUP BY au.tax) unmapped
-#     ON mapped_tax=unmapped_tax
-# LEFT OUTER JOIN compara_species s ON s.tax=mapped_tax GROUP BY mapped_tax HAVING unmapped_seqs IS NULL AND is_model=1 ORDER BY s.id, mapped_fraction DESC) t ORDER BY t.mapped_seqs DESC;"""))
-# complete_taxa = FetchSet(Query(f"""SELECT DISTINCT t.mapped_tax FROM (SELECT *, mapped_tax IN (SELECT DISTINCT tax FROM alphafrag WHERE source IN (SELECT DISTINCT source FROM alphafrag HAVING source LIKE 'UP%')) AS is_model, mapped.mapped_seqs + unmapped.unmapped_seqs AS total_seqs, mapped.mapped_seqs / (mapped.mapped_seqs + unmapped.unmapped_seqs) AS mapped_fraction FROM
-# 	(SELECT au.tax AS mapped_tax, au.species AS mapped_species, COUNT(DISTINCT au.seq) AS mapped_seqs FROM alphauniprot au, alphamap m WHERE au.acc=m.value AND m.type='uniprot' AND m.version='{uniprot_version}' AND m.map IS NOT NULL AND best=1 GROUP BY au.tax) mapped
-#     LEFT OUTER JOIN
-#     (SELECT au.tax AS unmapped_tax, au.species AS unmapped_species, COUNT(DISTINCT au.seq) AS unmapped_seqs FROM alphauniprot au, alphamap m WHERE (au.reviewed=1 OR au.refprotcanon=1) AND acc=canon AND au.acc=m.value AND m.type='uniprot' AND m.version='{uniprot_version}' AND m.map IS NULL GROUP BY au.tax) unmapped
-#     ON mapped_tax=unmapped_tax
-# LEFT OUTER JOIN alphauniprot_species s ON s.tax=mapped_tax GROUP BY mapped_tax HAVING unmapped_seqs IS NULL AND is_model=1 ORDER BY s.id, mapped_fraction DESC) t ORDER BY t.mapped_seqs DESC;"""))
-print("\nGetting list of completed taxa from table 'alphauniprot_species'...")
-complete_taxa = FetchSet(Query(f"""SELECT DISTINCT tax FROM alphauniprot_species WHERE complete=1"""))
-print(f" >> current_species_completed {len(complete_taxa):,}")
-current_species_completed = len(complete_taxa)
-Query(f"INSERT INTO {alphastats} SET stat='current_species_completed', value='{current_species_completed}'")
-Stoptime()
-
-# current_species_completed_iso
-Starttime()
-print("\nGetting list of completed taxa (including isoforms) from table 'alphauniprot_species'...")
-complete_iso_taxa = FetchSet(Query(f"""SELECT DISTINCT tax FROM alphauniprot_species WHERE complete_iso=1"""))
-print(f" >> current_species_completed_iso {len(complete_iso_taxa):,}")
-current_species_completed_iso = len(complete_iso_taxa)
-Query(f"INSERT INTO {alphastats} SET stat='current_species_completed_iso', value='{current_species_completed_iso}'")
-Stoptime()
-
-# current_tablecount
-Starttime()
-print(f"\nGetting number of tables in schema 'alphasync_compact'...")
-current_tablecount = FetchOne(Query(f"SELECT COUNT(*) FROM information_schema.TABLES WHERE TABLE_SCHEMA='alphasync_compact' AND TABLE_NAME LIKE 'alpha%'"))
-print(f" >> current_tablecount {current_tablecount:,}")
-Query(f"INSERT INTO {alphastats} SET stat='current_tablecount', value='{current_tablecount}'")
-Stoptime()
-
-# uniprot_version
-Starttime()
-print(f"\nGetting local UniProt version...")
-# uniprot_version = get_local_uniprot_release()
-print(f" >> uniprot_version {uniprot_version}")
-Query(f"INSERT INTO {alphastats} SET stat='uniprot_version', value='{uniprot_version}'")
-Stoptime()
+print(f"\nGetting numbers of residues and contacts from table '{alphasummary}'...")
+# # Faster but slightly inaccurate due to afdb=1 and afdb=0 being present in some cases, but only afdb=0 being used
+# current_residues = FetchOne(Query(f"SELECT COUNT(*) FROM alphasync_compact.alphasa"))
+# current_residues = FetchOne(Query(f"SELECT COUNT(*) FROM alphasync_compact.alphamap m, alphasync_compact.alphasa a WHERE m.type='uniprot' AND m.version='{uniprot_version}' AND m.map=a.acc AND m.afdb=a.afdb"))
+# current_contacts = FetchOne(Query(f"SELECT COUNT(*) FROM alphasync_compact.alphacon"))
+# current_contacts = FetchOne(Query(f"SELECT COUNT(*) FROM alphasync_compact.alphamap m, alphasync.alphacon c WHERE m.type='uniprot' AND m.version='{uniprot_version}' AND m.map=c.acc AND m.afdb=c.afdb"))
+# Sums of precomputed per-structure residue and contact counts in table 'alphasummary' (instead of counting billions of 'alphasa' and 'alphacon' rows)
+(current_residues, current_contacts) = FetchRow(Query(f"SELECT SUM(s.length), SUM(s.contacts) FROM alphasync_compact.alphamap m, {alphasummary} s WHERE m.type='uniprot' AND m.version='{uniprot_version}' AND m.map=s.acc AND m.afdb=s.afdb"))
+Stat("current_residues", int(current_residues))
+Stat("current_contacts", int(current_contacts))
+Stoptime()
+
+# alphafrag: current_predictions_frags, current_isoform_predictions_frags (one scan)
+Starttime()
+print(f"\nGetting numbers of AlphaSync re-predicted structures (accessions & fragments, all and for UniProt non-canonical isoforms) in table 'alphafrag'...")
+# COUNT(DISTINCT a, b) skips rows where either is NULL
+(current_predictions_frags, current_isoform_predictions_frags) = FetchRow(Query(f"SELECT COUNT(DISTINCT acc, frag), COUNT(DISTINCT IF(acc REGEXP '-[0-9]+$', acc, NULL), frag) FROM alphafrag WHERE afdb=0"))
+Stat("current_predictions_frags", current_predictions_frags)
+Stat("current_isoform_predictions_frags", current_isoform_predictions_frags)
+Stoptime()
+
+# alphaseq: current_predictions_nofrag, current_isoform_predictions (one scan)
+Starttime()
+print(f"\nGetting numbers of AlphaSync re-predicted structures (unfragmented accessions, and accessions for UniProt non-canonical isoforms) in table 'alphaseq'...")
+(current_predictions_nofrag, current_isoform_predictions) = FetchRow(Query(f"SELECT COUNT(DISTINCT IF(frags=1, acc, NULL)), COUNT(DISTINCT IF(acc REGEXP '-[0-9]+$', acc, NULL)) FROM alphaseq WHERE afdb=0"))
+Stat("current_predictions_nofrag", current_predictions_nofrag)
+Stat("current_isoform_predictions", current_isoform_predictions)
+Stoptime()
+
+# alphauniprot_species: current_species_completed, current_species_completed_iso (one scan)
+Starttime()
+print("\nGetting numbers of completed taxa (without and with isoforms) from table 'alphauniprot_species'...")
+complete_taxa = set()
+complete_iso_taxa = set()
+for tax, complete, complete_iso in Query(f"SELECT tax, complete, complete_iso FROM alphauniprot_species WHERE complete=1 OR complete_iso=1"):
+    if complete == 1:
+        complete_taxa.add(tax)
+    if complete_iso == 1:
+        complete_iso_taxa.add(tax)
+Stat("current_species_completed", len(complete_taxa))
+Stat("current_species_completed_iso", len(complete_iso_taxa))
+Stoptime()
+
+# alphacoverage: current_accs_tax_[tax], current_species (one scan)
+Starttime()
+print(f"\nGetting numbers of UniProt accessions successfully mapped to structures for individual taxa from table '{alphacoverage}'...")
+# Precomputed per-taxon counts in table 'alphacoverage' (instead of grouping all of 'alphamap')
+# current_species: taxa with at least one accession mapped with best=1 (previously COUNT(DISTINCT tax) over all mapped rows in 'alphamap', which is the same set of taxa since every mapped accession has a best=1 row)
+current_species = 0
+for tax, accs in Query(f"SELECT tax, mapped_accs FROM {alphacoverage} WHERE version='{uniprot_version}' AND mapped_accs>0"):
+    current_species += 1
+    if tax in complete_taxa:
+        Stat(f"current_accs_tax_{tax}", accs)
+Stat("current_species", current_species)
+Stoptime()
+
+# information_schema: current_data, current_tablecount (one query)
+Starttime()
+print(f"\nGetting total size of data and number of tables in schema 'alphasync_compact' (also including 'alphasync.alphacon' in the size, which is only present as a view in 'alphasync_compact')...")
+(total_gb, current_tablecount) = FetchRow(Query(f"SELECT SUM(ROUND((data_length + index_length) / 1024 / 1024 / 1024, 2)), SUM(table_schema='alphasync_compact') FROM information_schema.TABLES WHERE (table_schema='alphasync_compact' AND table_name LIKE 'alpha%') OR (table_schema='blang' AND table_name='alphacon')"))
+Stat("current_data", str(round(total_gb)) + " GB")
+Stat("current_tablecount", int(current_tablecount))
+Stoptime()
+
+# ensembl_version, uniprot_version
+print(f"\nCurrent Ensembl version (Note: hardcoded here in alphastats.py) and local UniProt version:")
+Stat("ensembl_version", ensembl_version)
+Stat("uniprot_version", uniprot_version)
+
+
+
+# Verify: recompute every statistic from scratch, one query per statistic
+if Switch('verify'):
+    Starttime()
+    print(f"\nVerifying: Recomputing statistics from scratch (one query per statistic)...")
+    scratch = {}
+    scratch["current_accs"] = FetchOne(Query(f"SELECT COUNT(DISTINCT value) FROM alphasync_compact.alphamap WHERE type='uniprot' AND version='{uniprot_version}' AND map IS NOT NULL AND best=1"))
+    for tax, accs in Query(f"SELECT tax, COUNT(DISTINCT value) FROM alphasync_compact.alphamap WHERE type='uniprot' AND version='{uniprot_version}' AND map IS NOT NULL AND best=1 AND tax IN (SELECT DISTINCT tax FROM alphasync_compact.alphauniprot_species WHERE complete=1) GROUP BY tax"):
+        scratch[f"current_accs_tax_{tax}"] = accs
+    # Count the actual residue and contact rows (instead of summing the per-structure counts in table 'alphasummary', which is what's being verified)
+    scratch["current_residues"] = FetchOne(Query(f"SELECT COUNT(*) FROM alphasync_compact.alphamap m, alphasync_compact.alphasa a WHERE m.type='uniprot' AND m.version='{uniprot_version}' AND m.map=a.acc AND m.afdb=a.afdb"))
+    scratch["current_contacts"] = FetchOne(Query(f"SELECT COUNT(*) FROM alphasync_compact.alphamap m, alphasync.alphacon c WHERE m.type='uniprot' AND m.version='{uniprot_version}' AND m.map=c.acc AND m.afdb=c.afdb"))
+    scratch["current_data"] = str(round(FetchOne(Query(f"SELECT SUM(ROUND((data_length + index_length) / 1024 / 1024 / 1024, 2)) FROM information_schema.TABLES WHERE (table_schema='alphasync_compact' AND table_name LIKE 'alpha%') OR (table_schema='blang' AND table_name='alphacon')")))) + " GB"
+    scratch["ensembl_version"] = ensembl_version
+    scratch["current_predictions"] = FetchOne(Query(f"SELECT COUNT(DISTINCT map) FROM alphasync_compact.alphamap WHERE afdb=0"))
+    scratch["current_predictions_frags"] = FetchOne(Query(f"SELECT COUNT(DISTINCT acc, frag) FROM alphafrag WHERE afdb=0"))
+    scratch["current_predictions_nofrag"] = FetchOne(Query(f"SELECT COUNT(DISTINCT acc) FROM alphaseq WHERE afdb=0 AND frags=1"))
+    scratch["current_isoforms"] = FetchOne(Query(f"SELECT COUNT(DISTINCT value) FROM alphasync_compact.alphamap WHERE type='uniprot' AND version='{uniprot_version}' AND map IS NOT NULL AND value REGEXP '-[0-9]+$'"))
+    scratch["current_isoform_predictions"] = FetchOne(Query(f"SELECT COUNT(DISTINCT acc) FROM alphaseq WHERE afdb=0 AND acc REGEXP '-[0-9]+$'"))
+    scratch["current_isoform_predictions_frags"] = FetchOne(Query(f"SELECT COUNT(DISTINCT acc, frag) FROM alphafrag WHERE afdb=0 AND acc REGEXP '-[0-9]+$'"))
+    # Note: Table 'alphacoverage' only counts best=1 mappings (mapped_accs), so current_species is the number of taxa with at least one best=1 mapping (the same taxa as any mapping, since every mapped accession has a best=1 row)
+    scratch["current_species"] = FetchOne(Query(f"SELECT COUNT(DISTINCT tax) FROM alphasync_compact.alphamap WHERE type='uniprot' AND version='{uniprot_version}' AND map IS NOT NULL AND best=1"))
+    scratch["current_species_completed"] = len(FetchSet(Query(f"SELECT DISTINCT tax FROM alphauniprot_species WHERE complete=1")))
+    scratch["current_species_completed_iso"] = len(FetchSet(Query(f"SELECT DISTINCT tax FROM alphauniprot_species WHERE complete_iso=1")))
+    scratch["current_tablecount"] = FetchOne(Query(f"SELECT COUNT(*) FROM information_schema.TABLES WHERE TABLE_SCHEMA='alphasync_compact' AND TABLE_NAME LIKE 'alpha%'"))
+    scratch["uniprot_version"] = uniprot_version
+
+    differences = 0
+    for stat in sorted(set(stats) | set(scratch)):
+        if str(stats.get(stat)) != str(scratch.get(stat)):
+            print(f" >> {stat}: {stats.get(stat)} (single pass) vs. {scratch.get(stat)} (from scratch)")
+            Log("statistic differs from recomputation from scratch for stat", stat)
+            differences += 1
+    print(f" >> {Comma(differences)} differences")
+    Stoptime()
+
+
+
+# Write all statistics in a single transaction (so the website never sees an empty or partial table)
+if not Switch('debug'):
+    print(f"\nWriting {Comma(len(stats))} statistics to table '{alphastats}'...")
+    Query("START TRANSACTION")
+    Query(f"DELETE FROM {alphastats}")
+    Query(f"INSERT INTO {alphastats} (stat, value) VALUES " + ", ".join(f"('{stat}', '{value}')" for stat, value in stats.items()))
+    Query("COMMIT")
 
 Show(lim=0)
 
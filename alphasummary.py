@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+alphasummary.py:
+Backfill SQL table 'alphasummary' (per-structure summaries: length, mean/median pLDDT, fraction disordered, fraction surface, contact count, PAE availability) from tables 'alphasa' and 'alphacon', or check it against them (-check).
+The job scripts (job_dssp.py, job_lahuta.py, alphacon_add_pae.py) keep the table up to date as structures are finished, so this only needs to run once for structures that existed before, and for checking.
+Structures are read in batches of accessions (one 'alphasa' and one grouped 'alphacon' query per batch) and summarised using the same functions as the job scripts (summary.py).
+"""
+
+# Initialize
+from blang_mysql import *
+from blang import *
+from summary import *
+
+alphaseq = "alphaseq"       # SQL table with complete protein sequences (the set of structures)
+alphasa = "alphasa"         # SQL table with residue-level accessible surface area values from DSSP
+alphacon = "alphacon"       # SQL table with residue-level contacts from Lahuta
+
+# Number of structures per batch
+batchsize = 1000
+
+# Tolerance for comparing float columns (stored as single-precision floats)
+tolerance = 0.001
+
+Args(0, " \n -all: Recompute summaries for all structures (default: only structures whose summary is missing or incomplete)\n -check: Don't make any changes, compare table 'alphasummary' to summaries recomputed from 'alphasa' and 'alphacon' for all structures instead\n -debug: Don't actually make any changes, just simulate", " -check")
+
+if Switch('check'):
+    SetSwitch('all')
+    SetSwitch('debug')
+
+
+
+def Summaries(batch):
+    """Recompute summaries for a batch of structures [(acc, afdb, nocon)] from tables 'alphasa' and 'alphacon' (returns {(acc, afdb): {column: value}})"""
+    tmpin = ", ".join(f"('{acc}', '{afdb}')" for (acc, afdb, nocon) in batch)
+
+    # Residues
+    residues = {}
+    for (acc, afdb, plddt, dis10, surf) in Query(f"SELECT acc, afdb, plddt, dis10, surf FROM {alphasa} WHERE (acc, afdb) IN ({tmpin}) ORDER BY acc, afdb, site"):
+        (plddts, dis, surfs) = residues.setdefault((acc, int(afdb)), ([], [], []))
+        plddts.append(plddt)
+        dis.append(dis10)
+        surfs.append(surf)
+
+    # Contacts (and how many of them have PAE scores)
+    contacts = {}
+    for (acc, afdb, count, paes) in Query(f"SELECT acc, afdb, COUNT(*), COUNT(pae) FROM {alphacon} WHERE (acc, afdb) IN ({tmpin}) GROUP BY acc, afdb"):
+        contacts[(acc, int(afdb))] = (count, paes)
+
+    summaries = {}
+    for (acc, afdb, nocon) in batch:
+        values = dict.fromkeys(residue_columns + contact_columns)
+        if (acc, afdb) in residues:
+            values.update(ResidueSummary(*residues[(acc, afdb)]))
+        if (acc, afdb) in contacts:
+            values.update(ContactSummary(*contacts[(acc, afdb)]))
+        elif nocon == 1:
+            # Lahuta has run, but found no contacts
+            values.update(ContactSummary(0, 0))
+        # Skip structures that haven't been processed at all yet
+        if any(value is not None for value in values.values()):
+            summaries[(acc, afdb)] = values
+    return summaries
+
+def Differs(stored, values):
+    """Columns that differ between a stored summary and a recomputed one"""
+    differs = []
+    for column, value in values.items():
+        if stored[column] is None or value is None:
+            if stored[column] != value:
+                differs.append(column)
+        elif abs(stored[column] - value) > tolerance:
+            differs.append(column)
+    return differs
+
+
+
+# Start
+Starttime()
+
+print(f"\nGetting structures from table '{alphaseq}'...")
+structures = []
+taxa = {}
+for (acc, afdb, nocon, tax) in Query(f"SELECT acc, afdb, nocon, tax FROM {alphaseq}"):
+    structures.append((acc, afdb, nocon))
+    taxa[(acc, afdb)] = tax
+structures.sort()
+print(f" >> {Comma(len(structures))} structures")
+
+print(f"\nGetting existing summaries from table '{alphasummary}'...")
+stored = {}
+for (acc, afdb, *values) in Query(f"SELECT acc, afdb, {', '.join(residue_columns + contact_columns)} FROM {alphasummary}"):
+    stored[(acc, afdb)] = dict(zip(residue_columns + contact_columns, values))
+print(f" >> {Comma(len(stored))} summaries")
+
+# Taxa stored with the summaries (used to subtract structures from table 'alphacoverage', even once their 'alphaseq' rows are gone): fill in missing ones (e.g. for summaries from before the 'tax' column existed), and check that they match table 'alphaseq'
+if Switch('check'):
+    taxmismatches = FetchOne(Query(f"SELECT COUNT(*) FROM {alphasummary} s JOIN {alphaseq} q ON q.acc=s.acc AND q.afdb=s.afdb WHERE NOT s.tax<=>q.tax"))
+    print(f" >> {Comma(taxmismatches)} summaries whose taxon differs from table '{alphaseq}'")
+else:
+    taxmismatches = 0
+    if not Switch('debug'):
+        query = Query(f"UPDATE {alphasummary} s JOIN {alphaseq} q ON q.acc=s.acc AND q.afdb=s.afdb SET s.tax=q.tax WHERE s.tax IS NULL AND q.tax IS NOT NULL")
+        print(f" >> Filled in missing taxa for {Comma(Numrows(query))} summaries")
+
+# Summaries for structures that are no longer in table 'alphaseq'
+orphans = set(stored) - set((acc, afdb) for (acc, afdb, nocon) in structures)
+print(f" >> {Comma(len(orphans))} summaries for structures no longer in table '{alphaseq}'")
+for (acc, afdb) in sorted(orphans):
+    Log(f"summary without structure in table '{alphaseq}' for acc|afdb", f"{acc}|{afdb}")
+    if not Switch('debug'):
+        DeleteSummaries([acc], afdb)
+
+if not Switch('all'):
+    # Only structures whose summary is missing, or doesn't have residue or contact values yet
+    structures = [(acc, afdb, nocon) for (acc, afdb, nocon) in structures if (acc, afdb) not in stored or stored[(acc, afdb)]["length"] is None or stored[(acc, afdb)]["contacts"] is None]
+print(f" >> {Comma(len(structures))} structures to {'check' if Switch('check') else 'summarise'}")
+
+batches = [structures[i:i + batchsize] for i in range(0, len(structures), batchsize)]
+print(f"\nRecomputing summaries from tables '{alphasa}' and '{alphacon}' ({Comma(len(batches))} batches of up to {Comma(batchsize)} structures):")
+written = 0
+mismatches = 0
+for batch in tq(batches):
+    summaries = Summaries(batch)
+
+    if Switch('check'):
+        for (acc, afdb) in sorted(summaries):
+            if (acc, afdb) not in stored:
+                Log(f"summary missing from table '{alphasummary}' for acc|afdb", f"{acc}|{afdb}")
+                mismatches += 1
+                continue
+            for column in Differs(stored[(acc, afdb)], summaries[(acc, afdb)]):
+                Log(f"summary column '{column}' differs from tables '{alphasa}'/'{alphacon}' for acc|afdb", f"{acc}|{afdb}")
+                mismatches += 1
+        for (acc, afdb, nocon) in batch:
+            if (acc, afdb) in stored and (acc, afdb) not in summaries:
+                Log(f"summary for unprocessed structure (no rows in tables '{alphasa}'/'{alphacon}') for acc|afdb", f"{acc}|{afdb}")
+                mismatches += 1
+        continue
+
+    if len(summaries) == 0:
+        continue
+    q = f"REPLACE INTO {alphasummary} (acc, afdb, tax, {', '.join(residue_columns + contact_columns)}) VALUES " + ", ".join(f"('{acc}', '{afdb}', {SummaryValue(taxa[(acc, afdb)])}, " + ", ".join(SummaryValue(value) for value in values.values()) + ")" for (acc, afdb), values in summaries.items())
+    if not Switch('debug'):
+        # Replace these structures' contributions to their taxa's coverage in table 'alphacoverage' as well (in the same transaction)
+        Query("START TRANSACTION")
+        try:
+            Query(CoverageQuery(list(summaries), -1))
+            Query(q)
+            Query(CoverageQuery(list(summaries), 1))
+        except BaseException:
+            Query("ROLLBACK")
+            raise
+        Query("COMMIT")
+    written += len(summaries)
+
+Show(lim=20)
+
+if Switch('check'):
+    print(f"\nInconsistencies: {Comma(mismatches + len(orphans) + taxmismatches)}")
+else:
+    print(f"\nSummaries written: {Comma(written)}")
+    if not Switch('debug'):
+        Optimize(alphasummary)
+
+Stoptime()
+print("\nDone!")
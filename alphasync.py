@@ -14,6 +14,7 @@ Uses sequence sources such as the current 'alphauniprot' table, obtained from Un
 # import matplotlib.pyplot as mp
 from blang_mysql import *
 from blang import *
+from fragments import Fragments
 
 # Set SQL table names to use
 alphamap = "alphamap"
@@ -472,17 +473,8 @@ for value, seq in Fetch(Query(q)):
 
     
     
-    # Get number of fragments (maxfrag)
-    if len(seq) <= 2699:
-        frag = 1
-    else:
-        frag = 1
-        for start in range(0, len(seq), 200):
-            end = min(start + 1400, len(seq))
-            if end == len(seq):
-                break
-            frag += 1
-    maxfrag = frag
+    # Get number of fragments (maxfrag) (see fragments.py)
+    maxfrag = len(Fragments(seq))
 
 
 
@@ -507,7 +499,7 @@ for value, seq in Fetch(Query(q)):
     # Write FASTA files (fragmented if >= 2700 aa, into fragments of 1400 aa with a step size of 200 aa)
     # (AlphaFold DB maximum is 2699: SELECT MIN(LENGTH(seq)), MAX(LENGTH(seq)) FROM alphafrag WHERE afdb=1;)
     frag = 1
-    if len(seq) <= 2699:
+    if maxfrag == 1:
 
         Log("total acc|frags", f"{value}|{frag}")
 
@@ -561,9 +553,8 @@ for value, seq in Fetch(Query(q)):
         # Log("total fragment sequences", fragseq)
 
     else:
-        for start in range(0, len(seq), 200):
+        for (start, end) in Fragments(seq):
 
-            end = min(start + 1400, len(seq))
             # if f"{value}_F{frag}" == "Q23551_F7" or f"{value}_F{frag}" == "Q9N533_F1":
             #     d()
 
@@ -2,6 +2,8 @@
 """
 alphamap_uniprot_cleanup.py:
 Removes AlphaSync prediction (CIF, PAE and params files) that are no longer necessary since there are better structures available for their sequences.
+Obsolete structures are loaded into a staging table and deleted from each table with keyed DELETE ... JOIN statements, chunked by accession (the leading primary key column) to bound lock and undo size.
+Output files are found with a single listing of each directory and removed with os.unlink in a thread pool. With -debug, only a dry-run report is shown (files and bytes, and rows per table that would be deleted).
 """
 
 # Initialize
@@ -13,11 +15,15 @@ import pandas as pd
 import tarfile
 import gzip
 import io
+import os
+import re
 import requests
 import json
+from concurrent.futures import ThreadPoolExecutor
 # from Bio import SeqIO
 from blang_mysql import *
 from blang import *
+from summary import *
 
 # type = "alphauniprot"
 type = "uniprot"
@@ -28,13 +34,39 @@ alphafrag = "alphafrag"
 alphaseq = "alphaseq"
 alphasa = "alphasa"
 alphacon = "alphacon"
+tmptable = "alphasync_tmp_cleanup"      # Staging table for obsolete structures (acc, afdb)
 
 # Paths for deleting outdated AlphaSync structure predictions (where an accession has since been made obsolete, or a sequence was changed, in UniProt)
 cifdir = "input/alphasync/cif"
 paedir = "input/alphasync/pae"
 paramdir = "input/alphasync/params"
+# Output file names per directory (the accession can contain '-' for isoforms, e.g. AF-P12345-2-F1-model_v0.cif.gz)
+outfiles = {
+    cifdir: re.compile(r"^AF-(.+)-F\d+-model_v0\.cif\.gz$"),
+    paedir: re.compile(r"^AF-(.+)-F\d+-predicted_aligned_error_v0\.json\.gz$"),
+    paramdir: re.compile(r"^AF-(.+)-F\d+-alphafold_params\.json$"),
+}
 
-(version) = Args(1, "[Current UniProt version]\n -debug: Don't actually make any changes, just simulate", "2025_01")
+# Number of parallel os.unlink calls
+workers = 16
+# Number of accessions per staging table INSERT
+batchsize = 10000
+# Number of accessions per DELETE (alphacon has thousands of rows per structure, so this bounds each statement to a few hundred thousand rows)
+chunksize = 100
+
+
+
+def Unlink(file):
+    """Remove a file, like 'rm -f' (returns False if it was already gone)"""
+    try:
+        os.unlink(file)
+        return True
+    except FileNotFoundError:
+        return False
+
+
+
+(version) = Args(1, "[Current UniProt version]\n -debug: Don't actually make any changes, just show a dry-run report", "2025_01")
 print()
 
 # Get AFDB=0 accessions in alphaseq
@@ -48,69 +80,103 @@ alphamap_afdb0 = FetchSet(Query(f"SELECT DISTINCT map FROM {alphamap} WHERE type
 print(f"   >> {len(alphamap_afdb0):,}")
 
 print(f" >> unnecessary structures (alphaseq afdb=0 accessions that are not mapped to in alphamap):")
-unnecessary_structures = alphaseq_afdb0 - alphamap_afdb0
+unnecessary_structures = sorted(alphaseq_afdb0 - alphamap_afdb0)
 print(f"   >> {len(unnecessary_structures):,}")
 
+
+
+# Output files: list each directory once and match accessions (instead of one 'rm' process per accession)
 print()
-print("Deleting unnecessary structure CIF/PAE/params output files:")
-for acc in tq(unnecessary_structures):
-    if not Switch('debug'):
-
-        # Delete output files (CIF/PAE/params)
-        Run(f"Delete all output files for obsolete acc '{acc}' (if they exist)", f"rm -fv {cifdir}/AF-{acc}-F*-model_v0.cif.gz {paedir}/AF-{acc}-F*-predicted_aligned_error_v0.json.gz {paramdir}/AF-{acc}-F*-alphafold_params.json")
-        Log(f"obsolete CIF/PAE/params files deleted for acc", acc)
-
-        # First, check if there are any best=1 mappings for this acc in table 'alphamap' (there shouldn't be)
-        query = Query(f"SELECT * FROM {alphamap} WHERE type='{type}' AND version='{version}' AND afdb=0 AND map='{acc}' AND best=1")
-        if Numrows(query) > 0:
-            Die(f"Error: Found best=1 mappings for obsolete acc '{acc}' in table '{alphamap}' (shouldn't happen)")
-        # Remove acc from table 'alphamap'
-        Query(f"DELETE FROM {alphamap} WHERE type='{type}' AND version='{version}' AND afdb=0 AND map='{acc}'")
-        Log(f"obsolete 'map' acc deleted from table '{alphamap}' for acc", acc)
-
-        # Remove acc from table 'alphafrag'
-        Query(f"DELETE FROM {alphafrag} WHERE afdb=0 AND acc='{acc}'")
-        Log(f"obsolete acc deleted from table '{alphafrag}' for acc", acc)
-
-        # Remove acc from table 'alphaseq'
-        Query(f"DELETE FROM {alphaseq} WHERE afdb=0 AND acc='{acc}'")
-        Log(f"obsolete acc deleted from table '{alphaseq}' for acc", acc)
-
-        # Remove acc from table 'alphasa'
-        Query(f"DELETE FROM {alphasa} WHERE afdb=0 AND acc='{acc}'")
-        Log(f"obsolete acc deleted from table '{alphasa}' for acc", acc)
-
-        # Remove acc from table 'alphacon'
-        Query(f"DELETE FROM {alphacon} WHERE afdb=0 AND acc='{acc}'")
-        Log(f"obsolete acc deleted from table '{alphacon}' for acc", acc)
-
-    else:
-        
+print("Finding unnecessary structure CIF/PAE/params output files:")
+obsolete = set(unnecessary_structures)
+files = []
+for dir, pattern in outfiles.items():
+    size = 0
+    n = 0
+    if os.path.isdir(dir):
+        for entry in os.scandir(dir):
+            m = pattern.match(entry.name)
+            if m and m.group(1) in obsolete:
+                files.append(entry.path)
+                size += entry.stat().st_size
+                n += 1
+                Log(f"obsolete CIF/PAE/params files found for acc", m.group(1))
+    print(f" >> {dir}: {Comma(n)} files ({size / 1024 ** 3:,.2f} GB)")
+
+
+
+# Staging table of obsolete structures (acc, afdb)
+print(f"\nLoading {Comma(len(unnecessary_structures))} unnecessary structures into staging table '{tmptable}'...")
+Query(f"CREATE TEMPORARY TABLE {tmptable} (`acc` char(13) NOT NULL, `afdb` tinyint NOT NULL, PRIMARY KEY (`acc`, `afdb`)) ENGINE=InnoDB")
+for i in range(0, len(unnecessary_structures), batchsize):
+    Query(f"INSERT INTO {tmptable} (acc, afdb) VALUES " + ", ".join(f"('{acc}', 0)" for acc in unnecessary_structures[i:i + batchsize]))
+
+# First, check if there are any best=1 mappings for these accs in table 'alphamap' (there shouldn't be)
+query = Query(f"SELECT DISTINCT m.map FROM {alphamap} m JOIN {tmptable} s ON s.acc=m.map AND s.afdb=m.afdb WHERE m.type='{type}' AND m.version='{version}' AND m.best=1")
+if Numrows(query) > 0:
+    Die(f"Error: Found best=1 mappings for {Comma(Numrows(query))} obsolete accs (e.g. '{FetchList(query)[0]}') in table '{alphamap}' (shouldn't happen)")
+
+# Only delete files once the sanity check above has passed (so a failed check leaves both files and table rows in place)
+if not Switch('debug'):
+    print(f"\nDeleting {Comma(len(files))} files ({workers} parallel)...")
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for file, deleted in tq(zip(files, executor.map(Unlink, files)), total=len(files)):
+            if not deleted:
+                Log(f"obsolete CIF/PAE/params file already gone (removed in the meantime)", file)
+
+# Tables keyed by acc (leading primary key column), in deletion order (deleting from 'alphasummary' also subtracts the structures from their taxa's coverage in table 'alphacoverage', using the taxa stored in 'alphasummary')
+# 'alphaseq' goes last, so an interrupted run still finds the remaining structures when run again
+tables = [alphafrag, alphasummary, alphasa, alphacon, alphaseq]
+
+if Switch('debug'):
+
+    # Dry-run report: rows that would be deleted per table, and obsolete accs without any rows (shouldn't happen)
+    print(f"\nDry run (-debug is active): rows that would be deleted:")
+    query = Query(f"SELECT COUNT(*), COUNT(DISTINCT m.map) FROM {alphamap} m JOIN {tmptable} s ON s.acc=m.map AND s.afdb=m.afdb WHERE m.type='{type}' AND m.version='{version}'")
+    (rows, accs) = FetchRow(query)
+    print(f" >> {alphamap}:\t{Comma(rows)} rows for {Comma(accs)} accs")
+    for table in tables:
+        (rows, accs) = FetchRow(Query(f"SELECT COUNT(*), COUNT(DISTINCT t.acc) FROM {table} t JOIN {tmptable} s ON s.acc=t.acc AND s.afdb=t.afdb"))
+        print(f" >> {table}:\t{Comma(rows)} rows for {Comma(accs)} accs")
+    for table in [alphamap] + tables:
+        key = "map" if table == alphamap else "acc"
+        where = f" AND t.type='{type}' AND t.version='{version}'" if table == alphamap else ""
+        for (acc,) in Query(f"SELECT s.acc FROM {tmptable} s LEFT JOIN {table} t ON t.{key}=s.acc AND t.afdb=s.afdb{where} WHERE t.{key} IS NULL"):
+            Log(f"no rows found in table '{table}' for obsolete acc (shouldn't happen)", acc)
+    for acc in unnecessary_structures:
         Log(f"obsolete CIF/PAE/params files & table rows would have been deleted (but -debug is active) for acc", acc)
-        
-        query = Query(f"SELECT * FROM {alphamap} WHERE type='{type}' AND version='{version}' AND afdb=0 AND map='{acc}' AND best=1")
-        if Numrows(query) > 0:
-            Die(f"Error: Found best=1 mappings for obsolete acc '{acc}' in table '{alphamap}' (shouldn't happen)")
-        
-        query = Query(f"SELECT * FROM {alphamap} WHERE type='{type}' AND version='{version}' AND afdb=0 AND map='{acc}'")
-        if Numrows(query) == 0:
-            Die(f"Error: No mappings found for obsolete acc '{acc}' in table '{alphamap}' (shouldn't happen)")
-        
-        query = Query(f"SELECT * FROM {alphafrag} WHERE afdb=0 AND acc='{acc}'")
-        if Numrows(query) == 0:
-            Die(f"Error: No rows found for obsolete acc '{acc}' in table '{alphafrag}' (shouldn't happen)")
-
-        query = Query(f"SELECT * FROM {alphaseq} WHERE afdb=0 AND acc='{acc}'")
-        if Numrows(query) == 0:
-            Die(f"Error: No rows found for obsolete acc '{acc}' in table '{alphaseq}' (shouldn't happen)")
-
-        query = Query(f"SELECT * FROM {alphasa} WHERE afdb=0 AND acc='{acc}'")
-        if Numrows(query) == 0:
-            Die(f"Error: No rows found for obsolete acc '{acc}' in table '{alphasa}' (shouldn't happen)")
-
-        query = Query(f"SELECT * FROM {alphacon} WHERE afdb=0 AND acc='{acc}'")
-        if Numrows(query) == 0:
-            Die(f"Error: No rows found for obsolete acc '{acc}' in table '{alphacon}' (shouldn't happen)")
+
+else:
+
+    # Remove accs from table 'alphamap' ('map' isn't a leading key column here, so first get the primary keys of the affected rows in a single pass, then delete by primary key)
+    print(f"\nDeleting obsolete 'map' accs from table '{alphamap}'...")
+    keys = FetchAll(Query(f"SELECT m.value, m.best, m.map FROM {alphamap} m JOIN {tmptable} s ON s.acc=m.map AND s.afdb=m.afdb WHERE m.type='{type}' AND m.version='{version}'"))
+    deleted = 0
+    for i in tq(range(0, len(keys), batchsize)):
+        query = Query(f"DELETE FROM {alphamap} WHERE type='{type}' AND version='{version}' AND afdb=0 AND (value, best, map) IN (" + ", ".join(f"('{value}', '{best}', '{map}')" for (value, best, map) in keys[i:i + batchsize]) + ")")
+        deleted += Numrows(query)
+    print(f" >> {Comma(deleted)} rows deleted")
+    for (value, best, map) in keys:
+        Log(f"obsolete 'map' acc deleted from table '{alphamap}' for acc", map)
+
+    # Remove accs from the other tables, one chunk of accessions at a time (all tables per chunk, so 'alphaseq' rows only go once everything else for them is gone)
+    print(f"\nDeleting obsolete accs from tables {', '.join(repr(table) for table in tables)} ({chunksize} accs per DELETE)...")
+    deleted = dict.fromkeys(tables, 0)
+    for i in tq(range(0, len(unnecessary_structures), chunksize)):
+        chunk = unnecessary_structures[i:i + chunksize]
+        for table in tables:
+            if table == alphasummary:
+                # Also subtracts them from their taxa's coverage in table 'alphacoverage'
+                query = DeleteSummaries(chunk, 0)
+            else:
+                query = Query(f"DELETE t FROM {table} t JOIN {tmptable} s ON s.acc=t.acc AND s.afdb=t.afdb WHERE s.acc IN ('" + "', '".join(chunk) + "')")
+            deleted[table] += Numrows(query)
+    for table in tables:
+        print(f" >> {table}:\t{Comma(deleted[table])} rows deleted")
+    for acc in unnecessary_structures:
+        Log(f"obsolete CIF/PAE/params files & table rows deleted for acc", acc)
+
+Query(f"DROP TEMPORARY TABLE {tmptable}")
 
 Show(lim=0)
 
@@ -20,16 +20,24 @@ import sys
 import requests
 from requests.adapters import HTTPAdapter, Retry
 # import tempfile
-import ijson
 # from Bio import SeqIO
 from blang_mysql import *
 from blang import *
+from uniprotapi import *
 
 # Variables
 alphauniprot = "alphauniprot"
+alphauniprot_staging = "alphauniprot_staging"   # Staging table for the new release (-delta)
+alphauniprot_changes = "alphauniprot_changes"   # Accessions inserted, deleted or changed per release (-delta)
+
+# Columns filled by this script, which make up the content hash compared in -delta mode (not 'refprotcanon', which alphauniprot_refprotcanon.py sets afterwards)
+columns = ["canon", "name", "species", "tax", "species_common", "species_latin", "reviewed", "refproteome", "fullname", "symbols", "synonyms", "func", "seqlen", "seq"]
+
+# Maximum fraction of changed rows for applying differences to table 'alphauniprot' in place (-delta): above this, the staging table replaces it instead
+max_delta_fraction = 0.25
 
 # Start
-Args(0, "[-reviewed] [-compara_species] [-all] [-debug] [-refresh]", " -reviewed: Get all reviewed proteins from UniProt (i.e. UniProtKB/Swiss-Prot), including isoforms, in JSON format, batch size 500 (default)\n -compara_species: Get all proteins for the 200 Ensembl Compara species from UniProt (i.e. UniProtKB/Swiss-Prot and UniProtKB/TrEMBL), including isoforms, in JSON format, batch size 500\n -all: Get all proteins from UniProt (i.e. UniProtKB/Swiss-Prot and UniProtKB/TrEMBL), including isoforms, in JSON format, batch size 500 (not really feasible)\n -refresh: Run even if the local UniProt release is still current\n -debug: Don't actually make any changes, just simulate", " -compara_species")
+Args(0, "[-reviewed] [-compara_species] [-all] [-json] [-delta] [-debug] [-refresh]", " -reviewed: Get all reviewed proteins from UniProt (i.e. UniProtKB/Swiss-Prot), including isoforms, in JSON format, batch size 500 (default)\n -compara_species: Get all proteins for the 200 Ensembl Compara species from UniProt (i.e. UniProtKB/Swiss-Prot and UniProtKB/TrEMBL), including isoforms, in JSON format, batch size 500\n -all: Get all proteins from UniProt (i.e. UniProtKB/Swiss-Prot and UniProtKB/TrEMBL), including isoforms, in JSON format, batch size 500 (not really feasible)\n -json: Download complete JSON records (default: only the fields needed, gzip-compressed, as TSV plus JSON for nested fields)\n -delta: Load the new release into a staging table, and only apply inserted, deleted and changed rows to table 'alphauniprot' (recorded in table 'alphauniprot_changes'), instead of clearing and refilling it\n -refresh: Run even if the local UniProt release is still current\n -debug: Don't actually make any changes, just simulate", " -compara_species")
 
 # Default to:
 # - The 200 Ensembl Compara species,
@@ -48,9 +56,16 @@ if Switch("all"):
 # Check if UniProt has been updated, and exit if not (unless -refresh is active)
 check_uniprot_release()
 
+# Table to fill: in -delta mode, the new release goes into a staging table first, so 'alphauniprot' stays complete for downstream readers until the differences are applied (see ApplyDelta)
+target = alphauniprot
+if Switch('delta'):
+    target = alphauniprot_staging
+    if not Switch('debug'):
+        Query(f"CREATE TABLE IF NOT EXISTS {alphauniprot_staging} LIKE {alphauniprot}")
+
 # Clear table
 if not Switch('debug'):
-    Clear(alphauniprot)
+    Clear(target)
 
 
 
@@ -100,12 +115,12 @@ if proteins_to_get == "compara_species":
     # url = f'https://rest.uniprot.org/uniprotkb/search?format=json&size=500&includeIsoform=true&query=%28{taxa}%29'
     # taxa = FetchList(Query("SELECT tax FROM compara_species ORDER BY id"))
     # Exclude taxa that are already present in table 'alphauniprot' (in case this script is being re-run)
-    taxa = FetchList(Query(f"SELECT tax FROM compara_species WHERE tax NOT IN (SELECT DISTINCT tax FROM {alphauniprot}) ORDER BY id"))
+    taxa = FetchList(Query(f"SELECT tax FROM compara_species WHERE tax NOT IN (SELECT DISTINCT tax FROM {target}) ORDER BY id"))
     
     # Also include the "Model organisms" and "Global health proteomes" from the AlphaFold Protein Structure Database, all of which start with UP...
     # taxa.append(FetchList(Query("SELECT DISTINCT tax FROM alphafrag WHERE source IN (SELECT DISTINCT source FROM alphafrag HAVING source LIKE 'UP%') AND tax NOT IN (SELECT DISTINCT tax FROM compara_species)")))
     # Exclude taxa that are already present in table 'alphauniprot' (and those that are in table 'compara_species')
-    taxa.extend(FetchList(Query(f"SELECT DISTINCT tax FROM alphafrag WHERE tax NOT IN (SELECT DISTINCT tax FROM {alphauniprot}) AND source IN (SELECT DISTINCT source FROM alphafrag HAVING source LIKE 'UP%') AND tax NOT IN (SELECT DISTINCT tax FROM compara_species)")))
+    taxa.extend(FetchList(Query(f"SELECT DISTINCT tax FROM alphafrag WHERE tax NOT IN (SELECT DISTINCT tax FROM {target}) AND source IN (SELECT DISTINCT source FROM alphafrag HAVING source LIKE 'UP%') AND tax NOT IN (SELECT DISTINCT tax FROM compara_species)")))
     
     # taxa = FetchList(Query("SELECT 3469 AS tax"))
     # taxa = FetchList(Query("SELECT 9358 AS tax"))
@@ -121,7 +136,7 @@ if proteins_to_get == "compara_species":
     # Then, get reviewed proteins for all other (non-compara_species) taxa:
     # Add any taxa that are already fully in alphauniprot (in casethis script is being re-run)
     tmptaxa = taxa
-    tmptaxa.extend(FetchList(Query(f"SELECT DISTINCT tax FROM {alphauniprot}")))
+    tmptaxa.extend(FetchList(Query(f"SELECT DISTINCT tax FROM {target}")))
     # list(dict(...)): remove duplicates while maintaining order
     queries += ["(reviewed:true) AND NOT (" + " OR ".join([f"organism_id:{tax}" for tax in list(dict.fromkeys(tmptaxa))]) + ")"]
     
@@ -133,100 +148,50 @@ if Switch("debug"):
 
 
 
-# Function to download data UniProt API to file, showing download progress
-def download_uniprot_data(url, block_size=262144):  # 256 KB default
-    # retries = Retry(total=5, backoff_factor=0.25, status_forcelist=[500, 502, 503, 504])
-    # session = requests.Session()
-    # session.mount("https://", HTTPAdapter(max_retries=retries))
-    # 
-    # response = session.get(url, stream=True)
-    # response.raise_for_status()
-    # 
-    # # # Display compression information
-    # # content_encoding = response.headers.get('Content-Encoding', '')
-    # # print(f" >> Content-Encoding: {content_encoding}")
-    # # is_compressed = 'gzip' in content_encoding or 'deflate' in content_encoding
-    # # print(f" >> Is compressed: {is_compressed}")
-    # 
-    # total_size = int(response.headers.get('content-length', 0))
-    
-    # # Create directory tmp_alphauniprot if it doesn't exist
-    # os.makedirs(temp_dir, exist_ok=True)
-    # Create a temporary file
-    # with tempfile.NamedTemporaryFile(delete=False, mode='wb', dir=temp_dir) as temp_file:
-    # with open(temp_file_name, 'wb') as temp_file:
-    #     try:
-    #         # with tqdm(total=total_size, unit='iB', unit_scale=True, desc="Downloading") as progress_bar:
-    #         # with tqdm(total=total_size, unit='iB', unit_scale=True, desc=f"   >> Downloading to '{temp_file.name}'") as progress_bar:
-    #         # with tqdm(total=total_size, file=sys.stdout, unit='B', unit_divisor=1024, unit_scale=True, desc=f"   >> Downloading", bar_format="{desc}: {n_fmt} >> {rate_fmt}{postfix}, {elapsed} elapsed") as progress_bar:
-    #         # with tqdm(total=total_size, file=sys.stdout, unit='B', unit_divisor=1024, unit_scale=True, desc=f"   >> Downloading to '{temp_file.name}'", bar_format="{desc}: {n_fmt} >> {rate_fmt}{postfix}, {elapsed} elapsed") as progress_bar:
-    #         with tqdm(total=total_size, file=sys.stdout, unit='B', unit_divisor=1024, unit_scale=True, desc=f"   >> Downloading", bar_format="{desc}: {n_fmt} >> {rate_fmt}{postfix}, {elapsed} elapsed") as progress_bar:
-    #             for chunk in response.iter_content(chunk_size=block_size):
-    #                 size = len(chunk)
-    #                 temp_file.write(chunk)
-    #                 progress_bar.update(size)
-    #     except:
-    #         # Clean up the temporary file if interrupted
-    #         os.unlink(temp_file_name)
-    #         # # Clean up the temporary directory if interrupted
-    #         # os.rmdir(temp_dir)
-
-    # Keep trying until successfully fully downloaded
-    temp_file_name = None
-    while temp_file_name is None:
-        try:
-            # retries = Retry(total=5, backoff_factor=0.25, status_forcelist=[500, 502, 503, 504])
-            retries = Retry(
-                total=10,           # Total retries
-                backoff_factor=0.5, # Delay between retries
-                status_forcelist=[500, 502, 503, 504, 429, 408],  # Rate limit (429) and timeout (408)
-                connect=5,          # Connection retries
-                read=5,             # Read retries
-                respect_retry_after_header=True  # Honor server's retry-after header
-            )
-            session = requests.Session()
-            session.mount("https://", HTTPAdapter(max_retries=retries))
-            
-            response = session.get(url, stream=True)
-            response.raise_for_status()
-
-            total_size = int(response.headers.get('content-length', 0))
-
-            # Create a temporary file
-            temp_file_name = "tmp-alphauniprot.json"
-            with open(temp_file_name, 'wb') as temp_file:
-                with tqdm(total=total_size, file=sys.stdout, unit='B', unit_divisor=1024, unit_scale=True, desc=f"   >> Downloading", bar_format="{desc}: {n_fmt} >> {rate_fmt}{postfix}, {elapsed} elapsed") as progress_bar:
-                    for chunk in response.iter_content(chunk_size=block_size):
-                        size = len(chunk)
-                        temp_file.write(chunk)
-                        progress_bar.update(size)
-            response.close()
-            session.close()
-
-        except:
-            # Download failed
-            print( "     >> Download failed, retrying...")
-            response.close()
-            session.close()
-            # Clean up the temporary file if interrupted
-            os.unlink(temp_file_name)
-            temp_file_name = None
-
-    return temp_file_name
-
-def parse_uniprot_data(file_name):
-    # Parse JSON from the downloaded file (streaming to avoid high memory usage)
-    with open(file_name, 'rb') as json_file:
-        try:
-            # Use ijson.items to directly iterate over the 'results' array
-            for item in ijson.items(json_file, 'results.item'):
-            # for item in tqdm(ijson.items(json_file, 'results.item'), unit='', desc=f"   >> Parsing proteins"):
-                yield item
-        finally:    
-            # Clean up the temporary file, including if interrupted
-            os.unlink(file_name)
-            # # Clean up the temporary directory, including if interrupted
-            # os.rmdir(temp_dir)
+# Downloading (concurrently and resumably) and parsing: see uniprotapi.py
+
+def ContentHash(alias):
+    """SQL expression for the content hash of a row (JSON_ARRAY keeps NULL distinct from empty strings and column boundaries intact)"""
+    return f"MD5(JSON_ARRAY({', '.join(f'{alias}.{column}' for column in columns)}))"
+
+def ApplyDelta(version):
+    """Compare the staging table to table 'alphauniprot' by accession and content hash, record the differences in table 'alphauniprot_changes', and apply them (in place in a single transaction, or by swapping in the staging table if too much has changed)"""
+    print(f"\nComparing staging table '{alphauniprot_staging}' to table '{alphauniprot}' (UniProt release '{version}')...")
+    staged = FetchOne(Query(f"SELECT COUNT(*) FROM {alphauniprot_staging}"))
+    current = FetchOne(Query(f"SELECT COUNT(*) FROM {alphauniprot}"))
+    if staged == 0:
+        Die(f"Error: Staging table '{alphauniprot_staging}' is empty")
+
+    # Record changed accessions (for downstream incremental steps)
+    Query(f"DELETE FROM {alphauniprot_changes} WHERE version='{version}'")
+    inserted = Numrows(Query(f"INSERT INTO {alphauniprot_changes} (version, acc, type) SELECT '{version}', s.acc, 'inserted' FROM {alphauniprot_staging} s LEFT JOIN {alphauniprot} a ON a.acc=s.acc WHERE a.acc IS NULL"))
+    deleted = Numrows(Query(f"INSERT INTO {alphauniprot_changes} (version, acc, type) SELECT '{version}', a.acc, 'deleted' FROM {alphauniprot} a LEFT JOIN {alphauniprot_staging} s ON s.acc=a.acc WHERE s.acc IS NULL"))
+    changed = Numrows(Query(f"INSERT INTO {alphauniprot_changes} (version, acc, type) SELECT '{version}', s.acc, 'changed' FROM {alphauniprot_staging} s JOIN {alphauniprot} a ON a.acc=s.acc WHERE {ContentHash('s')}!={ContentHash('a')}"))
+    print(f" >> {Comma(current)} rows in table '{alphauniprot}', {Comma(staged)} rows in staging table")
+    print(f" >> {Comma(inserted)} inserted, {Comma(deleted)} deleted, {Comma(changed)} changed (recorded in table '{alphauniprot_changes}')")
+
+    if inserted + deleted + changed > max_delta_fraction * staged:
+        # Too many differences: swap in the staging table instead (RENAME TABLE is atomic)
+        print(f"\nMore than {max_delta_fraction:.0%} of rows differ: replacing table '{alphauniprot}' with staging table '{alphauniprot_staging}'...")
+        Query(f"DROP TABLE IF EXISTS {alphauniprot}_old")
+        Query(f"RENAME TABLE {alphauniprot} TO {alphauniprot}_old, {alphauniprot_staging} TO {alphauniprot}")
+        Query(f"DROP TABLE {alphauniprot}_old")
+        Optimize(alphauniprot)
+        return
+
+    # Apply only the differences, in a single transaction (readers see either the previous or the new release)
+    print(f"\nApplying differences to table '{alphauniprot}'...")
+    Query("START TRANSACTION")
+    try:
+        Query(f"DELETE a FROM {alphauniprot} a JOIN {alphauniprot_changes} c ON c.acc=a.acc WHERE c.version='{version}' AND c.type='deleted'")
+        Query(f"REPLACE INTO {alphauniprot} (acc, {', '.join(columns)}) SELECT s.acc, {', '.join(f's.{column}' for column in columns)} FROM {alphauniprot_staging} s JOIN {alphauniprot_changes} c ON c.acc=s.acc WHERE c.version='{version}' AND c.type IN ('inserted', 'changed')")
+        Query("COMMIT")
+    except:
+        Query("ROLLBACK")
+        raise
+    # (DROP TABLE after the transaction, since it would implicitly commit it)
+    Query(f"DROP TABLE {alphauniprot_staging}")
+    print(f" >> {Comma(FetchOne(Query(f'SELECT COUNT(*) FROM {alphauniprot}')))} rows in table '{alphauniprot}'")
 
 
 
@@ -260,92 +225,28 @@ print(f"Getting all '{proteins_to_get}' proteins from UniProt API, including iso
 
 
 # Run individual queries (one per species)
+# Without pagination (much faster, using the /stream endpoint), and per species so the queries aren't too resource-intensive
+# Downloads run concurrently (up to uniprotapi.downloads at a time, each to its own temporary file, resuming interrupted downloads), while completed downloads get parsed and inserted here in query order
+# By default, only the fields used below are downloaded (gzip-compressed TSV for flat fields, and JSON for nested ones: two downloads per query, see uniprotapi.ParseEntries), since complete JSON records are many times larger
+if Switch("json"):
+    urls = [[StreamUrl(query)] for query in queries]
+else:
+    urls = [FieldUrls(query) for query in queries]
+files = Downloads([url for query_urls in urls for url in query_urls])
 for qi, query in enumerate(queries, 1):
-
-#     # Standard UniProt API pagination from https://www.uniprot.org/help/api_queries (quite slow, though)
-#     # url = f'https://rest.uniprot.org/uniprotkb/search?format=json&size=500&includeIsoform=true&query={query}'
-#     print(f"Querying UniProt API ('{url}')...")
-# 
-#     re_next_link = re.compile(r'<(.+)>; rel="next"')
-#     retries = Retry(total=5, backoff_factor=0.25, status_forcelist=[500, 502, 503, 504])
-#     session = requests.Session()
-#     session.mount("https://", HTTPAdapter(max_retries=retries))
-# 
-#     def get_next_link(headers):
-#         if "Link" in headers:
-#             match = re_next_link.match(headers["Link"])
-#             if match:
-#                 return match.group(1)
-# 
-#     def get_batch(batch_url):
-#         while batch_url:
-#             response = session.get(batch_url)
-#             response.raise_for_status()
-#             total = response.headers["x-total-results"]
-#             yield response, total
-#             batch_url = get_next_link(response.headers)
+    # Files for this query (Downloads yields them in order)
+    temp_files = [next(files) for url in urls[qi - 1]]
 
     # First, get maximum number of items from API /search endpoint and response.headers["x-total-results"]
-    url = f'https://rest.uniprot.org/uniprotkb/search?format=json&includeIsoform=true&size=500&query={query}'
-    # retries = Retry(total=5, backoff_factor=0.25, status_forcelist=[500, 502, 503, 504])
-    retries = Retry(
-        total=10,           # Total retries
-        backoff_factor=0.5, # Delay between retries
-        status_forcelist=[500, 502, 503, 504, 429, 408],  # Rate limit (429) and timeout (408)
-        connect=5,          # Connection retries
-        read=5,             # Read retries
-        respect_retry_after_header=True  # Honor server's retry-after header
-    )
-    session = requests.Session()
-    session.mount("https://", HTTPAdapter(max_retries=retries))
-    response = session.get(url)
-    response.raise_for_status()
-    total = response.headers["x-total-results"]
-    total = int(total)
-    response.close()
-
-    # Without pagination (much faster), and per species so the queries aren't too resource-intensive
-    url = f'https://rest.uniprot.org/uniprotkb/stream?format=json&includeIsoform=true&query={query}'
-    # print(f" >> Query {qi} / {len(queries)}: '{url}'")
-    print(f" >> {qi} / {len(queries)} >> Query '{query}'")
-
-    
-
+    total = TotalResults(query)
 
-
-    # retries = Retry(total=5, backoff_factor=0.25, status_forcelist=[500, 502, 503, 504])
-    # session = requests.Session()
-    # session.mount("https://", HTTPAdapter(max_retries=retries))
-    # response = session.get(url)
-    # response.raise_for_status()
-    # # total = response.headers["x-total-results"]
-    # # total = int(total)
-    # # data = requests.get(url).json()
-    # batch = response
-    # # print(f"Total proteins: {Comma(total)}")
-    # data = fetch_uniprot_data(url)
-
-    # Get UniProt data
-    # i = 0
-    # for batch, total in get_batch(url):
-    # Get JSON from batch
-    # data = batch.json()
-    # total = int(total)
-    # i += 1
-
-    # Process each protein in batch
-    # for e in tq(data['results'], initial=(i - 1) * 500, total=total, leave=False):
-    # for e in tq(data['results'], initial=(i - 1) * 500, total=total):
-    # for e in tq(data['results']):
-    # for e in fetch_uniprot_data(url):
-    temp_file = download_uniprot_data(url)
-    # with tqdm(total=0, unit='', desc=f"   >> Parsing proteins") as progress_bar:
-        # for qe, e in enumerate(parse_uniprot_data(temp_file), 1):
-    # for e in tqdm(parse_uniprot_data(temp_file), total=0, unit='', desc=f"   >> Parsing proteins", smoothing=0, bar_format="{desc:<5.5}{percentage:3.0f}%[{bar:32}] {n:,} / {total:,} >> {rate_fmt}{postfix}, {elapsed} elapsed, {remaining} remaining"):
-    # for e in tqdm(parse_uniprot_data(temp_file), total=total, unit='', desc=f"   >> Parsing proteins", smoothing=0, bar_format="{desc}: {n:,} >> {rate_fmt}{postfix}, {elapsed} elapsed"):
+    print(f" >> {qi} / {len(queries)} >> Query '{query}'")
     print(f"   >> Parsing proteins:")
-    # i = 0
-    for e in tqd(parse_uniprot_data(temp_file), total=total):
+    if Switch("json"):
+        entries = ParseJson(*temp_files)
+    else:
+        entries = ParseEntries(*temp_files)
+    for e in tqd(entries, total=total):
         # i += 1
         if Switch("debug"):
             d()
@@ -504,7 +405,7 @@ for qi, query in enumerate(queries, 1):
         # ) ENGINE=InnoDB DEFAULT CHARSET=latin1 COMMENT='UniProt annotation via API';
 
         # Insert into table
-        q = f"INSERT INTO {alphauniprot} SET acc='{acc}', canon='{canon}', name='{name}', fullname='{Esc(fullname)}', tax='{tax}', species='{species}', species_common='{Esc(species_common)}', species_latin='{Esc(species_latin)}', reviewed='{reviewed}', refproteome='{refproteome}', symbols='{Esc(symbols)}', synonyms='{Esc(synonyms)}', func='{Esc(comments)}', seqlen='{seqlen}', seq='{seq}'"
+        q = f"INSERT INTO {target} SET acc='{acc}', canon='{canon}', name='{name}', fullname='{Esc(fullname)}', tax='{tax}', species='{species}', species_common='{Esc(species_common)}', species_latin='{Esc(species_latin)}', reviewed='{reviewed}', refproteome='{refproteome}', symbols='{Esc(symbols)}', synonyms='{Esc(synonyms)}', func='{Esc(comments)}', seqlen='{seqlen}', seq='{seq}'"
         q = q.replace("=''", "=NULL")
         if not Switch('debug'):
             Query(q)
@@ -525,11 +426,16 @@ for qi, query in enumerate(queries, 1):
 # print()
 Show(lim=50, sort=True)
 
+# Apply the new release's differences to table 'alphauniprot' (-delta)
+if Switch('delta') and not Switch('debug'):
+    ApplyDelta(get_local_uniprot_release())
+
 # Successfully finished: update locally recorded UniProt release version
 # update_local_uniprot_release()
 check_uniprot_release(update = 1)
 
-if not Switch('debug'):
+# (Not needed after applying only differences, which would otherwise trigger a full table rebuild)
+if not Switch('debug') and not Switch('delta'):
     Optimize(alphauniprot)
 
 # SELECT COUNT(DISTINCT species), COUNT(DISTINCT tax), COUNT(DISTINCT species_common), COUNT(DISTINCT species_latin), COUNT(DISTINCT species, tax), COUNT(DISTINCT species_latin, tax), COUNT(DISTINCT species_latin, species, tax) FROM alphauniprot;
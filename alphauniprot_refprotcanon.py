@@ -2,6 +2,7 @@
 """
 alphauniprot.py:
 Get canonical reference proteome status for via UniProt's FTP server and update AlphaSync table 'alphauniprot' (column 'refprotcanon').
+Reference proteome FASTA files are downloaded concurrently and cached locally until they change (see uniprotapi.py), and their accessions are applied with a single join UPDATE via a staging table.
 
 'refprotcanon' complements the 'refproteome' column: 'refprotcanon' are the "canonical" reference proteome sequences.
 Mouse, for example, has ~55,000 reference proteome sequences, but only ~22,000 canonical reference proteome sequences (one per gene).
@@ -27,104 +28,79 @@ import os
 import sys
 # from ftplib import FTP
 # import re
-import requests
-from requests.adapters import HTTPAdapter, Retry
-import gzip
-import io
 # import tempfile
 # from Bio import SeqIO
 from blang_mysql import *
 from blang import *
+from uniprotapi import *
 
 # Variables
 
 alphauniprot = "alphauniprot"       # Table name
 refprotcanon = "refprotcanon"       # Column name
 alphafrag = "alphafrag"
+tmptable = "alphauniprot_tmp_refprotcanon"     # Staging table for reference proteome accessions
+
+# Number of accessions per INSERT
+batchsize = 10000
 
 # Start
 Args(0, "[-debug]", "-debug: Don't actually make any changes, just simulate", "")
 
-# Clear table
-if not Switch('debug'):
-    print(f"Clearing column '{refprotcanon}' in table '{alphauniprot}'...")
-    # Query(f"UPDATE {alphauniprot} SET {refprotcanon}=NULL")
-    query = Query(f"UPDATE {alphauniprot} SET {refprotcanon}=0")
-    print(f"{Numrows(query):,} rows affected")
-
 # Start
 
-# Download and parse UniProt reference proteome FASTA files
-State(f"Downloading and parsing UniProt reference proteome FASTA files and updating '{refprotcanon}' column in table '{alphauniprot}':")
+# Download (concurrently, cached locally until they change on the FTP server) and parse UniProt reference proteome FASTA files
+State(f"Downloading and parsing UniProt reference proteome FASTA files:")
 # https://ftp.uniprot.org/pub/databases/uniprot/current_release/knowledgebase/reference_proteomes/Eukaryota/UP000000589/UP000000589_10090.fasta.gz
 # proteomes = FetchList(Query("SELECT DISTINCT source FROM alphafrag HAVING source LIKE 'UP%'"))
-# Stream FASTA file from FTP server over https
-retries = Retry(total=5, backoff_factor=1, status_forcelist=[500, 502, 503, 504])
-session = requests.Session()
-session.mount('https://', HTTPAdapter(max_retries=retries))
 if not Switch('debug'):
     # Get the 48 "Model organisms" and "Global health proteomes" from the AlphaFold Protein Structure Database proteome identifiers (which start with UP...) only
     # This is actually pretty fast (~30 minutes). Might want to add the 200 Ensembl Compara species later (or all other AlphaSync species)
-    query = Query(f"SELECT DISTINCT source FROM {alphafrag} HAVING source LIKE 'UP%'")
+    sources = FetchList(Query(f"SELECT DISTINCT source FROM {alphafrag} HAVING source LIKE 'UP%'"))
 else:
     # For debugging: Get human only
-    query = Query(f"SELECT DISTINCT source FROM {alphafrag} HAVING source='UP000005640_9606_HUMAN_v4'")
-# query = Query(f"SELECT source, tax FROM {alphafrag} GROUP BY source HAVING source LIKE 'UP%'")
-# query = Query(f"SELECT DISTINCT source, tax FROM {alphafrag} WHERE source IN (SELECT DISTINCT source FROM {alphafrag} HAVING source LIKE 'UP%')")
+    sources = FetchList(Query(f"SELECT DISTINCT source FROM {alphafrag} HAVING source='UP000005640_9606_HUMAN_v4'"))
 # Source: e.g. UP000005640_9606_HUMAN_v4, where proteome=UP000005640, tax=9606
-i = 0
-for source, in query:
-    i += 1
-    print(f" >> {i} / {Numrows(query)} >> {source}")
+proteomes = [(source.split('_')[0], source.split('_')[1]) for source in sources]
 
+# Collect canonical reference proteome accessions for all proteomes: {(tax, acc)}
+accs = set()
+for i, (source, (proteome, tax, infile, downloaded)) in enumerate(zip(sources, ReferenceProteomes(proteomes)), 1):
     Log("total sources", source)
 
-    # Split
-    proteome = source.split('_')[0]
-    tax = source.split('_')[1]
-
-    # Canonical reference proteome
-
-    # Check if the file exists in /Eukaryota/, /Archaea/, /Bacteria/ or /Viruses/
-    categories = ['Eukaryota', 'Archaea', 'Bacteria', 'Viruses']
-    url = None
-    for category in categories:
-        # e.g. https://ftp.uniprot.org/pub/databases/uniprot/current_release/knowledgebase/reference_proteomes/Eukaryota/UP000005640/UP000005640_9606.fasta.gz
-        test_url = f"https://ftp.uniprot.org/pub/databases/uniprot/current_release/knowledgebase/reference_proteomes/{category}/{proteome}/{proteome}_{tax}.fasta.gz"
-        response = session.head(test_url)
-        if response.status_code == 200:
-            url = test_url
-            break
-
-    if url is None:
+    if infile is None:
         # # Expected crashes for UP000020681_1299332_MYCUL_v4 and UP000325664_1352_ENTFC_v4
-        # if source != 'UP000020681_1299332_MYCUL_v4' and source != 'UP000325664_1352_ENTFC_v4':
-        #     # Otherwise, crash
-        #     Die(f"Error: Canonical file not found for {source} in any category (Eukaryota, Archaea, Bacteria, Viruses)")
-        print(f"SKIP (canonical file not found for {source} in any category (Eukaryota, Archaea, Bacteria, Viruses))")
+        print(f" >> {i} / {len(sources)} >> {source} >> SKIP (canonical file not found in any category (Eukaryota, Archaea, Bacteria, Viruses))")
         Log(f"canonical file not found in any subfolder (Eukaryota etc.) for source (skipped)", source)
         continue
 
-    print(f"   >> canonical >> {url}")
-    # print(f"   >> canonical >>  ", end="")
-    response = session.get(url)
-    if response.status_code == 200:
-        # Decompress and parse FASTA file
-        with gzip.open(io.BytesIO(response.content), 'rt') as f:
-            lines = f.read().strip().split('\n')
-            for line in tq(lines):
-                if line.startswith('>'):
-                    acc = line.split('|')[1]
-                    if not Switch('debug'):
-                        Query(f"UPDATE {alphauniprot} SET {refprotcanon}=1 WHERE tax='{tax}' AND acc='{acc}'")
-                    else:
-                        State(f"UPDATE {alphauniprot} SET {refprotcanon}=1 WHERE tax='{tax}' AND acc='{acc}'")
-                    Log(f"successfully updated row for acc", acc)
-                    Log(f"successfully updated row for canonical source", source)
+    n = len(accs)
+    for acc in FastaAccs(infile):
+        accs.add((tax, acc))
+        Log(f"successfully parsed header for acc", acc)
+    print(f" >> {i} / {len(sources)} >> {source} >> {'downloaded' if downloaded else 'cached'} >> {Comma(len(accs) - n)} accessions")
+    Log(f"successfully parsed canonical source", source)
+    if downloaded:
+        Log(f"downloaded (new or changed) canonical source", source)
     else:
-        print(f" >> Error downloading {url}: {response.status_code}")
-        Log(f"error: could not download url for canonical source (skipped)", source)
-        Log(f"error: could not download url for canonical url (skipped)", url)
+        Log(f"cached (unchanged) canonical source", source)
+
+# Load all accessions into a staging table
+print(f"\nLoading {Comma(len(accs))} canonical reference proteome accessions into staging table '{tmptable}'...")
+Query(f"CREATE TEMPORARY TABLE {tmptable} (`tax` mediumint NOT NULL, `acc` varchar(13) NOT NULL, PRIMARY KEY (`acc`, `tax`)) ENGINE=InnoDB")
+accs = sorted(accs)
+for batch in tq([accs[j:j + batchsize] for j in range(0, len(accs), batchsize)]):
+    Query(f"INSERT INTO {tmptable} (tax, acc) VALUES " + ", ".join(f"('{tax}', '{acc}')" for (tax, acc) in batch))
+
+# Update column with a single join: 1 for accessions in their species' canonical reference proteome, 0 for all others (no-op updates don't get written)
+q = f"UPDATE {alphauniprot} a LEFT JOIN {tmptable} t ON t.acc=a.acc AND t.tax=a.tax SET a.{refprotcanon}=IF(t.acc IS NULL, 0, 1)"
+if not Switch('debug'):
+    print(f"\nUpdating column '{refprotcanon}' in table '{alphauniprot}'...")
+    query = Query(q)
+    print(f" >> {Comma(Numrows(query))} rows changed")
+else:
+    State(q)
+print(f" >> {Comma(FetchOne(Query(f'SELECT COUNT(*) FROM {alphauniprot} a JOIN {tmptable} t ON t.acc=a.acc AND t.tax=a.tax')))} canonical reference proteome accessions found in table '{alphauniprot}'")
 
 # This would set refprotcanon to 0 for isoforms and variants, but it only makes sense if we used NULL as the default (rather than 0).
 # Using only 0 and 1 now for clarity: either an accession is in the canonical reference proteome for a given species (one per gene) or it is not.
@@ -21,6 +21,7 @@ alphamap = "alphamap"
 ensembl_species = "ensembl_species"
 compara_species = "compara_species"
 alphauniprot_species = "alphauniprot_species"
+alphacoverage = "alphacoverage"
 
 # Args(0, "", "")
 # var = Args(1, "[species]", "human")
@@ -28,6 +29,13 @@ alphauniprot_species = "alphauniprot_species"
 
 uniprot_version = get_local_uniprot_release()
 
+# Check that table 'alphacoverage' is up to date (alphacoverage.py)
+if FetchOne(Query(f"SELECT COUNT(*) FROM {alphacoverage} WHERE version='{uniprot_version}'")) == 0:
+    Die(f"Error: Table '{alphacoverage}' has no accession counts for UniProt release '{uniprot_version}' yet (run alphacoverage.py first)")
+
+# "Model organisms" and "Global health proteomes" from the AlphaFold Protein Structure Database (proteome sources start with UP...)
+model_taxa = "(SELECT DISTINCT tax FROM alphafrag WHERE source IN (SELECT DISTINCT source FROM alphafrag HAVING source LIKE 'UP%'))"
+
 # Clear table
 Clear(alphauniprot_species)
 
@@ -35,14 +43,16 @@ Clear(alphauniprot_species)
 
 
 
-# Query to get the list of fully finished, albeit ((au.reviewed=1 OR au.refprotcanon=1) AND acc=canon) (canonical reference proteome or reviewed, and no isoforms) taxa:
-print(f"Getting list of completed taxa in table '{alphauniprot}' using table '{alphamap}'...")
-complete_taxa = FetchSet(Query(f"""SELECT DISTINCT t.mapped_tax FROM (SELECT *, mapped_tax IN (SELECT DISTINCT tax FROM alphafrag WHERE source IN (SELECT DISTINCT source FROM alphafrag HAVING source LIKE 'UP%')) AS is_model, mapped.mapped_seqs + unmapped.unmapped_seqs AS total_seqs, mapped.mapped_seqs / (mapped.mapped_seqs + unmapped.unmapped_seqs) AS mapped_fraction FROM
-	(SELECT au.tax AS mapped_tax, au.species AS mapped_species, COUNT(DISTINCT au.seq) AS mapped_seqs FROM {alphauniprot} au, {alphamap} m WHERE au.acc=m.value AND m.type='uniprot' AND m.version='{uniprot_version}' AND m.map IS NOT NULL AND best=1 GROUP BY au.tax) mapped
-    LEFT OUTER JOIN
-    (SELECT au.tax AS unmapped_tax, au.species AS unmapped_species, COUNT(DISTINCT au.seq) AS unmapped_seqs FROM {alphauniprot} au, {alphamap} m WHERE (au.reviewed=1 OR au.refprotcanon=1) AND acc=canon AND au.acc=m.value AND m.type='uniprot' AND m.version='{uniprot_version}' AND m.map IS NULL GROUP BY au.tax) unmapped
-    ON mapped_tax=unmapped_tax
-LEFT OUTER JOIN alphauniprot_species s ON s.tax=mapped_tax GROUP BY mapped_tax HAVING unmapped_seqs IS NULL AND is_model=1 ORDER BY s.id, mapped_fraction DESC) t ORDER BY t.mapped_seqs DESC;"""))
+# Get the list of fully finished, albeit ((au.reviewed=1 OR au.refprotcanon=1) AND acc=canon) (canonical reference proteome or reviewed, and no isoforms) taxa:
+# (Model organism or global health proteome taxa with mapped sequences, but no unmapped core sequences, from per-taxon coverage in table 'alphacoverage', filled by alphacoverage.py, instead of grouping all of 'alphauniprot' and 'alphamap' here)
+print(f"Getting list of completed taxa from table '{alphacoverage}'...")
+# complete_taxa = FetchSet(Query(f"""SELECT DISTINCT t.mapped_tax FROM (SELECT *, mapped_tax IN (SELECT DISTINCT tax FROM alphafrag WHERE source IN (SELECT DISTINCT source FROM alphafrag HAVING source LIKE 'UP%')) AS is_model, mapped.mapped_seqs + unmapped.unmapped_seqs AS total_seqs, mapped.mapped_seqs / (mapped.mapped_seqs + unmapped.unmapped_seqs) AS mapped_fraction FROM
+# 	(SELECT au.tax AS mapped_tax, au.species AS mapped_species, COUNT(DISTINCT au.seq) AS mapped_seqs FROM {alphauniprot} au, {alphamap} m WHERE au.acc=m.value AND m.type='uniprot' AND m.version='{uniprot_version}' AND m.map IS NOT NULL AND best=1 GROUP BY au.tax) mapped
+#     LEFT OUTER JOIN
+#     (SELECT au.tax AS unmapped_tax, au.species AS unmapped_species, COUNT(DISTINCT au.seq) AS unmapped_seqs FROM {alphauniprot} au, {alphamap} m WHERE (au.reviewed=1 OR au.refprotcanon=1) AND acc=canon AND au.acc=m.value AND m.type='uniprot' AND m.version='{uniprot_version}' AND m.map IS NULL GROUP BY au.tax) unmapped
+#     ON mapped_tax=unmapped_tax
+# LEFT OUTER JOIN alphauniprot_species s ON s.tax=mapped_tax GROUP BY mapped_tax HAVING unmapped_seqs IS NULL AND is_model=1 ORDER BY s.id, mapped_fraction DESC) t ORDER BY t.mapped_seqs DESC;"""))
+complete_taxa = FetchSet(Query(f"SELECT tax FROM {alphacoverage} WHERE version='{uniprot_version}' AND mapped_seqs>0 AND unmapped_seqs=0 AND tax IN {model_taxa}"))
 # Concatenate for query
 complete_taxa_string = "(" + ", ".join(str(tax) for tax in complete_taxa) + ")"
 
@@ -52,14 +62,15 @@ if len(complete_taxa) == 0:
 
 
 
-# Query to get the list of fully finished, albeit (au.reviewed=1 OR au.refprotcanon=1) (canonical reference proteome or reviewed, including isoforms) taxa:
-print(f"Getting list of completed taxa (including isoforms) in table '{alphauniprot}' using table '{alphamap}'...")
-complete_iso_taxa = FetchSet(Query(f"""SELECT DISTINCT t.mapped_tax FROM (SELECT *, mapped_tax IN (SELECT DISTINCT tax FROM alphafrag WHERE source IN (SELECT DISTINCT source FROM alphafrag HAVING source LIKE 'UP%')) AS is_model, mapped.mapped_seqs + unmapped.unmapped_seqs AS total_seqs, mapped.mapped_seqs / (mapped.mapped_seqs + unmapped.unmapped_seqs) AS mapped_fraction FROM
-	(SELECT au.tax AS mapped_tax, au.species AS mapped_species, COUNT(DISTINCT au.seq) AS mapped_seqs FROM {alphauniprot} au, {alphamap} m WHERE au.acc=m.value AND m.type='uniprot' AND m.version='{uniprot_version}' AND m.map IS NOT NULL AND best=1 GROUP BY au.tax) mapped
-    LEFT OUTER JOIN
-    (SELECT au.tax AS unmapped_tax, au.species AS unmapped_species, COUNT(DISTINCT au.seq) AS unmapped_seqs FROM {alphauniprot} au, {alphamap} m WHERE (au.reviewed=1 OR au.refprotcanon=1) AND au.acc=m.value AND m.type='uniprot' AND m.version='{uniprot_version}' AND m.map IS NULL GROUP BY au.tax) unmapped
-    ON mapped_tax=unmapped_tax
-LEFT OUTER JOIN alphauniprot_species s ON s.tax=mapped_tax GROUP BY mapped_tax HAVING unmapped_seqs IS NULL AND is_model=1 ORDER BY s.id, mapped_fraction DESC) t ORDER BY t.mapped_seqs DESC;"""))
+# Get the list of fully finished, albeit (au.reviewed=1 OR au.refprotcanon=1) (canonical reference proteome or reviewed, including isoforms) taxa:
+print(f"Getting list of completed taxa (including isoforms) from table '{alphacoverage}'...")
+# complete_iso_taxa = FetchSet(Query(f"""SELECT DISTINCT t.mapped_tax FROM (SELECT *, mapped_tax IN (SELECT DISTINCT tax FROM alphafrag WHERE source IN (SELECT DISTINCT source FROM alphafrag HAVING source LIKE 'UP%')) AS is_model, mapped.mapped_seqs + unmapped.unmapped_seqs AS total_seqs, mapped.mapped_seqs / (mapped.mapped_seqs + unmapped.unmapped_seqs) AS mapped_fraction FROM
+# 	(SELECT au.tax AS mapped_tax, au.species AS mapped_species, COUNT(DISTINCT au.seq) AS mapped_seqs FROM {alphauniprot} au, {alphamap} m WHERE au.acc=m.value AND m.type='uniprot' AND m.version='{uniprot_version}' AND m.map IS NOT NULL AND best=1 GROUP BY au.tax) mapped
+#     LEFT OUTER JOIN
+#     (SELECT au.tax AS unmapped_tax, au.species AS unmapped_species, COUNT(DISTINCT au.seq) AS unmapped_seqs FROM {alphauniprot} au, {alphamap} m WHERE (au.reviewed=1 OR au.refprotcanon=1) AND au.acc=m.value AND m.type='uniprot' AND m.version='{uniprot_version}' AND m.map IS NULL GROUP BY au.tax) unmapped
+#     ON mapped_tax=unmapped_tax
+# LEFT OUTER JOIN alphauniprot_species s ON s.tax=mapped_tax GROUP BY mapped_tax HAVING unmapped_seqs IS NULL AND is_model=1 ORDER BY s.id, mapped_fraction DESC) t ORDER BY t.mapped_seqs DESC;"""))
+complete_iso_taxa = FetchSet(Query(f"SELECT tax FROM {alphacoverage} WHERE version='{uniprot_version}' AND mapped_seqs>0 AND unmapped_iso_seqs=0 AND tax IN {model_taxa}"))
 # Concatenate for query
 complete_iso_taxa_string = "(" + ", ".join(str(tax) for tax in complete_iso_taxa) + ")"
 
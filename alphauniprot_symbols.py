@@ -2,6 +2,7 @@
 """
 alphauniprot_symbols.py:
 Fill AlphaSync table 'alphauniprot_symbols', a normalised mapping of UniProt gene symbols and synonyms to UniProt accessions for quick lookup.
+Reads 'alphauniprot' in a single pass, bulk-inserts into a staging table, and swaps it in atomically once complete.
 """
 
 # Initialize
@@ -15,39 +16,73 @@ from blang import *
 
 alphauniprot = "alphauniprot"
 alphauniprot_symbols = "alphauniprot_symbols"
+tmptable = "alphauniprot_symbols_new"     # Staging table (swapped in once complete)
+
+# Number of rows per INSERT
+batchsize = 10000
 
 # Args(0, "", "")
 # var = Args(1, "[species]", "human")
 # infile = f"input/input.txt"
 
-# Clear table
-Clear(alphauniprot_symbols)
+
+
+def Aliases(acc, symbols, synonyms):
+    """Gene symbols and synonyms for an entry as (type, alias), de-duplicated (every row includes the accession, so duplicates can only come from the same entry)"""
+    aliases = {}
+    for type, values in (("symbol", symbols), ("synonym", synonyms)):
+        if values:
+            for alias in values.split("|"):
+                alias = alias.strip()
+                # Case-insensitive and ignoring trailing spaces, like the table's collation (the first occurrence wins, as with INSERT IGNORE)
+                aliases.setdefault((type, alias.lower().rstrip()), (type, alias))
+    return aliases.values()
+
+def InsertBatch(rows):
+    """Insert a batch of rows (acc, species, tax, type, alias) into the staging table with a single statement"""
+    if len(rows) > 0:
+        Query(f"INSERT IGNORE INTO {tmptable} (acc, species, tax, type, alias) VALUES " + ", ".join(f"('{acc}', '{species}', '{tax}', '{type}', '{Esc(alias)}')" for (acc, species, tax, type, alias) in rows))
+
+
 
 # Start
-print(f"\nFilling table '{alphauniprot_symbols}' with (not necessarily unambiguous) gene symbols and synonyms from '{alphauniprot}'...")
-# Insert gene symbols and synonyms
+Starttime()
+
+# Staging table (table 'alphauniprot_symbols' stays complete for readers until it is swapped out)
+Query(f"DROP TABLE IF EXISTS {tmptable}")
+Query(f"CREATE TABLE {tmptable} LIKE {alphauniprot_symbols}")
+
+print(f"\nFilling staging table '{tmptable}' with (not necessarily unambiguous) gene symbols and synonyms from '{alphauniprot}' (in a single pass, in batches of {Comma(batchsize)} rows)...")
+t = time.perf_counter()
+rows = []
+inserted = 0
 for acc, species, tax, symbols, synonyms in Fetch(Query(f"SELECT acc, species, tax, symbols, synonyms FROM {alphauniprot} WHERE symbols IS NOT NULL OR synonyms IS NOT NULL")):
-    if symbols:
-        for symbol in symbols.split("|"):
-            Query(f"INSERT IGNORE INTO {alphauniprot_symbols} SET acc='{acc}', species='{species}', tax='{tax}', type='symbol', alias='{Esc(symbol.strip())}'")
-            Log("inserted total symbols", symbol.strip())
-            Log("inserted symbol for acc", acc)
-            Log("inserted total entries", symbol.strip())
-            Log("inserted entry for acc", acc)
-            Log("inserted entry for species", species)
-            Log("inserted entry for tax", tax)
-    if synonyms:
-        for synonym in synonyms.split("|"):
-            Query(f"INSERT IGNORE INTO {alphauniprot_symbols} SET acc='{acc}', species='{species}', tax='{tax}', type='synonym', alias='{Esc(synonym.strip())}'")
-            Log("inserted total synonyms", synonym.strip())
-            Log("inserted synonym for acc", acc)
-            Log("inserted total entries", synonym.strip())
-            Log("inserted entry for acc", acc)
-            Log("inserted entry for species", species)
-            Log("inserted entry for tax", tax)
+    for type, alias in Aliases(acc, symbols, synonyms):
+        rows.append((acc, species, tax, type, alias))
+        Log(f"inserted total {type}s", alias)
+        Log(f"inserted {type} for acc", acc)
+        Log("inserted total entries", alias)
+        Log("inserted entry for acc", acc)
+        Log("inserted entry for species", species)
+        Log("inserted entry for tax", tax)
+    if len(rows) >= batchsize:
+        InsertBatch(rows)
+        inserted += len(rows)
+        rows = []
+InsertBatch(rows)
+inserted += len(rows)
+t = time.perf_counter() - t
+print(f" >> {Comma(inserted)} rows in {t:,.1f} sec ({inserted / t if t > 0 else 0:,.0f} rows/s)")
 
 Show(lim=0)
 
-Optimize(alphauniprot_symbols)
+Optimize(tmptable)
+
+# Swap in the staging table (RENAME TABLE is atomic)
+print(f"\nReplacing table '{alphauniprot_symbols}' with staging table '{tmptable}'...")
+Query(f"DROP TABLE IF EXISTS {alphauniprot_symbols}_old")
+Query(f"RENAME TABLE {alphauniprot_symbols} TO {alphauniprot_symbols}_old, {tmptable} TO {alphauniprot_symbols}")
+Query(f"DROP TABLE {alphauniprot_symbols}_old")
 
+Stoptime()
 print("\nDone!")
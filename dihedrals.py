@@ -0,0 +1,241 @@
+"""Dihedral angle functions: backbone and side chain dihedral angles (phi, psi, omega, chi1-5) and tau angles from mmCIF coordinates, vectorized using NumPy"""
+
+import numpy as np
+import pandas as pd
+import re
+from blang import Die, ThreeToOne
+# Fragment length and step size used by DeepMind (see fragments.py)
+from fragments import fraglen, fragstep
+
+# Proline isomerization states: omega angle thresholds
+omega_cis_max = 50.0
+omega_trans_min = 130.0
+
+# Angle columns (in 'alphasa' column order)
+angles = ["phi", "psi", "omega", "chi1", "chi2", "chi3", "chi4", "chi5", "tau"]
+
+# Maximum peptide bond length (C-N, in Angstroms) for consecutive residues to be treated as linked (same as Bio.PDB's IC_Chain.MaxPeptideBond)
+# phi and omega of the following residue and psi of the preceding residue are undefined (NaN) across chain breaks
+max_peptide_bond = 1.4
+
+# Side chain dihedral angle atom definitions per residue type (standard chi angles, as in Bio.PDB's ic_data)
+chi_atoms = {
+    "ARG": (("N", "CA", "CB", "CG"), ("CA", "CB", "CG", "CD"), ("CB", "CG", "CD", "NE"), ("CG", "CD", "NE", "CZ"), ("CD", "NE", "CZ", "NH1")),
+    "ASN": (("N", "CA", "CB", "CG"), ("CA", "CB", "CG", "OD1")),
+    "ASP": (("N", "CA", "CB", "CG"), ("CA", "CB", "CG", "OD1")),
+    "CYS": (("N", "CA", "CB", "SG"),),
+    "GLN": (("N", "CA", "CB", "CG"), ("CA", "CB", "CG", "CD"), ("CB", "CG", "CD", "OE1")),
+    "GLU": (("N", "CA", "CB", "CG"), ("CA", "CB", "CG", "CD"), ("CB", "CG", "CD", "OE1")),
+    "HIS": (("N", "CA", "CB", "CG"), ("CA", "CB", "CG", "ND1")),
+    "ILE": (("N", "CA", "CB", "CG1"), ("CA", "CB", "CG1", "CD1")),
+    "LEU": (("N", "CA", "CB", "CG"), ("CA", "CB", "CG", "CD1")),
+    "LYS": (("N", "CA", "CB", "CG"), ("CA", "CB", "CG", "CD"), ("CB", "CG", "CD", "CE"), ("CG", "CD", "CE", "NZ")),
+    "MET": (("N", "CA", "CB", "CG"), ("CA", "CB", "CG", "SD"), ("CB", "CG", "SD", "CE")),
+    "PHE": (("N", "CA", "CB", "CG"), ("CA", "CB", "CG", "CD1")),
+    "PRO": (("N", "CA", "CB", "CG"), ("CA", "CB", "CG", "CD")),
+    "SER": (("N", "CA", "CB", "OG"),),
+    "THR": (("N", "CA", "CB", "OG1"),),
+    "TRP": (("N", "CA", "CB", "CG"), ("CA", "CB", "CG", "CD1")),
+    "TYR": (("N", "CA", "CB", "CG"), ("CA", "CB", "CG", "CD1")),
+    "VAL": (("N", "CA", "CB", "CG1"),),
+}
+
+# Atom names needed (column order of the per-residue coordinate array)
+atom_names = ["N", "CA", "C"] + sorted({atom for chis in chi_atoms.values() for chi in chis for atom in chi} - {"N", "CA", "C"})
+atom_index = {atom: i for i, atom in enumerate(atom_names)}
+# Index of an all-NaN "missing atom" slot (for undefined chi angles)
+missing = len(atom_names)
+
+# Atom indices per residue type for chi1-5 (shape: residue types × 5 chi angles × 4 atoms), using the missing slot for undefined angles
+resnames = sorted(chi_atoms)
+resname_index = {resname: i for i, resname in enumerate(resnames)}
+chi_index = np.full((len(resnames) + 1, 5, 4), missing)     # Last row: residue types without side chain dihedrals (e.g. ALA, GLY)
+for resname, chis in chi_atoms.items():
+    for k, chi in enumerate(chis):
+        chi_index[resname_index[resname], k] = [atom_index[atom] for atom in chi]
+
+
+
+def ReadAtoms(ciffile):
+    """Read residue numbers, residue names and atom coordinates from the _atom_site loop of an mmCIF file (first model only)"""
+    columns = []
+    rows = []
+    with open(ciffile) as f:
+        for line in f:
+            if line.startswith("_atom_site."):
+                columns.append(line.rstrip())
+            elif line.startswith("ATOM"):
+                rows.append(re.split(r" +", line.rstrip()))
+    if len(rows) == 0:
+        Die(f"Error: No atoms found in mmCIF file '{ciffile}'")
+
+    rows = np.array(rows)
+    i = {column: columns.index(f"_atom_site.{column}") for column in ("label_seq_id", "label_comp_id", "label_atom_id", "Cartn_x", "Cartn_y", "Cartn_z", "pdbx_PDB_model_num")}
+    rows = rows[rows[:, i["pdbx_PDB_model_num"]] == rows[0, i["pdbx_PDB_model_num"]]]
+
+    sites = rows[:, i["label_seq_id"]].astype(int)
+    comps = rows[:, i["label_comp_id"]]
+    atoms = rows[:, i["label_atom_id"]]
+    coords = rows[:, [i["Cartn_x"], i["Cartn_y"], i["Cartn_z"]]].astype(float)
+
+    return (sites, comps, atoms, coords)
+
+def ResidueCoordinates(sites, comps, atoms, coords):
+    """Arrange atom coordinates per residue (shape: residues × atom_names + 1 missing slot × 3, NaN where absent)"""
+
+    # Residues (in order of appearance: atoms of a residue are consecutive in the _atom_site loop)
+    new = np.r_[True, sites[1:] != sites[:-1]]
+    residx = np.cumsum(new) - 1
+    ressites = sites[new]
+    rescomps = comps[new]
+
+    # Fill coordinate array for the atoms needed
+    xyz = np.full((len(ressites), len(atom_names) + 1, 3), np.nan)
+    wanted = np.isin(atoms, atom_names)
+    atomidx = np.array([atom_index[atom] for atom in atoms[wanted]], dtype=int)
+    xyz[residx[wanted], atomidx] = coords[wanted]
+
+    return (ressites, rescomps, xyz)
+
+def Dihedral(p0, p1, p2, p3):
+    """Dihedral angles (in degrees, -180 to 180) for arrays of four points (shape: n × 3 each)"""
+    # Undefined angles (missing atoms, i.e. NaN coordinates) are NaN
+    with np.errstate(invalid="ignore"):
+        b0 = p0 - p1
+        b1 = p2 - p1
+        b2 = p3 - p2
+        b1 = b1 / np.linalg.norm(b1, axis=-1, keepdims=True)
+        v = b0 - np.sum(b0 * b1, axis=-1, keepdims=True) * b1
+        w = b2 - np.sum(b2 * b1, axis=-1, keepdims=True) * b1
+        x = np.sum(v * w, axis=-1)
+        y = np.sum(np.cross(b1, v) * w, axis=-1)
+        return np.degrees(np.arctan2(y, x))
+
+def Angle(p0, p1, p2):
+    """Bond angles (in degrees, 0 to 180) at p1 for arrays of three points (shape: n × 3 each)"""
+    with np.errstate(invalid="ignore"):
+        a = p0 - p1
+        b = p2 - p1
+        cos = np.sum(a * b, axis=-1) / (np.linalg.norm(a, axis=-1) * np.linalg.norm(b, axis=-1))
+        return np.degrees(np.arccos(np.clip(cos, -1, 1)))
+
+def DihedralAngles(ciffile):
+    """Get phi, psi, omega, chi1-5 and tau angles (in degrees, NaN where undefined) for all residues in an mmCIF file as a data frame"""
+
+    (ressites, rescomps, xyz) = ResidueCoordinates(*ReadAtoms(ciffile))
+    n = len(ressites)
+
+    N = xyz[:, atom_index["N"]]
+    CA = xyz[:, atom_index["CA"]]
+    C = xyz[:, atom_index["C"]]
+
+    # Peptide bonds between consecutive residues (linked[i]: residue i is linked to residue i + 1)
+    linked = np.linalg.norm(C[:-1] - N[1:], axis=-1) <= max_peptide_bond
+
+    # Backbone dihedrals
+    phi = np.full(n, np.nan)
+    psi = np.full(n, np.nan)
+    omega = np.full(n, np.nan)
+    phi[1:] = np.where(linked, Dihedral(C[:-1], N[1:], CA[1:], C[1:]), np.nan)
+    psi[:-1] = np.where(linked, Dihedral(N[:-1], CA[:-1], C[:-1], N[1:]), np.nan)
+    omega[1:] = np.where(linked, Dihedral(CA[:-1], C[:-1], N[1:], CA[1:]), np.nan)
+
+    # tau: N-CA-C bond angle
+    tau = Angle(N, CA, C)
+
+    # Side chain dihedrals (all residues and chi angles at once)
+    types = np.array([resname_index.get(comp, len(resnames)) for comp in rescomps], dtype=int)
+    idx = chi_index[types]                                  # residues × 5 × 4
+    p = xyz[np.arange(n)[:, None, None], idx]               # residues × 5 × 4 × 3
+    chis = Dihedral(p[:, :, 0], p[:, :, 1], p[:, :, 2], p[:, :, 3])
+
+    return pd.DataFrame({
+        "site": ressites,
+        "aa3": rescomps,
+        "phi": phi,
+        "psi": psi,
+        "omega": omega,
+        "chi1": chis[:, 0],
+        "chi2": chis[:, 1],
+        "chi3": chis[:, 2],
+        "chi4": chis[:, 3],
+        "chi5": chis[:, 4],
+        "tau": tau,
+    })
+
+def CircularMean(df, by, columns):
+    """Average angles (in degrees) within groups using sums of sines and cosines (NaN if any angle in a group is NaN)"""
+    rad = np.radians(df[columns])
+    sums = pd.concat([np.sin(rad).add_suffix("_sin"), np.cos(rad).add_suffix("_cos"), df[columns].isna().add_suffix("_nan")], axis=1)
+    sums[by] = df[by]
+    sums = sums.groupby(by, as_index=False).sum()
+    res = sums[by].copy()
+    for column in columns:
+        res[column] = np.degrees(np.arctan2(sums[f"{column}_sin"], sums[f"{column}_cos"]))
+        res.loc[sums[f"{column}_nan"] > 0, column] = np.nan
+    return res
+
+def KeptRange(frag, maxfrag, length):
+    """Get the range of residues in a fragment whose angles will be kept by CombineFragments (in fragment coordinates)"""
+
+    # Remove N-terminal 200 aa at artificial N-termini (frag > 1 will have an artificial N-terminus)
+    start = 1
+    if frag > 1:
+        start = fragstep + 1
+
+    # Remove C-terminal 200 aa at artificial C-termini (frag < maxfrag will have an artificial C-terminus)
+    # (The last fragment is kept up to its end)
+    stop = length
+    if frag < maxfrag:
+        stop = fraglen - fragstep
+
+    return (start, stop)
+
+def FragmentAngles(ciffile, frag, maxfrag, length):
+    """Get dihedral angles for the kept residue range of one fragment mmCIF file (columns frag, site, aa3, angles)"""
+    df = DihedralAngles(ciffile)
+    (start, stop) = KeptRange(frag, maxfrag, length)
+    df = df[(df["site"] >= start) & (df["site"] <= stop)]
+    df.insert(0, "frag", frag)
+    return df
+
+def CombineFragments(df, seq, maxfrag):
+    """Combine per-fragment angles into one row per residue: shift sites, verify residues against seq, average angles across fragments and assign isomerization states (columns site, aa, iso, angles)"""
+
+    # Ignore values from dubious regions (artificial termini)
+    # Remove any residue in fragment 2 or above that is between 1-200, and any residue except in the last fragment that is between 1201-1400
+    df = df.loc[~((df["frag"] > 1) & (df["site"] <= fragstep)) & ~((df["frag"] < maxfrag) & (df["site"] > fraglen - fragstep))].copy()
+
+    # Shift site according to fragment number (i.e. residue 1 in fragment 2 will become 201)
+    df["site"] += fragstep * (df["frag"] - 1)
+
+    # One-letter residue codes
+    df["aa"] = df["aa3"].map({aa3: ThreeToOne(aa3) for aa3 in df["aa3"].unique()})
+
+    # Verify that all amino acid positions listed are the correct residue
+    expaas = np.array(list(seq))[df["site"] - 1]
+    wrong = df["aa"].to_numpy() != expaas
+    if wrong.any():
+        (tmpsite, tmpaa, expaa) = (df["site"].to_numpy()[wrong][0], df["aa"].to_numpy()[wrong][0], expaas[wrong][0])
+        Die(f"Error: Expected residue '{expaa}' at position '{tmpsite}', but got '{tmpaa}'")
+
+    # Get average dihedral angles (averaging across fragments, using circular means from summed sines and cosines)
+    df = CircularMean(df, ["site", "aa"], angles)
+
+    # Isomerization state based on average omega angle
+    df.insert(2, "iso", np.select([df["omega"].abs() <= omega_cis_max, df["omega"].abs() >= omega_trans_min], ["c", "t"], " "))
+
+    # Sort rows by site
+    return df.sort_values(["site"], ignore_index=True)
+
+def SqlValues(df, columns):
+    """Format data frame columns as quoted SQL values per row (NULL for NaN), e.g. for multi-row INSERT ... VALUES ROW(...) queries"""
+    return [", ".join("NULL" if pd.isna(x) else f"'{x}'" for x in row) for row in df[columns].itertuples(index=False)]
+
+def ProteinAngles(infiles, seq, maxfrag):
+    """Get dihedral angles and isomerization states for a protein from its fragment mmCIF files (AF-{acc}-F{frag}-model_v{version}.cif), combined across fragments (columns site, aa, iso, angles)"""
+    dfs = []
+    for ciffile in infiles:
+        frag = int(re.search(r"-F(\d+)-model_v\d+\.cif$", ciffile).group(1))
+        dfs.append(FragmentAngles(ciffile, frag, maxfrag, len(seq)))
+    return CombineFragments(pd.concat(dfs), seq, maxfrag)
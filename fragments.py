@@ -0,0 +1,21 @@
+"""Fragment functions: how AlphaSync splits long proteins into overlapping fragments for prediction, as AlphaFold DB does (shared by alphasync.py, which writes the fragment FASTA files, and alphafrag.py, which checks predicted fragments against current sequences)"""
+
+# Fragment length and step size used by DeepMind.
+# Proteins longer than 2699 residues (the AlphaFold DB maximum for unfragmented predictions) are split into windows of width 1400 with a step size of 200.
+fraglen = 1400
+fragstep = 200
+maxlen = 2699
+
+
+
+def Fragments(seq):
+    """Fragment windows of a protein sequence as [(start, end)] (0-based, end exclusive, i.e. fragment n is seq[start:end] for the n-th window): a single window up to maxlen residues, else windows of fraglen residues with a step size of fragstep, the last one ending at the C-terminus"""
+    if len(seq) <= maxlen:
+        return [(0, len(seq))]
+    windows = []
+    for start in range(0, len(seq), fragstep):
+        end = min(start + fraglen, len(seq))
+        windows.append((start, end))
+        if end == len(seq):
+            break
+    return windows
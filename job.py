@@ -12,6 +12,7 @@ job.py: Job script that sequentially runs DSSP and Lahuta on individual fragment
 # Initialize
 from blang_mysql import *
 from blang import *
+from summary import *
 
 # alphafrag = "alphafrag"     # SQL table with fragment protein sequences (>2700 aa proteins get split into 1400 aa fragments with a step size of 200 in AlphaFold DB, for human only - other species don't have results for >2700 aa proteins)
 alphaseq = "alphaseq"       # SQL table with complete protein sequences
@@ -42,6 +43,10 @@ if Switch('alphasync'):
             query = Query(f"DELETE FROM {alphacon} WHERE acc='{acc}' AND afdb={afdb}")
             print(f"   >> Rows affected: {Numrows(query):,}")
 
+            print(f"\n >> Clearing AlphaSync data for acc '{acc}' from table '{alphasummary}'...")
+            query = DeleteSummaries([acc], afdb)
+            print(f"   >> Rows affected: {Numrows(query):,}")
+
             print(f"\n >> Clearing AlphaSync data for acc '{acc}' from table '{alphaseq} (resetting its 'nocon' (no contacts) flag)'...")
             query = Query(f"UPDATE {alphaseq} SET nocon=NULL WHERE acc='{acc}' AND afdb={afdb}")
             print(f"   >> Rows affected: {Numrows(query):,}")
@@ -133,7 +138,7 @@ Run("Getting relative accessible surface areas using DSSP (for SQL table 'alphas
 # Note that this requires running bash (sh's redirect syntax doesn't seem to support filtering only STDERR)
 Run("Getting contacts using Lahuta (for SQL table 'alphacon')", f"bash -c \"../../job_lahuta.py {acc} {maxfrag}{tmp_alphasync} 2> >(grep -viP '(Open Babel Warning +in PerceiveBondOrders|Failed to kekulize aromatic bonds in OBMol::PerceiveBondOrders|Constructed NamedStream from a NamedStream|^==============================$|^$)'>&2)\"", silent=False)
 
-# 3. Run Bio.PDB dihedral angle calculation
+# 3. Backfill dihedral angles (normally already written by job_dssp.py together with the 'alphasa' rows, in which case this exits immediately (skip))
 # Run("Getting dihedral angles (for SQL table 'alphasa')", f"../../job_dihedral_angles.py {acc} {maxfrag}", silent=False)
 Run("Getting dihedral angles (for SQL table 'alphasa')", f"bash -c \"../../job_dihedral_angles.py {acc} {maxfrag}{tmp_alphasync} 2> >(grep -viP '(Open Babel Warning +in PerceiveBondOrders|Failed to kekulize aromatic bonds in OBMol::PerceiveBondOrders|Constructed NamedStream from a NamedStream|^==============================$|^$)'>&2)\"", silent=False)
 
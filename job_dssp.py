@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 """
 Job script (runs on a given protein accession): Run DSSP on individual fragment files to calculate residue-level accessible surface area, combine them using combine_fragments_dssp.py, parse its results into the 'alphaseq' and 'alphasa' MySQL tables, and then remove temporary tmp/{acc} directory once complete
+Dihedral angles and proline isomerization states (dihedrals.py) are written in the same INSERT that creates the 'alphasa' rows (job_dihedral_angles.py only handles backfills)
 """
 
 # Initialize
@@ -8,6 +9,8 @@ import pandas as pd
 import gemmi
 from blang_mysql import *
 from blang import *
+from dihedrals import *
+from summary import *
 
 alphaseq = "alphaseq"       # SQL table with complete protein sequences
 alphasa = "alphasa"         # SQL table with residue-level accessible surface area values
@@ -245,9 +248,18 @@ if seq != tmpseq:
 
 
 
-# Insert into alphasa
+# Get dihedral angles and proline isomerization states (cis/trans), combined across fragments (vectorized, see dihedrals.py)
+dihedrals = ProteinAngles(infiles, seq, maxfrag)
+if list(dihedrals["site"]) != list(df["#position"]):
+    Die(f"Error: Residues with dihedral angles don't match DSSP residues for acc '{acc}'")
+dihedral_values = SqlValues(dihedrals, ["iso"] + angles)
+
+# Insert into alphasa (including dihedral angles, so the rows only get written once)
 # Parse row-wise
-q = f"INSERT INTO {alphasa} (acc, species, tax, frags, afdb, site, aa, plddt, plddt10, asa, asa10, relasa, relasa10, dis, dis10, surf, surf10, sec) VALUES "
+residue_plddts = []
+residue_dis10 = []
+residue_surf = []
+q = f"INSERT INTO {alphasa} (acc, species, tax, frags, afdb, site, aa, plddt, plddt10, asa, asa10, relasa, relasa10, dis, dis10, surf, surf10, sec, iso, {', '.join(angles)}) VALUES "
 for i, a in df.iterrows():
     # print(a)
     site = a["#position"]
@@ -322,12 +334,17 @@ for i, a in df.iterrows():
     else:
         surf10 = "S"
     
+    # Keep values for this structure's summary in table 'alphasummary'
+    residue_plddts.append(plddt)
+    residue_dis10.append(dis10)
+    residue_surf.append(surf)
+    
     # Insert residue-level data (processed across fragments) into alphasa SQL table
     # q = f"INSERT INTO {alphasa} SET acc='{acc}', name='{name}', species='{species}', frags='{maxfrag}', source='{source}', afdb=1, site='{site}', aa='{aa}', plddt='{plddt}', plddt10='{plddt10}', asa='{asa}', asa10='{asa10}', relasa='{relasa}', relasa10='{relasa10}', sec='{sec}', dis='{dis}', dis10='{dis10}', surf='{surf}', surf10='{surf10}'"
     # q = f"INSERT INTO {alphasa} SET acc='{acc}', name='{name}', species='{species}', frags='{maxfrag}', afdb=1, site='{site}', aa='{aa}', plddt='{plddt}', plddt10='{plddt10}', asa='{asa}', asa10='{asa10}', relasa='{relasa}', relasa10='{relasa10}', dis='{dis}', dis10='{dis10}', surf='{surf}', surf10='{surf10}', sec='{sec}'"
     # q = f"INSERT INTO {alphasa} SET acc='{acc}', species='{species}', tax='{tax}', frags='{maxfrag}', afdb=1, site='{site}', aa='{aa}', plddt='{plddt}', plddt10='{plddt10}', asa='{asa}', asa10='{asa10}', relasa='{relasa}', relasa10='{relasa10}', dis='{dis}', dis10='{dis10}', surf='{surf}', surf10='{surf10}', sec='{sec}'"
     # q += f"INSERT INTO {alphasa} SET acc='{acc}', species='{species}', tax='{tax}', frags='{maxfrag}', afdb=1, site='{site}', aa='{aa}', plddt='{plddt}', plddt10='{plddt10}', asa='{asa}', asa10='{asa10}', relasa='{relasa}', relasa10='{relasa10}', dis='{dis}', dis10='{dis10}', surf='{surf}', surf10='{surf10}', sec='{sec}'; "
-    q += f"ROW ('{acc}', '{species}', '{tax}', '{maxfrag}', '{afdb}', '{site}', '{aa}', '{plddt}', '{plddt10}', '{asa}', '{asa10}', '{relasa}', '{relasa10}', '{dis}', '{dis10}', '{surf}', '{surf10}', '{sec}'), "
+    q += f"ROW ('{acc}', '{species}', '{tax}', '{maxfrag}', '{afdb}', '{site}', '{aa}', '{plddt}', '{plddt10}', '{asa}', '{asa10}', '{relasa}', '{relasa10}', '{dis}', '{dis10}', '{surf}', '{surf10}', '{sec}', {dihedral_values[i]}), "
 
 # Insert all rows in a single multi-row insert query
 q = re.sub(r", $", ";", q)
@@ -335,6 +352,9 @@ if not Switch('debug'):
     Query(q)
 else:
     State(q)
+
+# Insert structure summary (length, pLDDT, disorder and surface fractions) into table 'alphasummary'
+UpdateSummary(acc, afdb, ResidueSummary(residue_plddts, residue_dis10, residue_surf))
             
 
 # Delete temporary files
@@ -358,6 +378,6 @@ if not Switch('debug'):
 
 Show(lim=20)
 
-print(f"Successfully inserted ASA values into table '{alphasa}'")
+print(f"Successfully inserted ASA values, dihedral angles and proline isomerization states into table '{alphasa}'")
 
 print("\nDone!")
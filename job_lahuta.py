@@ -6,8 +6,11 @@ Job script (runs on a given protein accession): Get contacts from mmCIF file usi
 # Initialize
 import pandas as pd
 import numpy as np
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
 from blang_mysql import *
 from blang import *
+from summary import *
 np.set_printoptions(suppress=True)
 
 # Currently using an old Lahuta (a pre-release v0.6 version). Keeping this version for reproducibility.
@@ -75,13 +78,18 @@ alphafrag = "alphafrag"     # SQL table with fragment protein sequences (>2700 a
 alphaseq = "alphaseq"       # SQL table with complete protein sequences (used for retrieving additional protein information here)
 alphacon = "alphacon"       # SQL table with residue-level contacts from Lahuta
 
-# Fragment length and step size used by DeepMind.
+# Fragment length and step size used by DeepMind (fraglen, fragstep), and the residue range of a fragment that gets kept (KeptRange, shared with dihedral angles and PAE averaging)
 # Proteins longer than 2700 residues are split into windows of width 1400 with a step size of 200.
-fraglen = 1400
-fragstep = 200
+from dihedrals import KeptRange, fraglen, fragstep
+
+# Residues within fragstep of an artificial terminus get discarded by CombineFragmentContacts, so fragments get trimmed to their kept residue range before running Lahuta.
+# A few residues beyond the kept range are retained on either side so that atom typing (bonds, termini) of the kept residues is the same as in the complete fragment.
+trimbuffer = 3
+# Temporary directory for trimmed fragment mmCIF files (outside the job directory's *.cif files, which are used by the other job scripts)
+trimpath = "trimmed"
 
 # Get arguments
-(acc, maxfrag) = Args(2, "[UniProt accession] [Number of fragments]\n\n -alphasync: Updating AlphaSync proteins (non-AFDB, i.e. afdb=0)", "A0A087WUL8 14")
+(acc, maxfrag) = Args(2, "[UniProt accession] [Number of fragments]\n\n -alphasync: Updating AlphaSync proteins (non-AFDB, i.e. afdb=0)\n -threads: Evaluate contact types in parallel using threads rather than forked processes (only faster if Lahuta releases the GIL)", "A0A087WUL8 14")
 
 # inpath = f"../{source}/{acc}"
 inpath = f"../{acc}"
@@ -93,6 +101,10 @@ afdb = 1
 if Switch('alphasync'):
     afdb = 0
 
+# Number of workers for evaluating the contact types in parallel
+# LSF sets LSB_DJOB_NUMPROC to the number of cores allocated to the job (bsub -n, requested by main.py according to protein length)
+workers = min(int(os.environ.get("LSB_DJOB_NUMPROC", 1)), len(types))
+
 
 
 # Functions
@@ -112,6 +124,49 @@ def GetContacts(type, frag, universe, neighbors):
     # Return data frame
     return df
 
+# Worker function for evaluating a single contact type in parallel
+# Uses the current fragment's universe and neighbors from the parent process (shared with forked worker processes via copy-on-write, so the neighbour search is only run once per fragment)
+def GetContactsWorker(type):
+    return GetContacts(type, frag, universe, neighbors)
+
+# Get contacts of all types for the current fragment (in parallel if more than one worker is available)
+def GetAllContacts():
+
+    if workers <= 1:
+        # Sequential
+        return [GetContactsWorker(type) for type in types]
+
+    if Switch('threads'):
+        # Threads (only faster if Lahuta releases the GIL during contact evaluation)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(GetContactsWorker, types))
+    else:
+        # Forked processes (need to be started after the neighbour search so that they inherit its results)
+        # chunksize=1 since run times vary considerably between contact types
+        with multiprocessing.get_context("fork").Pool(workers) as pool:
+            return pool.map(GetContactsWorker, types, chunksize=1)
+
+# Write a copy of a fragment mmCIF file containing only the atoms of residues start-stop (±trimbuffer), and return its filename
+def TrimFragment(ciffile, start, stop):
+
+    trimfile = f"{trimpath}/{ciffile}"
+    columns = []
+    siteindex = None
+    with open(ciffile) as f, open(trimfile, "w") as out:
+        for line in f:
+            if line.startswith("_atom_site."):
+                # Get column order of the _atom_site loop (AFDB and AlphaSync mmCIF files differ)
+                columns.append(line.rstrip())
+            elif line.startswith("ATOM"):
+                if siteindex is None:
+                    siteindex = columns.index("_atom_site.label_seq_id")
+                site = int(re.split(r" +", line)[siteindex])
+                if site < start - trimbuffer or site > stop + trimbuffer:
+                    continue
+            out.write(line)
+
+    return trimfile
+
 # Format Lahuta data frame for insertion into SQL table
 def FormatContacts(df):
     
@@ -277,7 +332,7 @@ if maxfrag != tmpmaxfrag:
 
 # Start
 
-print(f"\nRunning Lahuta on '{inpath}' (acc '{acc}', {maxfrag} fragments):")
+print(f"\nRunning Lahuta on '{inpath}' (acc '{acc}', {maxfrag} fragments, {workers} workers):")
 
 # # Change directory
 # Not necessary now since the job moves to this directory before running this script (to avoid delays from Python's module import due to the huge number of log files in tmp/_logs/)
@@ -292,6 +347,9 @@ contacts = None
 # tmpfiles = set()
 # Minimum length: no non-neighbor contacts possible until length ≥ 3
 if len(seq) > 2:
+    if maxfrag > 1:
+        os.makedirs(trimpath, exist_ok=True)
+
     for ciffile in tq(infiles):
         # print(f" >> {ciffile}")
 
@@ -330,18 +388,20 @@ if len(seq) > 2:
         #     warnings.filterwarnings("ignore", message=".+Failed to kekulize aromatic bonds in OBMol::PerceiveBondOrders.+")
         #     warnings.filterwarnings("ignore", message=".+Constructed NamedStream from a NamedStream.+")
         # universe = Universe("test_alphafold_db_cif_Q7NBS4/AF-Q7NBS4-F1-model_v2.cif")
-        universe = Universe(ciffile)
+        # Restrict Lahuta to the atoms that can produce kept contacts (for fragmented proteins, the 200 aa next to artificial termini would only get discarded in CombineFragmentContacts)
+        if maxfrag > 1:
+            (start, stop) = KeptRange(frag, maxfrag, len(seq))
+            universe = Universe(TrimFragment(ciffile, start, stop))
+            Log(f"trimmed fragment to kept residue range for acc|frag|start|stop", f"{acc}|{frag}|{start}|{stop}")
+        else:
+            universe = Universe(ciffile)
 
         # Compute neighboring residues
         # print(f" >> Computing neighbors")
         neighbors = universe.compute_neighbors()
 
-        # Get contacts (of all the types specified above)
-        for type in types:
-            # print(f" >> {type}")
-
-            # Get contacts using Lahuta
-            type_contacts = GetContacts(type, frag, universe, neighbors)
+        # Get contacts (of all the types specified above, in parallel if possible)
+        for type_contacts in GetAllContacts():
 
             # Format data frame
             type_contacts = FormatContacts(type_contacts)
@@ -357,6 +417,10 @@ if len(seq) > 2:
         # c = c.sort_values(["acc", "site1", "site2", "type", "groupid1", "groupid2", "dist"], ignore_index=True)
 
         Log(f"ran lahuta for acc|frag", f"{acc}|{frag}")
+
+        # Remove trimmed fragment mmCIF file
+        if maxfrag > 1:
+            os.remove(f"{trimpath}/{ciffile}")
         
 
 
@@ -364,6 +428,10 @@ if len(seq) > 2:
     if (frag != maxfrag):
         Die(f"Error: Expected to have processed {maxfrag} fragments, but only processed {frag}")
 
+    # Remove temporary directory for trimmed fragments (will throw an error if not empty)
+    if maxfrag > 1:
+        os.rmdir(trimpath)
+
     # Accession is complete (Lahuta run for all fragments):
     # Combine output across fragments (by using the union of all contacts (ignoring any from dubious regions within 200 aa of artificial termini), and averaging distances)
     contacts = CombineFragmentContacts(contacts)
@@ -383,5 +451,12 @@ else:
     print(f"No contacts found for acc '{acc}' (afdb={afdb})")
     print(f" >> Setting column 'nocon'=1 for acc '{acc}' (afdb={afdb}) in table '{alphaseq}'")
 
+# Insert contact count into table 'alphasummary' (contacts are inserted without PAE scores, alphacon_add_pae.py sets 'has_pae' once they're in)
+tmpcontacts = 0
+if contacts is not None:
+    tmpcontacts = len(contacts)
+UpdateSummary(acc, afdb, ContactSummary(tmpcontacts, 0))
+print(f" >> Setting column 'contacts'={tmpcontacts} for acc '{acc}' (afdb={afdb}) in table '{alphasummary}'")
+
 
 print("\nDone!")
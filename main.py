@@ -15,6 +15,8 @@ import io
 # from Bio import SeqIO
 from blang_mysql import *
 from blang import *
+from manifest import *
+from summary import *
 
 alphafrag = "alphafrag"     # SQL table with fragment protein sequences (>2700 aa proteins get split into 1400 aa fragments with a step size of 200 in AlphaFold DB, for human only - other species don't have results for >2700 aa proteins)
 alphaseq = "alphaseq"       # SQL table with complete protein sequences
@@ -46,6 +48,18 @@ queues = ["standard"]
 # queues = ["short", "standard"]
 # queues = ["short", "priority"]
 
+# Number of cores to request per job, by protein length
+# job_lahuta.py evaluates the 11 Lahuta contact types in parallel using all cores allocated by LSF (LSB_DJOB_NUMPROC).
+# Small proteins don't benefit, since their run time is dominated by start-up, DSSP and SQL inserts, and the contact types vary strongly in run time (so speedup levels off well below 11 cores).
+# See scripts/benchmark_lahuta_workers.py for speedup curves by protein length (used to choose these thresholds).
+# (minimum length, cores), checked in order:
+cores_by_length = [
+    (2701, 8),      # Fragmented proteins (>2700 aa, split into 1400 aa fragments)
+    (1500, 4),
+    (800, 2),
+    (0, 1),
+]
+
 
 
 Args(0,
@@ -53,7 +67,9 @@ Args(0,
  -alphakeep: Syncing: Only re-run updated AlphaSync proteins, and keep existing AlphaSync data. Use this for re-runs of 'main.py -alphasync' jobs.
  -debug: Don't submit cluster jobs (only print the submit commands that would have been used)
  -humanonly: Parse only human TAR file
- -keepincompletes: Keep incomplete proteins in tables alphasa and alphacon (rather than deleting and re-running them).""",
+ -keepincompletes: Keep incomplete proteins in tables alphasa and alphacon (rather than deleting and re-running them).
+ -changes: Only show what changed since the last run (per TAR archive: new, changed, appended, unfinished or unchanged according to table 'alphamanifest', and bytes that would be read), don't submit any jobs
+ -rescan: Ignore table 'alphamanifest' and read all TAR archives completely""",
 " -debug -humanonly")
 
 alphasyncpath = "input/alphasync"
@@ -90,6 +106,10 @@ Starttime()
 print(f"Initialize: Getting fragment counts per UniProt accession and source file from table '{alphafrag}'...")
 frags = FetchMap(Query(f"SELECT CONCAT(acc, '|', source) AS accsource, MAX(frag) AS maxfrag FROM {alphafrag} GROUP BY acc, source"))
 
+# Get sequence lengths per acc|afdb (for choosing the number of cores per job)
+print(f"Initialize: Getting sequence lengths per UniProt accession from table '{alphaseq}'...")
+seqlens = FetchMap(Query(f"SELECT CONCAT(acc, '|', afdb) AS accafdb, LENGTH(seq) AS seqlen FROM {alphaseq}"))
+
 # # Get annotation per acc|frag|source (just for logging)
 # print(f"Getting annotation (species, sequence etc.) per UniProt accession and source file from table '{alphafrag}'...")
 # annotation = FetchMap(Query(f"SELECT CONCAT_WS('|', acc, frag, source), CONCAT_WS('|', name, species, tax, fragstart, fragstop, seq) FROM {alphafrag}"))
@@ -255,6 +275,10 @@ if len(incomplete_accs) > 0:
             query = Query(f"SELECT * FROM {alphacon} WHERE acc IN ('" + "', '".join(incomplete_accs) + f"') AND afdb='{afdb}'")
         alphacon_accs_deleted = Numrows(query)
         print(f" >> Deleted {Comma(alphacon_accs_deleted)} rows from table '{alphacon}'")
+
+        if not Switch('debug'):
+            query = DeleteSummaries(incomplete_accs, afdb)
+            print(f" >> Deleted {Comma(Numrows(query))} rows from table '{alphasummary}'")
         Stoptime()
         print()
 
@@ -319,6 +343,39 @@ else:
         if rx("alphasync", file) or rx("_HUMAN_", file) or rx("-9606-", file):
             infiles.insert(0, infiles.pop(infiles.index(file)))
 
+# Compare TAR archives to the manifest (table 'alphamanifest', see manifest.py): skip unchanged archives, and only read new members of appended archives
+if not Switch('rescan'):
+    statuses = ArchiveStatuses(infiles, "main")
+else:
+    statuses = {infile: ("new", 0, 0) for infile in infiles}
+
+# Wanted accessions per source archive (from table 'alphafrag')
+source_accs = {}
+for accsource in frags:
+    (acc, source) = accsource.split("|")
+    source_accs.setdefault(source, set()).add(acc)
+
+# Archives that were read before, but still contain wanted accessions (e.g. from failed jobs) before the manifest offset, need to be read completely again
+for infile in infiles:
+    (status, offset, members) = statuses[infile]
+    if status not in ("unchanged", "appended"):
+        continue
+    tmpwanted = wanted_accs & source_accs.get(ArchiveSource(infile), set())
+    if status == "appended":
+        # Wanted accessions in the appended members are fine
+        for membername in ListMembers(infile, offset):
+            m = rx(r"^AF-(\w+(-\d+)?)-F\d+-model_v\d+\.cif\.gz$", membername)
+            if m:
+                tmpwanted.discard(m[0])
+    if len(tmpwanted) > 0:
+        statuses[infile] = ("unfinished", 0, 0)
+
+ManifestReport(statuses, "main")
+if Switch('changes'):
+    # Report only
+    Done()
+    sys.exit(0)
+
 # Make temporary directory for job log files
 Run("Make temporary directory for job logs", f"mkdir -p {logpath}", silent=True)
 
@@ -355,6 +412,14 @@ for infile in infiles:
     # for member in tq(tar, total=int(Return(f"cat '{diagpath}/{source}.tar.files.txt' | wc -l"))):      # Get number of files in archive from diagnostic list (not really faster and would require those lists)
     # for member in tq(tar, total=int(Return(f"tar -tf {infile} | wc -l"))):                             # Get number of files in archive directly from tar -tf (quite slow)
 
+    # Skip archive if it was read completely before, and hasn't changed since (see manifest.py)
+    (status, offset, members) = statuses[infile]
+    if status == "unchanged":
+        print(f"     >> Unchanged since last run according to table 'alphamanifest' (skipped)")
+        continue
+    if status == "appended":
+        print(f"     >> Appended since last run according to table 'alphamanifest': reading members after byte offset {Comma(offset)} ({Comma(members)} members already read)")
+
     # Get number of accs contained in archive from table 'alphafrag' (should be efficient - COUNT(*) is much faster than even COUNT(id))
     tmptotal = FetchOne(Query(f"SELECT COUNT(*) FROM alphafrag WHERE source='{source}'"))
     # Skip archive if it contains no .cif.gz files (e.g. swissprot_pdb_v4)
@@ -376,9 +441,10 @@ for infile in infiles:
         Warn(f"Unhandled source type: '{source}'")
         tmptotal = tmptotal * 1
 
-    # Open TAR file
-    # mode "r:": "Open for reading exclusively without compression" (https://docs.python.org/3/library/tarfile.html)
-    tar = tarfile.open(infile, mode="r:")
+    # Open TAR file (from the manifest offset on, i.e. only new members of appended archives)
+    tar = OpenArchive(infile, offset)
+    end = offset
+    readmembers = 0
     acc = None
     # prevacc = None
     myjobs = Myjobs()
@@ -388,8 +454,13 @@ for infile in infiles:
     submitted = 0
 
     # Stream TAR archive
-    for member in tq(tar, total=tmptotal):
+    # (skipping members marked as removed in the archive's member index, e.g. older copies of re-predicted structures, see manifest.py)
+    for member in tq(LiveMembers(tar), total=tmptotal):
         # print(f"   >> {member.name}")
+
+        # Byte offset after this member (for the manifest)
+        end = MemberEnd(member)
+        readmembers += 1
         
         frag = None
 
@@ -463,6 +534,10 @@ for infile in infiles:
         # if maxfrag != tmpmaxfrag:
         #     Die(f"Error: MAX(frag) and COUNT(DISTINCT frag) don't match for acc '{acc}' in table 'alphafrag'")
         maxfrag = frags[f"{acc}|{source}"]
+
+        # Get number of cores to request for this accession (according to protein length)
+        cores = next(tmpcores for (minlen, tmpcores) in cores_by_length if seqlens.get(f"{acc}|{afdb}", 0) >= minlen)
+        Log(f"requested cores for acc", f"{cores}|{acc}")
         
         # Extract .cif.gz to .cif using gzip (streaming, no temporary files)
         gz = tar.extractfile(member)
@@ -544,7 +619,7 @@ for infile in infiles:
                         if mypending >= maxpending:
                             time.sleep(sleeptime)
 
-                Run(f"Submit job (which runs DSSP and Lahuta, parses their results into the alphasa and alphacon MySQL tables, and cleans up its {tmppath}/acc directory once complete)", f"""bsub -P idr -J update_alphasync_tmp_{tmplogdir}_cd____{tmpacc}_________job_py_{tmpacc}_{maxfrag}{tmpalphasync2}{tmpdebug2} -L /bin/bash -env 'LSB_JOB_REPORT_MAIL=N' -q {queue} -n 1 -R "rusage[mem=4G]" "bash -c 'cd ../{acc}; ../../job.py {acc} {maxfrag}{tmpalphasync}{tmpdebug} > ../{logdir}/log-output-update_alphasync_tmp_{tmplogdir}_cd____{tmpacc}_________job_py_{tmpacc}_{maxfrag}{tmpalphasync2}{tmpdebug2}.txt 2> ../{logdir}/log-errors-update_alphasync_tmp_{tmplogdir}_cd____{tmpacc}_________job_py_{tmpacc}_{maxfrag}{tmpalphasync2}{tmpdebug2}.txt; if [[ ! -s ../{logdir}/log-errors-update_alphasync_tmp_{tmplogdir}_cd____{tmpacc}_________job_py_{tmpacc}_{maxfrag}{tmpalphasync2}{tmpdebug2}.txt ]]; then rm -f ../{logdir}/log-errors-update_alphasync_tmp_{tmplogdir}_cd____{tmpacc}_________job_py_{tmpacc}_{maxfrag}{tmpalphasync2}{tmpdebug2}.txt ../{logdir}/log-output-update_alphasync_tmp_{tmplogdir}_cd____{tmpacc}_________job_py_{tmpacc}_{maxfrag}{tmpalphasync2}{tmpdebug2}.txt; fi'" -e /dev/null -o /dev/null > /dev/null &""", silent=True)
+                Run(f"Submit job (which runs DSSP and Lahuta, parses their results into the alphasa and alphacon MySQL tables, and cleans up its {tmppath}/acc directory once complete)", f"""bsub -P idr -J update_alphasync_tmp_{tmplogdir}_cd____{tmpacc}_________job_py_{tmpacc}_{maxfrag}{tmpalphasync2}{tmpdebug2} -L /bin/bash -env 'LSB_JOB_REPORT_MAIL=N' -q {queue} -n {cores} -R "span[hosts=1]" -R "rusage[mem=4G]" "bash -c 'cd ../{acc}; ../../job.py {acc} {maxfrag}{tmpalphasync}{tmpdebug} > ../{logdir}/log-output-update_alphasync_tmp_{tmplogdir}_cd____{tmpacc}_________job_py_{tmpacc}_{maxfrag}{tmpalphasync2}{tmpdebug2}.txt 2> ../{logdir}/log-errors-update_alphasync_tmp_{tmplogdir}_cd____{tmpacc}_________job_py_{tmpacc}_{maxfrag}{tmpalphasync2}{tmpdebug2}.txt; if [[ ! -s ../{logdir}/log-errors-update_alphasync_tmp_{tmplogdir}_cd____{tmpacc}_________job_py_{tmpacc}_{maxfrag}{tmpalphasync2}{tmpdebug2}.txt ]]; then rm -f ../{logdir}/log-errors-update_alphasync_tmp_{tmplogdir}_cd____{tmpacc}_________job_py_{tmpacc}_{maxfrag}{tmpalphasync2}{tmpdebug2}.txt ../{logdir}/log-output-update_alphasync_tmp_{tmplogdir}_cd____{tmpacc}_________job_py_{tmpacc}_{maxfrag}{tmpalphasync2}{tmpdebug2}.txt; fi'" -e /dev/null -o /dev/null > /dev/null &""", silent=True)
 
                 # print("+", end="")
                 myjobs += 1
@@ -567,7 +642,7 @@ for infile in infiles:
             else:
                 # Print only
                 # print(f"   >> Submit job (which runs DSSP, parses its results into the alphasa and alphacon MySQL tables, and cleans up its tmp/acc directory once complete): ~/scripts/qsub.sh ../../dssp.py {source} {acc} {maxfrag}")
-                print(f"   >> Submit job (which runs DSSP and Lahuta, parses their results into the alphasa and alphacon MySQL tables, and cleans up its {tmppath}/acc directory once complete): " + f"""bsub -P idr -J update_alphasync_tmp_{tmplogdir}_cd____{tmpacc}_________job_py_{tmpacc}_{maxfrag}{tmpalphasync2}{tmpdebug2} -L /bin/bash -env 'LSB_JOB_REPORT_MAIL=N' -q {queue} -n 1 -R "rusage[mem=4G]" "bash -c 'cd ../{acc}; ../../job.py {acc} {maxfrag}{tmpalphasync}{tmpdebug} > ../{logdir}/log-output-update_alphasync_tmp_{tmplogdir}_cd____{tmpacc}_________job_py_{tmpacc}_{maxfrag}{tmpalphasync2}{tmpdebug2}.txt 2> ../{logdir}/log-errors-update_alphasync_tmp_{tmplogdir}_cd____{tmpacc}_________job_py_{tmpacc}_{maxfrag}{tmpalphasync2}{tmpdebug2}.txt; if [[ ! -s ../{logdir}/log-errors-update_alphasync_tmp_{tmplogdir}_cd____{tmpacc}_________job_py_{tmpacc}_{maxfrag}{tmpalphasync2}{tmpdebug2}.txt ]]; then rm -f ../{logdir}/log-errors-update_alphasync_tmp_{tmplogdir}_cd____{tmpacc}_________job_py_{tmpacc}_{maxfrag}{tmpalphasync2}{tmpdebug2}.txt ../{logdir}/log-output-update_alphasync_tmp_{tmplogdir}_cd____{tmpacc}_________job_py_{tmpacc}_{maxfrag}{tmpalphasync2}{tmpdebug2}.txt; fi'" -e /dev/null -o /dev/null > /dev/null""")
+                print(f"   >> Submit job (which runs DSSP and Lahuta, parses their results into the alphasa and alphacon MySQL tables, and cleans up its {tmppath}/acc directory once complete): " + f"""bsub -P idr -J update_alphasync_tmp_{tmplogdir}_cd____{tmpacc}_________job_py_{tmpacc}_{maxfrag}{tmpalphasync2}{tmpdebug2} -L /bin/bash -env 'LSB_JOB_REPORT_MAIL=N' -q {queue} -n {cores} -R "span[hosts=1]" -R "rusage[mem=4G]" "bash -c 'cd ../{acc}; ../../job.py {acc} {maxfrag}{tmpalphasync}{tmpdebug} > ../{logdir}/log-output-update_alphasync_tmp_{tmplogdir}_cd____{tmpacc}_________job_py_{tmpacc}_{maxfrag}{tmpalphasync2}{tmpdebug2}.txt 2> ../{logdir}/log-errors-update_alphasync_tmp_{tmplogdir}_cd____{tmpacc}_________job_py_{tmpacc}_{maxfrag}{tmpalphasync2}{tmpdebug2}.txt; if [[ ! -s ../{logdir}/log-errors-update_alphasync_tmp_{tmplogdir}_cd____{tmpacc}_________job_py_{tmpacc}_{maxfrag}{tmpalphasync2}{tmpdebug2}.txt ]]; then rm -f ../{logdir}/log-errors-update_alphasync_tmp_{tmplogdir}_cd____{tmpacc}_________job_py_{tmpacc}_{maxfrag}{tmpalphasync2}{tmpdebug2}.txt ../{logdir}/log-output-update_alphasync_tmp_{tmplogdir}_cd____{tmpacc}_________job_py_{tmpacc}_{maxfrag}{tmpalphasync2}{tmpdebug2}.txt; fi'" -e /dev/null -o /dev/null > /dev/null""")
                 submitted += 1
                 tmpfiles = set()
         
@@ -588,6 +663,10 @@ for infile in infiles:
     
     # TAR file completely processed
     print(f"     >> Submitted {Comma(submitted)} jobs")
+
+    # Record read members in the manifest
+    if not Switch('debug'):
+        UpdateManifest(infile, "main", end, members + readmembers)
         
 Show("submitted job for acc") if Switch('debug') else None
 # Show()
@@ -0,0 +1,125 @@
+"""TAR archive manifest functions: skip archives (or archive members) that were already ingested in a previous run
+
+Table 'alphamanifest' records, per archive and stage (e.g. 'alphafrag' for alphafrag.py, 'main' for main.py), the archive's size and modification time, a checksum of its contents, and the byte offset and number of the members ingested so far.
+TAR archives only ever grow by appending members (tar -r), so the members already ingested are the ones before this offset:
+ - unchanged archives (same size and modification time) get skipped outright,
+ - appended archives (larger, with the ingested part unchanged according to its checksum) get read from the offset on, i.e. only their new members,
+ - new or otherwise changed archives get read completely.
+The checksum covers the first and last MiB before the offset (reading entire archives of up to hundreds of GB would defeat the purpose).
+
+AlphaSync archives can also contain members that are marked as removed in a member index next to the archive (.tar.index.tsv, see migrate_alphasync_tar_archives.py), e.g. older copies of re-predicted structures, or structures whose files were deleted.
+Readers iterate over LiveMembers (or ListMembers) instead of the archive itself, so they skip these.
+"""
+
+import hashlib
+import os
+import tarfile
+from blang import Basename, Comma, nsort
+from blang_mysql import FetchOne, Numrows, Query
+
+manifest = "alphamanifest"
+
+# Number of bytes at the start and end of the ingested part of an archive to checksum
+checksum_bytes = 1024 * 1024
+
+
+
+def ArchiveSource(infile):
+    """Source name of a TAR archive (file name without .tar, e.g. UP000000589_10090_MOUSE_v2, as in table 'alphafrag')"""
+    return Basename(infile).removesuffix(".tar")
+
+def ArchiveChecksum(infile, offset):
+    """MD5 checksum of the first and last MiB of a TAR archive before a byte offset"""
+    md5 = hashlib.md5()
+    with open(infile, "rb") as f:
+        md5.update(f.read(min(offset, checksum_bytes)))
+        f.seek(max(offset - checksum_bytes, 0))
+        md5.update(f.read(min(offset, checksum_bytes)))
+    return md5.hexdigest()
+
+def ArchiveStatus(infile, stage):
+    """Compare a TAR archive to its manifest entry for a stage: returns (status, offset, members), where status is 'new', 'unchanged', 'appended' or 'changed', and offset and members refer to the members already ingested"""
+    query = Query(f"SELECT size, mtime, checksum, ingested, members FROM {manifest} WHERE source='{ArchiveSource(infile)}' AND stage='{stage}'")
+    if Numrows(query) == 0:
+        return ("new", 0, 0)
+    (size, mtime, checksum, offset, members) = FetchOne(query)
+    stat = os.stat(infile)
+    if stat.st_size == size and int(stat.st_mtime) == mtime:
+        return ("unchanged", offset, members)
+    if stat.st_size >= offset and ArchiveChecksum(infile, offset) == checksum:
+        if stat.st_size == size:
+            # Only the modification time changed
+            return ("unchanged", offset, members)
+        return ("appended", offset, members)
+    return ("changed", 0, 0)
+
+def ArchiveBytes(infile, status, offset):
+    """Number of bytes that need to be read from a TAR archive given its status (see ArchiveStatus)"""
+    if status == "unchanged":
+        return 0
+    return os.path.getsize(infile) - offset
+
+def ArchiveStatuses(infiles, stage):
+    """Compare a list of TAR archives to their manifest entries for a stage (returns {infile: (status, offset, members)}, see ArchiveStatus)"""
+    return {infile: ArchiveStatus(infile, stage) for infile in infiles}
+
+def ManifestReport(statuses, stage):
+    """Print a 'what changed' report for TAR archives (see ArchiveStatuses): status and bytes that would be read per archive"""
+    total = 0
+    print(f"\nTAR archives compared to table '{manifest}' (stage '{stage}'):")
+    for infile, (status, offset, members) in statuses.items():
+        tmpbytes = ArchiveBytes(infile, status, offset)
+        total += tmpbytes
+        print(f" >> {status}\t{tmpbytes / 1e9:,.2f} GB to read\t({Comma(members)} members already ingested)\t{infile}")
+    for status in nsort(set(status for (status, offset, members) in statuses.values())):
+        print(f" >> {status}: {sum(1 for (tmpstatus, offset, members) in statuses.values() if tmpstatus == status)} archives")
+    print(f" >> Total: {total / 1e9:,.2f} GB to read")
+
+def UpdateManifest(infile, stage, offset, members):
+    """Record that the members of a TAR archive up to a byte offset have been ingested for a stage"""
+    stat = os.stat(infile)
+    Query(f"REPLACE INTO {manifest} SET source='{ArchiveSource(infile)}', stage='{stage}', size={stat.st_size}, mtime={int(stat.st_mtime)}, checksum='{ArchiveChecksum(infile, offset)}', ingested={offset}, members={members}")
+
+def CopyManifest(infile, outfile):
+    """Copy a TAR archive's manifest entries (all stages) to an identical copy of it under another name (e.g. when carrying an archive forward to a new release), so the copy doesn't count as new"""
+    Query(f"REPLACE INTO {manifest} (source, stage, size, mtime, checksum, ingested, members) SELECT '{ArchiveSource(outfile)}', stage, size, mtime, checksum, ingested, members FROM {manifest} WHERE source='{ArchiveSource(infile)}'")
+
+def OpenArchive(infile, offset=0):
+    """Open a TAR archive for streaming, starting at a byte offset (the start of a member header, e.g. the offset recorded in the manifest)"""
+    f = open(infile, "rb")
+    f.seek(offset)
+    # mode "r:": "Open for reading exclusively without compression" (https://docs.python.org/3/library/tarfile.html)
+    return tarfile.open(fileobj=f, mode="r:")
+
+def MemberEnd(member):
+    """Byte offset right after a TAR archive member (its header plus its data, padded to 512-byte blocks)"""
+    return member.offset_data + (member.size + tarfile.BLOCKSIZE - 1) // tarfile.BLOCKSIZE * tarfile.BLOCKSIZE
+
+def IndexFile(infile):
+    """Member index of a TAR archive (TSV: name, header offset, end offset, size, mtime, removed), written by migrate_alphasync_tar_archives.py"""
+    return f"{infile}.index.tsv"
+
+def RemovedMembers(infile):
+    """Header byte offsets of the members of a TAR archive that are marked as removed in its member index (empty if it has no index, e.g. AFDB archives)"""
+    removed = set()
+    if os.path.exists(IndexFile(infile)):
+        with open(IndexFile(infile)) as f:
+            next(f)
+            for line in f:
+                (name, offset, end, size, mtime, tmpremoved) = line.rstrip("\n").split("\t")
+                if tmpremoved == "1":
+                    removed.add(int(offset))
+    return removed
+
+def LiveMembers(tar):
+    """Members of an open TAR archive (see OpenArchive), skipping members that are marked as removed in its member index (see RemovedMembers)"""
+    removed = RemovedMembers(tar.name)
+    for member in tar:
+        if member.offset in removed:
+            continue
+        yield member
+
+def ListMembers(infile, offset=0):
+    """Names of the live members of a TAR archive from a byte offset on (reads member headers only, see LiveMembers)"""
+    with OpenArchive(infile, offset) as tar:
+        return [member.name for member in LiveMembers(tar)]
@@ -0,0 +1,30 @@
+"""Membrane functions: flag residues in table 'alphasa' that are within UniProt 'transmembrane region' or 'intramembrane region' features (table 'unifeat')
+
+Feature intervals are matched to 'alphaseq' accessions by sequence and bulk-loaded into a staging table with a single INSERT ... SELECT, then applied with a single range-join UPDATE (instead of one UPDATE per feature and accession).
+Used by alphasa_add_membrane.py, and by scripts/validate_alphasa_membrane.py to validate it against the previous per-feature method.
+"""
+
+from blang_mysql import FetchRow, Numrows, Query
+
+alphasa = "alphasa"
+tmptable = "alphasa_tmp_membrane"       # Staging table for membrane feature intervals (acc, start, stop)
+
+
+
+def AddMembrane():
+    """Set membrane=1 in table 'alphasa' for residues within membrane features, returns (intervals, accs, rows changed)"""
+
+    # Bulk-load feature intervals for all alphaseq accs that have the feature's exact sequence (we don't care about the species here)
+    # Note: As before, intervals apply to all structures (afdb values) for an acc, regardless of which alphaseq row's sequence matched
+    Query(f"DROP TEMPORARY TABLE IF EXISTS {tmptable}")
+    Query(f"CREATE TEMPORARY TABLE {tmptable} (`acc` char(13) NOT NULL, `start` mediumint NOT NULL, `stop` mediumint NOT NULL, PRIMARY KEY (`acc`, `start`, `stop`)) ENGINE=InnoDB")
+    Query(f"INSERT IGNORE INTO {tmptable} (acc, start, stop) SELECT DISTINCT a.acc, f.start, f.stop FROM unifeat f, uniseq s, alphaseq a WHERE f.type IN ('transmembrane region', 'intramembrane region') AND f.acc=s.acc AND s.type IN ('UniProt', 'UniIso') AND a.seq=s.seq")
+    (intervals, accs) = FetchRow(Query(f"SELECT COUNT(*), COUNT(DISTINCT acc) FROM {tmptable}"))
+
+    # Set membrane column to 1 for each residue within any interval (range join on the primary key (acc, site, afdb))
+    query = Query(f"UPDATE {alphasa} a JOIN {tmptable} t ON t.acc=a.acc AND a.site BETWEEN t.start AND t.stop SET a.membrane=1")
+    changed = Numrows(query)
+
+    Query(f"DROP TEMPORARY TABLE {tmptable}")
+
+    return (intervals, accs, changed)
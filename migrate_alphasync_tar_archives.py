@@ -2,6 +2,7 @@
 """
 migrate_alphasync_tar_archives.py:
 Compress all CIF/PAE/params output files into .tar archives
+Archives are maintained incrementally: new output files are appended, members whose files were removed or replaced are marked in a member index next to the archive (.tar.index.tsv, which alphafrag.py and main.py use to skip them, see manifest.py), and an archive is only rewritten from scratch (compacted) once removed members take up more than a set fraction of it.
 """
 
 # Initialize
@@ -15,51 +16,198 @@ import gzip
 import io
 import requests
 import json
+import fnmatch
+import os
+import shutil
 # from Bio import SeqIO
 from blang_mysql import *
 from blang import *
+from manifest import ArchiveSource, CopyManifest, IndexFile, MemberEnd, OpenArchive
 
 # Paths for deleting outdated AlphaSync structure predictions (where an accession has since been made obsolete, or a sequence was changed, in UniProt)
+alphasyncpath = "input/alphasync"
 cifdir = "input/alphasync/cif"
 paedir = "input/alphasync/pae"
 paramdir = "input/alphasync/params"
 
-(version) = Args(1, "[Current UniProt version]\n -debug: Don't actually make any changes, just simulate", "2025_01")
-
-# Output files
-alphasync_cif_tar = f"alphasync_cif_{version}.tar"
-alphasync_pae_tar = f"alphasync_pae_{version}.tar"
-alphasync_params_tar = f"alphasync_params_{version}.tar"
-
-# Compress all CIF/PAE/params output files into .tar archives
-if not Switch('debug') and not Switch('debug2'):
-    if glob(f"{cifdir}/AF-*.cif.gz"):
-        # Run("Compress all CIF files into a single .tar file", f"cd {cifdir}; tar -cf {alphasync_tar} ../AF-*.cif.gz")
-        # Run("Compress all CIF files into a single .tar file", f"cd {cifdir}; find . -name 'AF-*.cif.gz' -print0 | tar --null -T - -cf ../{alphasync_tar}")
-
-        # Run sequentially
-        Run("Compress all CIF files into a single .tar file (naturally sorted)",            f"cd {cifdir};   find . -name 'AF-*.cif.gz' -printf '%P\\n'  | sort -V | tar -T - -cf ../{alphasync_cif_tar}")
-        Run("Compress all PAE JSON files into a single .tar file (naturally sorted)",       f"cd {paedir};   find . -name 'AF-*.json.gz' -printf '%P\\n' | sort -V | tar -T - -cf ../{alphasync_pae_tar}")
-        Run("Compress all parameter JSON files into a single .tar file (naturally sorted)", f"cd {paramdir}; find . -name 'AF-*.json' -printf '%P\\n'    | sort -V | tar -T - -cf ../{alphasync_params_tar}")
-
-        # # Run in parallel
-        # Run("Compress all CIF files into a single .tar file (naturally sorted)",            f"""~/scripts/qsub.sh sh -c 'cd {cifdir};   find . -name "AF-*.cif.gz"  -printf '%P\\n'  | sort -V | tar -T - -cf ../{alphasync_cif_tar}'""")
-        # Run("Compress all PAE JSON files into a single .tar file (naturally sorted)",       f"""~/scripts/qsub.sh sh -c 'cd {paedir};   find . -name "AF-*.json.gz" -printf '%P\\n' | sort -V | tar -T - -cf ../{alphasync_pae_tar}'""")
-        # Run("Compress all parameter JSON files into a single .tar file (naturally sorted)", f"""~/scripts/qsub.sh sh -c 'cd {paramdir}; find . -name "AF-*.json"    -printf '%P\\n'    | sort -V | tar -T - -cf ../{alphasync_params_tar}'""")
-        # Waitforjobs()
-
-        # Run manually, sequentially (for 2025_01):
-        # cd input/alphasync/cif;    find . -name 'AF-*.cif.gz' -printf '%P\n' | sort -V | tar -T - -cf ../alphasync_cif_2025_01.tar  ; echo " >> alphasync_cif_2025_01.tar complete";    cd input/alphasync; 
-        # cd input/alphasync/pae;    find . -name 'AF-*.json.gz' -printf '%P\n' | sort -V | tar -T - -cf ../alphasync_pae_2025_01.tar ; echo " >> alphasync_pae_2025_01.tar complete";    cd input/alphasync; 
-        # cd input/alphasync/params; find . -name 'AF-*.json' -printf '%P\n' | sort -V | tar -T - -cf ../alphasync_params_2025_01.tar ; echo " >> alphasync_params_2025_01.tar complete"; cd input/alphasync; 
-        # In one line (for 2025_01):
-        # cd input/alphasync/cif;    find . -name 'AF-*.cif.gz' -printf '%P\n' | sort -V | tar -T - -cf ../alphasync_cif_2025_01.tar  ; echo " >> alphasync_cif_2025_01.tar complete";    cd input/alphasync; cd input/alphasync/pae;    find . -name 'AF-*.json.gz' -printf '%P\n' | sort -V | tar -T - -cf ../alphasync_pae_2025_01.tar ; echo " >> alphasync_pae_2025_01.tar complete";    cd input/alphasync; cd input/alphasync/params; find . -name 'AF-*.json' -printf '%P\n' | sort -V | tar -T - -cf ../alphasync_params_2025_01.tar ; echo " >> alphasync_params_2025_01.tar complete"; cd input/alphasync; 
-        # Run manually, in parallel (for 2025_01):
-        # ~/scripts/qsub.sh sh -c 'cd input/alphasync/cif;    find . -name "AF-*.cif.gz"  -printf '%P\n' | sort -V | tar -T - -cf ../alphasync_cif_2025_01.tar'
-        # ~/scripts/qsub.sh sh -c 'cd input/alphasync/pae;    find . -name "AF-*.json.gz" -printf '%P\n' | sort -V | tar -T - -cf ../alphasync_pae_2025_01.tar'
-        # ~/scripts/qsub.sh sh -c 'cd input/alphasync/params; find . -name "AF-*.json"    -printf '%P\n' | sort -V | tar -T - -cf ../alphasync_params_2025_01.tar'
-        # In one line (for 2025_01):
-        # ~/scripts/qsub.sh sh -c 'cd input/alphasync/cif;    find . -name "AF-*.cif.gz"  -printf '%P\n' | sort -V | tar -T - -cf ../alphasync_cif_2025_01.tar'; ~/scripts/qsub.sh sh -c 'cd input/alphasync/pae;    find . -name "AF-*.json.gz" -printf '%P\n' | sort -V | tar -T - -cf ../alphasync_pae_2025_01.tar'; ~/scripts/qsub.sh sh -c 'cd input/alphasync/params; find . -name "AF-*.json"    -printf '%P\n' | sort -V | tar -T - -cf ../alphasync_params_2025_01.tar'
+alphafrag = "alphafrag"
+
+# Compact an archive (rewrite it from scratch) once removed members take up more than this fraction of it
+compact_fraction = 0.25
+
+(version) = Args(1, "[Current UniProt version]\n -compact: Rewrite all archives from scratch (naturally sorted, without removed members), regardless of how much of them is taken up by removed members\n -debug: Don't actually make any changes, just show what would be appended, removed and compacted", "2025_01")
+
+# Output files: (kind, directory, file name pattern, archive)
+archives = [
+    ("CIF", cifdir, "AF-*.cif.gz", f"{alphasyncpath}/alphasync_cif_{version}.tar"),
+    ("PAE JSON", paedir, "AF-*.json.gz", f"{alphasyncpath}/alphasync_pae_{version}.tar"),
+    ("parameter JSON", paramdir, "AF-*.json", f"{alphasyncpath}/alphasync_params_{version}.tar"),
+]
+
+
+
+# Functions
+
+def Files(dir, pattern):
+    """Output files in a directory: {name: (size, mtime)}"""
+    files = {}
+    for entry in os.scandir(dir):
+        if entry.is_file() and fnmatch.fnmatch(entry.name, pattern):
+            stat = entry.stat()
+            files[entry.name] = (stat.st_size, int(stat.st_mtime))
+    return files
+
+def IndexArchive(archive):
+    """Build a member index by reading an archive's member headers (all members live)"""
+    with OpenArchive(archive) as tar:
+        return [[member.name, member.offset, MemberEnd(member), member.size, int(member.mtime), 0] for member in tar]
+
+def ReadIndex(archive):
+    """Read an archive's member index (building it from the archive if there is none yet, e.g. for archives created before indexing)"""
+    if not os.path.exists(IndexFile(archive)):
+        return IndexArchive(archive)
+    index = []
+    with open(IndexFile(archive)) as f:
+        next(f)
+        for line in f:
+            (name, offset, end, size, mtime, removed) = line.rstrip("\n").split("\t")
+            index.append([name, int(offset), int(end), int(size), int(mtime), int(removed)])
+    return index
+
+def WriteIndex(archive, index):
+    """Write an archive's member index (atomically), returns bytes written"""
+    tmpfile = f"{IndexFile(archive)}.tmp"
+    with open(tmpfile, "w") as f:
+        print("name\toffset\tend\tsize\tmtime\tremoved", file=f)
+        for row in index:
+            print("\t".join(str(value) for value in row), file=f)
+    os.replace(tmpfile, IndexFile(archive))
+    return os.path.getsize(IndexFile(archive))
+
+def Append(archive, dir, names, end, index):
+    """Append files to an archive after its last member (overwriting the end-of-archive blocks, like tar -r), adding them to its index, returns bytes written"""
+    with open(archive, "r+b") as f:
+        f.seek(end)
+        # Writes start at the current position of the file object (TarFile.offset starts at f.tell())
+        tar = tarfile.open(fileobj=f, mode="w:", format=tarfile.GNU_FORMAT)
+        for name in names:
+            info = tar.gettarinfo(f"{dir}/{name}", arcname=name)
+            offset = tar.offset
+            with open(f"{dir}/{name}", "rb") as infile:
+                tar.addfile(info, infile)
+            index.append([name, offset, tar.offset, info.size, int(info.mtime), 0])
+        # Writes the end-of-archive blocks (padded to a full record)
+        tar.close()
+        f.truncate()
+        return f.tell() - end
+
+def CarryForward(previous, archive):
+    """Copy the previous release's archive (and its index) to this release's name, keeping the previous one, and carry its manifest entries and the source of its rows in table 'alphafrag' forward, so alphafrag.py and main.py don't read the copy again"""
+    tmpfile = f"{archive}.tmp"
+    # copy2 keeps the modification time, so the copy matches the manifest entries
+    shutil.copy2(previous, tmpfile)
+    if os.path.exists(IndexFile(previous)):
+        shutil.copy2(IndexFile(previous), IndexFile(archive))
+    Query("START TRANSACTION")
+    CopyManifest(previous, archive)
+    query = Query(f"UPDATE {alphafrag} SET source='{ArchiveSource(archive)}' WHERE source='{ArchiveSource(previous)}'")
+    Query("COMMIT")
+    print(f" >> {Comma(Numrows(query))} rows in table '{alphafrag}' now refer to '{ArchiveSource(archive)}'")
+    # Only put the archive in place once everything else has been carried forward (an interrupted run carries it forward again)
+    os.replace(tmpfile, archive)
+
+def Compact(kind, dir, pattern, archive):
+    """Rewrite an archive from scratch from the output files (naturally sorted, without removed members), returns its new index"""
+    tmpfile = f"{archive}.tmp"
+    Run(f"Compress all {kind} files into a single .tar file (naturally sorted)", f"cd {dir}; find . -name '{pattern}' -printf '%P\\n' | sort -V | tar -T - -cf {os.path.abspath(tmpfile)}")
+    if not os.path.exists(tmpfile):
+        Die(f"Error: Couldn't write archive '{tmpfile}'")
+    os.replace(tmpfile, archive)
+    return IndexArchive(archive)
+
+
+
+# Start
+
+# Maintain CIF/PAE/params .tar archives incrementally: append new (or changed) output files, mark members whose files were removed in the archive's member index, and only rewrite an archive once removed members take up too much of it
+# Appended members don't change the part of an archive that was already ingested, so alphafrag.py and main.py only read the new members (see manifest.py)
+# Members marked as removed (e.g. older copies of re-predicted structures) stay in the archive until it gets compacted, but all readers skip them (see manifest.LiveMembers)
+Starttime()
+total_written = 0
+for (kind, dir, pattern, archive) in archives:
+    print(f"\n{kind} files in '{dir}' >> '{archive}':")
+    if not glob(f"{dir}/{pattern}"):
+        print(f" >> No files (skipped)")
+        continue
+
+    # New UniProt release: carry a copy of the previous release's archive (and its index and manifest entries) forward instead of rewriting it, keeping the previous release's archive
+    if not os.path.exists(archive):
+        previous = nsort(glob(archive.replace(version, "*")))
+        if len(previous) > 0:
+            print(f" >> Carrying forward a copy of previous archive '{previous[-1]}'")
+            if not Switch('debug'):
+                CarryForward(previous[-1], archive)
+            else:
+                archive = previous[-1]
+
+    written = 0
+    if not os.path.exists(archive):
+        print(f" >> No archive yet: creating it from scratch")
+        if not Switch('debug'):
+            written = WriteIndex(archive, Compact(kind, dir, pattern, archive)) + os.path.getsize(archive)
+
+    else:
+        files = Files(dir, pattern)
+        index = ReadIndex(archive)
+        end = index[-1][2] if len(index) > 0 else 0
+
+        # Compare live members to the output files: members whose file is gone (or was replaced, e.g. re-predicted) get marked as removed, new (or replaced) files get appended
+        live = {row[0]: row for row in index if row[5] == 0}
+        removed = [row for name, row in live.items() if files.get(name) != (row[3], row[4])]
+        new = nsort([name for name in files if name not in live or files[name] != (live[name][3], live[name][4])])
+        for row in removed:
+            row[5] = 1
+        removed_bytes = sum(row[2] - row[1] for row in index if row[5] == 1)
+        print(f" >> {Comma(len(live))} live members, {Comma(len(new))} new files to append, {Comma(len(removed))} members to mark as removed")
+        print(f" >> Removed members take up {removed_bytes / 1e9:,.2f} GB of {end / 1e9:,.2f} GB")
+
+        if Switch('compact') or (end > 0 and removed_bytes > compact_fraction * end):
+            print(f" >> Compacting (rewriting archive from scratch)")
+            if not Switch('debug'):
+                written = WriteIndex(archive, Compact(kind, dir, pattern, archive)) + os.path.getsize(archive)
+        elif len(new) > 0 or len(removed) > 0 or not os.path.exists(IndexFile(archive)):
+            if not Switch('debug'):
+                if len(new) > 0:
+                    written += Append(archive, dir, new, end, index)
+                written += WriteIndex(archive, index)
+        else:
+            print(f" >> Unchanged")
+
+    print(f" >> {written / 1e9:,.2f} GB written")
+    total_written += written
+
+print(f"\nTotal: {total_written / 1e9:,.2f} GB written")
+Stoptime()
+
+# Previous approach: rewrite all archives from scratch every time
+# # Run in parallel
+# Run("Compress all CIF files into a single .tar file (naturally sorted)",            f"""~/scripts/qsub.sh sh -c 'cd {cifdir};   find . -name "AF-*.cif.gz"  -printf '%P\\n'  | sort -V | tar -T - -cf ../{alphasync_cif_tar}'""")
+# Run("Compress all PAE JSON files into a single .tar file (naturally sorted)",       f"""~/scripts/qsub.sh sh -c 'cd {paedir};   find . -name "AF-*.json.gz" -printf '%P\\n' | sort -V | tar -T - -cf ../{alphasync_pae_tar}'""")
+# Run("Compress all parameter JSON files into a single .tar file (naturally sorted)", f"""~/scripts/qsub.sh sh -c 'cd {paramdir}; find . -name "AF-*.json"    -printf '%P\\n'    | sort -V | tar -T - -cf ../{alphasync_params_tar}'""")
+# Waitforjobs()
+
+# Run manually, sequentially (for 2025_01):
+# cd input/alphasync/cif;    find . -name 'AF-*.cif.gz' -printf '%P\n' | sort -V | tar -T - -cf ../alphasync_cif_2025_01.tar  ; echo " >> alphasync_cif_2025_01.tar complete";    cd input/alphasync; 
+# cd input/alphasync/pae;    find . -name 'AF-*.json.gz' -printf '%P\n' | sort -V | tar -T - -cf ../alphasync_pae_2025_01.tar ; echo " >> alphasync_pae_2025_01.tar complete";    cd input/alphasync; 
+# cd input/alphasync/params; find . -name 'AF-*.json' -printf '%P\n' | sort -V | tar -T - -cf ../alphasync_params_2025_01.tar ; echo " >> alphasync_params_2025_01.tar complete"; cd input/alphasync; 
+# In one line (for 2025_01):
+# cd input/alphasync/cif;    find . -name 'AF-*.cif.gz' -printf '%P\n' | sort -V | tar -T - -cf ../alphasync_cif_2025_01.tar  ; echo " >> alphasync_cif_2025_01.tar complete";    cd input/alphasync; cd input/alphasync/pae;    find . -name 'AF-*.json.gz' -printf '%P\n' | sort -V | tar -T - -cf ../alphasync_pae_2025_01.tar ; echo " >> alphasync_pae_2025_01.tar complete";    cd input/alphasync; cd input/alphasync/params; find . -name 'AF-*.json' -printf '%P\n' | sort -V | tar -T - -cf ../alphasync_params_2025_01.tar ; echo " >> alphasync_params_2025_01.tar complete"; cd input/alphasync; 
+# Run manually, in parallel (for 2025_01):
+# ~/scripts/qsub.sh sh -c 'cd input/alphasync/cif;    find . -name "AF-*.cif.gz"  -printf '%P\n' | sort -V | tar -T - -cf ../alphasync_cif_2025_01.tar'
+# ~/scripts/qsub.sh sh -c 'cd input/alphasync/pae;    find . -name "AF-*.json.gz" -printf '%P\n' | sort -V | tar -T - -cf ../alphasync_pae_2025_01.tar'
+# ~/scripts/qsub.sh sh -c 'cd input/alphasync/params; find . -name "AF-*.json"    -printf '%P\n' | sort -V | tar -T - -cf ../alphasync_params_2025_01.tar'
+# In one line (for 2025_01):
+# ~/scripts/qsub.sh sh -c 'cd input/alphasync/cif;    find . -name "AF-*.cif.gz"  -printf '%P\n' | sort -V | tar -T - -cf ../alphasync_cif_2025_01.tar'; ~/scripts/qsub.sh sh -c 'cd input/alphasync/pae;    find . -name "AF-*.json.gz" -printf '%P\n' | sort -V | tar -T - -cf ../alphasync_pae_2025_01.tar'; ~/scripts/qsub.sh sh -c 'cd input/alphasync/params; find . -name "AF-*.json"    -printf '%P\n' | sort -V | tar -T - -cf ../alphasync_params_2025_01.tar'
 
 
 # # Compress all CIF files into per-species .tar files (as for all other AlphaFold Protein Structure Database files)
@@ -0,0 +1,173 @@
+"""mmCIF header functions: parse AlphaFold fragment annotation and sequences from mmCIF files without reading their atom coordinates
+
+AlphaFold mmCIF files have their header categories (_entity_poly, _entity_poly_seq, _ma_target_ref_db_details etc.) before the _atom_site coordinate loop, which makes up over 90% of each file.
+ParseCifHeader stops reading as soon as all required fields have been parsed, so (when reading from a streamed .cif.gz file) the _atom_site loop never gets decompressed.
+AlphaSync mmCIF files (afdb=0) have no _ma_target_ref_db_details annotation (alphafrag.py gets it from table 'alphauniprot' instead), so for these it stops right after the _entity_poly_seq.mon_id sequence block.
+"""
+
+from blang import Die, ThreeToOne, rx
+
+
+
+def ParseCifHeader(cif, acc, ciffile, afdb, full=False):
+    """Parse UniProt accession, name (UniProt ID), species, taxonomy, fragment start/stop coordinates and sequence from an open mmCIF file (text mode, e.g. gzip.open(..., mode="rt"))
+
+    Custom parsing, since Bio.SeqIO would require temporary files and be much slower.
+    For AlphaSync structures (afdb=0), the sequence gets parsed from _entity_poly_seq.mon_id instead of _entity_poly.pdbx_seq_one_letter_code_can.
+    Fields that can't be found are None (for AlphaSync structures, everything but the sequence). With full=True, reads the entire file (as before, for comparison).
+
+    Returns (tmpacc, name, species, tax, fragstart, fragstop, seq).
+    """
+    tmpacc = None
+    name = None
+    species = None
+    tax = None
+    fragstart = None
+    fragstop = None
+    seq = None
+    # AlphaSync structures: sequence gets parsed from _entity_poly_seq.mon_id (see below)
+    monid = False
+    for line in cif:
+        # Parse line
+
+        # Stop reading once all required fields have been parsed (normally before the _atom_site coordinate loop, which makes up most of the file)
+        # If a field is still missing, keep reading to the end of the file instead (fallback to a full read)
+        if not full and seq is not None:
+            # AlphaSync: only the sequence (the _entity_poly_seq.mon_id block), since there is no _ma_target_ref_db_details annotation
+            if afdb == 0 and monid:
+                break
+            if afdb == 1 and None not in (tmpacc, name, species, tax, fragstart, fragstop):
+                break
+
+        # Parse annotation
+        if rx(r"^_ma_target_ref_db_details\.", line):
+            # _ma_target_ref_db_details.db_accession                 A0A087WUL8
+            # _ma_target_ref_db_details.db_code                      NBPFJ_HUMAN
+            # _ma_target_ref_db_details.db_name                      UNP
+            # _ma_target_ref_db_details.gene_name                    NBPF19
+            # _ma_target_ref_db_details.ncbi_taxonomy_id             9606
+            # _ma_target_ref_db_details.organism_scientific          "Homo sapiens"
+            # _ma_target_ref_db_details.seq_db_align_begin           201
+            # _ma_target_ref_db_details.seq_db_align_end             1600
+            # _ma_target_ref_db_details.seq_db_isoform               ?
+            # _ma_target_ref_db_details.seq_db_sequence_checksum     24A59AA23097CB90
+            # _ma_target_ref_db_details.seq_db_sequence_version_date 2014-10-29
+            # _ma_target_ref_db_details.target_entity_id             1
+            
+            # Accession
+            m = rx(r"^_ma_target_ref_db_details\.db_accession +(\w+)", line)
+            if m:
+                tmpacc = m[0]
+                # Verify that this is the correct UniProt accession (as expected from the file name)
+                if tmpacc != acc:
+                    Die(f"Error: Expected UniProt accession '{acc}', but found '{tmpacc}' in '{ciffile}'")
+            else:
+            # Name (UniProt ID)
+                m = rx(r"^_ma_target_ref_db_details.db_code +(\w+)", line)
+                if m:
+                    name = m[0]
+                    # Parse species from e.g. NUD4B_HUMAN
+                    m = rx(r"[A-Z0-9]+_([A-Z0-9]+)", name)
+                    if m:
+                        species = m[0]
+                    else:
+                        Die(f"Error: Couldn't parse species from UniProt ID '{name}'")
+                else:
+            # Taxonomy (NCBI ID)
+                    m = rx(r"^_ma_target_ref_db_details.ncbi_taxonomy_id +(\d+)", line)
+                    if m:
+                        tax = m[0]
+                    else:
+            # Start coordinate of this fragment
+                        m = rx(r"^_ma_target_ref_db_details.seq_db_align_begin +(\d+)", line)
+                        if m:
+                            fragstart = m[0]
+            # Stop coordinate of this fragment
+                        m = rx(r"^_ma_target_ref_db_details.seq_db_align_end +(\d+)", line)
+                        if m:
+                            fragstop = m[0]
+        
+        # Parse sequence from _entity_poly.pdbx_seq_one_letter_code_can lines
+        # Documentation:
+        # https://mmcif.wwpdb.org/dictionaries/mmcif_pdbx_v40.dic/Items/_entity_poly.pdbx_seq_one_letter_code_can.html (uses canonical residues as far as possible) (doesn't make any difference for AlphaFold, but should be the best choice for PDB structures as well)
+        # https://mmcif.wwpdb.org/dictionaries/mmcif_pdbx_v50.dic/Items/_entity_poly.pdbx_seq_one_letter_code.html
+        # https://mmcif.wwpdb.org/dictionaries/mmcif_pdbx_v40.dic/Items/_struct_ref.pdbx_seq_one_letter_code.html
+        # _entity_poly.pdbx_seq_one_letter_code_can 
+        # ;EDSLEECAITYSNSHGPYDSNQPHRKTKITFEEDKVDSTLIGSSSHVEWEDAVHIIPENESDDEEEEEKGPVSPRNLQES
+        # EEEEVPQESWDEGYSTLSIPPEMLASYQSYSSTFHSLEEQQVCMAVDIGRHRWDQVKKEDQEATGPRLSRELLDEKGPEV
+        # LQDSLDRCYSTPSGCLELTDSCQPYRSAFYVLEQQRVGLAIDMDEIEKYQEVEEDQDPSCPRLSRELLDEKEPEVLQDSL
+        # DRCYSIPSGYLELPDLGQPYSSAVYSLEEQYLGLALDVDRIKKDQEEEEDQDPPCPRLSRELVEVVEPEVLQDSLDRCYS
+        # TPSSCLEQPDSCQPYGSSFYALEEKHVGFSLDVGEIEKKGKGKKRRGRRSKKERRRGRKEGEEDQNPPCPRLSRELLDEK
+        # GPEVLQDSLDRCYSTPSGCLELTDSCQPYRSAFYILEQQCVGLAVDMDEIEKYQEVEEDQDPSCPRLSRELLDEKEPEVL
+        # QDSLDRCYSIPSGYLELPDLGQPYSSAVYSLEEQYLGLALDVDRIKKDQEEEEDQDPPCPRLSRELVEVVEPEVLQDSLD
+        # RCYSTPSSCLEQPDSCQPYGSSFYALEEKHVGFSLDVGEIEKKGKGKKRRGRRSKKERRRGRKEGEEDQNPPCPRLSREL
+        # LDEKGPEVLQDSLDRCYSTPSGCLELTDSCQPYRSAFYILEQQCVGLAIDMDEIEKYQEVEEDQDPSCPRLSRELLDEKE
+        # PEVLQDSLDRCYSIPSGYLELPDLGQPYSSAVYSLEEQYLGLALDVDRIKKDQEEEEDQDPPCPRLSRELVEVVEPEVLQ
+        # DSLDRCYSTPSSCLEQPDSCQPYGSSFYALEEKHVGFSLDVGEIEKKGKGKKRRGRRSKKERRRGRKEGEEDQNPPCPRL
+        # SRELLDEKGPEVLQDSLDRCYSTPSGCLELTDSCQPYRSAFYILEQQCVGLAVDMDEIEKYQEVEEDQDPSCPRLSRELL
+        # DEKEPEVLQDSLDRCYSIPSGYLELPDLGQPYSSAVYSLEEQYLGLALDVDRIKKDQEEEEDQDPPCPRLSRELVEVVEP
+        # EVLQDSLDRCYSTPSSCLEQPDSCQPYGSSFYALEEKHVGFSLDVGEIEKKGKGKKRRGRRSKKERRRGRKEGEEDQNPP
+        # CPRLSRELLDEKGPEVLQDSLDRCYSTPSGCLELTDSCQPYRSAFYILEQQCVGLAVDMDEIEKYQEVEEDQDPSCPRLS
+        # RELLDEKEPEVLQDSLDRCYSIPSGYLELPDLGQPYSSAVYSLEEQYLGLALDVDRIKKDQEEEEDQDPPCPRLSRELVE
+        # VVEPEVLQDSLDRCYSTPSSCLEQPDSCQPYGSSFYALEEKHVGFSLDVGEIEKKGKGKKRRGRRSKKERRRGRKEGEED
+        # QNPPCPRLSRELLDEKGPEVLQDSLDRCYSTPSGCLELTD
+        # ;
+        elif rx(r"^_entity_poly.pdbx_seq_one_letter_code_can +", line):
+
+            m = rx(r"^_entity_poly.pdbx_seq_one_letter_code_can +(\w+)$", line)
+            if m:
+                # Single-line sequence:
+                seq = m[0]
+            else:
+                # Multi-line sequence:
+                seq = ""
+
+                # Parse entire sequence block
+                for line in cif:
+
+                    # Break on closing semicolon
+                    if rx(r"^;$", line):
+                        break
+
+                    # Ignore initial semicolon
+                    m = rx(r"^;?([A-Z]+)$", line)
+                    if m:
+                        # Build complete sequence
+                        seq += m[0]
+                    else:
+                        Die(f"Error: Couldn't parse '_entity_poly.pdbx_seq_one_letter_code_can' line:\n\n'{line}'\n\n")
+
+        # AlphaSync structure (re-predicted using AlphaFold 2.3.2):
+        # Parse sequence from _entity_poly_seq.mon_id lines instead (three-letter code, can convert using ThreeToOne())
+        # Always one line per residue, terminated by #
+        # _entity_poly_seq.mon_id
+        # 0 1   MET 
+        # 0 2   GLY 
+        # 0 3   ARG 
+        # 0 4   VAL 
+        # 0 5   ARG 
+        # ...
+        # 0 270 GLN 
+        # 0 271 GLU 
+        # 0 272 GLN 
+        # #
+        elif afdb == 0 and rx(r"^_entity_poly_seq.mon_id$", line):
+            seq = ""
+            monid = True
+
+            # Parse entire sequence block
+            for line in cif:
+
+                # Break on #
+                if rx(r"^#$", line):
+                    break
+
+                # Ignore initial semicolon
+                m = rx(r"^0 \d+ +([A-Z]{3}) +$", line)
+                if m:
+                    # Build complete sequence
+                    seq += ThreeToOne(m[0])
+                else:
+                    Die(f"Error: Couldn't parse '_entity_poly_seq.mon_id' line:\n\n'{line}'\n\n")
+
+    return (tmpacc, name, species, tax, fragstart, fragstop, seq)
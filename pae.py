@@ -0,0 +1,88 @@
+"""PAE functions: read AlphaFold predicted aligned error (PAE) matrices and look up PAE values for residue pairs (contacts), vectorized using NumPy
+
+PAE matrices can be read from AlphaFold .json.gz files or from a quantized store of memory-mapped uint8 .npy files (one per .json.gz file, written by pae_store.py).
+PAE values range from 0 to 31.75 Å, and are stored in steps of 0.25 Å (value × 4), which is exact for AlphaFold DB PAE files (integers), but not for AlphaSync PAE files (non-integer values, so alphacon_add_pae.py reads these from .json.gz files).
+Reading from the store only touches the pages holding the requested residue pairs, without decompressing or parsing whole files.
+"""
+
+import gzip
+import json
+import re
+import numpy as np
+from blang import Die
+from dihedrals import KeptRange, fraglen, fragstep
+
+# Quantization step for the uint8 PAE store (Å)
+pae_step = 0.25
+# Maximum PAE value (Å)
+pae_max = 31.75
+
+
+
+def ReadPae(infile):
+    """Read a PAE matrix from an AlphaFold .json.gz file (AF-{acc}-F{frag}-predicted_aligned_error_v{version}.json.gz) as a NumPy array (residues × residues)
+
+    For .npy files from the uint8 store, returns a read-only memory map instead (quantized, see PairPae).
+    """
+    if infile.endswith(".npy"):
+        return np.load(infile, mmap_mode="r")
+    with gzip.open(infile, "rt") as f:
+        data = json.load(f)
+    pae = np.array(data[0]["predicted_aligned_error"], dtype=np.float32)
+    if pae.ndim != 2 or pae.shape[0] != pae.shape[1]:
+        Die(f"Error: Expected a square PAE matrix, but got shape '{pae.shape}' in '{infile}'")
+    return pae
+
+def QuantizePae(pae):
+    """Quantize a PAE matrix to uint8 (in steps of pae_step)"""
+    if np.nanmin(pae) < 0 or np.nanmax(pae) > pae_max:
+        Die(f"Error: Expected PAE values between 0 and {pae_max}, but got values between {np.nanmin(pae)} and {np.nanmax(pae)}")
+    return np.round(pae / pae_step).astype(np.uint8)
+
+def WritePae(pae, outfile):
+    """Write a PAE matrix to the uint8 store (.npy file, memory-mappable using ReadPae)"""
+    np.save(outfile, QuantizePae(pae))
+
+def PairPae(pae, site1, site2):
+    """PAE values for arrays of residue pairs (1-based sites)
+
+    The PAE matrix is asymmetric (PAE at (i, j) is the error at residue j when aligned on residue i), so use the "worst possible" (highest) value of both directions, since site1 and site2 are equally important for a given contact.
+    """
+    values = np.maximum(pae[site1 - 1, site2 - 1], pae[site2 - 1, site1 - 1])
+    # Dequantize values from the uint8 store
+    if pae.dtype == np.uint8:
+        values = values.astype(np.float32) * pae_step
+    return values
+
+def ProteinPae(infiles, site1, site2, length):
+    """PAE values for arrays of residue pairs (1-based sites in full-length protein coordinates) from a protein's fragment PAE files (.json.gz or .npy from the uint8 store)
+
+    For fragmented proteins (>2700 aa), pairs are looked up in every fragment in whose kept range (see KeptRange) both residues lie, and averaged across these fragments (as for contact distances in job_lahuta.py).
+    Pairs not covered by any fragment are NaN.
+    """
+    maxfrag = len(infiles)
+    total = np.zeros(len(site1))
+    count = np.zeros(len(site1))
+    for infile in infiles:
+        frag = int(re.search(r"-F(\d+)-predicted_aligned_error_v\d+\.(json\.gz|npy)$", infile).group(1))
+        pae = ReadPae(infile)
+
+        # Verify PAE matrix size (fragment length)
+        offset = fragstep * (frag - 1)
+        if maxfrag == 1:
+            expected = length
+        else:
+            expected = min(offset + fraglen, length) - offset
+        if len(pae) != expected:
+            Die(f"Error: Expected PAE matrix size '{expected}', but got '{len(pae)}' instead in '{infile}'")
+
+        # Pairs within the kept range of this fragment (in fragment coordinates)
+        (start, stop) = KeptRange(frag, maxfrag, len(pae))
+        (fragsite1, fragsite2) = (site1 - offset, site2 - offset)
+        covered = (fragsite1 >= start) & (fragsite1 <= stop) & (fragsite2 >= start) & (fragsite2 <= stop)
+
+        total[covered] += PairPae(pae, fragsite1[covered], fragsite2[covered])
+        count[covered] += 1
+
+    with np.errstate(invalid="ignore"):
+        return total / count
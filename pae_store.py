@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+pae_store.py:
+Convert AlphaFold PAE .json.gz files into a quantized store of memory-mapped uint8 .npy files (see pae.py), so that PAE values for arbitrary residue pairs can be read without decompressing and parsing whole JSON files.
+The store mirrors the directory structure of the .json.gz files (e.g. input/pae/besian/store/afdb/data/x8772/AF-P53587-F1-predicted_aligned_error_v4.json.gz >> input/pae/besian_uint8/store/afdb/data/x8772/AF-P53587-F1-predicted_aligned_error_v4.npy).
+Existing .npy files are skipped, so this can be re-run to convert new files only.
+"""
+
+# Initialize
+from blang import *
+from pae import *
+
+Args(0, " \n -alphasync: Convert AlphaSync updated structures' PAE files (input/alphasync/pae) (lossy, since their PAE values aren't integers: alphacon_add_pae.py -store doesn't use these)\n -verify: Verify each converted file against its .json.gz source\n -debug: Don't actually write any files, just simulate", "")
+paepath = "input/pae/besian"
+storepath = "input/pae/besian_uint8"
+
+if Switch('alphasync'):
+    # AlphaSync updated structures only (not in AlphaFold Protein Structure Database)
+    paepath = "input/alphasync/pae"
+    storepath = "input/alphasync/pae_uint8"
+
+
+
+# Start
+Starttime()
+
+print(f"\nGetting list of .json.gz archives in '{paepath}'...")
+infiles = nsort(Return(f"find {paepath} -name '*.json.gz'").split("\n"))
+
+print(f"\nConverting PAE .json.gz files in '{paepath}' to uint8 .npy files in '{storepath}':")
+t = time.perf_counter()
+inbytes = 0
+outbytes = 0
+converted = 0
+for infile in tq(infiles):
+
+    outfile = storepath + re.sub(r"\.json\.gz$", ".npy", infile[len(paepath):])
+    if Exists(outfile):
+        Log(f"output file already existed for infile (skipped)", infile)
+        continue
+
+    pae = ReadPae(infile)
+
+    if not Switch('debug'):
+        os.makedirs(os.path.dirname(outfile), exist_ok=True)
+        # Write to a temporary file first, so interrupted runs don't leave incomplete .npy files behind
+        WritePae(pae, f"{outfile}.tmp.npy")
+        os.replace(f"{outfile}.tmp.npy", outfile)
+        outbytes += os.path.getsize(outfile)
+
+        if Switch('verify'):
+            if not np.array_equal(ReadPae(outfile), QuantizePae(pae)):
+                Die(f"Error: Converted file '{outfile}' doesn't match '{infile}'")
+            # AlphaFold DB PAE values are integers, so quantization is exact for them
+            maxdiff = np.abs(ReadPae(outfile).astype(np.float32) * pae_step - pae).max()
+            if maxdiff > pae_step / 2:
+                Die(f"Error: Quantization error {maxdiff} exceeds {pae_step / 2} for '{infile}'")
+
+    inbytes += os.path.getsize(infile)
+    converted += 1
+    Log(f"successfully converted infile", infile)
+
+elapsed = time.perf_counter() - t
+
+Show(lim=20)
+
+print(f"\nConverted {Comma(converted)} files in {elapsed:.1f} sec ({converted / elapsed:,.1f} files/s, {inbytes / elapsed / 1e6:,.1f} MB/s of .json.gz input)")
+if outbytes > 0:
+    print(f" >> Size: {inbytes / 1e6:,.1f} MB .json.gz >> {outbytes / 1e6:,.1f} MB .npy ({outbytes / inbytes:.2f}x)")
+
+Stoptime()
+
+print("\nDone!")
@@ -51,8 +51,11 @@ if not Switch('alphasync'):
     # # Use -checkseqs switch when updating existing alphaseq and alphasa tables (slow) (parses sequences)
     # Run("Main: Submit jobs that run DSSP and Lahuta on fragments and combine output across fragments, insert ASA values into table 'alphasa', and contacts into table 'alphacon'", "main.py -checkseqs")
 
+    # Backfill per-structure summaries (table 'alphasummary') for any structures the job scripts haven't summarised (alphamap reads average pLDDT from there)
+    Run("Backfill missing per-structure summaries in table 'alphasummary'", "alphasummary.py")
+
     # Update alphamap (mapping from latest UniProt via API to AlphaFold accessions)
-    Run("Update alphamap for UniProt (latest, via UniProt API)", f"alphamap_uniprot.py {local_uniprot_release}")
+    Run("Update alphamap for UniProt (latest, via UniProt API)", f"alphamap_uniprot.py {local_uniprot_release} -incremental")
 
     # # Update alphamap (mapping from UniProt and Ensembl to AlphaFold accessions)
     # Run("Update alphamap for UniProt (local)", "alphamap_uniprot_local.py 2022_04")
@@ -231,10 +234,12 @@ else:
     Run("Main: Submit jobs that run DSSP and Lahuta on fragments and combine output across fragments, insert ASA values into table 'alphasa', and contacts into table 'alphacon'", "main.py -alphasync")
     Run("Parse AlphaFold PAE scores from JSON files into SQL table 'alphacon'", "alphacon_add_pae.py -alphasync")
 
-    Run("Update table 'alphamap' that maps UniProt sequences to previously existing AFDB or new AlphaSync structures", f"alphamap_uniprot.py {local_uniprot_release}")
+    Run("Backfill missing per-structure summaries in table 'alphasummary'", "alphasummary.py")
+    Run("Update table 'alphamap' that maps UniProt sequences to previously existing AFDB or new AlphaSync structures", f"alphamap_uniprot.py {local_uniprot_release} -incremental")
     Run("Remove AlphaSync prediction (CIF, PAE and params files) that are no longer necessary since there are better structures available for their sequences", f"alphasync_cleanup.py {local_uniprot_release}")
-    Run("Compress all CIF/PAE/params output files into .tar archives (now minus the obsolete accessions)", f"scripts/migrate_alphasync_tar_archives.py {local_uniprot_release}")
+    Run("Compress all CIF/PAE/params output files into .tar archives (now marking the obsolete accessions as removed, compacting archives if needed)", f"scripts/migrate_alphasync_tar_archives.py {local_uniprot_release}")
 
+    Run("Update table 'alphacoverage', per-taxon coverage (UniProt accessions for the current release, and verify its structure columns, which the job scripts keep up to date)", "alphacoverage.py")
     Run("Update table 'alphauniprot_species', a summary table of UniProt taxon IDs, latin names and common species names for efficient lookup (requires alphamap to be updated first)", "alphauniprot_species.py")
     Run("Migrate to optimized SQL tables (alphasync_compact) for tablespace export to web server", f"scripts/migrate_alphasync_compact.py")
     Run("Update precalculated statistics in SQL table 'alphastats'", f"alphastats.py")
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Benchmark: Mapping a full proteome to AlphaSync structures (as in alphamap_uniprot.py) with one alphaseq/alphasa query per sequence vs. an in-memory hash join (seqmap.py)
+
+Reports run time and sequences/s for both approaches (the hash join including loading all structures once), and verifies that both produce the same mappings in the same order.
+"""
+
+# Initialize
+from blang_mysql import *
+from blang import *
+from seqmap import *
+
+alphauniprot = "alphauniprot"
+
+(tax) = Args(1, "[NCBI taxon ID of the proteome to map]", "9606")
+
+
+
+# Start
+
+seqs = FetchAll(Query(f"SELECT acc, seq FROM {alphauniprot} WHERE tax='{tax}'"))
+print(f"\nBenchmarking mapping of {Comma(len(seqs))} UniProt sequences for taxon '{tax}' to table '{alphaseq}':")
+
+# Per-sequence queries (previous approach)
+old = {}
+t = time.perf_counter()
+for (acc, seq) in tq(seqs, desc="queries"):
+    if rx("[BZUX]", seq):
+        seq = ReplaceNonstandardAAs(seq)
+    old[acc] = [alphacc for (alphacc, afdb, avg_plddt) in Query(f"SELECT s.acc, s.afdb, AVG(a.plddt) AS avg_plddt FROM {alphaseq} s, {alphasa} a WHERE s.seq='{seq}' AND a.acc=s.acc AND a.afdb=s.afdb GROUP BY s.acc ORDER BY avg_plddt DESC, s.afdb ASC, s.acc")]
+old_time = time.perf_counter() - t
+
+# Hash join
+new = {}
+t = time.perf_counter()
+structures = StructureMap()
+load_time = time.perf_counter() - t
+for (acc, seq) in tq(seqs, desc="hash join"):
+    if rx("[BZUX]", seq):
+        seq = ReplaceNonstandardAAs(seq)
+    new[acc] = [alphacc for (alphacc, afdb, avg_plddt) in structures.get(SeqHash(seq), [])]
+new_time = time.perf_counter() - t
+
+print(f"\n >> Per-sequence queries:\t{old_time:,.1f} sec\t{len(seqs) / old_time:,.1f} sequences/s")
+print(f" >> Hash join:\t\t{new_time:,.1f} sec\t{len(seqs) / new_time:,.1f} sequences/s (of which {load_time:,.1f} sec loading {Comma(len(structures))} unique structure sequences)")
+print(f" >> Speedup:\t\t{old_time / new_time:,.1f}x (the structure map only needs to be loaded once for all proteomes)")
+
+mismatches = [acc for acc in old if old[acc] != new[acc]]
+print(f"\nMappings differing between both approaches: {len(mismatches)}")
+for acc in mismatches[:10]:
+    print(f" >> {acc}\t{old[acc]}\t{new[acc]}")
+
+print("\nDone!")
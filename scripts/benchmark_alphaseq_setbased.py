@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""
+Benchmark: alphaseq.py (fragments stitched in Python, Python set of comparafasta_… sequences, one INSERT per protein) vs. alphaseq_setbased.py (set-based SQL)
+
+Runs both scripts without making changes (alphaseq.py -debug2, alphaseq_setbased.py -debug) as child processes, and reports wall time and peak memory use (maximum resident set size) of each.
+"""
+
+# Initialize
+import subprocess
+from blang import *
+
+Args(0, " \n -comparaonly: Pass -comparaonly to both scripts\n -alphasync: Pass -alphasync to both scripts", " -comparaonly")
+
+tmpswitches = ""
+if Switch('comparaonly'):
+    tmpswitches += " -comparaonly"
+if Switch('alphasync'):
+    tmpswitches += " -alphasync"
+
+commands = {
+    "alphaseq.py": f"python3 alphaseq.py{tmpswitches} -debug2",
+    "alphaseq_setbased.py": f"python3 alphaseq_setbased.py{tmpswitches} -debug",
+}
+
+
+
+# Start
+
+print(f"\nBenchmarking alphaseq.py vs. alphaseq_setbased.py (switches:{tmpswitches or ' none'}):")
+
+results = {}
+for script, command in commands.items():
+    print(f"\n >> {command}")
+    t = time.perf_counter()
+    process = subprocess.Popen(command, shell=True, stdout=subprocess.DEVNULL)
+    # os.wait4 returns resource usage for this child process only (peak memory in kB on Linux)
+    (pid, status, usage) = os.wait4(process.pid, 0)
+    elapsed = time.perf_counter() - t
+    if status != 0:
+        Die(f"Error: '{command}' failed with exit status {status}")
+    results[script] = (elapsed, usage.ru_maxrss)
+
+print()
+for script, (elapsed, maxrss) in results.items():
+    print(f" >> {script}:\t{elapsed:,.1f} sec\t{maxrss / 1024:,.0f} MB peak memory")
+print(f" >> Speedup:\t{results['alphaseq.py'][0] / results['alphaseq_setbased.py'][0]:,.1f}x")
+
+print("\nDone!")
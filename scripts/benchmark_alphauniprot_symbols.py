@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Benchmark: Filling 'alphauniprot_symbols' (alphauniprot_symbols.py) from 'alphauniprot' entries for a taxon
+
+Compares, on scratch tables created LIKE 'alphauniprot_symbols':
+- single: Previous path: one INSERT IGNORE per gene symbol and synonym
+- batch:  Aliases de-duplicated per entry, and bulk-inserted with multi-row INSERT IGNORE (alphauniprot_symbols.py)
+Reports total time and rows/s for both, and verifies that both produce the same rows.
+"""
+
+# Initialize
+from blang_mysql import *
+from blang import *
+
+alphauniprot = "alphauniprot"
+alphauniprot_symbols = "alphauniprot_symbols"
+scratch = "alphauniprot_symbols_benchmark"      # Scratch tables (created LIKE 'alphauniprot_symbols', dropped at the end)
+
+# Number of rows per INSERT (as in alphauniprot_symbols.py)
+batchsize = 10000
+
+(tax) = Args(1, "[NCBI taxon ID]", "9606")
+
+
+
+# Functions
+
+def Aliases(acc, symbols, synonyms):
+    """Same as in alphauniprot_symbols.py"""
+    aliases = {}
+    for type, values in (("symbol", symbols), ("synonym", synonyms)):
+        if values:
+            for alias in values.split("|"):
+                alias = alias.strip()
+                aliases.setdefault((type, alias.lower().rstrip()), (type, alias))
+    return aliases.values()
+
+def FillSingle(table, entries):
+    for acc, species, tax, symbols, synonyms in entries:
+        for type, values in (("symbol", symbols), ("synonym", synonyms)):
+            if values:
+                for alias in values.split("|"):
+                    Query(f"INSERT IGNORE INTO {table} SET acc='{acc}', species='{species}', tax='{tax}', type='{type}', alias='{Esc(alias.strip())}'")
+
+def FillBatch(table, entries):
+    rows = [(acc, species, tax, type, alias) for acc, species, tax, symbols, synonyms in entries for type, alias in Aliases(acc, symbols, synonyms)]
+    for i in range(0, len(rows), batchsize):
+        Query(f"INSERT IGNORE INTO {table} (acc, species, tax, type, alias) VALUES " + ", ".join(f"('{acc}', '{species}', '{tax}', '{type}', '{Esc(alias)}')" for (acc, species, tax, type, alias) in rows[i:i + batchsize]))
+
+
+
+# Start
+
+entries = FetchAll(Query(f"SELECT acc, species, tax, symbols, synonyms FROM {alphauniprot} WHERE tax='{tax}' AND (symbols IS NOT NULL OR synonyms IS NOT NULL)"))
+print(f"\nFilling scratch tables from {Comma(len(entries))} '{alphauniprot}' entries for taxon '{tax}':")
+
+times = {}
+results = {}
+for (mode, fill) in (("single", FillSingle), ("batch", FillBatch)):
+    table = f"{scratch}_{mode}"
+    Query(f"DROP TABLE IF EXISTS {table}")
+    Query(f"CREATE TABLE {table} LIKE {alphauniprot_symbols}")
+    t = time.perf_counter()
+    fill(table, entries)
+    times[mode] = time.perf_counter() - t
+    results[mode] = FetchSet(Query(f"SELECT CONCAT_WS('|', acc, species, tax, type, alias) FROM {table}"))
+    Query(f"DROP TABLE {table}")
+
+rows = len(results["batch"])
+print(f"\nRun time ({Comma(rows)} rows):")
+for mode in times:
+    print(f" >> {mode}:\t{times[mode]:.2f} sec\t{rows / times[mode]:,.0f} rows/s\t{times['single'] / times[mode]:.1f}x")
+
+if results["single"] != results["batch"]:
+    Die(f"Error: Rows differ ({Comma(len(results['single'] ^ results['batch']))} rows only in one of them)")
+print(f"\nBoth produce identical rows")
+
+print("\nDone!")
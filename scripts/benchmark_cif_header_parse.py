@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Benchmark: Header-only mmCIF parsing (mmcif.py, stops before the _atom_site coordinate loop) vs. reading entire .cif.gz files (as alphafrag.py used to)
+
+Reports bytes decompressed per file and files/s for the first n .cif.gz members of a TAR archive, and verifies that both approaches parse identical fields.
+Also benchmarks n AlphaSync-style (afdb=0) files, which have no _ma_target_ref_db_details annotation and get their sequence from _entity_poly_seq.mon_id (generated, unless the archive is an AlphaSync archive already), and checks that header-only parsing stops before their _atom_site loop.
+"""
+
+# Initialize
+import tarfile
+import gzip
+import io
+import numpy as np
+from blang import *
+from mmcif import *
+
+(infile, n) = Args(2, "[TAR archive] [maximum number of .cif.gz members]", "input/ftp/UP000005640_9606_HUMAN_v4.tar 1000")
+
+afdb = 1
+if rx("alphasync", infile):
+    afdb = 0
+
+# Residue types for generated AlphaSync-style files
+aa3 = ["ALA", "ARG", "ASN", "ASP", "CYS", "GLN", "GLU", "GLY", "HIS", "ILE", "LEU", "LYS", "MET", "PHE", "PRO", "SER", "THR", "TRP", "TYR", "VAL"]
+
+
+
+# Functions
+
+def AlphaSyncCif(acc, length):
+    """Generate a compressed AlphaSync-style mmCIF file (AlphaFold 2.3.2 output: sequence in _entity_poly_seq.mon_id, no _ma_target_ref_db_details, followed by an _atom_site loop with 8 atoms per residue)"""
+    residues = [aa3[(i * 7) % len(aa3)] for i in range(length)]
+    lines = [f"data_{acc}", "#", "_entry.id AF", "#", "loop_", "_entity_poly_seq.entity_id", "_entity_poly_seq.num", "_entity_poly_seq.mon_id"]
+    lines += [f"0 {i + 1} {resname} " for i, resname in enumerate(residues)]
+    lines += ["#", "loop_"] + [f"_atom_site.{column}" for column in ("group_PDB", "id", "type_symbol", "label_atom_id", "label_comp_id", "label_seq_id", "Cartn_x", "Cartn_y", "Cartn_z", "B_iso_or_equiv")]
+    atom = 0
+    for i, resname in enumerate(residues):
+        for atomname in ("N", "CA", "C", "O", "CB", "CG", "CD", "CE"):
+            atom += 1
+            lines.append(f"ATOM {atom} {atomname[0]} {atomname} {resname} {i + 1} {i * 1.5:.3f} {atom * 0.1:.3f} {-i * 0.7:.3f} {50 + i % 50:.2f}")
+    lines.append("#")
+    return gzip.compress(("\n".join(lines) + "\n").encode())
+
+def Benchmark(members, afdb, desc):
+    """Benchmark header-only vs. entire-file parsing for compressed .cif.gz members [(member name, acc, data)], verifying that both parse identical fields (returns mean bytes decompressed per file: (entire file, header only))"""
+    print(f"\nBenchmarking mmCIF header parsing for {len(members)} .cif.gz {desc} (afdb={afdb}):")
+    results = {}
+    for full in (True, False):
+        parsed = []
+        decompressed = []
+        t = time.perf_counter()
+        for (membername, acc, data) in tq(members, desc="full" if full else "header"):
+            gz = gzip.GzipFile(fileobj=io.BytesIO(data))
+            cif = io.TextIOWrapper(gz)
+            parsed.append(ParseCifHeader(cif, acc, membername, afdb, full=full))
+            # Uncompressed bytes decompressed so far (including read-ahead buffering)
+            decompressed.append(gz.tell())
+        elapsed = time.perf_counter() - t
+        results[full] = (parsed, decompressed, elapsed)
+
+    for full in (True, False):
+        (parsed, decompressed, elapsed) = results[full]
+        print(f" >> {'Entire file' if full else 'Header only'}:\t{len(members) / elapsed:,.1f} files/s\t{np.mean(decompressed) / 1e3:,.1f} kB decompressed per file (median {np.median(decompressed) / 1e3:,.1f} kB)")
+    print(f" >> Speedup:\t{results[True][2] / results[False][2]:,.1f}x")
+
+    # Verify that both approaches parse identical fields
+    mismatches = sum(1 for a, b in zip(results[True][0], results[False][0]) if a != b)
+    print(f" >> Mismatches between header-only and entire-file parsing: {mismatches}")
+    if mismatches > 0:
+        Die(f"Error: Header-only parsing differs from entire-file parsing for {mismatches} {desc}")
+    return (np.mean(results[True][1]), np.mean(results[False][1]))
+
+
+
+# Start
+
+# Read compressed members into memory first (so only decompression and parsing get timed)
+members = []
+with tarfile.open(infile, mode="r:") as tar:
+    for member in tar:
+        m = rx(r"^AF-(\w+(-\d+)?)-F(\d+)-model_v\d+\.cif\.gz$", member.name)
+        if not m:
+            continue
+        members.append((member.name, m[0], tar.extractfile(member).read()))
+        if len(members) >= n:
+            break
+Benchmark(members, afdb, f"members of '{infile}'")
+
+# AlphaSync-style files (afdb=0), unless the archive was an AlphaSync archive already
+if afdb == 1:
+    members = [(f"AF-Q{i:05}-F1-model_v0.cif.gz", f"Q{i:05}", AlphaSyncCif(f"Q{i:05}", 100 + (i * 37) % 900)) for i in range(n)]
+    (full_bytes, header_bytes) = Benchmark(members, 0, "generated AlphaSync-style files")
+    # Header-only parsing must stop before the _atom_site loop (the sequence block makes up well under half of these files)
+    if header_bytes > 0.5 * full_bytes:
+        Die(f"Error: Header-only parsing of AlphaSync-style files decompressed {header_bytes / full_bytes:.0%} of each file (didn't stop before the _atom_site loop)")
+
+print("\nDone!")
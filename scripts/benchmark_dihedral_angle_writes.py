@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Benchmark: Writing dihedral angles to 'alphasa' (job_dssp.py, job_dihedral_angles.py)
+
+Compares, on a scratch copy of 'alphasa' rows for a sample of accessions:
+- json:    Previous path: insert rows without angles, upload all angles as one JSON document and UPDATE using JSON_EXTRACT per residue and column
+- insert:  Fill angle columns in the same INSERT that creates the rows (job_dssp.py)
+- staging: Insert rows without angles, then bulk-insert angles into a typed staging table and UPDATE ... JOIN on (acc, site, afdb) (backfills, job_dihedral_angles.py)
+"""
+
+# Initialize
+import pandas as pd
+from blang_mysql import *
+from blang import *
+
+alphasa = "alphasa"
+scratch = "alphasa_benchmark"       # Scratch table (created LIKE 'alphasa', dropped at the end)
+jsontable = "alphasa_benchmark_json"
+stagingtable = "alphasa_benchmark_staging"
+
+columns = ["acc", "site", "afdb", "aa", "plddt", "plddt10", "asa", "asa10", "relasa", "relasa10", "dis", "dis10", "surf", "surf10", "sec"]
+angles = ["iso", "phi", "psi", "omega", "chi1", "chi2", "chi3", "chi4", "chi5", "tau"]
+
+(n) = Args(1, "[number of accessions to sample from 'alphasa' (with dihedral angles)]", "200")
+
+
+
+# Functions
+
+def Values(df, columns):
+    return [", ".join("NULL" if pd.isna(x) else f"'{x}'" for x in row) for row in df[columns].itertuples(index=False)]
+
+def InsertRows(df, columns):
+    Query(f"INSERT INTO {scratch} ({', '.join(columns)}) VALUES " + ", ".join(f"ROW ({values})" for values in Values(df, columns)))
+
+def WriteJson(df):
+    InsertRows(df, columns)
+    Query(f"TRUNCATE {jsontable}")
+    data = df[["site"] + angles].to_json(orient='records').replace(":", "\\:")
+    Query(f"INSERT INTO {jsontable} SET dihedrals='{data}'")
+    Query(f"UPDATE {scratch} a, {jsontable} t SET " + ", ".join(f"a.{angle}=NULLIF(JSON_UNQUOTE(JSON_EXTRACT(dihedrals, CONCAT('$[', a.site-1, '].{angle}'))), 'null')" for angle in angles) + f" WHERE a.acc='{df['acc'].iloc[0]}' AND a.afdb='{df['afdb'].iloc[0]}'")
+
+def WriteInsert(df):
+    InsertRows(df, columns + angles)
+
+def WriteStaging(df):
+    InsertRows(df, columns)
+    Query(f"TRUNCATE {stagingtable}")
+    Query(f"INSERT INTO {stagingtable} (acc, site, afdb, {', '.join(angles)}) VALUES " + ", ".join(f"ROW ({values})" for values in Values(df, ["acc", "site", "afdb"] + angles)))
+    Query(f"UPDATE {scratch} a JOIN {stagingtable} t ON a.acc=t.acc AND a.site=t.site AND a.afdb=t.afdb SET " + ", ".join(f"a.{angle}=t.{angle}" for angle in angles))
+
+
+
+# Start
+
+Query(f"DROP TABLE IF EXISTS {scratch}")
+Query(f"CREATE TABLE {scratch} LIKE {alphasa}")
+Query(f"CREATE TEMPORARY TABLE {jsontable} (`dihedrals` json DEFAULT NULL) ENGINE=InnoDB")
+Query(f"CREATE TEMPORARY TABLE {stagingtable} LIKE {alphasa}")
+
+# Sample accessions with dihedral angles
+accs = FetchList(Query(f"SELECT DISTINCT CONCAT(acc, '|', afdb) FROM {alphasa} WHERE iso IS NOT NULL LIMIT {n}"))
+proteins = []
+for accafdb in accs:
+    (acc, afdb) = accafdb.split("|")
+    proteins.append(pd.read_sql(f"SELECT {', '.join(columns + angles)} FROM {alphasa} WHERE acc='{acc}' AND afdb='{afdb}' ORDER BY site", blang_mysql_connection))
+residues = sum(len(df) for df in proteins)
+
+print(f"\nWriting {Comma(residues)} residues for {len(proteins)} accessions to scratch table '{scratch}':")
+
+times = {}
+for (mode, write) in (("json", WriteJson), ("insert", WriteInsert), ("staging", WriteStaging)):
+    Query(f"TRUNCATE {scratch}")
+    t = time.perf_counter()
+    for df in tq(proteins, desc=mode):
+        write(df)
+    times[mode] = time.perf_counter() - t
+
+    # Verify that the angles written match the source table
+    mismatches = FetchOne(Query(f"SELECT COUNT(*) FROM {scratch} b JOIN {alphasa} a ON a.acc=b.acc AND a.site=b.site AND a.afdb=b.afdb WHERE NOT (" + " AND ".join(f"a.{angle} <=> b.{angle}" for angle in angles) + ")"))
+    if mismatches > 0:
+        Warn(f"Warning: {Comma(mismatches)} rows with angles differing from '{alphasa}' for mode '{mode}'")
+
+print(f"\nRun time ({Comma(residues)} residues):")
+for mode in times:
+    print(f" >> {mode}:\t{times[mode]:.2f} sec\t{residues / times[mode]:,.0f} residues/s\t{times['json'] / times[mode]:.1f}x")
+
+Query(f"DROP TABLE {scratch}")
+
+print("\nDone!")
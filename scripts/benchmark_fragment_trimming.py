@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Benchmark: Reduction in compute from trimming fragments to their kept residue range before running Lahuta (job_lahuta.py) and calculating dihedral angles (job_dihedral_angles.py)
+
+For proteins >2700 aa (split into 1400 aa fragments with a step size of 200), residues within 200 aa of artificial fragment termini get discarded when combining fragments.
+Reports the residues computed per protein with and without trimming (e.g. for titin, Q8WZ42, 34,350 aa), and optionally times Lahuta on complete vs. trimmed fragment files.
+"""
+
+# Initialize
+from blang import *
+
+# Fragment length and step size used by DeepMind (as in job_lahuta.py)
+fraglen = 1400
+fragstep = 200
+trimbuffer = 3
+
+(length) = Args(1, "[protein length, e.g. 34350 for titin]\n\n -lahuta: Also time Lahuta on complete vs. trimmed fragment mmCIF files in the current directory (AF-*-F*-model_v*.cif)", "34350")
+
+
+
+# Functions
+
+# Get fragment ranges (1-based, inclusive) for a protein of a given length (as in alphasync.py)
+def Fragments(length):
+    if length <= 2699:
+        return [(1, length)]
+    fragments = []
+    for start in range(0, length, fragstep):
+        end = min(start + fraglen, length)
+        fragments.append((start + 1, end))
+        if end == length:
+            break
+    return fragments
+
+# Get the range of residues in a fragment whose contacts and angles will be kept (in fragment coordinates, as in job_lahuta.py)
+def KeptRange(frag, maxfrag, fraglength):
+    start = 1
+    if frag > 1:
+        start = fragstep + 1
+    stop = fraglength
+    if frag < maxfrag:
+        stop = fraglen - fragstep
+    return (start, stop)
+
+# Write a copy of a fragment mmCIF file containing only the atoms of residues start-stop (±trimbuffer) (as in job_lahuta.py)
+def TrimFragment(ciffile, trimfile, start, stop):
+    columns = []
+    siteindex = None
+    with open(ciffile) as f, open(trimfile, "w") as out:
+        for line in f:
+            if line.startswith("_atom_site."):
+                columns.append(line.rstrip())
+            elif line.startswith("ATOM"):
+                if siteindex is None:
+                    siteindex = columns.index("_atom_site.label_seq_id")
+                site = int(re.split(r" +", line)[siteindex])
+                if site < start - trimbuffer or site > stop + trimbuffer:
+                    continue
+            out.write(line)
+
+
+
+# Start
+
+# Residues computed (analytical)
+fragments = Fragments(length)
+maxfrag = len(fragments)
+total = 0
+kept = 0
+for frag, (fragstart, fragend) in enumerate(fragments, start=1):
+    fraglength = fragend - fragstart + 1
+    (start, stop) = KeptRange(frag, maxfrag, fraglength)
+    total += fraglength
+    if maxfrag > 1:
+        # Trimmed fragments still contain trimbuffer residues on either side (within the fragment)
+        kept += min(stop + trimbuffer, fraglength) - max(start - trimbuffer, 1) + 1
+    else:
+        kept += fraglength
+
+print(f"\nProtein length {Comma(length)} aa ({maxfrag} fragments):")
+print(f" >> Residues computed without trimming:\t{Comma(total)}")
+print(f" >> Residues computed with trimming:\t{Comma(kept)}")
+print(f" >> Reduction:\t\t\t\t{Percent(1 - kept / total, 1)}")
+
+# Lahuta run time on complete vs. trimmed fragment files
+if Switch('lahuta'):
+    from lahuta.core.universe import Universe
+    import lahuta.contacts
+
+    types = ("AromaticContacts", "CarbonylContacts", "CovalentContacts", "HBondContacts", "HydrophobicContacts", "IonicContacts", "MetalContacts", "PolarHBondContacts", "VanDerWaalsContacts", "WeakHBondContacts", "WeakPolarHBondContacts")
+
+    infiles = nsort(glob("AF-*-F*-model_v*.cif"))
+    if len(infiles) != maxfrag:
+        Die(f"Error: Expected {maxfrag} fragment files for length {length}, but found {len(infiles)}")
+
+    times = {"complete": 0, "trimmed": 0}
+    print(f"\nTiming Lahuta on {len(infiles)} complete vs. trimmed fragment files:")
+    for ciffile in tq(infiles):
+        frag = rx(r"-F(\d+)-model_v\d+\.cif$", ciffile)[0]
+        (start, stop) = KeptRange(frag, maxfrag, fraglen)
+        trimfile = f"trimmed_{ciffile}"
+        TrimFragment(ciffile, trimfile, start, stop)
+
+        for mode, infile in (("complete", ciffile), ("trimmed", trimfile)):
+            t = time.perf_counter()
+            universe = Universe(infile)
+            neighbors = universe.compute_neighbors()
+            for type in types:
+                getattr(lahuta.contacts, type)(universe, neighbors).contacts("dataframe", "expanded")
+            times[mode] += time.perf_counter() - t
+
+        os.remove(trimfile)
+
+    print(f" >> Lahuta time without trimming:\t{times['complete']:.1f} sec")
+    print(f" >> Lahuta time with trimming:\t\t{times['trimmed']:.1f} sec")
+    print(f" >> Reduction:\t\t\t\t{Percent(1 - times['trimmed'] / times['complete'], 1)}")
+
+print("\nDone!")
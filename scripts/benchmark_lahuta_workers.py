@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Benchmark: Speedup of parallel Lahuta contact type evaluation (as in job_lahuta.py) by protein length and number of workers
+
+Used to choose the number of cores requested per job by protein length in main.py (cores_by_length).
+"""
+
+# Initialize
+import pandas as pd
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+from blang import *
+
+from lahuta.core.universe import Universe
+import lahuta.contacts
+
+# Contact types (as in job_lahuta.py)
+types = (
+    "AromaticContacts",
+    "CarbonylContacts",
+    "CovalentContacts",
+    "HBondContacts",
+    "HydrophobicContacts",
+    "IonicContacts",
+    "MetalContacts",
+    "PolarHBondContacts",
+    "VanDerWaalsContacts",
+    "WeakHBondContacts",
+    "WeakPolarHBondContacts",
+)
+
+# Worker counts to test
+worker_counts = (1, 2, 4, 8, 11)
+
+# Length bins for the speedup summary
+length_bins = [0, 400, 800, 1500, 2700, 36000]
+
+(inpath, outfile) = Args(2, "[directory containing mmCIF files, e.g. a sample of structures of different lengths] [output TSV file]\n\n -threads: Also benchmark threads (in addition to forked processes)", "tmp/benchmark_lahuta benchmark_lahuta_workers.tsv")
+
+modes = ["fork"]
+if Switch('threads'):
+    modes.append("threads")
+
+
+
+# Functions
+
+def Length(ciffile):
+    """Get protein length (number of CA atoms in the mmCIF file)"""
+    with open(ciffile) as f:
+        return sum(1 for line in f if line.startswith("ATOM") and re.split(r" +", line)[3] == "CA")
+
+def GetContactsWorker(type):
+    return getattr(lahuta.contacts, type)(universe, neighbors).contacts("dataframe", "expanded")
+
+def GetAllContacts(workers, mode):
+    if workers <= 1:
+        return [GetContactsWorker(type) for type in types]
+    if mode == "threads":
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(GetContactsWorker, types))
+    else:
+        with multiprocessing.get_context("fork").Pool(workers) as pool:
+            return pool.map(GetContactsWorker, types, chunksize=1)
+
+
+
+# Start
+
+infiles = nsort(glob(f"{inpath}/*.cif"))
+print(f"\nBenchmarking Lahuta contact type evaluation for {len(infiles)} mmCIF files in '{inpath}' (workers: {', '.join(str(w) for w in worker_counts)}; modes: {', '.join(modes)}):")
+
+rows = []
+for ciffile in tq(infiles):
+
+    universe = Universe(ciffile)
+    length = Length(ciffile)
+
+    t = time.perf_counter()
+    neighbors = universe.compute_neighbors()
+    neighbors_time = time.perf_counter() - t
+
+    for mode in modes:
+        for workers in worker_counts:
+            t = time.perf_counter()
+            contacts = GetAllContacts(workers, mode)
+            contacts_time = time.perf_counter() - t
+            rows.append([Basename(ciffile), length, mode, workers, neighbors_time, contacts_time, sum(len(df) for df in contacts)])
+
+df = pd.DataFrame(rows, columns=["file", "length", "mode", "workers", "neighbors_time", "contacts_time", "contacts"])
+
+# Speedup relative to a single worker (for the same file)
+serial = df[df["workers"] == 1][["file", "mode", "contacts_time"]].rename(columns={"contacts_time": "serial_time"})
+df = df.merge(serial, on=["file", "mode"])
+# Speedup of the whole Lahuta step (neighbour search is always serial)
+df["speedup"] = (df["neighbors_time"] + df["serial_time"]) / (df["neighbors_time"] + df["contacts_time"])
+
+write_tsv(df, outfile)
+
+# Speedup curves by protein length
+df["length_bin"] = pd.cut(df["length"], length_bins)
+print("\nMedian speedup by protein length (rows) and number of workers (columns):")
+for mode in modes:
+    print(f"\n >> {mode}")
+    print(df[df["mode"] == mode].pivot_table(index="length_bin", columns="workers", values="speedup", aggfunc="median", observed=True).round(2))
+
+print(f"\nWrote to '{outfile}'")
+
+print("\nDone!")
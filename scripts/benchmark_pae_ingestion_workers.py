@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Benchmark: Throughput of parallel PAE ingestion (as in alphacon_add_pae.py) by number of worker processes
+
+Each worker has its own MySQL connection and processes batches of accessions in a single transaction, which gets rolled back here (no changes to 'alphacon').
+"""
+
+# Initialize
+import multiprocessing
+import numpy as np
+from blang_mysql import *
+from blang import *
+from pae import *
+
+alphaseq = "alphaseq"
+alphacon = "alphacon"
+tmptable = f"alphacon_tmp_update"
+
+# Worker counts to test
+worker_counts = (1, 2, 4, 8, 16)
+
+# Number of accessions per transaction (as in alphacon_add_pae.py)
+batchsize = 50
+
+(inpath, n) = Args(2, "[directory containing PAE .json.gz or .npy files (sample)] [maximum number of accessions]", "input/pae/besian/store/afdb/data/x0006 500")
+
+afdb = 1
+
+
+
+# Functions (as in alphacon_add_pae.py)
+
+def InitWorker():
+    Connect()
+    Query(f"""CREATE TEMPORARY TABLE {tmptable} (
+    `site1` mediumint NOT NULL,
+    `site2` mediumint NOT NULL,
+    `pae` float DEFAULT NULL,
+    PRIMARY KEY (`site1`, `site2`)
+    ) engine=InnoDB""")
+
+def AddPae(acc, infiles, length):
+    sites = np.array(FetchAll(Query(f"SELECT DISTINCT site1, site2 FROM {alphacon} WHERE acc='{acc}' AND afdb={afdb}")), dtype=int).reshape(-1, 2)
+    if len(sites) == 0:
+        return 0
+    paes = np.round(ProteinPae(infiles, sites[:, 0], sites[:, 1], length))
+    Query(f"DELETE FROM {tmptable}")
+    Query(f"INSERT INTO {tmptable} (site1, site2, pae) VALUES " + ", ".join(f"ROW ({site1}, {site2}, {pae:g})" for (site1, site2), pae in zip(sites, paes)))
+    query = Query(f"UPDATE {alphacon} c JOIN {tmptable} t ON c.site1=t.site1 AND c.site2=t.site2 SET c.pae=t.pae WHERE c.acc='{acc}' AND c.afdb={afdb}")
+    return Numrows(query)
+
+def AddPaeBatch(batch):
+    Query("START TRANSACTION")
+    res = [(acc, AddPae(acc, infiles, length)) for (acc, infiles, length) in batch]
+    # Roll back (benchmark only)
+    Query("ROLLBACK")
+    return res
+
+
+
+# Start
+
+# Single-fragment accessions with PAE files in inpath
+accfiles = {}
+for infile in nsort(glob(f"{inpath}/AF-*-F1-predicted_aligned_error_v*")):
+    accfiles[rx(r"AF-(\w+(-\d+)?)-F1-predicted_aligned_error_v\d+\.(json\.gz|npy)$", infile)[0]] = [infile]
+seqlen = FetchMap(Query(f"SELECT acc, LENGTH(seq) FROM {alphaseq} WHERE afdb={afdb} AND frags=1 AND acc IN ('" + "', '".join(accfiles) + "')"))
+accs = nsort(seqlen)[:n]
+batches = [[(acc, accfiles[acc], seqlen[acc]) for acc in accs[i:i + batchsize]] for i in range(0, len(accs), batchsize)]
+
+print(f"\nBenchmarking PAE ingestion for {len(accs)} accessions in '{inpath}' ({len(batches)} batches of up to {batchsize} accessions; workers: {', '.join(str(w) for w in worker_counts)}):")
+
+times = {}
+for workers in worker_counts:
+    rows = 0
+    t = time.perf_counter()
+    with multiprocessing.get_context("fork").Pool(workers, initializer=InitWorker) as pool:
+        for res in pool.imap_unordered(AddPaeBatch, batches):
+            rows += sum(affected for (acc, affected) in res)
+    times[workers] = time.perf_counter() - t
+    print(f" >> {workers} workers:\t{times[workers]:.1f} sec\t{len(accs) / times[workers]:,.1f} accessions/s\t{rows / times[workers]:,.0f} rows/s\tspeedup {times[worker_counts[0]] / times[workers]:.1f}x")
+
+print("\nDone!")
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Benchmark: Quantized uint8 PAE store (pae_store.py, pae.py) vs. PAE .json.gz files
+
+Reports conversion throughput (files/s, MB/s), store size, and random-access latency for looking up PAE values for a set of random residue pairs per file (.json.gz: decompress and parse whole file; .npy: memory map and read only the pages needed).
+Also compares the rounded PAE values that alphacon_add_pae.py writes to table 'alphacon' from both: these need to be identical for AlphaFold DB files (integer PAE values), which is why -store is used for them only.
+For comparison, the same is reported for generated AlphaSync-style files (non-integer PAE values), for which the store is lossy (so alphacon_add_pae.py -store reads their .json.gz files instead).
+"""
+
+# Initialize
+import gzip
+import json
+import tempfile
+from blang import *
+from pae import *
+
+(inpath, pairs) = Args(2, "[directory containing PAE .json.gz files (sample)] [number of random residue pairs to look up per file]", "input/pae/besian/store/afdb/data/x0006 100")
+
+rng = np.random.default_rng(0)
+
+# Number and size of generated AlphaSync-style PAE files (non-integer values, as from AlphaFold 2.3.2)
+synthetic = 10
+synthetic_length = 300
+
+
+
+# Functions
+
+def RoundedPae(infile, site1, site2, length):
+    """PAE values for residue pairs as written to table 'alphacon' by alphacon_add_pae.py (rounded)"""
+    return np.round(ProteinPae([infile], site1, site2, length))
+
+def CompareRounded(files):
+    """Compare rounded 'alphacon' PAE values for all residue pairs from .json.gz and .npy files [(infile, outfile)], returns (pairs compared, pairs differing, maximum difference)"""
+    compared = 0
+    differing = 0
+    maxdiff = 0
+    for infile, outfile in files:
+        n = len(ReadPae(outfile))
+        (site1, site2) = np.triu_indices(n)
+        (site1, site2) = (site1 + 1, site2 + 1)
+        diff = np.abs(RoundedPae(infile, site1, site2, n) - RoundedPae(outfile, site1, site2, n))
+        compared += len(diff)
+        differing += int((diff > 0).sum())
+        maxdiff = max(maxdiff, diff.max())
+    return (compared, differing, maxdiff)
+
+
+
+# Start
+
+infiles = nsort(glob(f"{inpath}/*.json.gz"))
+print(f"\nBenchmarking uint8 PAE store for {len(infiles)} .json.gz files in '{inpath}' ({pairs} random residue pairs per file):")
+
+with tempfile.TemporaryDirectory() as tmpdir:
+
+    # Conversion throughput
+    outfiles = []
+    inbytes = 0
+    outbytes = 0
+    t = time.perf_counter()
+    for infile in tq(infiles, desc="convert"):
+        outfile = tmpdir + "/" + re.sub(r"\.json\.gz$", ".npy", Basename(infile))
+        WritePae(ReadPae(infile), outfile)
+        outfiles.append(outfile)
+        inbytes += os.path.getsize(infile)
+        outbytes += os.path.getsize(outfile)
+    convert_time = time.perf_counter() - t
+
+    # Random-access latency (per file: look up random residue pairs)
+    json_times = []
+    npy_times = []
+    maxdiff = 0
+    for infile, outfile in tq(list(zip(infiles, outfiles)), desc="lookup"):
+        n = len(ReadPae(outfile))
+        site1 = rng.integers(1, n + 1, pairs)
+        site2 = rng.integers(1, n + 1, pairs)
+
+        t = time.perf_counter()
+        a = PairPae(ReadPae(infile), site1, site2)
+        json_times.append(time.perf_counter() - t)
+
+        t = time.perf_counter()
+        b = PairPae(ReadPae(outfile), site1, site2)
+        npy_times.append(time.perf_counter() - t)
+
+        maxdiff = max(maxdiff, np.abs(a - b).max())
+
+    # Rounded 'alphacon' values: AlphaFold DB files (integer PAE values)
+    afdb_rounded = CompareRounded(list(zip(infiles, outfiles)))
+
+    # Rounded 'alphacon' values: generated AlphaSync-style files (non-integer PAE values)
+    synthfiles = []
+    for i in range(synthetic):
+        infile = f"{tmpdir}/AF-Q{i:05}-F1-predicted_aligned_error_v0.json.gz"
+        outfile = f"{tmpdir}/AF-Q{i:05}-F1-predicted_aligned_error_v0.npy"
+        pae = np.round(rng.uniform(0, pae_max, (synthetic_length, synthetic_length)), 2)
+        with gzip.open(infile, "wt") as f:
+            json.dump([{"predicted_aligned_error": pae.tolist(), "max_predicted_aligned_error": pae_max}], f)
+        WritePae(ReadPae(infile), outfile)
+        synthfiles.append((infile, outfile))
+    alphasync_rounded = CompareRounded(synthfiles)
+
+print(f"\nConversion:")
+print(f" >> {len(infiles) / convert_time:,.1f} files/s, {inbytes / convert_time / 1e6:,.1f} MB/s of .json.gz input")
+print(f" >> Size: {inbytes / 1e6:,.1f} MB .json.gz >> {outbytes / 1e6:,.1f} MB .npy ({outbytes / inbytes:.2f}x)")
+
+print(f"\nRandom-access latency per file ({pairs} residue pairs, median / 95th percentile):")
+print(f" >> .json.gz:\t{np.median(json_times) * 1e3:.2f} / {np.percentile(json_times, 95) * 1e3:.2f} ms")
+print(f" >> .npy:\t{np.median(npy_times) * 1e3:.3f} / {np.percentile(npy_times, 95) * 1e3:.3f} ms")
+print(f" >> Speedup:\t{np.median(json_times) / np.median(npy_times):,.0f}x")
+print(f"\nMaximum difference between .json.gz and .npy values: {maxdiff} Å (quantization step {pae_step} Å)")
+
+print(f"\nRounded PAE values as written to table 'alphacon' (alphacon_add_pae.py), .json.gz vs. .npy (all residue pairs):")
+for (desc, (compared, differing, tmpmaxdiff)) in (("AlphaFold DB files", afdb_rounded), ("AlphaSync-style files", alphasync_rounded)):
+    print(f" >> {desc}:\t{Comma(differing)} of {Comma(compared)} pairs differ ({differing / max(compared, 1):.1%}, by up to {tmpmaxdiff:g} Å)")
+if afdb_rounded[1] > 0:
+    Die(f"Error: Rounded PAE values from the uint8 store differ from the .json.gz files for {Comma(afdb_rounded[1])} AlphaFold DB residue pairs (expected identical values for integer PAE values)")
+
+print("\nDone!")
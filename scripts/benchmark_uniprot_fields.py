@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Benchmark: Downloading UniProt entries as complete JSON records vs. field-restricted, gzip-compressed TSV plus JSON for nested fields (uniprotapi.py, as in alphauniprot.py)
+
+Runs against a local stand-in for the UniProt REST API /stream endpoint, which serves the same synthetic entries (with feature, reference and cross-reference sections like real records) in both forms.
+Complete JSON is served with HTTP gzip Content-Encoding (as UniProt does for clients that accept it), field-restricted downloads with compressed=true.
+Reports bytes transferred and rows/s (download and parse) for both, and verifies that both produce identical 'alphauniprot' rows (using the same extraction as alphauniprot.py).
+"""
+
+# Initialize
+import gzip
+import json
+import os
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from blang import *
+from uniprotapi import *
+
+(n) = Args(1, "[number of entries]", "20000")
+n = int(n)
+
+random.seed(1)
+aas = "ACDEFGHIKLMNPQRSTVWY"
+
+
+
+# Functions
+
+def Entry(i):
+    """Synthetic complete UniProt JSON record (canonical or isoform, with or without gene names, recommended or submitted names, function comments etc.)"""
+    canon = f"Q{i // 3:05}"
+    acc = canon if i % 3 == 0 else f"{canon}-{i % 3 + 1}"
+    reviewed = i % 4 == 0
+    seq = "".join(random.choice(aas) for j in range(random.randint(50, 800)))
+    e = {
+        "entryType": "UniProtKB reviewed (Swiss-Prot)" if reviewed else "UniProtKB unreviewed (TrEMBL)",
+        "primaryAccession": acc,
+        "uniProtkbId": f"P{i // 3}_HUMAN" if i % 7 else f"P{i // 3}_MOUSE",
+        "organism": {"scientificName": "Homo sapiens", "commonName": "Human", "taxonId": 9606, "lineage": ["Eukaryota", "Metazoa", "Chordata", "Mammalia", "Primates", "Hominidae", "Homo"]},
+        "proteinDescription": {},
+        "sequence": {"value": seq, "length": len(seq), "molWeight": len(seq) * 110, "crc64": f"{random.getrandbits(64):016X}", "md5": f"{random.getrandbits(128):032X}"},
+        "features": [{"type": "Domain", "location": {"start": {"value": j * 10, "modifier": "EXACT"}, "end": {"value": j * 10 + 9, "modifier": "EXACT"}}, "description": f"Domain {j}", "evidences": [{"evidenceCode": "ECO:0000259", "source": "PROSITE", "id": f"PS{j:05}"}]} for j in range(random.randint(5, 40))],
+        "references": [{"citation": {"id": f"{random.randint(1, 10 ** 8)}", "citationType": "journal article", "authors": [f"Author {k}" for k in range(8)], "title": "A synthetic reference title for benchmarking purposes", "journal": "J. Synth.", "firstPage": "1", "lastPage": "10", "volume": "1", "publicationDate": "2025"}, "referencePositions": ["NUCLEOTIDE SEQUENCE [LARGE SCALE MRNA]"]} for j in range(random.randint(1, 10))],
+        "uniProtKBCrossReferences": [{"database": "EMBL", "id": f"AB{random.randint(0, 10 ** 6):06}", "properties": [{"key": "ProteinId", "value": f"BAA{random.randint(0, 10 ** 5):05}.1"}, {"key": "Status", "value": "-"}]} for j in range(random.randint(5, 60))],
+        "comments": [{"commentType": "SUBCELLULAR LOCATION", "subcellularLocations": [{"location": {"value": "Nucleus", "id": "SL-0191"}}]}],
+    }
+    if i % 5 == 0:
+        del e["organism"]["commonName"]
+    if i % 2 == 0:
+        e["proteinDescription"]["recommendedName"] = {"fullName": {"value": f"Synthetic protein {i}"}}
+        e["proteinDescription"]["alternativeNames"] = [{"fullName": {"value": f"Alternative name {i}"}}]
+    else:
+        e["proteinDescription"]["submissionNames"] = [{"fullName": {"value": f"Submitted protein {i}"}}]
+    if i % 6 != 5:
+        e["genes"] = [{"geneName": {"value": f"GENE{i}"}, "synonyms": [{"value": f"SYN{i}A"}, {"value": f"SYN {i}B"}]}]
+        if i % 10 == 0:
+            e["genes"].append({"orderedLocusNames": [{"value": f"At{i}"}], "synonyms": [{"value": f"SYN{i}C"}]})
+    if i % 3 != 2:
+        e["comments"].append({"commentType": "FUNCTION", "texts": [{"value": f"Does synthetic thing {i}", "evidences": [{"evidenceCode": "ECO:0000269"}]}]})
+    if acc == canon:
+        e["keywords"] = [{"id": "KW-0002", "category": "Technical term", "name": "3D-structure"}] + ([{"id": "KW-1185", "category": "Technical term", "name": "Reference proteome"}] if i % 4 != 1 else [])
+    return e
+
+def Restricted(e):
+    """Field-restricted JSON record (json_fields only)"""
+    r = {key: e[key] for key in ("entryType", "primaryAccession", "uniProtkbId")}
+    r["proteinDescription"] = e["proteinDescription"]
+    r["organism"] = e["organism"]
+    if "genes" in e:
+        r["genes"] = e["genes"]
+    comments = [comment for comment in e["comments"] if comment["commentType"] == "FUNCTION"]
+    if len(comments) > 0:
+        r["comments"] = comments
+    return r
+
+def TsvLine(e):
+    """TSV line (tsv_fields)"""
+    keywords = "; ".join(keyword["id"] for keyword in e.get("keywords", []))
+    return "\t".join([e["primaryAccession"], e["uniProtkbId"], "reviewed" if e["entryType"].startswith("UniProtKB reviewed") else "unreviewed", str(e["organism"]["taxonId"]), keywords, str(e["sequence"]["length"]), e["sequence"]["value"]]) + "\n"
+
+def Row(e):
+    """alphauniprot row for an entry (same extraction as alphauniprot.py)"""
+    reviewed = 1 if e.get("entryType") == "UniProtKB reviewed (Swiss-Prot)" else 0
+    refproteome = 1 if "keywords" in e and any(k["id"] == "KW-1185" for k in e["keywords"]) else 0
+    fullname = ""
+    if "recommendedName" in e["proteinDescription"]:
+        fullname = e["proteinDescription"]["recommendedName"]["fullName"]["value"]
+    elif "submissionNames" in e["proteinDescription"]:
+        fullname = e["proteinDescription"]["submissionNames"][0]["fullName"]["value"]
+    symbols = []
+    synonyms = []
+    comments = []
+    if "genes" in e and len(e["genes"]) > 0:
+        symbols = [gene["geneName"]["value"] for gene in e["genes"] if "geneName" in gene]
+        synonyms = [synonym["value"] for gene in e["genes"] if "synonyms" in gene for synonym in gene["synonyms"]]
+    if "comments" in e and len(e["comments"]) > 0:
+        comments = [text["value"] for comment in e["comments"] if comment["commentType"] == "FUNCTION" for text in comment["texts"]]
+    comments = "\n".join(c if c.endswith(".") else c + "." for c in comments)
+    return (e["primaryAccession"], e["uniProtkbId"], fullname, e["organism"]["taxonId"], e["organism"].get("commonName", ""), e["organism"].get("scientificName", ""), reviewed, refproteome, "|".join(symbols), "|".join(synonyms), comments, e["sequence"]["length"], e["sequence"]["value"])
+
+
+
+# Local UniProt API stand-in
+print(f"\nGenerating {Comma(n)} synthetic UniProt entries...")
+entries = [Entry(i) for i in range(n)]
+full_body = json.dumps({"results": entries}).encode()
+bodies = {
+    "json": gzip.compress(full_body, 6),
+    "json-fields": gzip.compress(json.dumps({"results": [Restricted(e) for e in sorted(entries, key=lambda e: e["primaryAccession"])]}).encode(), 6),
+    "tsv-fields": gzip.compress(("Entry\tEntry Name\tReviewed\tOrganism (ID)\tKeyword ID\tLength\tSequence\n" + "".join(TsvLine(e) for e in sorted(entries, key=lambda e: e["primaryAccession"]))).encode(), 6),
+}
+
+class Handler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        params = parse_qs(urlparse(self.path).query)
+        format = params["format"][0]
+        key = format if "fields" not in params else f"{format}-fields"
+        body = bodies[key]
+        self.send_response(200)
+        if "compressed" not in params:
+            # Complete JSON: HTTP-level compression
+            self.send_header("content-encoding", "gzip")
+        self.send_header("content-length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+threading.Thread(target=server.serve_forever, daemon=True).start()
+baseurl = f"http://127.0.0.1:{server.server_port}/uniprotkb"
+query = "organism_id:9606"
+
+
+
+# Start
+
+def Run(urls, parse):
+    """Download and parse a query (returns rows, bytes transferred and seconds)"""
+    t = time.perf_counter()
+    files = list(Downloads(urls))
+    size = sum(os.path.getsize(file) for file in files)
+    rows = [Row(e) for e in parse(*files)]
+    return rows, size, time.perf_counter() - t
+
+print(f"\nBenchmarking UniProt downloads from local stand-in server '{baseurl}' ({Comma(n)} entries, {Comma(len(full_body))} bytes of uncompressed complete JSON):")
+full_rows, full_size, full_time = Run([StreamUrl(query, baseurl)], ParseJson)
+field_rows, field_size, field_time = Run(FieldUrls(query, baseurl), ParseEntries)
+server.shutdown()
+
+print(f" >> Complete JSON:\t\t{Comma(full_size)} bytes\t{full_time:,.2f} sec\t{len(full_rows) / full_time:,.0f} rows/s")
+print(f" >> Field-restricted TSV/JSON:\t{Comma(field_size)} bytes\t{field_time:,.2f} sec\t{len(field_rows) / field_time:,.0f} rows/s")
+print(f" >> {full_size / field_size:,.1f}x fewer bytes, {full_time / field_time:,.1f}x faster")
+
+# Rows arrive sorted by accession with field restriction
+if sorted(full_rows) != field_rows:
+    Die(f"Error: Rows differ ({Comma(len(set(full_rows) ^ set(field_rows)))} rows only in one of them)")
+print(f"\nBoth produce identical rows ({Comma(len(field_rows))})")
+
+print("\nDone!")
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Test: Fragment windows (fragments.Fragments), as used by alphasync.py to write fragment FASTA files and by alphafrag.py to check predicted fragments against current sequences
+
+Checks the single-fragment limit (2699 aa: 1 fragment, 2700 and 2701 aa: 8 fragments), and that for all lengths up to 6,000 aa the windows match alphasync.py's original fragment loop and cover the whole sequence.
+"""
+
+# Initialize
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from blang import *
+from fragments import *
+
+Args(0, "", "")
+
+
+
+# Functions
+
+def OriginalFragments(length):
+    """Fragment windows as computed by alphasync.py's original loop (0-based, end exclusive)"""
+    if length <= 2699:
+        return [(0, length)]
+    windows = []
+    for start in range(0, length, 200):
+        end = min(start + 1400, length)
+        windows.append((start, end))
+        if end == length:
+            break
+    return windows
+
+
+
+# Start
+
+errors = 0
+
+# Boundary: AlphaFold DB's maximum length for unfragmented predictions is 2699 aa
+for (length, expected) in ((2699, 1), (2700, 8), (2701, 8)):
+    windows = Fragments("A" * length)
+    print(f" >> {length} aa: {len(windows)} fragments {windows}")
+    if len(windows) != expected:
+        print(f"   >> Error: expected {expected} fragments")
+        errors += 1
+
+for length in range(1, 6001):
+    windows = Fragments("A" * length)
+    if windows != OriginalFragments(length):
+        print(f" >> Error: {length} aa: {windows} differs from alphasync.py's original loop {OriginalFragments(length)}")
+        errors += 1
+    if windows[0][0] != 0 or windows[-1][1] != length or (len(windows) > 1 and any(end - start > fraglen for (start, end) in windows)):
+        print(f" >> Error: {length} aa: windows {windows} don't cover the sequence")
+        errors += 1
+
+if errors > 0:
+    Die(f"Error: {errors} fragment window errors")
+
+print("\nDone!")
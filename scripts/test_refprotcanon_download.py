@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Test: Reference proteome FASTA downloads for alphauniprot_refprotcanon.py (uniprotapi.ReferenceProteomes) against a local stand-in for the UniProt FTP server (over HTTP)
+
+Serves canonical reference proteome FASTA files in different categories (Eukaryota, Bacteria, Viruses), plus one proteome that isn't in any category.
+Verifies that each file is found in its category, downloaded to the cache and parsed into the expected accessions (in proteome order), that a second run downloads nothing (HEAD only),
+and that a proteome that changed on the server (new Last-Modified) gets downloaded again.
+"""
+
+# Initialize
+import gzip
+import os
+import sys
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from blang import *
+from uniprotapi import *
+
+Args(0, "", "")
+
+# Canned proteomes: (proteome, tax) => (category, accessions)
+proteomes = {
+    ("UP000005640", "9606"): ("Eukaryota", [f"P{i:05}" for i in range(3000)]),
+    ("UP000000589", "10090"): ("Eukaryota", [f"Q{i:05}" for i in range(2000)]),
+    ("UP000000625", "83333"): ("Bacteria", [f"A0A{i:07}" for i in range(500)]),
+    ("UP000002494", "10116"): ("Eukaryota", [f"F1L{i:03}" for i in range(100)]),
+    ("UP000009136", "11676"): ("Viruses", ["P04585", "P04591"]),
+    ("UP000020681", "1299332"): (None, []),
+}
+files = {}
+modified = {}
+for (proteome, tax), (category, accs) in proteomes.items():
+    if category is not None:
+        fasta = "".join(f">{'sp' if i % 2 else 'tr'}|{acc}|{acc}_SPECIES Protein {acc} OS=Species OX={tax} GN=G{i} PE=1 SV=1\nMKVLAAGIVG\nLLLASS\n" for i, acc in enumerate(accs))
+        files[f"/reference_proteomes/{category}/{proteome}/{proteome}_{tax}.fasta.gz"] = gzip.compress(fasta.encode())
+        modified[f"/reference_proteomes/{category}/{proteome}/{proteome}_{tax}.fasta.gz"] = "Wed, 01 Oct 2025 00:00:00 GMT"
+
+# Requests seen: method => count
+seen = {}
+lock = threading.Lock()
+
+
+
+# Local UniProt FTP server stand-in
+class Handler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def respond(self, body):
+        with lock:
+            seen[self.command] = seen.get(self.command, 0) + 1
+        if self.path not in files:
+            self.send_response(404)
+            self.send_header("content-length", "0")
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("content-length", str(len(files[self.path])))
+        self.send_header("last-modified", modified[self.path])
+        self.end_headers()
+        if body:
+            self.wfile.write(files[self.path])
+
+    def do_HEAD(self):
+        self.respond(False)
+
+    def do_GET(self):
+        self.respond(True)
+
+
+
+# Start
+
+server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+threading.Thread(target=server.serve_forever, daemon=True).start()
+baseurl = f"http://127.0.0.1:{server.server_port}/reference_proteomes"
+cachedir = tempfile.mkdtemp(prefix="tmp-refprotcanon-")
+print(f"\nTesting reference proteome downloads from local stand-in server '{baseurl}' to '{cachedir}' ({len(proteomes)} proteomes):")
+
+errors = 0
+def Check(run, expect_downloaded):
+    """Fetch all proteomes, and check files, accessions and downloads"""
+    global errors
+    seen.clear()
+    downloads = 0
+    for (proteome, tax, infile, downloaded) in ReferenceProteomes(list(proteomes), baseurl=baseurl, cachedir=cachedir):
+        (category, accs) = proteomes[(proteome, tax)]
+        if category is None:
+            if infile is not None:
+                print(f" >> Error: {proteome} isn't in any category, but got '{infile}'")
+                errors += 1
+            continue
+        if list(FastaAccs(infile)) != accs:
+            print(f" >> Error: {proteome} accessions differ from canned FASTA headers")
+            errors += 1
+        if downloaded != ((proteome, tax) in expect_downloaded):
+            print(f" >> Error: {proteome} {'downloaded' if downloaded else 'not downloaded'} unexpectedly")
+            errors += 1
+        downloads += downloaded
+    print(f" >> {run}: {downloads} downloaded, {seen.get('HEAD', 0)} HEAD and {seen.get('GET', 0)} GET requests")
+
+Check("First run", {key for key, (category, accs) in proteomes.items() if category is not None})
+Check("Second run (unchanged)", set())
+modified["/reference_proteomes/Bacteria/UP000000625/UP000000625_83333.fasta.gz"] = "Thu, 02 Oct 2025 00:00:00 GMT"
+Check("Third run (one proteome changed)", {("UP000000625", "83333")})
+
+server.shutdown()
+for file in os.listdir(cachedir):
+    os.unlink(os.path.join(cachedir, file))
+os.rmdir(cachedir)
+
+if errors > 0:
+    Die(f"Error: {errors} failed checks")
+print("\nAll checks passed")
+
+print("\nDone!")
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+Test: Concurrent, resumable UniProt downloads (uniprotapi.py) against a local stand-in for the UniProt REST API
+
+Serves canned /stream results (plain and gzip-compressed, with an ETag) and /search totals from a local HTTP server that honours Range requests with If-Range (206/416, or 200 if the ETag doesn't match), drops the first response for each query halfway through (so the download has to resume), and ignores Range for one query (so the download has to start over).
+Before downloading, leaves stale partial files for two queries: one with the validator of an earlier response (as from an interrupted run of an earlier release), and one without any validator.
+Verifies that every downloaded file matches the canned response byte for byte (no stale bytes spliced in), that Downloads() yields files in query order without starting more than 'pending' downloads ahead, and that ParseJson() returns all entries and removes the file afterwards.
+Also verifies that a client error (400 for a malformed query) fails right away instead of being retried, and that a download that keeps failing gives up after max_attempts attempts.
+"""
+
+# Initialize
+import gzip
+import hashlib
+import json
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from blang import *
+import uniprotapi
+from uniprotapi import *
+
+Args(0, "", "")
+
+# Keep retries quick
+uniprotapi.max_backoff = 0.1
+
+# Canned results: query => body (every other query gzip-compressed, the last one without Range support)
+queries = [f"organism_id:{tax}" for tax in (9606, 10090, 10116, 7955, 6239, 7227)]
+entries = {}
+bodies = {}
+for qi, query in enumerate(queries):
+    entries[query] = [{"primaryAccession": f"P{qi}{i:04}", "sequence": {"value": "MKV" * (i % 50 + 1)}} for i in range(2000)]
+    body = json.dumps({"results": entries[query]}).encode()
+    if qi % 2 == 1:
+        body = gzip.compress(body)
+    bodies[query] = body
+norange = queries[-1]
+# Query that gets a 400 (as for a malformed query or field list), and one whose downloads always get cut off
+badquery = "organism_id:(malformed"
+flakyquery = "organism_id:9598"
+etags = {query: f'"{hashlib.md5(bodies[query]).hexdigest()}"' for query in queries}
+
+# Maximum number of downloads started ahead of the consumer
+pending = 2
+
+# Requests seen per query (the first one for each query gets cut off)
+seen = {}
+lock = threading.Lock()
+
+
+
+# Local UniProt API stand-in
+class Handler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)["query"][0]
+
+        if query in (badquery, flakyquery):
+            with lock:
+                seen[query] = seen.get(query, 0) + 1
+            if query == badquery:
+                self.send_response(400)
+                self.send_header("content-length", "0")
+                self.end_headers()
+            else:
+                self.send_response(200)
+                self.send_header("content-length", "1000")
+                self.end_headers()
+                self.wfile.write(b"x" * 10)
+                self.wfile.flush()
+                self.close_connection = True
+            return
+
+        if url.path.endswith("/search"):
+            self.send_response(200)
+            self.send_header("x-total-results", str(len(entries[query])))
+            self.send_header("content-length", "2")
+            self.end_headers()
+            self.wfile.write(b"{}")
+            return
+
+        body = bodies[query]
+        with lock:
+            seen[query] = seen.get(query, 0) + 1
+            first = seen[query] == 1
+
+        start = 0
+        m = rx(r"^bytes=(\d+)-$", self.headers.get("Range", ""))
+        # If-Range: only honour Range if the validator matches the current content
+        if m and self.headers.get("If-Range") not in (None, etags[query]):
+            m = None
+        if m and query != norange:
+            start = int(m[0])
+            if start >= len(body):
+                self.send_response(416)
+                self.send_header("content-length", "0")
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header("content-range", f"bytes {start}-{len(body) - 1}/{len(body)}")
+        else:
+            self.send_response(200)
+        part = body[start:]
+        self.send_header("etag", etags[query])
+        self.send_header("content-length", str(len(part)))
+        self.end_headers()
+        if first:
+            # Drop the connection halfway through
+            self.wfile.write(part[:len(part) // 2])
+            self.wfile.flush()
+            self.close_connection = True
+            return
+        self.wfile.write(part)
+
+
+
+# Start
+
+server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+threading.Thread(target=server.serve_forever, daemon=True).start()
+baseurl = f"http://127.0.0.1:{server.server_port}/uniprotkb"
+print(f"\nTesting UniProt downloads from local stand-in server '{baseurl}' ({len(queries)} queries, {uniprotapi.downloads} concurrent downloads):")
+
+urls = [StreamUrl(query, baseurl) for query in queries]
+for url in urls:
+    RemoveDownload(TempFile(url))
+
+# Stale partial files: one with an earlier response's validator, one without a validator
+with open(TempFile(urls[0]), "wb") as f:
+    f.write(b"stale bytes from an earlier release")
+with open(f"{TempFile(urls[0])}.validator", "w") as f:
+    f.write(f'"earlier-etag"\n{len(bodies[queries[0]])}')
+with open(TempFile(urls[1]), "wb") as f:
+    f.write(bodies[queries[1]][:100][::-1])
+
+errors = 0
+for qi, (query, url, temp_file) in enumerate(zip(queries, urls, Downloads(urls, pending=pending))):
+    if temp_file != TempFile(url):
+        print(f" >> Error: '{query}' yielded out of order ('{temp_file}' instead of '{TempFile(url)}')")
+        errors += 1
+    ahead = sum(1 for later in urls[qi + 1:] if os.path.exists(TempFile(later)))
+    if ahead > pending:
+        print(f" >> Error: '{query}' {ahead} later downloads started ahead of the consumer (at most {pending})")
+        errors += 1
+    with open(temp_file, "rb") as f:
+        if f.read() != bodies[query]:
+            print(f" >> Error: '{query}' downloaded file differs from canned response")
+            errors += 1
+    if Download(url) != temp_file:
+        print(f" >> Error: '{query}' re-download of complete file returned a different file")
+        errors += 1
+    total = TotalResults(query, baseurl)
+    parsed = [e["primaryAccession"] for e in ParseJson(temp_file)]
+    if parsed != [e["primaryAccession"] for e in entries[query]] or total != len(parsed):
+        print(f" >> Error: '{query}' parsed {Comma(len(parsed))} entries (expected {Comma(total)})")
+        errors += 1
+    if os.path.exists(temp_file) or os.path.exists(f"{temp_file}.validator"):
+        print(f" >> Error: '{query}' temporary file '{temp_file}' (or its validator) still exists after parsing")
+        errors += 1
+    print(f" >> {query}: {Comma(len(bodies[query]))} bytes, {Comma(len(parsed))} entries, {seen[query]} requests")
+
+# Client error: fails on the first attempt (no retries)
+try:
+    Download(StreamUrl(badquery, baseurl))
+    print(f" >> Error: '{badquery}' download didn't fail")
+    errors += 1
+except Exception as e:
+    print(f" >> {badquery}: failed after {seen[badquery]} requests")
+    if seen[badquery] != 1:
+        print(f" >> Error: '{badquery}' was requested {seen[badquery]} times (expected 1)")
+        errors += 1
+RemoveDownload(TempFile(StreamUrl(badquery, baseurl)))
+
+# Download that keeps failing: gives up after max_attempts attempts
+uniprotapi.max_attempts = 3
+try:
+    Download(StreamUrl(flakyquery, baseurl))
+    print(f" >> Error: '{flakyquery}' download didn't fail")
+    errors += 1
+except Exception as e:
+    print(f" >> {flakyquery}: gave up after {seen[flakyquery]} requests")
+    if seen[flakyquery] < uniprotapi.max_attempts or seen[flakyquery] > uniprotapi.max_attempts * 6:
+        print(f" >> Error: '{flakyquery}' was requested {seen[flakyquery]} times (expected {uniprotapi.max_attempts} attempts)")
+        errors += 1
+RemoveDownload(TempFile(StreamUrl(flakyquery, baseurl)))
+
+server.shutdown()
+
+if errors > 0:
+    Die(f"Error: {errors} failed checks")
+print("\nAll checks passed")
+
+print("\nDone!")
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Validate incremental alphamap updates (alphamap_uniprot.py -incremental, seqmap.MapDelta) against a full rebuild (seqmap.MapAll) on a fixture database
+
+The fixture database needs the state after a full alphamap_uniprot.py run for a previous UniProt version, followed by updating 'alphauniprot' (and optionally 'alphaseq'/'alphasummary') to newer contents.
+Runs the incremental update first and records its results (tables 'alphamap', 'alphamap_sources' and 'alphamap_structures'), then rebuilds all mappings from scratch, and reports any differences.
+Also checks that both keep other versions' rows in table 'alphamap' unchanged (e.g. the previous version's mappings that the incremental update copies from).
+Note: This changes the fixture database's tables.
+"""
+
+# Initialize
+from blang_mysql import *
+from blang import *
+from seqmap import *
+
+type = "uniprot"
+alphauniprot = "alphauniprot"
+
+(database, version) = Args(2, "[fixture database (not 'alphasync')] [current UniProt version]", "alphasync_fixture 2025_02")
+
+if database == "alphasync":
+    Die("Error: Refusing to validate on the production database 'alphasync' (use a fixture database)")
+
+Connect(database)
+
+
+
+# Functions
+
+def Results():
+    """Current mapping results in the fixture database (sets of rows per table)"""
+    return {
+        alphamap: FetchSet(Query(f"SELECT type, version, value, map, afdb, best, species, tax, ROUND(avg_plddt, 3) FROM {alphamap} WHERE type='{type}' AND version='{version}'")),
+        alphamap_sources: FetchSet(Query(f"SELECT type, value, species, tax, HEX(hash), HEX(maphash) FROM {alphamap_sources} WHERE type='{type}'")),
+        alphamap_structures: FetchSet(Query(f"SELECT type, HEX(hash), acc, afdb, ROUND(avg_plddt, 3) FROM {alphamap_structures} WHERE type='{type}'")),
+    }
+
+
+def OtherVersions():
+    """Rows for other versions in table 'alphamap' (which neither MapDelta nor MapAll should change)"""
+    return FetchSet(Query(f"SELECT type, version, value, map, afdb, best, species, tax, ROUND(avg_plddt, 3) FROM {alphamap} WHERE type='{type}' AND version!='{version}'"))
+
+def CheckOtherVersions(before, step):
+    """Die if a step changed other versions' rows in table 'alphamap'"""
+    after = OtherVersions()
+    if after != before:
+        Die(f"Error: {step} changed other versions' rows in table '{alphamap}' ({Comma(len(before - after))} missing, {Comma(len(after - before))} extra)")
+    print(f" >> {step} kept other versions' rows in table '{alphamap}' unchanged ({Comma(len(after))} rows)")
+
+
+
+# Start
+
+print(f"\nValidating incremental alphamap update against a full rebuild in fixture database '{database}' (type '{type}', version '{version}'):")
+structures = StructureMap()
+others = OtherVersions()
+
+print(f"\nIncremental update:\n")
+t = time.perf_counter()
+MapDelta(type, version, alphauniprot, structures)
+incremental_time = time.perf_counter() - t
+incremental = Results()
+CheckOtherVersions(others, "Incremental update")
+
+print(f"\nFull rebuild:\n")
+t = time.perf_counter()
+MapAll(type, version, alphauniprot, structures)
+full_time = time.perf_counter() - t
+full = Results()
+CheckOtherVersions(others, "Full rebuild")
+
+print(f"\n >> Incremental update:\t{incremental_time:,.1f} sec")
+print(f" >> Full rebuild:\t{full_time:,.1f} sec")
+
+differences = 0
+for table in full:
+    missing = full[table] - incremental[table]
+    extra = incremental[table] - full[table]
+    differences += len(missing) + len(extra)
+    print(f"\nTable '{table}': {Comma(len(full[table]))} rows after full rebuild, {Comma(len(missing))} missing and {Comma(len(extra))} extra after incremental update")
+    for row in sorted(missing, key=str)[:10]:
+        print(f" >> missing\t{row}")
+    for row in sorted(extra, key=str)[:10]:
+        print(f" >> extra\t{row}")
+
+if differences > 0:
+    Die(f"Error: Incremental update differs from full rebuild ({Comma(differences)} rows)")
+print(f"\nIncremental update matches full rebuild")
+
+print("\nDone!")
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Validate alphasa_add_membrane.py's bulk range-join UPDATE against the previous method (one UPDATE per membrane feature and matching 'alphaseq' accession) on a fixture database
+
+Resets the 'membrane' column in table 'alphasa', runs the previous per-feature method and records the flagged residues, then resets again and runs the bulk method (membrane.AddMembrane, as used by alphasa_add_membrane.py).
+Reports run time of both, and any residues (acc, site, afdb) flagged by only one of them.
+Note: This changes the fixture database's 'alphasa' table.
+"""
+
+# Initialize
+from blang_mysql import *
+from blang import *
+from membrane import *
+
+(database) = Args(1, "[fixture database (not 'alphasync')]", "alphasync_fixture")
+
+if database == "alphasync":
+    Die("Error: Refusing to validate on the production database 'alphasync' (use a fixture database)")
+
+Connect(database)
+
+
+
+# Functions
+
+def PerFeature():
+    """Previous method: one UPDATE per membrane feature and matching alphaseq acc"""
+    for (uniacc, seq, start, stop) in tq(Query(f"SELECT f.acc, s.seq, f.start, f.stop FROM unifeat f, uniseq s WHERE f.type IN ('transmembrane region', 'intramembrane region') AND f.acc=s.acc AND s.type IN ('UniProt', 'UniIso')")):
+        for (acc,) in Query(f"SELECT DISTINCT acc FROM alphaseq WHERE seq='{seq}'"):
+            Query(f"UPDATE {alphasa} SET membrane=1 WHERE acc='{acc}' AND site BETWEEN {start} AND {stop}")
+
+def Flagged():
+    """Residues with membrane=1"""
+    return FetchSet(Query(f"SELECT CONCAT_WS('|', acc, site, afdb) FROM {alphasa} WHERE membrane=1"))
+
+
+
+# Start
+
+print(f"\nValidating bulk membrane flags against the previous per-feature method in fixture database '{database}':")
+
+times = {}
+results = {}
+for (method, fill) in (("per-feature", PerFeature), ("bulk", AddMembrane)):
+    print(f"\n{method}:\n")
+    Query(f"UPDATE {alphasa} SET membrane=NULL WHERE membrane IS NOT NULL")
+    t = time.perf_counter()
+    fill()
+    times[method] = time.perf_counter() - t
+    results[method] = Flagged()
+
+print(f"\nRun time ({Comma(len(results['bulk']))} residues flagged):")
+for method in times:
+    print(f" >> {method}:\t{times[method]:,.1f} sec\t{times['per-feature'] / times[method]:.1f}x")
+
+missing = results["per-feature"] - results["bulk"]
+extra = results["bulk"] - results["per-feature"]
+for residue in sorted(missing)[:10]:
+    print(f" >> missing\t{residue}")
+for residue in sorted(extra)[:10]:
+    print(f" >> extra\t{residue}")
+
+if len(missing) + len(extra) > 0:
+    Die(f"Error: Bulk method differs from per-feature method ({Comma(len(missing))} residues missing, {Comma(len(extra))} extra)")
+print(f"\nBulk method matches per-feature method")
+
+print("\nDone!")
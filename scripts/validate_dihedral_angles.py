@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Validate and benchmark the NumPy dihedral angle calculation (dihedrals.py, used by job_dihedral_angles.py) against Bio.PDB internal coordinates (used previously)
+
+Compares phi, psi, omega, chi1-5 and tau for all residues in a set of mmCIF files, and reports run time per residue for both.
+"""
+
+# Initialize
+import pandas as pd
+import numpy as np
+from Bio.PDB.MMCIFParser import MMCIFParser
+from blang import *
+from dihedrals import *
+
+angles = ["phi", "psi", "omega", "chi1", "chi2", "chi3", "chi4", "chi5", "tau"]
+
+# Maximum allowed difference (degrees)
+tolerance = 0.01
+
+(inpath) = Args(1, "[directory containing mmCIF files (fixture set)]", "tmp/dihedral_fixtures")
+
+
+
+# Functions
+
+# Dihedral angles using Bio.PDB internal coordinates (as previously in job_dihedral_angles.py)
+def BioPDBAngles(ciffile):
+    rows = []
+    structure = MMCIFParser(QUIET=True).get_structure("fixture", ciffile)
+    for model in structure:
+        for chain in model:
+            chain.atom_to_internal_coordinates()
+            for res in chain:
+                c = res.internal_coord
+                rows.append([res.id[1]] + [np.nan if c.get_angle(angle) is None else c.get_angle(angle) for angle in angles])
+        # First model only
+        break
+    return pd.DataFrame(rows, columns=["site"] + angles)
+
+
+
+# Start
+
+infiles = nsort(glob(f"{inpath}/*.cif"))
+print(f"\nComparing dihedral angles from NumPy (dihedrals.py) and Bio.PDB for {len(infiles)} mmCIF files in '{inpath}':")
+
+residues = 0
+times = {"numpy": 0, "biopdb": 0}
+maxdiffs = {angle: 0 for angle in angles}
+nanmismatches = {angle: 0 for angle in angles}
+for ciffile in tq(infiles):
+
+    t = time.perf_counter()
+    np_angles = DihedralAngles(ciffile)
+    times["numpy"] += time.perf_counter() - t
+
+    t = time.perf_counter()
+    bio_angles = BioPDBAngles(ciffile)
+    times["biopdb"] += time.perf_counter() - t
+
+    if list(np_angles["site"]) != list(bio_angles["site"]):
+        Die(f"Error: Residue numbers differ between NumPy and Bio.PDB for '{ciffile}'")
+    residues += len(np_angles)
+
+    for angle in angles:
+        a = np_angles[angle].to_numpy()
+        b = bio_angles[angle].to_numpy()
+
+        # Defined in one, but not the other
+        mismatch = np.isnan(a) != np.isnan(b)
+        nanmismatches[angle] += int(mismatch.sum())
+        for site in np_angles["site"][mismatch]:
+            Log(f"angle defined in only one of NumPy/Bio.PDB for file|site|angle", f"{Basename(ciffile)}|{site}|{angle}")
+
+        # Circular difference
+        both = ~np.isnan(a) & ~np.isnan(b)
+        diff = np.abs((a[both] - b[both] + 180) % 360 - 180)
+        if len(diff) > 0:
+            maxdiffs[angle] = max(maxdiffs[angle], diff.max())
+            for site in np_angles["site"][both][diff > tolerance]:
+                Log(f"angle differs by more than {tolerance} degrees for file|site|angle", f"{Basename(ciffile)}|{site}|{angle}")
+
+print(f"\nValidation ({Comma(residues)} residues):")
+for angle in angles:
+    print(f" >> {angle}:\tmaximum difference {maxdiffs[angle]:.6f} degrees\tdefined in only one: {nanmismatches[angle]}")
+
+print(f"\nRun time per residue:")
+print(f" >> NumPy:\t{times['numpy'] / residues * 1e6:.1f} µs")
+print(f" >> Bio.PDB:\t{times['biopdb'] / residues * 1e6:.1f} µs (without structure_rebuild_test, which roughly doubled this)")
+print(f" >> Speedup:\t{times['biopdb'] / times['numpy']:.1f}x")
+
+Show(lim=20)
+
+if max(maxdiffs.values()) > tolerance or max(nanmismatches.values()) > 0:
+    Die(f"Error: NumPy and Bio.PDB dihedral angles differ (see above)")
+
+print("\nDone!")
@@ -0,0 +1,284 @@
+"""Sequence mapping functions: map source sequences (UniProt, Ensembl) to AlphaSync structures in table 'alphaseq' by perfect sequence matching, using an in-memory hash join
+
+All structures (acc, afdb, average pLDDT from table 'alphasummary') are loaded once into a dictionary keyed by the MD5 hash of their sequence, so each source sequence can be looked up without a query.
+Mappings are written to table 'alphamap' using multi-row INSERTs.
+
+Mappings can also be updated incrementally (MapDelta) instead of rebuilding them for every source sequence (MapAll).
+Both record what they mapped:
+ - table 'alphamap_sources': per source identifier, a hash of its sequence, the hash it was mapped by (after replacing non-standard amino acids), and its species and taxon,
+ - table 'alphamap_structures': the structures they were mapped to (as in StructureMap).
+MapDelta compares these to the current source table and structures, and only remaps source identifiers that were added, changed (sequence, species or taxon), or whose sequence matches structures that were added, removed or changed since.
+"""
+
+import hashlib
+from blang import Comma, Die, Log, ReplaceNonstandardAAs, State, Switch, rx, tq
+from blang_mysql import Fetch, FetchOne, FetchSet, Numrows, Query
+from summary import alphasummary
+
+alphamap = "alphamap"
+alphamap_sources = "alphamap_sources"
+alphamap_structures = "alphamap_structures"
+alphasa = "alphasa"
+alphaseq = "alphaseq"
+
+# Number of rows per multi-row INSERT into table 'alphamap' (and number of identifiers per IN list)
+batchsize = 10000
+
+
+
+def SeqHash(seq):
+    """MD5 hash of a sequence (as in MySQL's UNHEX(MD5(seq)))"""
+    return hashlib.md5(seq.encode()).digest()
+
+def SortStructures(structures):
+    """Order each list in a structure map (see StructureMap) as ORDER BY avg_plddt DESC, s.afdb ASC, s.acc did"""
+    for seqhash in structures:
+        structures[seqhash].sort(key=lambda structure: (-structure[2], structure[1], structure[0]))
+    return structures
+
+def StructureMap():
+    """Get all structures in table 'alphaseq' with their average pLDDT (from table 'alphasummary'), keyed by sequence hash: {hash: [(acc, afdb, avg_plddt), ...]}, each list ordered from best to worst (descending average pLDDT, then AFDB before AlphaSync, then acc)"""
+    structures = {}
+    # Structures that have residues in table 'alphasa' but no summary yet would silently drop out of the mapping (and alphasync_cleanup.py would then delete them as unnecessary), so require alphasummary.py to have run
+    missing = FetchOne(Query(f"SELECT COUNT(*) FROM {alphaseq} s LEFT OUTER JOIN {alphasummary} m ON m.acc=s.acc AND m.afdb=s.afdb WHERE m.acc IS NULL AND EXISTS (SELECT 1 FROM {alphasa} a WHERE a.acc=s.acc AND a.afdb=s.afdb)"))
+    if missing > 0:
+        Die(f"Error: {Comma(missing)} structures in table '{alphaseq}' have residues in table '{alphasa}', but no summary in table '{alphasummary}' (run alphasummary.py first)")
+    # query = Query(f"SELECT UNHEX(MD5(s.seq)), s.acc, s.afdb, AVG(a.plddt) AS avg_plddt FROM {alphaseq} s, {alphasa} a WHERE a.acc=s.acc AND a.afdb=s.afdb GROUP BY s.acc, s.afdb")
+    # Precomputed per-structure average pLDDT (instead of aggregating all residues in table 'alphasa')
+    query = Query(f"SELECT UNHEX(MD5(s.seq)), s.acc, s.afdb, m.avg_plddt FROM {alphaseq} s, {alphasummary} m WHERE m.acc=s.acc AND m.afdb=s.afdb AND m.avg_plddt IS NOT NULL")
+    for (seqhash, acc, afdb, avg_plddt) in tq(query, total=Numrows(query)):
+        structures.setdefault(seqhash, []).append((acc, afdb, avg_plddt))
+    return SortStructures(structures)
+
+def MapRows(type, version, species, tax, value, matches):
+    """Table 'alphamap' rows (SQL value tuples) for one source identifier and its matching structures (best match first, see StructureMap), or a NULL mapping if there are none"""
+    if len(matches) == 0:
+        return [f"('{type}', '{version}', '{species}', '{tax}', '{value}', NULL, NULL, NULL, NULL)"]
+    rows = []
+    best = 1
+    for (alphacc, afdb, avg_plddt) in matches:
+        rows.append(f"('{type}', '{version}', '{species}', '{tax}', '{value}', '{alphacc}', '{afdb}', '{avg_plddt}', '{best}')")
+        best = 0
+    return rows
+
+def SqlValue(value):
+    """SQL literal for a value (NULL for None)"""
+    if value is None:
+        return "NULL"
+    return f"'{value}'"
+
+def InsertRows(table, columns, rows, force=False):
+    """Insert queued rows (SQL value tuples) into a table using a multi-row INSERT once there are at least batchsize rows (or any rows, with force=True), and clear the queue (returns number of rows inserted)"""
+    if len(rows) == 0 or (len(rows) < batchsize and not force):
+        return 0
+    q = f"INSERT INTO {table} ({', '.join(columns)}) VALUES " + ", ".join(rows)
+    if not Switch('debug'):
+        Query(q)
+    else:
+        State(q)
+    inserted = len(rows)
+    rows.clear()
+    return inserted
+
+def InsertMapRows(rows, force=False):
+    """Insert queued 'alphamap' rows (see InsertRows)"""
+    return InsertRows(alphamap, ["type", "version", "species", "tax", "value", "map", "afdb", "avg_plddt", "best"], rows, force)
+
+def InsertSourceRows(rows, force=False):
+    """Insert queued 'alphamap_sources' rows (see InsertRows)"""
+    return InsertRows(alphamap_sources, ["type", "value", "species", "tax", "hash", "maphash"], rows, force)
+
+def InsertStructureRows(rows, force=False):
+    """Insert queued 'alphamap_structures' rows (see InsertRows)"""
+    return InsertRows(alphamap_structures, ["type", "hash", "acc", "afdb", "avg_plddt"], rows, force)
+
+def MapSource(type, version, value, species, tax, seq, structures, rows, sourcerows):
+    """Map one source sequence to structures (see StructureMap), queueing its 'alphamap' and 'alphamap_sources' rows (returns its matches, best first)"""
+    sourcehash = SeqHash(seq)
+
+    # Replace non-standard amino acids (B/Z/U/X) in sequence (for compatibility with AlphaFold)
+    if rx("[BZUX]", seq):
+        seq = ReplaceNonstandardAAs(seq)
+    maphash = SeqHash(seq)
+
+    Log("total accs", value)
+    Log("total species", species)
+    Log("total taxa", tax)
+    Log("total sequences", seq)
+
+    # Get all alphaseq accs that have this exact sequence (any species is fine - the only input to AlphaFold 2 is a sequence), best first
+    matches = structures.get(maphash, [])
+
+    # Queue mapping rows for table 'alphamap' (a NULL mapping if there are no matches)
+    rows.extend(MapRows(type, version, species, tax, value, matches))
+    InsertMapRows(rows)
+
+    # Record what this identifier was mapped by
+    sourcerows.append(f"('{type}', '{value}', {SqlValue(species)}, {SqlValue(tax)}, UNHEX('{sourcehash.hex()}'), UNHEX('{maphash.hex()}'))")
+    InsertSourceRows(sourcerows)
+
+    if len(matches) == 0:
+        Log(f"sequence not found in {alphaseq} for acc (skipped)", value)
+        Log(f"sequence not found in {alphaseq} for seq (skipped)", seq)
+        return matches
+
+    best = 1
+    for alphacc, afdb, avg_plddt in matches:
+        if best == 1:
+            Log("successfully mapped for best=1 acc|alphacc", f"{value}|{alphacc}")
+        best = 0
+
+        Log("successfully mapped for acc|alphacc", f"{value}|{alphacc}")
+        Log("successfully mapped for acc", value)
+        Log("successfully mapped for alphacc", alphacc)
+        Log("successfully mapped for seq", seq)
+        Log("successfully mapped for species", species)
+        Log("successfully mapped for tax", tax)
+        if afdb == 0:
+            Log("successfully mapped to non-AFDB AlphaSync acc for acc|alphacc", f"{value}|{alphacc}")
+            Log("successfully mapped to non-AFDB AlphaSync acc for acc", value)
+            Log("successfully mapped to non-AFDB AlphaSync acc for alphacc", alphacc)
+            Log("successfully mapped to non-AFDB AlphaSync acc for seq", seq)
+            Log("successfully mapped to non-AFDB AlphaSync acc for species", species)
+            Log("successfully mapped to non-AFDB AlphaSync acc for tax", tax)
+    return matches
+
+def Change(q):
+    """Run a query that changes tables (unless -debug is active), returns the number of rows affected (0 in debug mode)"""
+    if Switch('debug'):
+        return 0
+    return Numrows(Query(q))
+
+def Batches(values):
+    """Split a collection of identifiers (or hashes) into sorted lists of up to batchsize"""
+    values = sorted(values)
+    return [values[i:i + batchsize] for i in range(0, len(values), batchsize)]
+
+def InList(values):
+    """SQL IN list of quoted identifiers"""
+    return "('" + "', '".join(values) + "')"
+
+def HashList(seqhashes):
+    """SQL IN list of sequence hashes"""
+    return "(" + ", ".join(f"UNHEX('{seqhash.hex()}')" for seqhash in seqhashes) + ")"
+
+def StructureSnapshot(type):
+    """Get the structures that type's mappings were made with from table 'alphamap_structures' (same format as StructureMap)"""
+    structures = {}
+    for (seqhash, acc, afdb, avg_plddt) in Fetch(Query(f"SELECT hash, acc, afdb, avg_plddt FROM {alphamap_structures} WHERE type='{type}'")):
+        structures.setdefault(seqhash, []).append((acc, afdb, avg_plddt))
+    return SortStructures(structures)
+
+def SaveStructureSnapshot(type, structures, seqhashes=None):
+    """Record the structures type's mappings were made with in table 'alphamap_structures' (all of them, or only those for a set of sequence hashes)"""
+    if seqhashes is None:
+        Change(f"DELETE FROM {alphamap_structures} WHERE type='{type}'")
+        seqhashes = structures.keys()
+    else:
+        for batch in Batches(seqhashes):
+            Change(f"DELETE FROM {alphamap_structures} WHERE type='{type}' AND hash IN {HashList(batch)}")
+    rows = []
+    for seqhash in seqhashes:
+        for (acc, afdb, avg_plddt) in structures.get(seqhash, []):
+            rows.append(f"('{type}', UNHEX('{seqhash.hex()}'), '{acc}', '{afdb}', '{avg_plddt}')")
+        InsertStructureRows(rows)
+    InsertStructureRows(rows, force=True)
+
+def ChangedSeqHashes(structures, snapshot):
+    """Sequence hashes whose structures (acc, afdb, average pLDDT, or their order) differ between two structure maps (see StructureMap)"""
+    return set(seqhash for seqhash in structures.keys() | snapshot.keys() if structures.get(seqhash) != snapshot.get(seqhash))
+
+def MapAll(type, version, source, structures):
+    """Map all sequences in a source table (with columns acc, species, tax, seq, e.g. 'alphauniprot') to structures, replacing type's mappings for a version in table 'alphamap' and its mapping state (returns number of mappings inserted)"""
+    print(f"Deleting type '{type}' version '{version}' rows from table '{alphamap}'...")
+    deleted = Change(f"DELETE FROM {alphamap} WHERE type='{type}' AND version='{version}'")
+    print(f"Rows affected: {deleted:,}")
+    Change(f"DELETE FROM {alphamap_sources} WHERE type='{type}'")
+    print()
+
+    State(f"Filling table '{alphamap}' with type '{type}' mappings for version '{version}' based on perfect sequence matching between tables '{source}' and '{alphaseq}':")
+    # Note: This used to take ~12 hours with one alphaseq/alphasa query per UniProt sequence.
+    inserted = 0
+    rows = []
+    sourcerows = []
+    for acc, species, tax, seq in Fetch(Query(f"SELECT acc, species, tax, seq FROM {source}")):
+        inserted += len(MapSource(type, version, acc, species, tax, seq, structures, rows, sourcerows))
+    InsertMapRows(rows, force=True)
+    InsertSourceRows(sourcerows, force=True)
+
+    State(f"Recording structures used in table '{alphamap_structures}':")
+    SaveStructureSnapshot(type, structures)
+    return inserted
+
+def HasPreviousMapping(type):
+    """Whether tables 'alphamap', 'alphamap_sources' and 'alphamap_structures' hold a previous mapping for a type that MapDelta can update"""
+    if FetchOne(Query(f"SELECT COUNT(*) FROM {alphamap} WHERE type='{type}'")) == 0:
+        return False
+    if FetchOne(Query(f"SELECT COUNT(*) FROM {alphamap_sources} WHERE type='{type}'")) == 0:
+        return False
+    if FetchOne(Query(f"SELECT COUNT(*) FROM {alphamap_structures} WHERE type='{type}'")) == 0:
+        return False
+    return True
+
+def MapDelta(type, version, source, structures):
+    """Incrementally update type's mappings in table 'alphamap' to a version: only remap identifiers in a source table (see MapAll) that were added or changed since the previous mapping, or whose sequence matches structures that changed since (returns number of mappings inserted)"""
+    previous = FetchOne(Query(f"SELECT MAX(version) FROM {alphamap} WHERE type='{type}'"))
+    snapshot = StructureSnapshot(type)
+    if previous is None or len(snapshot) == 0 or FetchOne(Query(f"SELECT COUNT(*) FROM {alphamap_sources} WHERE type='{type}'")) == 0:
+        Die(f"Error: No previous type '{type}' mappings in tables '{alphamap}', '{alphamap_sources}' and '{alphamap_structures}' to update (run a full mapping first)")
+    if previous > version:
+        Die(f"Error: Previous type '{type}' mappings in table '{alphamap}' are for a later version ('{previous}') than '{version}'")
+
+    State(f"Comparing type '{type}' mappings (version '{previous}') to the current contents of tables '{source}' and '{alphaseq}':")
+
+    # Structures that were added, removed or changed (e.g. newly finished AlphaSync predictions), by sequence hash
+    changed = ChangedSeqHashes(structures, snapshot)
+    print(f" >> Sequences with changed structures: {Comma(len(changed))}")
+
+    # Source identifiers that were added or changed (sequence hash, species or taxon)
+    updated = FetchSet(Query(f"SELECT u.acc FROM {source} u LEFT OUTER JOIN {alphamap_sources} s ON s.type='{type}' AND s.value=u.acc WHERE s.value IS NULL OR s.hash!=UNHEX(MD5(u.seq)) OR NOT s.species<=>u.species OR NOT s.tax<=>u.tax"))
+    print(f" >> Added or changed identifiers in table '{source}': {Comma(len(updated))}")
+
+    # Source identifiers that were removed
+    removed = FetchSet(Query(f"SELECT s.value FROM {alphamap_sources} s LEFT OUTER JOIN {source} u ON u.acc=s.value WHERE s.type='{type}' AND u.acc IS NULL"))
+    print(f" >> Removed identifiers: {Comma(len(removed))}")
+
+    # Unchanged source identifiers whose sequence matches changed structures
+    remapped = set()
+    for batch in Batches(changed):
+        remapped |= FetchSet(Query(f"SELECT value FROM {alphamap_sources} WHERE type='{type}' AND maphash IN {HashList(batch)}"))
+    remapped -= removed
+    remapped -= updated
+    print(f" >> Unchanged identifiers matching changed structures: {Comma(len(remapped))}")
+
+    affected = updated | remapped
+    print(f" >> Identifiers to remap: {Comma(len(affected))}")
+    print()
+
+    # Copy the previous version's mappings to this version (keeping the previous version's rows, as MapAll does)
+    if previous != version:
+        print(f"Copying type '{type}' version '{previous}' rows to version '{version}' in table '{alphamap}'...")
+        affected_rows = Change(f"INSERT INTO {alphamap} (type, version, value, best, afdb, map, species, tax, avg_plddt) SELECT type, '{version}', value, best, afdb, map, species, tax, avg_plddt FROM {alphamap} WHERE type='{type}' AND version='{previous}'")
+        print(f"Rows affected: {affected_rows:,}")
+
+    print(f"Deleting type '{type}' version '{version}' rows for removed identifiers and identifiers to remap from table '{alphamap}'...")
+    deleted = 0
+    for batch in tq(Batches(removed | affected)):
+        deleted += Change(f"DELETE FROM {alphamap} WHERE type='{type}' AND version='{version}' AND value IN {InList(batch)}")
+        Change(f"DELETE FROM {alphamap_sources} WHERE type='{type}' AND value IN {InList(batch)}")
+    print(f"Rows affected: {deleted:,}")
+    print()
+
+    State(f"Remapping identifiers in table '{alphamap}' (type '{type}', version '{version}') based on perfect sequence matching between tables '{source}' and '{alphaseq}':")
+    inserted = 0
+    rows = []
+    sourcerows = []
+    for batch in tq(Batches(affected)):
+        for acc, species, tax, seq in Query(f"SELECT acc, species, tax, seq FROM {source} WHERE acc IN {InList(batch)}"):
+            inserted += len(MapSource(type, version, acc, species, tax, seq, structures, rows, sourcerows))
+    InsertMapRows(rows, force=True)
+    InsertSourceRows(sourcerows, force=True)
+
+    State(f"Recording changed structures in table '{alphamap_structures}':")
+    SaveStructureSnapshot(type, structures, changed)
+    return inserted
@@ -13,6 +13,24 @@ CREATE TABLE `alphacon` (
   PRIMARY KEY (`acc`,`site1`,`site2`,`atom1`,`atom2`,`type`,`afdb`)
 ) ENGINE=InnoDB DEFAULT CHARSET=latin1 COMMENT='AlphaSync contacts';
 
+CREATE TABLE `alphacoverage` (
+  `tax` mediumint NOT NULL,
+  `version` char(7) DEFAULT NULL,
+  `accs` int NOT NULL DEFAULT '0',
+  `mapped_accs` int NOT NULL DEFAULT '0',
+  `mapped_seqs` int NOT NULL DEFAULT '0',
+  `unmapped_seqs` int NOT NULL DEFAULT '0',
+  `unmapped_iso_seqs` int NOT NULL DEFAULT '0',
+  `structures` int NOT NULL DEFAULT '0',
+  `alphasync_structures` int NOT NULL DEFAULT '0',
+  `afdb_structures` int NOT NULL DEFAULT '0',
+  `residues` bigint NOT NULL DEFAULT '0',
+  `plddt_sum` double NOT NULL DEFAULT '0',
+  `updated` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  PRIMARY KEY (`tax`),
+  KEY `Version` (`version`)
+) ENGINE=InnoDB DEFAULT CHARSET=latin1 COMMENT='AlphaSync per-taxon coverage (accession columns per UniProt release via alphacoverage.py, structure columns maintained along with alphasummary)';
+
 CREATE TABLE `alphafrag` (
   `acc` varchar(15) NOT NULL,
   `name` varchar(16) DEFAULT NULL,
@@ -36,6 +54,18 @@ CREATE TABLE `alphafrag` (
   KEY `Tax` (`tax`)
 ) ENGINE=InnoDB DEFAULT CHARSET=latin1 COMMENT='AlphaFold fragment sequences';
 
+CREATE TABLE `alphamanifest` (
+  `source` varchar(30) NOT NULL,
+  `stage` varchar(10) NOT NULL,
+  `size` bigint NOT NULL,
+  `mtime` bigint NOT NULL,
+  `checksum` char(32) NOT NULL,
+  `ingested` bigint NOT NULL,
+  `members` int NOT NULL,
+  `updated` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  PRIMARY KEY (`source`,`stage`)
+) ENGINE=InnoDB DEFAULT CHARSET=latin1 COMMENT='AlphaSync TAR archive manifest (members already ingested per archive and stage)';
+
 CREATE TABLE `alphamap` (
   `type` char(12) NOT NULL,
   `version` char(7) NOT NULL,
@@ -49,6 +79,27 @@ CREATE TABLE `alphamap` (
   PRIMARY KEY (`type`,`version`,`value`,`best`,`afdb`,`map`)
 ) ENGINE=InnoDB DEFAULT CHARSET=latin1 COMMENT='AlphaSync mapping from latest UniProt to AlphaFold DB accessions';
 
+CREATE TABLE `alphamap_sources` (
+  `type` char(12) NOT NULL,
+  `value` char(23) NOT NULL,
+  `species` char(32) DEFAULT NULL,
+  `tax` mediumint DEFAULT NULL,
+  `hash` binary(16) NOT NULL,
+  `maphash` binary(16) NOT NULL,
+  PRIMARY KEY (`type`,`value`),
+  KEY `Maphash` (`maphash`)
+) ENGINE=InnoDB DEFAULT CHARSET=latin1 COMMENT='AlphaSync mapping state: source identifiers and sequence hashes as of the last alphamap run';
+
+CREATE TABLE `alphamap_structures` (
+  `type` char(12) NOT NULL,
+  `hash` binary(16) NOT NULL,
+  `acc` char(13) NOT NULL,
+  `afdb` tinyint NOT NULL,
+  `avg_plddt` float DEFAULT NULL,
+  PRIMARY KEY (`type`,`acc`,`afdb`),
+  KEY `Hash` (`type`,`hash`)
+) ENGINE=InnoDB DEFAULT CHARSET=latin1 COMMENT='AlphaSync mapping state: structures as of the last alphamap run';
+
 CREATE TABLE `alphasa` (
   `acc` char(13) NOT NULL,
   `site` mediumint NOT NULL,
@@ -99,6 +150,21 @@ CREATE TABLE `alphastats` (
   PRIMARY KEY (`stat`)
 ) ENGINE=InnoDB DEFAULT CHARSET=latin1 COMMENT='AlphaSync precalculated statistics';
 
+CREATE TABLE `alphasummary` (
+  `acc` char(13) NOT NULL,
+  `afdb` tinyint NOT NULL,
+  `tax` mediumint DEFAULT NULL,
+  `length` mediumint DEFAULT NULL,
+  `avg_plddt` float DEFAULT NULL,
+  `median_plddt` float DEFAULT NULL,
+  `dis_fraction` float DEFAULT NULL,
+  `surf_fraction` float DEFAULT NULL,
+  `contacts` int DEFAULT NULL,
+  `has_pae` tinyint DEFAULT NULL,
+  `updated` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  PRIMARY KEY (`acc`,`afdb`)
+) ENGINE=InnoDB DEFAULT CHARSET=latin1 COMMENT='AlphaSync per-structure summaries (aggregated from alphasa and alphacon)';
+
 CREATE TABLE `alphauniprot` (
   `acc` varchar(13) NOT NULL,
   `canon` varchar(10) DEFAULT NULL,
@@ -130,6 +196,14 @@ CREATE TABLE `alphauniprot` (
   KEY `Refprotcanon` (`refprotcanon`)
 ) ENGINE=InnoDB DEFAULT CHARSET=latin1 COMMENT='UniProt annotation via API';
 
+CREATE TABLE `alphauniprot_changes` (
+  `version` char(7) NOT NULL,
+  `acc` varchar(13) NOT NULL,
+  `type` enum('inserted','deleted','changed') NOT NULL,
+  PRIMARY KEY (`version`,`acc`),
+  KEY `Type` (`type`)
+) ENGINE=InnoDB DEFAULT CHARSET=latin1 COMMENT='UniProt accessions inserted, deleted or changed in table alphauniprot per release (alphauniprot.py -delta)';
+
 CREATE TABLE `alphauniprot_species` (
   `id` int unsigned NOT NULL AUTO_INCREMENT,
   `tax` mediumint NOT NULL,
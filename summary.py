@@ -0,0 +1,99 @@
+"""Structure summary functions: per-structure aggregates (length, mean/median pLDDT, fraction disordered, fraction surface, contact count, PAE availability) in table 'alphasummary'
+
+Job scripts write a structure's summary as soon as its residues (job_dssp.py), contacts (job_lahuta.py) or PAE scores (alphacon_add_pae.py) are in, so consumers can read one row per structure instead of aggregating billions of 'alphasa'/'alphacon' rows.
+alphasummary.py backfills existing structures and checks the table against 'alphasa'/'alphacon' (using the same functions, so both paths give identical values).
+Columns that haven't been computed yet are NULL (e.g. 'contacts' before job_lahuta.py has run).
+
+Per-taxon coverage in table 'alphacoverage' (structures, AlphaSync vs. AFDB structures, residues, pLDDT sum for the mean) is kept up to date along with the residue summaries: a structure's previous residue summary is subtracted and its new one added (see CoverageQuery).
+Each summary stores its structure's taxon (from table 'alphaseq'), so its coverage can still be subtracted once the structure's 'alphaseq' row is gone.
+alphacoverage.py fills the per-release UniProt accession columns, and rebuilds the structure columns from scratch to verify them.
+"""
+
+import statistics
+from blang import State, Switch
+from blang_mysql import Query
+
+alphasummary = "alphasummary"
+alphacoverage = "alphacoverage"
+alphaseq = "alphaseq"       # Taxa of structures
+
+# Columns filled from residues in table 'alphasa' (dis10: disorder based on relASA smoothed in a ±10 aa window, as calibrated in job_dssp.py; surf: surface based on unsmoothed relASA)
+residue_columns = ["length", "avg_plddt", "median_plddt", "dis_fraction", "surf_fraction"]
+# Columns filled from contacts in table 'alphacon'
+contact_columns = ["contacts", "has_pae"]
+# Columns in table 'alphacoverage' maintained from residue summaries (mean pLDDT per taxon: plddt_sum / residues)
+coverage_columns = ["structures", "alphasync_structures", "afdb_structures", "residues", "plddt_sum"]
+
+
+
+def ResidueSummary(plddts, dis, surf):
+    """Summary values for a structure's residues (lists of pLDDT, dis10 ('*' disordered) and surf ('S' surface) values in table 'alphasa'): {column: value} for residue_columns"""
+    length = len(plddts)
+    return {
+        "length": length,
+        "avg_plddt": statistics.fmean(plddts),
+        "median_plddt": statistics.median(plddts),
+        "dis_fraction": dis.count("*") / length,
+        "surf_fraction": surf.count("S") / length,
+    }
+
+def ContactSummary(contacts, paes):
+    """Summary values for a structure's contacts (number of rows in table 'alphacon', and how many of them have a PAE score): {column: value} for contact_columns"""
+    return {
+        "contacts": contacts,
+        "has_pae": int(paes > 0),
+    }
+
+def SummaryValue(value):
+    """SQL literal for a summary value"""
+    if value is None:
+        return "NULL"
+    return f"'{value}'"
+
+def TaxQuery(acc, afdb):
+    """SQL subquery for a structure's taxon in table 'alphaseq'"""
+    return f"(SELECT tax FROM {alphaseq} WHERE acc='{acc}' AND afdb='{afdb}')"
+
+def SummaryQuery(acc, afdb, values):
+    """SQL query that inserts or updates some of a structure's summary columns in table 'alphasummary' (values: {column: value}, e.g. from ResidueSummary or ContactSummary), leaving the others unchanged (also sets its taxon from table 'alphaseq', keeping the stored one if the structure isn't there)"""
+    tmpvalues = ", ".join(f"{column}={SummaryValue(value)}" for column, value in values.items())
+    return f"INSERT INTO {alphasummary} SET acc='{acc}', afdb='{afdb}', tax={TaxQuery(acc, afdb)}, {tmpvalues} ON DUPLICATE KEY UPDATE tax=COALESCE({TaxQuery(acc, afdb)}, tax), {tmpvalues}"
+
+def CoverageQuery(structures, sign):
+    """SQL query that adds (sign=1) or subtracts (sign=-1) structures' current residue summaries [(acc, afdb)] to/from their taxa's coverage in table 'alphacoverage' (using the taxa stored in table 'alphasummary', so this also works once their 'alphaseq' rows are gone)"""
+    tmpin = ", ".join(f"('{acc}', '{afdb}')" for (acc, afdb) in structures)
+    return f"""INSERT INTO {alphacoverage} (tax, {', '.join(coverage_columns)})
+    SELECT s.tax, {sign}*COUNT(*), {sign}*SUM(s.afdb=0), {sign}*SUM(s.afdb=1), {sign}*SUM(s.length), {sign}*SUM(s.avg_plddt*s.length) FROM {alphasummary} s WHERE (s.acc, s.afdb) IN ({tmpin}) AND s.length IS NOT NULL AND s.tax IS NOT NULL GROUP BY s.tax
+    ON DUPLICATE KEY UPDATE """ + ", ".join(f"{column}={column}+VALUES({column})" for column in coverage_columns)
+
+def UpdateSummary(acc, afdb, values):
+    """Insert or update some of a structure's summary columns in table 'alphasummary' (see SummaryQuery), and its taxon's coverage if residue columns change (in a single transaction)"""
+    queries = [SummaryQuery(acc, afdb, values)]
+    if any(column in values for column in residue_columns):
+        queries = [CoverageQuery([(acc, afdb)], -1)] + queries + [CoverageQuery([(acc, afdb)], 1)]
+    if not Switch('debug'):
+        Query("START TRANSACTION")
+        try:
+            for q in queries:
+                Query(q)
+        except BaseException:
+            # Roll back (otherwise the next START TRANSACTION on this connection would implicitly commit a partial update, leaving 'alphacoverage' inconsistent)
+            Query("ROLLBACK")
+            raise
+        Query("COMMIT")
+    else:
+        for q in queries:
+            State(q)
+
+def DeleteSummaries(accs, afdb):
+    """Delete summaries for a list of accessions from table 'alphasummary' (e.g. when their 'alphasa'/'alphacon' rows get deleted), subtracting them from their taxa's coverage first (in a single transaction), returns the query"""
+    Query("START TRANSACTION")
+    try:
+        if len(accs) > 0:
+            Query(CoverageQuery([(acc, afdb) for acc in accs], -1))
+        query = Query(f"DELETE FROM {alphasummary} WHERE acc IN ('" + "', '".join(accs) + f"') AND afdb='{afdb}'")
+    except BaseException:
+        Query("ROLLBACK")
+        raise
+    Query("COMMIT")
+    return query
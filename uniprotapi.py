@@ -0,0 +1,297 @@
+"""UniProt REST API functions: download query results from the /stream endpoint concurrently and resumably, and parse them
+
+Each query is downloaded to its own temporary file (named after a hash of its URL, so a re-run finds the same file again).
+Interrupted downloads resume from the bytes already written using an HTTP Range request with If-Range (the ETag or Last-Modified of the original response), and start over if the content changed or the server doesn't honour Range (200 instead of 206 Partial Content).
+Downloads run in a bounded pool of threads, at most a few files ahead of the caller, which parses and inserts completed downloads in query order (see Downloads), so network and parse time overlap.
+Files are written exactly as received (including any gzip compression), and decompressed while parsing if needed.
+
+Entries can be fetched as complete JSON records (ParseJson), or field-restricted and gzip-compressed (ParseEntries): flat fields as TSV (tsv_fields), plus a JSON download with only the nested fields (json_fields), both sorted by accession and merged back into JSON-style entries with the keys alphauniprot.py uses.
+
+Reference proteome FASTA files (from the UniProt FTP server, over HTTPS) are downloaded concurrently to a local cache, and only downloaded again once they change on the server (see ReferenceProteome).
+"""
+
+import gzip
+import hashlib
+import io
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import zip_longest
+import ijson
+import requests
+from requests.adapters import HTTPAdapter, Retry
+from blang import Die
+
+# UniProt REST API
+apiurl = "https://rest.uniprot.org/uniprotkb"
+
+# Number of concurrent downloads (UniProt's API rate-limits heavy use)
+downloads = 4
+
+# Maximum number of downloads started ahead of parsing (running, or complete but not yet parsed), bounding disk use
+pending_downloads = 2 * downloads
+
+# Download block size (bytes)
+block_size = 262144
+
+# Prefix for temporary download files
+temp_prefix = "tmp-alphauniprot"
+
+# Maximum delay between download attempts (seconds)
+max_backoff = 60
+
+# Maximum number of attempts per download (each resuming from the bytes already written)
+max_attempts = 20
+
+# Fields fetched as TSV (flat values, including the sequence, which makes up most of the data)
+tsv_fields = ["accession", "id", "reviewed", "organism_id", "keywordid", "length", "sequence"]
+
+# Fields fetched as JSON (nested values that don't survive TSV flattening: alternative names, common vs. scientific species names, per-gene symbols and synonyms, function comment texts)
+json_fields = ["accession", "protein_name", "organism_name", "gene_names", "cc_function"]
+
+# UniProt FTP server (reference proteomes, over HTTPS)
+ftpurl = "https://ftp.uniprot.org/pub/databases/uniprot/current_release/knowledgebase/reference_proteomes"
+
+# Reference proteome categories (FTP subdirectories)
+categories = ["Eukaryota", "Archaea", "Bacteria", "Viruses"]
+
+# Local cache for reference proteome FASTA files
+proteome_cache = "input/uniprot/reference_proteomes"
+
+# Sort order for field-restricted downloads (so TSV and JSON rows can be merged without holding either in memory)
+sort_order = "accession asc"
+
+
+
+def Session():
+    """requests session that retries failed requests (rate limits, timeouts and server errors)"""
+    retries = Retry(
+        total=10,           # Total retries
+        backoff_factor=0.5, # Delay between retries
+        status_forcelist=[500, 502, 503, 504, 429, 408],  # Rate limit (429) and timeout (408)
+        connect=5,          # Connection retries
+        read=5,             # Read retries
+        respect_retry_after_header=True  # Honor server's retry-after header
+    )
+    session = requests.Session()
+    session.mount("https://", HTTPAdapter(max_retries=retries))
+    session.mount("http://", HTTPAdapter(max_retries=retries))
+    return session
+
+def TotalResults(query, baseurl=apiurl):
+    """Number of UniProt entries (including isoforms) matching a query (from the /search endpoint's x-total-results header)"""
+    with Session() as session:
+        response = session.get(f"{baseurl}/search", params={"format": "json", "includeIsoform": "true", "size": 1, "query": query})
+        response.raise_for_status()
+        return int(response.headers["x-total-results"])
+
+def StreamUrl(query, baseurl=apiurl, format="json", fields=None, compressed=False, sort=None):
+    """URL of the /stream endpoint (all results at once, without pagination) for a query"""
+    url = f"{baseurl}/stream?format={format}&includeIsoform=true&query={query}"
+    if fields is not None:
+        url += f"&fields={','.join(fields)}"
+    if sort is not None:
+        url += f"&sort={sort}"
+    if compressed:
+        url += "&compressed=true"
+    return url
+
+def FieldUrls(query, baseurl=apiurl):
+    """URLs of the field-restricted, gzip-compressed TSV and JSON downloads for a query (see ParseEntries)"""
+    return [StreamUrl(query, baseurl, format="tsv", fields=tsv_fields, compressed=True, sort=sort_order),
+            StreamUrl(query, baseurl, format="json", fields=json_fields, compressed=True, sort=sort_order)]
+
+def TempFile(url):
+    """Temporary download file for a URL"""
+    return f"{temp_prefix}-{hashlib.md5(url.encode()).hexdigest()[:16]}"
+
+def Validator(response):
+    """Validator identifying a response's content for resuming it with If-Range: a strong ETag, or else Last-Modified (None if the server sends neither)"""
+    etag = response.headers.get("etag")
+    if etag and not etag.startswith("W/"):
+        return etag
+    return response.headers.get("last-modified")
+
+def RemoveDownload(infile):
+    """Delete a downloaded file and its validator file (see Download)"""
+    for file in (infile, f"{infile}.validator"):
+        if os.path.exists(file):
+            os.unlink(file)
+
+def Download(url, outfile=None):
+    """Download a URL to a file, resuming interrupted downloads via HTTP Range requests (up to max_attempts attempts, returns the file name)
+    The response's validator (see Validator) and total size are kept in a .validator file next to it, and resumed requests send it as If-Range, so a partial file only gets resumed if the server still has the same content (otherwise it sends everything again).
+    Partial files without a validator (e.g. left over from an interrupted run of an earlier release, since the URL stays the same) are discarded.
+    Client errors (e.g. 400 for a malformed query or field list, or 404) are permanent and fail right away (the session already retries 408 and 429)."""
+    if outfile is None:
+        outfile = TempFile(url)
+    validatorfile = f"{outfile}.validator"
+    attempt = 0
+    while True:
+        attempt += 1
+        # Bytes already downloaded (e.g. by a previous attempt or run), if they can be validated
+        offset = 0
+        validator = None
+        length = ""
+        if os.path.exists(outfile):
+            if os.path.exists(validatorfile):
+                with open(validatorfile) as f:
+                    (validator, length) = f.read().split("\n")
+                offset = os.path.getsize(outfile)
+            else:
+                RemoveDownload(outfile)
+        headers = {}
+        if offset > 0:
+            headers["Range"] = f"bytes={offset}-"
+            headers["If-Range"] = validator
+        try:
+            with Session() as session:
+                with session.get(url, headers=headers, stream=True) as response:
+                    if offset > 0 and response.status_code == 416:
+                        # Range Not Satisfiable (with a matching validator): the file is already complete, unless its size is off
+                        if length == "" or offset == int(length):
+                            return outfile
+                        RemoveDownload(outfile)
+                        raise IOError(f"Partial file has {offset:,} bytes, but the response has {int(length):,}")
+                    response.raise_for_status()
+                    if response.status_code == 206:
+                        # Partial Content (the validator still matches): append to what's already there
+                        mode = "ab"
+                    else:
+                        # Changed content, or Range not supported (or nothing downloaded yet): start over, recording the new response's validator and size first
+                        mode = "wb"
+                        offset = 0
+                        validator = Validator(response)
+                        if validator is None:
+                            if os.path.exists(validatorfile):
+                                os.unlink(validatorfile)
+                        else:
+                            with open(validatorfile, "w") as f:
+                                f.write(f"{validator}\n{response.headers.get('content-length', '')}")
+                    expected = response.headers.get("content-length")
+                    written = 0
+                    with open(outfile, mode) as f:
+                        # Keep bytes as received (without decoding any Content-Encoding), so Range offsets stay valid
+                        for chunk in response.raw.stream(block_size, decode_content=False):
+                            f.write(chunk)
+                            written += len(chunk)
+                    if expected is not None and written != int(expected):
+                        raise IOError(f"Expected {int(expected):,} bytes, but got {written:,}")
+            return outfile
+        except Exception as e:
+            if isinstance(e, requests.HTTPError) and e.response is not None and 400 <= e.response.status_code < 500:
+                Die(f"Error: Download of '{url}' failed with HTTP status {e.response.status_code} ({e})")
+            if attempt >= max_attempts:
+                Die(f"Error: Download of '{url}' failed after {attempt} attempts ({e})")
+            # Download failed: keep the partial file and resume from there
+            delay = min(0.5 * 2 ** attempt, max_backoff)
+            print(f"     >> Download failed ({e}), resuming in {delay:g} s...", file=sys.stderr)
+            time.sleep(delay)
+
+def Downloads(urls, workers=downloads, pending=pending_downloads):
+    """Download URLs concurrently (bounded number of worker threads), yielding their files in the order of the URLs as they complete
+    At most 'pending' downloads are started ahead of the caller (running, or complete but not yet yielded), so disk use stays bounded however far downloads get ahead of parsing."""
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = deque()
+        for url in urls:
+            if len(futures) >= max(pending, 1):
+                yield futures.popleft().result()
+            futures.append(executor.submit(Download, url))
+        while len(futures) > 0:
+            yield futures.popleft().result()
+
+def OpenDownload(infile):
+    """Open a downloaded file for reading (binary), decompressing it if it is gzip-compressed"""
+    with open(infile, "rb") as f:
+        magic = f.read(2)
+    if magic == b"\x1f\x8b":
+        return gzip.open(infile, "rb")
+    return open(infile, "rb")
+
+def ParseJson(infile):
+    """Parse UniProt entries from a downloaded JSON file (streaming, to avoid high memory use), and delete the file once all of them have been read"""
+    with OpenDownload(infile) as f:
+        # Use ijson.items to directly iterate over the 'results' array
+        for item in ijson.items(f, "results.item"):
+            yield item
+    # Only delete the file once it has been parsed completely (an interrupted run can re-use it)
+    RemoveDownload(infile)
+
+def ParseTsv(infile, fields=tsv_fields):
+    """Parse rows from a downloaded TSV file as {field: value} (skipping the header line, which has labels rather than field names), and delete the file once all of them have been read"""
+    with OpenDownload(infile) as f:
+        lines = io.TextIOWrapper(f, encoding="utf-8", newline="\n")
+        next(lines, None)
+        for line in lines:
+            yield dict(zip(fields, line.rstrip("\n").split("\t")))
+    RemoveDownload(infile)
+
+def ParseEntries(tsvfile, jsonfile):
+    """Parse UniProt entries from field-restricted TSV and JSON downloads (see FieldUrls), merged into JSON-style entries (same keys as the complete JSON records for the fields alphauniprot.py uses)"""
+    for row, e in zip_longest(ParseTsv(tsvfile), ParseJson(jsonfile)):
+        if row is None or e is None or row["accession"] != e["primaryAccession"]:
+            Die(f"Error: TSV and JSON downloads don't match up (TSV row {row['accession'] if row else None}, JSON entry {e['primaryAccession'] if e else None})")
+        e["uniProtkbId"] = row["id"]
+        e["entryType"] = "UniProtKB reviewed (Swiss-Prot)" if row["reviewed"] == "reviewed" else "UniProtKB unreviewed (TrEMBL)"
+        e["sequence"] = {"value": row["sequence"], "length": int(row["length"])}
+        e.setdefault("organism", {})["taxonId"] = int(row["organism_id"])
+        # Only canonical entries have keywords
+        if row["keywordid"] != "":
+            e["keywords"] = [{"id": keyword} for keyword in row["keywordid"].split("; ")]
+        yield e
+
+def Stamp(response):
+    """Version stamp of a file on the FTP server, from a HEAD response (last modified and size)"""
+    return f"{response.headers.get('last-modified', '')}|{response.headers.get('content-length', '')}"
+
+def ReferenceProteome(proteome, tax, baseurl=ftpurl, cachedir=proteome_cache):
+    """Download a canonical reference proteome FASTA file (e.g. Eukaryota/UP000005640/UP000005640_9606.fasta.gz) to the local cache, unless the cached copy is still current (returns (file, downloaded), or (None, False) if it isn't in any category)"""
+    outfile = os.path.join(cachedir, f"{proteome}_{tax}.fasta.gz")
+    stampfile = f"{outfile}.stamp"
+
+    # Check if the file exists in /Eukaryota/, /Archaea/, /Bacteria/ or /Viruses/
+    url = None
+    with Session() as session:
+        for category in categories:
+            test_url = f"{baseurl}/{category}/{proteome}/{proteome}_{tax}.fasta.gz"
+            response = session.head(test_url)
+            if response.status_code == 200:
+                url = test_url
+                break
+    if url is None:
+        return None, False
+
+    # Skip proteomes that haven't changed since they were cached
+    stamp = Stamp(response)
+    if os.path.exists(outfile) and os.path.exists(stampfile):
+        with open(stampfile) as f:
+            if f.read() == stamp:
+                return outfile, False
+
+    # New or changed: download from scratch (without a matching stamp, a partial file could be from an earlier version), and only record the stamp once complete
+    for file in (outfile, stampfile):
+        if os.path.exists(file):
+            os.unlink(file)
+    os.makedirs(cachedir, exist_ok=True)
+    Download(url, outfile)
+    # The stamp takes over from the download's validator file
+    RemoveDownload(f"{outfile}.validator")
+    with open(stampfile, "w") as f:
+        f.write(stamp)
+    return outfile, True
+
+def ReferenceProteomes(proteomes, workers=downloads, baseurl=ftpurl, cachedir=proteome_cache):
+    """Fetch reference proteomes [(proteome, tax)] concurrently (bounded number of worker threads), yielding (proteome, tax, file, downloaded) in order as they complete"""
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = [executor.submit(ReferenceProteome, proteome, tax, baseurl, cachedir) for (proteome, tax) in proteomes]
+        for (proteome, tax), future in zip(proteomes, futures):
+            yield (proteome, tax, *future.result())
+
+def FastaAccs(infile):
+    """Accessions from the headers of a gzip-compressed UniProt FASTA file (e.g. '>sp|P04637|P53_HUMAN Cellular tumor antigen p53 ...'), streamed from disk"""
+    with gzip.open(infile, "rt") as f:
+        for line in f:
+            if line.startswith(">"):
+                yield line.split("|")[1]